@@ -0,0 +1,352 @@
+"""
+Benchmark de carga dos steps contra o simulador local da mostQI.
+
+Sobe o simulador (mostqi.simulador) no próprio processo, aponta o cliente
+para ele e executa o `main` de cada step com N chamadas e concorrência C,
+reportando throughput, latências p50/p95/p99 e erros. Não usa rede externa,
+então pode rodar em CI; `--max-p95-ms` e `--max-taxa-erro` fazem o script
+terminar com código 1 quando os limites são ultrapassados.
+
+Uso:
+
+    python benchmarks/bench_carga.py --chamadas 200 --concorrencia 16
+    python benchmarks/bench_carga.py --escala 1 --taxa-429 0.02 --taxa-401 0.01 \\
+        --max-p95-ms 02_idp=2500 --saida-json carga.json
+
+Para medir o hedging (MOSTQI_HEDGE) na cauda do status da prova de vida:
+
+    MOSTQI_HEDGE=1 python benchmarks/bench_carga.py --steps 07_status \\
+        --chamadas 2000 --escala 1 --latencia liveness-status=lognormal:100:0.9
+"""
+
+import argparse
+import base64
+import contextlib
+import importlib
+import io
+import json
+import logging
+import os
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "steps"))
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# O cliente lê a URL base ao ser importado: o simulador precisa ter o
+# endereço definido antes de qualquer import do pacote mostqi
+PORTA_SIMULADOR = _porta_livre()
+os.environ["MOSTQI_BASE_URL"] = f"http://127.0.0.1:{PORTA_SIMULADOR}"
+os.environ.pop("MOSTQI_CACHE_DIR", None)
+os.environ.pop("MOSTQI_TOKEN_STORE", None)
+
+from mostqi import get_client  # noqa: E402
+from mostqi.simulador import (  # noqa: E402
+    SimuladorMostQI,
+    adicionar_argumentos,
+    configuracao_dos_argumentos,
+)
+
+CLIENT_KEY = "chave-benchmark"
+STEPS = (
+    "02_idp",
+    "04_vio",
+    "05_liveness",
+    "07_status",
+    "08_facematch",
+    "09_validacao",
+    "fluxo",
+)
+
+
+def gerar_imagem() -> bytes:
+    """JPEG pequeno de documento; sem Pillow, apenas um cabeçalho JPEG."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return b"\xff\xd8\xff\xe0" + os.urandom(64 * 1024) + b"\xff\xd9"
+    imagem = Image.effect_noise((1024, 640), 48).convert("RGB")
+    saida = io.BytesIO()
+    imagem.save(saida, format="JPEG", quality=85)
+    return saida.getvalue()
+
+
+class Cenario:
+    """Entradas e verificações de sucesso de cada step."""
+
+    def __init__(self, steps: Dict[str, Any], imagem: bytes) -> None:
+        self.steps = steps
+        self.imagem = imagem
+        self.lote = importlib.import_module("mostqi.lote")
+        self.process_ids: List[str] = []
+        self.amostra: Dict[str, Any] = {}
+
+    def imagem_unica(self) -> bytes:
+        # Bytes após o marcador EOI não alteram o JPEG, mas mudam o hash:
+        # cada chamada passa pela API em vez do cache de resultados
+        return self.imagem + os.urandom(16)
+
+    def idp(self) -> Dict[str, Any]:
+        resultado = self.steps["02_idp"].main(CLIENT_KEY, self.imagem_unica())
+        resultado.pop("imagem_corrigida", None)
+        return resultado
+
+    def vio(self) -> Dict[str, Any]:
+        return self.steps["04_vio"].main(CLIENT_KEY, self.imagem_unica())
+
+    def liveness(self) -> Dict[str, Any]:
+        resultado = self.steps["05_liveness"].main(CLIENT_KEY)
+        process_id = (resultado.get("default_args") or {}).get("process_id")
+        if process_id:
+            self.process_ids.append(process_id)
+        return resultado
+
+    def status(self, indice: int) -> Dict[str, Any]:
+        if not self.process_ids:
+            self.liveness()
+        process_id = self.process_ids[indice % len(self.process_ids)]
+        return self.steps["07_status"].main(CLIENT_KEY, process_id, 30)
+
+    def facematch(self) -> Dict[str, Any]:
+        selfie = base64.b64encode(self.imagem_unica()).decode()
+        return self.steps["08_facematch"].main(CLIENT_KEY, self.imagem_unica(), selfie)
+
+    def validacao(
+        self, idp: Dict[str, Any], vio: Dict[str, Any], fields: Dict[str, Any]
+    ):
+        argumentos = self.lote.argumentos_validacao(
+            idp.get("dados"),
+            vio.get("dados"),
+            0.98,
+            float(fields.get("similaridade_percentual") or 0.0),
+            bool(fields.get("aprovado")),
+        )
+        return self.steps["09_validacao"].main(**argumentos)
+
+    def fluxo(self) -> Dict[str, Any]:
+        idp, vio = self.idp(), self.vio()
+        fields = self.facematch().get("fields") or {}
+        validacao = self.validacao(idp, vio, fields)
+        ok = all(
+            (
+                idp.get("status") != "erro",
+                vio.get("status") != "erro",
+                "similaridade_percentual" in fields,
+                sucesso_validacao(validacao),
+            )
+        )
+        return {"status": "ok" if ok else "erro"}
+
+    def preparar_validacao(self) -> None:
+        """Saídas de 02, 04 e 08 usadas como entrada fixa do step 09."""
+        self.amostra.update(idp=self.idp(), vio=self.vio())
+        self.amostra["fields"] = self.facematch().get("fields") or {}
+
+    def chamadas(self) -> Dict[str, Tuple[Callable[[int], Any], Callable[[Any], bool]]]:
+        def validacao(_: int) -> Dict[str, Any]:
+            return self.validacao(
+                self.amostra["idp"], self.amostra["vio"], self.amostra["fields"]
+            )
+
+        return {
+            "02_idp": (lambda _: self.idp(), lambda r: r.get("status") != "erro"),
+            "04_vio": (lambda _: self.vio(), lambda r: r.get("status") != "erro"),
+            "05_liveness": (
+                lambda _: self.liveness(),
+                lambda r: bool((r.get("default_args") or {}).get("process_id")),
+            ),
+            "07_status": (self.status, lambda r: "outputs" in r),
+            "08_facematch": (
+                lambda _: self.facematch(),
+                lambda r: "similaridade_percentual" in (r.get("fields") or {}),
+            ),
+            "09_validacao": (validacao, sucesso_validacao),
+            "fluxo": (lambda _: self.fluxo(), lambda r: r.get("status") == "ok"),
+        }
+
+
+def sucesso_validacao(resultado: Dict[str, Any]) -> bool:
+    return not resultado.get("mensagem_resultado_final", "").startswith(
+        "Erro inesperado"
+    )
+
+
+def medir_step(
+    chamada: Callable[[int], Any],
+    sucesso: Callable[[Any], bool],
+    chamadas: int,
+    concorrencia: int,
+    percentil: Callable[[List[float], float], float],
+) -> Dict[str, Any]:
+    def executar(indice: int) -> Tuple[float, bool]:
+        inicio = time.perf_counter()
+        try:
+            ok = sucesso(chamada(indice))
+        except Exception:
+            ok = False
+        return (time.perf_counter() - inicio) * 1000, ok
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        resultados = list(executor.map(executar, range(chamadas)))
+    duracao = time.perf_counter() - inicio
+
+    tempos = sorted(ms for ms, _ in resultados)
+    erros = sum(1 for _, ok in resultados if not ok)
+    return {
+        "chamadas": chamadas,
+        "erros": erros,
+        "taxa_erro": round(erros / chamadas, 4) if chamadas else 0.0,
+        "chamadas_por_segundo": round(chamadas / duracao, 2) if duracao else 0.0,
+        "p50_ms": round(percentil(tempos, 50), 1),
+        "p95_ms": round(percentil(tempos, 95), 1),
+        "p99_ms": round(percentil(tempos, 99), 1),
+    }
+
+
+def formatar(resultados: Dict[str, Dict[str, Any]]) -> str:
+    linhas = [
+        f"{'step':<14}{'chamadas':>10}{'cham/s':>10}{'p50 ms':>10}"
+        f"{'p95 ms':>10}{'p99 ms':>10}{'erros':>8}"
+    ]
+    for step, r in resultados.items():
+        linhas.append(
+            f"{step:<14}{r['chamadas']:>10}{r['chamadas_por_segundo']:>10.1f}"
+            f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['erros']:>8}"
+        )
+    return "\n".join(linhas)
+
+
+def verificar_limites(
+    resultados: Dict[str, Dict[str, Any]],
+    max_p95: Dict[str, float],
+    max_taxa_erro: Optional[float],
+) -> List[str]:
+    violacoes = []
+    for step, limite in max_p95.items():
+        if step in resultados and resultados[step]["p95_ms"] > limite:
+            violacoes.append(
+                f"{step}: p95 {resultados[step]['p95_ms']} ms > {limite} ms"
+            )
+    if max_taxa_erro is not None:
+        for step, r in resultados.items():
+            if r["taxa_erro"] > max_taxa_erro:
+                violacoes.append(
+                    f"{step}: taxa de erro {r['taxa_erro']} > {max_taxa_erro}"
+                )
+    return violacoes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chamadas", type=int, default=100, help="Chamadas por step")
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument(
+        "--steps", default=",".join(STEPS), help="Lista de steps separada por vírgula"
+    )
+    parser.add_argument("--saida-json", help="Grava os resultados em JSON")
+    parser.add_argument(
+        "--max-p95-ms",
+        action="append",
+        default=[],
+        metavar="STEP=MS",
+        help="Limite de p95 por step (pode repetir)",
+    )
+    parser.add_argument("--max-taxa-erro", type=float, default=None)
+    adicionar_argumentos(parser)
+    # Em CI as latências reais (centenas de ms) são reduzidas por padrão
+    parser.set_defaults(escala=0.05, liveness_duracao=0.0)
+    args = parser.parse_args()
+
+    steps_escolhidos = [s.strip() for s in args.steps.split(",") if s.strip()]
+    desconhecidos = set(steps_escolhidos) - set(STEPS)
+    if desconhecidos:
+        parser.error(f"steps desconhecidos: {', '.join(sorted(desconhecidos))}")
+    max_p95 = {}
+    for item in args.max_p95_ms:
+        step, _, valor = item.partition("=")
+        max_p95[step] = float(valor)
+
+    logging.basicConfig(level=logging.CRITICAL)
+    simulador = SimuladorMostQI(
+        ("127.0.0.1", PORTA_SIMULADOR), configuracao_dos_argumentos(args)
+    ).iniciar()
+
+    steps = {
+        "02_idp": importlib.import_module("02_processar_cnh_frente_idp"),
+        "04_vio": importlib.import_module("04_processa_cnh_qrcode_vio"),
+        "05_liveness": importlib.import_module("05_liveness_get_link_start"),
+        "07_status": importlib.import_module("07_verifica_status_liveness"),
+        "08_facematch": importlib.import_module("08_compara_faces_facematch"),
+        "09_validacao": importlib.import_module("09_validacao_final"),
+    }
+    logging.getLogger().setLevel(logging.CRITICAL)
+    from mostqi.lote import percentil
+
+    cenario = Cenario(steps, gerar_imagem())
+    chamadas = cenario.chamadas()
+    resultados: Dict[str, Dict[str, Any]] = {}
+    try:
+        # Os steps imprimem diagnósticos no stdout; fora do relatório
+        with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+            if "09_validacao" in steps_escolhidos:
+                cenario.preparar_validacao()
+            for step in steps_escolhidos:
+                chamada, sucesso = chamadas[step]
+                resultados[step] = medir_step(
+                    chamada, sucesso, args.chamadas, args.concorrencia, percentil
+                )
+    finally:
+        simulador.parar()
+
+    print(
+        f"{args.chamadas} chamadas por step, concorrência {args.concorrencia}, "
+        f"latências x{args.escala:g}"
+    )
+    print(formatar(resultados))
+    print(
+        f"Respostas do simulador: {json.dumps(simulador.estatisticas.resumo()['respostas'])}"
+    )
+    client = get_client()
+    concorrencia = client.concorrencia.estatisticas() if client.concorrencia else {}
+    print(f"Repetições: {json.dumps(client.retry.estatisticas())}")
+    for path, limite in concorrencia.items():
+        print(f"Concorrência adaptativa {path}: {json.dumps(limite)}")
+    hedge = client.hedge.estatisticas() if client.hedge else {}
+    for path, dados in hedge.items():
+        print(f"Hedging {path}: {json.dumps(dados)}")
+
+    if args.saida_json:
+        with open(args.saida_json, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "parametros": vars(args),
+                    "resultados": resultados,
+                    "simulador": simulador.estatisticas.resumo(),
+                    "repeticoes": client.retry.estatisticas(),
+                    "concorrencia": concorrencia,
+                    "hedge": hedge,
+                },
+                f,
+                ensure_ascii=False,
+                indent=2,
+                default=str,
+            )
+
+    violacoes = verificar_limites(resultados, max_p95, args.max_taxa_erro)
+    for violacao in violacoes:
+        print(f"LIMITE EXCEDIDO - {violacao}", file=sys.stderr)
+    return 1 if violacoes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Benchmark de memória da ingestão de arquivos (mostqi.arquivos).
+
+Compara o pico de memória alocada (tracemalloc) para decodificar uma selfie
+em data URI base64, ler a frente da CNH do disco e montar o corpo multipart,
+com N casos simultâneos:
+
+- antes: re.sub + base64.b64decode + leitura completa + requests files=
+- depois: abrir_entrada/decodificar_base64 + CorpoMultipart em streaming
+
+Uso:
+
+    python benchmarks/bench_ingestao.py --casos 16 --tamanho-mb 4
+"""
+
+import argparse
+import base64
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "steps"))
+
+from requests.models import RequestEncodingMixin  # noqa: E402
+
+from mostqi.arquivos import CorpoMultipart, abrir_entrada  # noqa: E402
+
+TAMANHO_ENVIO = 64 * 1024
+
+
+def caso_antes(caminho: str, selfie_data_uri: str) -> int:
+    texto = re.sub(r"^data:.*;base64,", "", selfie_data_uri)
+    selfie = base64.b64decode(texto, validate=True)
+    with open(caminho, "rb") as f:
+        frente = f.read()
+    corpo, _ = RequestEncodingMixin._encode_files(
+        {
+            "faceFileA": ("face_a.jpg", frente, "image/jpeg"),
+            "faceFileB": ("face_b.jpg", selfie, "image/jpeg"),
+        },
+        {},
+    )
+    return len(corpo)
+
+
+def caso_depois(caminho: str, selfie_data_uri: str) -> int:
+    corpo = CorpoMultipart(
+        arquivos=[
+            (
+                "faceFileA",
+                "face_a.jpg",
+                abrir_entrada(caminho, aceitar_caminho=True),
+                "image/jpeg",
+            ),
+            ("faceFileB", "face_b.jpg", abrir_entrada(selfie_data_uri), "image/jpeg"),
+        ]
+    )
+    enviado = 0
+    while True:
+        bloco = corpo.read(TAMANHO_ENVIO)  # simula o envio pelo socket
+        if not bloco:
+            return enviado
+        enviado += len(bloco)
+
+
+def medir(funcao, casos: int, caminho: str, selfie: str):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=casos) as executor:
+        tamanhos = list(executor.map(lambda _: funcao(caminho, selfie), range(casos)))
+    duracao = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return pico, duracao, tamanhos[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--casos", type=int, default=16)
+    parser.add_argument("--tamanho-mb", type=float, default=4.0)
+    args = parser.parse_args()
+
+    tamanho = int(args.tamanho_mb * 1024 * 1024)
+    with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as f:
+        f.write(os.urandom(tamanho))
+        caminho = f.name
+    selfie = "data:image/jpeg;base64," + base64.b64encode(os.urandom(tamanho)).decode()
+
+    try:
+        print(f"{args.casos} casos simultâneos, arquivos de {args.tamanho_mb} MB")
+        print(
+            f"{'versão':<8}{'pico MB':>10}{'MB/caso':>10}{'tempo s':>10}{'corpo bytes':>14}"
+        )
+        for nome, funcao in (("antes", caso_antes), ("depois", caso_depois)):
+            pico, duracao, corpo = medir(funcao, args.casos, caminho, selfie)
+            print(
+                f"{nome:<8}{pico / 2**20:>10.1f}{pico / 2**20 / args.casos:>10.2f}"
+                f"{duracao:>10.2f}{corpo:>14,}"
+            )
+    finally:
+        os.unlink(caminho)
+
+
+if __name__ == "__main__":
+    main()
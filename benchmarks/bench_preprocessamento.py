@@ -0,0 +1,130 @@
+"""
+Benchmark do pré-processamento de imagens (mostqi.imagem).
+
+Compara bytes enviados e latência de ponta a ponta (pré-processamento +
+upload) com e sem redução/recompressão. O upload vai para um servidor
+local que simula a banda de subida do usuário.
+
+Uso (requer Pillow):
+
+    python benchmarks/bench_preprocessamento.py --banda-mbps 20 --repeticoes 3
+"""
+
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "steps"))
+
+import requests  # noqa: E402
+
+from mostqi.imagem import PERFIL_DOCUMENTO, PERFIL_FACE, preparar_imagem  # noqa: E402
+
+try:
+    from PIL import Image
+except ImportError:
+    sys.exit("Este benchmark requer Pillow (pip install pillow).")
+
+
+def gerar_foto(largura: int, altura: int, formato: str) -> bytes:
+    """Foto sintética com ruído (comprime como uma foto real) e EXIF de orientação."""
+    base = Image.effect_noise((largura // 4, altura // 4), 64).convert("RGB")
+    base = base.resize((largura, altura), Image.BILINEAR)
+    ruido = Image.effect_noise((largura, altura), 24).convert("RGB")
+    imagem = Image.blend(base, ruido, 0.35)
+    saida = io.BytesIO()
+    if formato == "JPEG":
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotação de 90° aplicada pela câmera
+        imagem.save(saida, format="JPEG", quality=95, exif=exif)
+    else:
+        imagem.save(saida, format=formato)
+    return saida.getvalue()
+
+
+def iniciar_servidor(banda_bps: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            tamanho = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(tamanho)
+            time.sleep(tamanho * 8 / banda_bps)
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def enviar(session: requests.Session, url: str, conteudo: bytes, mime: str) -> int:
+    response = session.post(url, files={"file": ("imagem", conteudo, mime)})
+    response.raise_for_status()
+    return len(conteudo)
+
+
+def medir(session, url, conteudo, perfil, preprocessar, repeticoes):
+    tempos = []
+    enviados = 0
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        if preprocessar:
+            imagem = preparar_imagem(conteudo, perfil)
+            enviados = enviar(session, url, imagem.conteudo, imagem.mime)
+        else:
+            enviados = enviar(session, url, conteudo, "image/jpeg")
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return enviados, statistics.median(tempos)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--banda-mbps", type=float, default=20.0)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    random.seed(0)
+    amostras = [
+        ("CNH frente 12 MP JPEG", gerar_foto(4000, 3000, "JPEG"), PERFIL_DOCUMENTO),
+        ("QR Code 8 MP PNG", gerar_foto(3264, 2448, "PNG"), PERFIL_DOCUMENTO),
+        ("Selfie 12 MP JPEG", gerar_foto(3000, 4000, "JPEG"), PERFIL_FACE),
+    ]
+
+    servidor = iniciar_servidor(args.banda_mbps * 1_000_000)
+    url = f"http://127.0.0.1:{servidor.server_address[1]}/upload"
+    session = requests.Session()
+
+    print(
+        f"Banda simulada: {args.banda_mbps} Mbit/s, mediana de {args.repeticoes} execuções"
+    )
+    print(
+        f"{'amostra':<24}{'bytes antes':>14}{'bytes depois':>14}{'ms antes':>10}{'ms depois':>11}"
+    )
+    for nome, conteudo, perfil in amostras:
+        bytes_antes, ms_antes = medir(
+            session, url, conteudo, perfil, False, args.repeticoes
+        )
+        bytes_depois, ms_depois = medir(
+            session, url, conteudo, perfil, True, args.repeticoes
+        )
+        print(
+            f"{nome:<24}{bytes_antes:>14,}{bytes_depois:>14,}"
+            f"{ms_antes:>10.0f}{ms_depois:>11.0f}"
+        )
+    servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
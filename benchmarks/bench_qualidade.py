@@ -0,0 +1,291 @@
+"""
+Benchmark da verificação local de qualidade (mostqi.qualidade).
+
+Roda `avaliar_qualidade` sobre um conjunto rotulado (fotos boas e fotos que a
+IDP/VIO recusaria) e mostra quantas chamadas pagas seriam evitadas, quantas
+fotos boas seriam recusadas por engano e o tempo da verificação.
+
+Sem `--amostras`, gera um conjunto sintético: documentos nítidos e variações
+desfocadas, escuras, superexpostas, com reflexo e em baixa resolução, além
+de degradações leves que ainda devem passar, documentos sobre fundo branco e
+QR Codes (captura de tela e foto do papel), avaliados com os limites do step
+04. Com `--amostras`, usa um diretório com as subpastas `boas/` e `ruins/`
+(e, opcionalmente, `qrcode/` com QR Codes utilizáveis).
+
+Uso (requer NumPy e Pillow):
+
+    python benchmarks/bench_qualidade.py --por-tipo 40
+    python benchmarks/bench_qualidade.py --amostras /caminho/rotuladas
+"""
+
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "steps"))
+
+from mostqi.qualidade import LimitesQualidade, avaliar_qualidade  # noqa: E402
+
+try:
+    from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
+except ImportError:
+    sys.exit("Este benchmark requer Pillow (pip install pillow).")
+
+EXTENSOES = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+
+
+def gerar_documento(rng: random.Random, largura: int = 1600) -> Image.Image:
+    """Cartão sintético com fundo claro, foto e linhas de texto."""
+    altura = int(largura * 0.63)
+    fundo = tuple(rng.randint(185, 225) for _ in range(3))
+    imagem = Image.new("RGB", (largura, altura), fundo)
+    desenho = ImageDraw.Draw(imagem)
+    # Foto do titular
+    foto = Image.effect_noise((largura // 16, altura // 10), 50).convert("RGB")
+    foto = foto.resize((largura // 4, int(altura * 0.55)), Image.BILINEAR)
+    imagem.paste(foto, (largura // 20, altura // 4))
+    # Linhas de "texto": traços escuros de altura e espaçamento variados
+    y = altura // 5
+    while y < altura * 0.9:
+        x = largura // 3
+        altura_letra = rng.randint(largura // 90, largura // 55)
+        while x < largura * 0.95:
+            largura_letra = rng.randint(altura_letra // 3, altura_letra)
+            desenho.rectangle(
+                (x, y, x + largura_letra, y + altura_letra),
+                fill=tuple(rng.randint(10, 70) for _ in range(3)),
+            )
+            x += largura_letra + rng.randint(2, altura_letra)
+        y += altura_letra * 2 + rng.randint(4, 20)
+    # Ruído de sensor, como em uma foto real
+    ruido = Image.effect_noise(imagem.size, 12).convert("RGB")
+    return Image.blend(imagem, ruido, 0.08)
+
+
+def sobre_fundo_branco(imagem: Image.Image, rng: random.Random) -> Image.Image:
+    """Documento fotografado sobre papel ou mesa branca (fundo estourado)."""
+    margem = rng.uniform(0.15, 0.35)
+    largura = int(imagem.width * (1 + 2 * margem))
+    altura = int(imagem.height * (1 + 2 * margem))
+    fundo = Image.new("RGB", (largura, altura), (255, 255, 255))
+    fundo.paste(imagem, ((largura - imagem.width) // 2, (altura - imagem.height) // 2))
+    return fundo
+
+
+def gerar_qrcode(rng: random.Random, tela: bool) -> Image.Image:
+    """
+    QR Code sintético: módulos aleatórios e os três padrões de posição.
+
+    Com `tela`, uma captura de tela 1080x1920 com fundo branco puro; sem,
+    uma foto do papel (fundo quase branco, levemente desfocada e com ruído).
+    """
+    modulos = rng.choice((25, 33, 41))
+    matriz = [[rng.random() < 0.5 for _ in range(modulos)] for _ in range(modulos)]
+    for y0, x0 in ((0, 0), (0, modulos - 7), (modulos - 7, 0)):
+        for y in range(7):
+            for x in range(7):
+                borda = y in (0, 6) or x in (0, 6)
+                miolo = 2 <= y <= 4 and 2 <= x <= 4
+                matriz[y0 + y][x0 + x] = borda or miolo
+    largura, altura = (1080, 1920) if tela else (rng.randint(1200, 1600),) * 2
+    lado = int(min(largura, altura) * rng.uniform(0.55, 0.8)) // modulos
+    imagem = Image.new("RGB", (largura, altura), (255, 255, 255))
+    desenho = ImageDraw.Draw(imagem)
+    x0, y0 = (largura - lado * modulos) // 2, (altura - lado * modulos) // 2
+    for y, linha in enumerate(matriz):
+        for x, preto in enumerate(linha):
+            if preto:
+                desenho.rectangle(
+                    (
+                        x0 + x * lado,
+                        y0 + y * lado,
+                        x0 + (x + 1) * lado - 1,
+                        y0 + (y + 1) * lado - 1,
+                    ),
+                    fill=(0, 0, 0),
+                )
+    if tela:
+        return imagem
+    imagem = imagem.filter(ImageFilter.GaussianBlur(rng.uniform(0.5, 1.2)))
+    imagem = ImageEnhance.Brightness(imagem).enhance(rng.uniform(0.92, 1.05))
+    ruido = Image.effect_noise(imagem.size, 12).convert("RGB")
+    return Image.blend(imagem, ruido, 0.05)
+
+
+def com_reflexo(imagem: Image.Image, fracao: float, rng: random.Random):
+    resultado = imagem
+    largura, altura = imagem.size
+    area = fracao * largura * altura
+    raio_x = int((area / 3.14159 * 1.6) ** 0.5)
+    raio_y = int(area / 3.14159 / max(raio_x, 1))
+    cx, cy = rng.randint(raio_x, largura - raio_x), rng.randint(0, altura)
+    mascara = Image.new("L", imagem.size, 0)
+    ImageDraw.Draw(mascara).ellipse(
+        (cx - raio_x, cy - raio_y, cx + raio_x, cy + raio_y), fill=255
+    )
+    # Borda suave, como um reflexo de flash ou de lâmpada
+    mascara = mascara.filter(ImageFilter.GaussianBlur(6))
+    branco = Image.new("RGB", imagem.size, (255, 255, 255))
+    return Image.composite(branco, resultado, mascara)
+
+
+def degradar(tipo: str, imagem: Image.Image, rng: random.Random) -> Image.Image:
+    if tipo == "nitida":
+        return imagem
+    # Desfoque proporcional à largura: o mesmo tremido em qualquer resolução
+    escala = imagem.width / 1000
+    if tipo == "desfoque_leve":
+        raio = rng.uniform(0.3, 0.8) * escala
+        return imagem.filter(ImageFilter.GaussianBlur(raio))
+    if tipo == "desfocada":
+        raio = rng.uniform(2.5, 6.0) * escala
+        return imagem.filter(ImageFilter.GaussianBlur(raio))
+    if tipo == "penumbra":
+        return ImageEnhance.Brightness(imagem).enhance(rng.uniform(0.55, 0.8))
+    if tipo == "escura":
+        return ImageEnhance.Brightness(imagem).enhance(rng.uniform(0.1, 0.25))
+    if tipo == "superexposta":
+        return ImageEnhance.Brightness(imagem).enhance(rng.uniform(1.35, 1.6))
+    if tipo == "reflexo_pequeno":
+        return com_reflexo(imagem, rng.uniform(0.005, 0.03), rng)
+    if tipo == "reflexo":
+        return com_reflexo(imagem, rng.uniform(0.12, 0.3), rng)
+    if tipo == "fundo_branco":
+        return sobre_fundo_branco(imagem, rng)
+    if tipo == "fundo_branco_reflexo":
+        return sobre_fundo_branco(com_reflexo(imagem, rng.uniform(0.12, 0.3), rng), rng)
+    if tipo == "baixa_resolucao":
+        return imagem.resize(
+            (rng.randint(320, 520), rng.randint(200, 330)), Image.BILINEAR
+        )
+    raise ValueError(tipo)
+
+
+# Tipo -> a foto é utilizável pela API?
+TIPOS = {
+    "nitida": True,
+    "desfoque_leve": True,
+    "penumbra": True,
+    "reflexo_pequeno": True,
+    "fundo_branco": True,
+    "qrcode_tela": True,
+    "qrcode_papel": True,
+    "desfocada": False,
+    "escura": False,
+    "superexposta": False,
+    "reflexo": False,
+    "fundo_branco_reflexo": False,
+    "baixa_resolucao": False,
+}
+# Tipos avaliados com os limites do step 04 (LimitesQualidade.para_qrcode)
+TIPOS_QRCODE = ("qrcode_tela", "qrcode_papel", "qrcode")
+
+
+def amostras_sinteticas(por_tipo: int, semente: int) -> List[Tuple[str, bool, bytes]]:
+    rng = random.Random(semente)
+    amostras = []
+    for tipo, utilizavel in TIPOS.items():
+        for _ in range(por_tipo):
+            saida = io.BytesIO()
+            if tipo in TIPOS_QRCODE:
+                # Captura de tela chega em PNG; foto do papel, em JPEG
+                tela = tipo == "qrcode_tela"
+                gerar_qrcode(rng, tela).save(
+                    saida, format="PNG" if tela else "JPEG", quality=85
+                )
+            else:
+                documento = gerar_documento(rng, rng.choice((1280, 1600, 2048)))
+                degradar(tipo, documento, rng).save(saida, format="JPEG", quality=85)
+            amostras.append((tipo, utilizavel, saida.getvalue()))
+    return amostras
+
+
+def amostras_do_diretorio(raiz: str) -> List[Tuple[str, bool, bytes]]:
+    amostras = []
+    for pasta, utilizavel in (("boas", True), ("ruins", False), ("qrcode", True)):
+        diretorio = os.path.join(raiz, pasta)
+        if not os.path.isdir(diretorio):
+            continue
+        for nome in sorted(os.listdir(diretorio)):
+            if nome.lower().endswith(EXTENSOES):
+                with open(os.path.join(diretorio, nome), "rb") as f:
+                    amostras.append((pasta, utilizavel, f.read()))
+    return amostras
+
+
+def percentil(valores: List[float], p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--amostras", help="Diretório com as subpastas boas/ e ruins/")
+    parser.add_argument("--por-tipo", type=int, default=40)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument(
+        "--latencia-api-ms",
+        type=float,
+        default=1500.0,
+        help="Tempo de uma chamada à IDP/VIO, para estimar o tempo poupado",
+    )
+    args = parser.parse_args()
+
+    if args.amostras:
+        amostras = amostras_do_diretorio(args.amostras)
+    else:
+        amostras = amostras_sinteticas(args.por_tipo, args.semente)
+    limites = LimitesQualidade.do_ambiente()
+    limites_qrcode = limites.para_qrcode()
+
+    por_tipo: Dict[str, Counter] = defaultdict(Counter)
+    tempos: List[float] = []
+    matriz = Counter()
+    for tipo, utilizavel, conteudo in amostras:
+        avaliacao = avaliar_qualidade(
+            conteudo, limites_qrcode if tipo in TIPOS_QRCODE else limites
+        )
+        tempos.append(avaliacao.duracao_ms)
+        por_tipo[tipo]["recusadas" if not avaliacao.aprovada else "aprovadas"] += 1
+        matriz[(utilizavel, avaliacao.aprovada)] += 1
+
+    print(f"Limites: {limites}")
+    print(f"{'tipo':<18}{'utilizável':>12}{'aprovadas':>11}{'recusadas':>11}")
+    for tipo, contagem in por_tipo.items():
+        utilizavel = TIPOS.get(tipo, tipo != "ruins")
+        print(
+            f"{tipo:<18}{'sim' if utilizavel else 'não':>12}"
+            f"{contagem['aprovadas']:>11}{contagem['recusadas']:>11}"
+        )
+
+    total = len(amostras)
+    ruins = matriz[(False, True)] + matriz[(False, False)]
+    boas = matriz[(True, True)] + matriz[(True, False)]
+    evitadas = matriz[(False, False)]
+    falsas_recusas = matriz[(True, False)]
+    print()
+    print(f"Amostras: {total} ({boas} utilizáveis, {ruins} inutilizáveis)")
+    print(
+        f"Chamadas pagas evitadas: {evitadas} de {total} "
+        f"({evitadas / total:.1%}; {evitadas / max(ruins, 1):.1%} das inutilizáveis)"
+    )
+    print(
+        f"Fotos boas recusadas por engano: {falsas_recusas} "
+        f"({falsas_recusas / max(boas, 1):.1%} das utilizáveis)"
+    )
+    print(f"Fotos ruins que ainda chegariam à API: {matriz[(False, True)]}")
+    print(
+        f"Verificação: p50 {statistics.median(tempos):.1f} ms, "
+        f"p95 {percentil(tempos, 0.95):.1f} ms; tempo de API poupado "
+        f"~{evitadas * args.latencia_api_ms / 1000:.0f} s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+Benchmark do modo em lote da validação final (mostqi.validacao).
+
+Gera casos sintéticos (com variações de caixa, pontuação, acentos, erros de
+OCR e campos ausentes), roda um laço chamando o `main` do step 09 caso a caso e
+compara com `validar_lote` sobre as mesmas colunas, conferindo que os
+scores e as flags de aprovação são idênticos.
+
+Uso:
+
+    python benchmarks/bench_validacao.py --casos 200000 --casos-laco 20000
+"""
+
+import argparse
+import importlib
+import os
+import random
+import sys
+import time
+import unicodedata
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "steps"))
+
+import numpy as np  # noqa: E402
+
+from mostqi.validacao import CHAVES, validar_lote  # noqa: E402
+
+NOMES = ["MARIA", "JOÃO", "ANA", "JOSÉ", "ANTÔNIO", "FRANCISCA", "CARLOS", "LÚCIA"]
+SOBRENOMES = ["SILVA", "SANTOS", "OLIVEIRA", "SOUZA", "PEREIRA", "CONCEIÇÃO", "LIMA"]
+
+
+def nome(rng: random.Random) -> str:
+    partes = [rng.choice(NOMES)] + rng.sample(SOBRENOMES, rng.randint(1, 3))
+    return " ".join(partes)
+
+
+def sem_acentos(valor: str) -> str:
+    decomposto = unicodedata.normalize("NFD", valor)
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def variar(valor: str, rng: random.Random) -> str:
+    """Mesma informação com outra formatação, como vem do OCR ou do QR Code."""
+    sorteio = rng.random()
+    if sorteio < 0.2:
+        return valor.lower()
+    if sorteio < 0.3:
+        return f" {valor} "
+    if sorteio < 0.4:
+        return valor.replace(".", "").replace("-", "").replace("/", "")
+    if sorteio < 0.5:
+        return sem_acentos(valor)
+    if sorteio < 0.55 and len(valor) > 8:
+        # Um caractere trocado pelo OCR
+        posicao = rng.randrange(len(valor))
+        return valor[:posicao] + rng.choice("ABCDEFGHIJ") + valor[posicao + 1 :]
+    return valor
+
+
+def gerar_casos(n: int, semente: int = 42) -> Dict[str, Dict[str, List]]:
+    rng = random.Random(semente)
+    idp: Dict[str, List] = {campo: [] for campo in CHAVES}
+    vio: Dict[str, List] = {campo: [] for campo in CHAVES}
+    for _ in range(n):
+        cpf = "".join(str(rng.randint(0, 9)) for _ in range(11))
+        rg = f"{rng.randint(10, 99)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}-{rng.randint(0, 9)}"
+        dados = {
+            "nome": nome(rng),
+            "cpf": f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}",
+            "nascimento": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1950, 2005)}",
+            "filiacao1": nome(rng),
+            "filiacao2": nome(rng),
+            "rg": rg,
+            "registro": "".join(str(rng.randint(0, 9)) for _ in range(11)),
+            "emissao": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2020",
+            "validade": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2030",
+            "categoria": rng.choice(["A", "B", "AB", "C", "D", "E"]),
+        }
+        for campo, valor in dados.items():
+            idp[campo].append(valor)
+            outro = variar(valor, rng)
+            sorteio = rng.random()
+            if campo == "rg" and sorteio < 0.3:
+                outro = f"{valor} SSP SP"
+            elif sorteio < 0.03:
+                outro = ""  # campo não lido
+            elif sorteio < 0.08:
+                outro = nome(rng) if campo.startswith(("nome", "filiacao")) else "0"
+            vio[campo].append(outro)
+    return {"idp": idp, "vio": vio}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--casos", type=int, default=200_000)
+    parser.add_argument(
+        "--casos-laco",
+        type=int,
+        default=20_000,
+        help="Casos processados no laço sobre o main (a taxa é extrapolada)",
+    )
+    args = parser.parse_args()
+
+    step = importlib.import_module("09_validacao_final")
+    casos = gerar_casos(args.casos)
+    idp, vio = casos["idp"], casos["vio"]
+    rng = np.random.default_rng(7)
+    liveness = rng.uniform(0, 100, args.casos).round(2)
+    facematch = rng.uniform(50, 100, args.casos).round(2)
+    facematch_aprovado = facematch >= 80
+
+    n_laco = min(args.casos_laco, args.casos)
+    inicio = time.perf_counter()
+    saidas = []
+    for i in range(n_laco):
+        argumentos = {}
+        for campo in CHAVES:
+            argumentos[f"{campo}_idp"] = idp[campo][i]
+            argumentos[f"{campo}_vio"] = vio[campo][i]
+        saidas.append(
+            step.main(
+                **argumentos,
+                liveness_score=float(liveness[i]),
+                facematch_score=float(facematch[i]),
+                facematch_aprovado=bool(facematch_aprovado[i]),
+            )
+        )
+    duracao_laco = time.perf_counter() - inicio
+
+    colunas_idp = {campo: np.array(valores) for campo, valores in idp.items()}
+    colunas_vio = {campo: np.array(valores) for campo, valores in vio.items()}
+    inicio = time.perf_counter()
+    resultado = validar_lote(colunas_idp, colunas_vio, liveness, facematch_aprovado)
+    duracao_lote = time.perf_counter() - inicio
+
+    divergencias = 0
+    for i, saida in enumerate(saidas):
+        esperado = resultado.caso(i)
+        for chave in (
+            "score_dados",
+            "aprovado_dados",
+            "aprovado_liveness",
+            "aprovado_facematch",
+        ):
+            if saida[chave] != esperado[chave]:
+                divergencias += 1
+                break
+
+    taxa_laco = n_laco / duracao_laco
+    taxa_lote = args.casos / duracao_lote
+    print(f"{'modo':<24}{'casos':>10}{'tempo s':>10}{'casos/s':>14}")
+    print(
+        f"{'laço sobre main()':<24}{n_laco:>10}{duracao_laco:>10.2f}{taxa_laco:>14,.0f}"
+    )
+    print(
+        f"{'validar_lote()':<24}{args.casos:>10}{duracao_lote:>10.2f}{taxa_lote:>14,.0f}"
+    )
+    print(f"Ganho: {taxa_lote / taxa_laco:.1f}x")
+    print(
+        f"Aprovados (dados): {int(resultado.aprovado_dados.sum())} de {len(resultado)}; "
+        f"divergências em relação ao main: {divergencias} de {n_laco}"
+    )
+    return 1 if divergencias else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,8 @@
 import * as wmill from "windmill-client";
 
+// Prazo de ponta a ponta do caso (segundos), repassado aos steps como prazo_caso
+const PRAZO_CASO_SEGUNDOS = 30 * 60;
+
 export async function main() {
   const urls = await wmill.getResumeUrls();
 
@@ -14,6 +17,8 @@ export async function main() {
       "Para iniciar o processo, clique em Resume.\n" +
       "Para cancelar, clique em Cancel.",
     resume: urls.resume,
-    cancel: urls.cancel
+    cancel: urls.cancel,
+    // Instante limite (segundos desde a época), usado nos timeouts das chamadas
+    prazo_caso: Date.now() / 1000 + PRAZO_CASO_SEGUNDOS
   };
 }
@@ -0,0 +1,78 @@
+# pip: requests
+# wm-input: client_key:str, cnh_image_file:file, qr_image_file:file
+# wm-input: prazo_caso:float
+
+import contextvars
+import importlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from mostqi.tracing import rastrear_step
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Os nomes dos steps começam com dígitos, então são importados pelo nome do módulo
+step_idp = importlib.import_module("02_processar_cnh_frente_idp")
+step_vio = importlib.import_module("04_processa_cnh_qrcode_vio")
+
+
+@rastrear_step("02_04_extracao")
+def main(
+    client_key: str,
+    cnh_image_file: bytes,
+    qr_image_file: bytes,
+    prazo_caso: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Extrai os dados da frente da CNH (IDP) e do QR Code (VIO) em paralelo.
+
+    As duas chamadas não dependem uma da outra, então o tempo total fica
+    próximo ao da chamada mais lenta em vez da soma das duas.
+
+    Args:
+        client_key (str): Chave fornecida pela mostQI para gerar o token JWT.
+        cnh_image_file: Imagem da frente da CNH.
+        qr_image_file: Imagem do verso da CNH com o QR Code.
+        prazo_caso (float, opcional): Limite do caso (segundos desde a época),
+            repassado às duas extrações pelo contexto.
+
+    Returns:
+        dict: Status consolidado e os resultados dos steps 02 ("idp") e 04 ("vio").
+    """
+    if not client_key:
+        return {
+            "status": "erro",
+            "mensagem": "Chave do cliente não fornecida",
+            "idp": None,
+            "vio": None,
+        }
+
+    logger.info("Iniciando extração concorrente da frente (IDP) e do QR Code (VIO)...")
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="extracao") as executor:
+        # Cada thread recebe uma cópia do contexto (case ID e span do step)
+        futuro_idp = executor.submit(
+            contextvars.copy_context().run, step_idp.main, client_key, cnh_image_file
+        )
+        futuro_vio = executor.submit(
+            contextvars.copy_context().run, step_vio.main, client_key, qr_image_file
+        )
+        resultado_idp = futuro_idp.result()
+        resultado_vio = futuro_vio.result()
+
+    status = {resultado_idp.get("status"), resultado_vio.get("status")}
+    if "erro" in status:
+        status_final, mensagem = "erro", "Falha em pelo menos uma das extrações"
+    elif "aviso" in status:
+        status_final, mensagem = "aviso", "Extração concluída com avisos"
+    else:
+        status_final, mensagem = "sucesso", "Frente e QR Code extraídos com sucesso"
+
+    return {
+        "status": status_final,
+        "mensagem": mensagem,
+        "idp": resultado_idp,
+        "vio": resultado_vio,
+    }
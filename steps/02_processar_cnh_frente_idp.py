@@ -1,71 +1,34 @@
 # pip: requests
 # wm-input: client_key:str, cnh_image_file:file
+# wm-input: perfil:str
+# wm-input: prazo_caso:float
 
 import requests
 import logging
-from typing import Dict, Any, Optional, Union
+from typing import Dict, Any, Optional
 from dataclasses import dataclass, asdict
 
-# Configurações
-TIMEOUT_SECONDS = 30
-EXTRACTION_URL = "https://mostqiapi.com/process-image/content-extraction"
-AUTH_URL = "https://mostqiapi.com/user/authenticate"
-HEADERS = {
-    "Content-Type": "application/json",
-    "User-Agent": "CNH-Validation-Workflow/1.0",
-}
+from mostqi import (
+    AuthError,
+    abrir_entrada,
+    get_client,
+    get_result_cache,
+    hash_conteudo,
+    preparar_imagem,
+)
+from mostqi.blobs import eh_referencia, get_armazem_blobs, guardar_imagem, reter_blob
+from mostqi.client import PERFIL_EXTRACAO_PADRAO, PERFIS_EXTRACAO
+from mostqi.idp import RespostaIDP, TrechoBase64
+from mostqi.imagem import PERFIL_DOCUMENTO
+from mostqi.qualidade import recusar_se_inutilizavel
+from mostqi.reuso import registrar_documento
+from mostqi.tracing import rastrear_step
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def get_jwt_token(client_key: str) -> Dict[str, str]:
-    """
-    Autentica na API mostQI usando a chave do cliente.
-
-    Args:
-        client_key (str): Chave fornecida pela mostQI para gerar o token JWT.
-
-    Returns:
-        dict: Resultado da autenticação com status, mensagem e o token (se bem-sucedido).
-    """
-    try:
-        logger.info("Autenticando na API mostQI...")
-        payload = {"token": client_key}
-        response = requests.post(AUTH_URL, json=payload, headers=HEADERS, timeout=10)
-        if response.status_code != 200:
-            logger.error(f"Erro na resposta: {response.status_code} - {response.text}")
-            return {
-                "status": "erro",
-                "mensagem": f"A API retornou status {response.status_code}: {response.text}",
-            }
-        data = response.json()
-        if not isinstance(data, dict):
-            return {
-                "status": "erro",
-                "mensagem": "Formato inválido na resposta da API.",
-            }
-        jwt_token = data.get("token")
-        if not jwt_token:
-            return {
-                "status": "erro",
-                "mensagem": "O token não foi encontrado na resposta da API.",
-            }
-        logger.info("Token JWT recebido e validado com sucesso.")
-        return {
-            "status": "sucesso",
-            "mensagem": "Token JWT obtido com sucesso.",
-            "token": jwt_token,
-        }
-    except Exception as e:
-        logger.exception("Erro inesperado na autenticação.")
-        return {
-            "status": "erro",
-            "mensagem": f"Erro inesperado ao obter o token: {str(e)}",
-        }
-
-
-@dataclass
+@dataclass(slots=True)
 class CNHData:
     """Estrutura para dados extraídos da CNH"""
 
@@ -83,15 +46,9 @@ class CNHData:
     score: Optional[float] = None
 
     @classmethod
-    def from_api_response(cls, api_data: Dict[str, Any]) -> "CNHData":
+    def from_api_response(cls, api_data: RespostaIDP) -> "CNHData":
         """Cria instância a partir da resposta da API"""
-        if not api_data.get("result") or not api_data["result"]:
-            return cls()
-
-        fields = api_data["result"][0].get("fields", [])
-        field_dict = {
-            field["name"]: field["value"] for field in fields if field["value"]
-        }
+        field_dict = api_data.valores()
 
         return cls(
             nome=field_dict.get("nome"),
@@ -105,10 +62,26 @@ class CNHData:
             registro=field_dict.get("registro"),
             filiacao_1=field_dict.get("filiacao_1"),
             filiacao_2=field_dict.get("filiacao_2"),
-            score=api_data["result"][0].get("score"),
+            score=api_data.score,
         )
 
 
+def guardar_trecho(trecho: Optional[TrechoBase64]) -> Optional[str]:
+    """
+    Imagem da resposta da IDP como referência de blob ou, sem armazém, base64.
+
+    Com o armazém, o base64 é decodificado direto do corpo da resposta, sem
+    passar por uma str do tamanho da imagem.
+    """
+    if trecho is None:
+        return None
+    if get_armazem_blobs() is not None:
+        ref = guardar_imagem(trecho.conteudo())
+        if eh_referencia(ref):
+            return ref
+    return trecho.texto()
+
+
 def format_cnh_output(cnh_data: CNHData) -> Dict[str, Any]:
     """
     Formata dados da CNH para saída estruturada
@@ -143,73 +116,68 @@ def format_cnh_output(cnh_data: CNHData) -> Dict[str, Any]:
     }
 
 
-def extract_file_content(file_input: Union[str, bytes, Any]) -> bytes:
+def erro_http(response: requests.Response) -> Dict[str, Any]:
     """
-    Extrai conteúdo binário do arquivo independente do tipo
+    Converte uma resposta de erro da API em saída do step
 
     Args:
-        file_input: Arquivo de entrada (pode ser string base64, bytes, file-like object ou caminho)
+        response: Resposta HTTP com status diferente de 2xx
 
     Returns:
-        bytes: Conteúdo binário do arquivo
+        Dict com status "erro" e mensagem adequada ao código HTTP
     """
-    import base64
-    import re
+    logger.info(f"Status da resposta: {response.status_code}")
 
-    try:
-        # Se já for bytes
-        if isinstance(file_input, bytes):
-            return file_input
-
-        # Se for string
-        if isinstance(file_input, str):
-            # Detecta e remove prefixo base64 se existir
-            if file_input.strip().startswith("data:"):
-                file_input = re.sub(r"^data:.*;base64,", "", file_input)
-            try:
-                # Tenta decodificar como base64
-                return base64.b64decode(file_input, validate=True)
-            except Exception:
-                # Se não for base64, tenta abrir como caminho de arquivo
-                try:
-                    with open(file_input, "rb") as f:
-                        return f.read()
-                except Exception:
-                    raise ValueError(
-                        "String não é base64 nem caminho de arquivo válido."
-                    )
-
-        # Se tiver método read (file-like object)
-        if hasattr(file_input, "read"):
-            content = file_input.read()
-            if isinstance(content, str):
-                return content.encode("utf-8")
-            return content
-
-        # Se tiver atributo content (alguns objetos Windmill)
-        if hasattr(file_input, "content"):
-            content = file_input.content
-            if isinstance(content, str):
-                if content.strip().startswith("data:"):
-                    content = re.sub(r"^data:.*;base64,", "", content)
-                return base64.b64decode(content)
-            return content
-
-        # Tenta converter para bytes
-        return str(file_input).encode("utf-8")
+    if response.status_code == 401:
+        logger.error("Token JWT inválido ou expirado")
+        return {
+            "status": "erro",
+            "mensagem": "Token JWT inválido ou expirado",
+            "dados": None,
+        }
 
-    except Exception as e:
-        logger.error(f"Erro ao extrair conteúdo do arquivo: {e}")
-        raise ValueError(f"Não foi possível extrair conteúdo do arquivo: {e}")
+    if response.status_code == 400:
+        logger.error(f"Erro na requisição: {response.text}")
+        return {
+            "status": "erro",
+            "mensagem": f"Erro na imagem ou formato: {response.text}",
+            "dados": None,
+        }
+
+    logger.error(f"Erro HTTP {response.status_code}: {response.text}")
+    return {
+        "status": "erro",
+        "mensagem": f"Erro da API: {response.status_code} - {response.text}",
+        "dados": None,
+    }
 
 
-def main(client_key: str, cnh_image_file: bytes) -> Dict[str, Any]:
+@rastrear_step("02_idp")
+def main(
+    client_key: str,
+    cnh_image_file: bytes,
+    perfil: Optional[str] = None,
+    prazo_caso: Optional[float] = None,
+) -> Dict[str, Any]:
     """
-    Gera o token JWT e extrai dados da CNH usando a API mostQI.
+    Extrai dados da CNH usando a API mostQI (o token JWT vem do cache compartilhado).
+
+    O resultado fica em cache pelo SHA-256 da imagem; um reenvio da mesma foto
+    não gera nova chamada à API, desde que o cache tenha as imagens pedidas
+    pelo perfil (um resultado extraído com "campos" não serve para "face").
+    "face_recortada" traz o recorte da foto do titular para o step 08. Com
+    MOSTQI_BLOBS_DIR definido, as duas imagens saem como referência de blob
+    ("blob:sha256:...") em vez de base64, e só essas referências vão para o
+    cache; sem o armazém, as imagens não são guardadas em cache.
 
     Args:
         client_key (str): Chave fornecida pela mostQI para gerar o token JWT.
         cnh_image_file: Arquivo de imagem da CNH (qualquer formato suportado pelo Windmill)
+        perfil (str, opcional): O que pedir à IDP além dos campos: "completo"
+            (imagem corrigida e recortes), "face" (só os recortes) ou "campos"
+            (nenhuma imagem). Padrão: MOSTQI_PERFIL_EXTRACAO ou "completo".
+        prazo_caso (float, opcional): Limite do caso (segundos desde a época);
+            os timeouts das chamadas não passam dele (mostqi.prazo).
 
     Returns:
         dict: Resultado da extração com dados formatados
@@ -232,19 +200,18 @@ def main(client_key: str, cnh_image_file: bytes) -> Dict[str, Any]:
                 "dados": None,
             }
 
-        # Gerar token JWT
-        token_result = get_jwt_token(client_key)
-        if token_result.get("status") != "sucesso" or not token_result.get("token"):
+        perfil = perfil or PERFIL_EXTRACAO_PADRAO
+        if perfil not in PERFIS_EXTRACAO:
             return {
                 "status": "erro",
-                "mensagem": f"Falha ao obter token JWT: {token_result.get('mensagem')}",
+                "mensagem": f"Perfil de extração inválido: {perfil} "
+                f"(use {', '.join(PERFIS_EXTRACAO)})",
                 "dados": None,
             }
-        jwt_token = token_result["token"]
 
         # Extrair conteúdo do arquivo
         try:
-            file_content = extract_file_content(cnh_image_file)
+            file_content = abrir_entrada(cnh_image_file, aceitar_caminho=True)
             logger.info(f"Arquivo lido com sucesso. Tamanho: {len(file_content)} bytes")
         except Exception as e:
             return {
@@ -253,107 +220,129 @@ def main(client_key: str, cnh_image_file: bytes) -> Dict[str, Any]:
                 "dados": None,
             }
 
-        # Preparar requisição
-        headers = {
-            "accept": "application/json",
-            "Authorization": f"Bearer {jwt_token}",
-        }
-
-        files = {
-            "file": ("cnh_image.jpg", file_content, "image/jpeg"),
-            "returnImage": "true",
-            "returnCrops": "true",
-            "tags": [
-                "id=bra-cnh-3",
-                "language=pt-BR",
-                "type=documento-pessoal",
-            ],
-        }
+        # Reenvios da mesma imagem reaproveitam o resultado já extraído
+        result_cache = get_result_cache()
+        image_hash = hash_conteudo(file_content)
+        cached_data = result_cache.get("idp", image_hash)
+        requisitos = PERFIS_EXTRACAO[perfil]
+        imagens = result_cache.get("idp_imagens", image_hash) or {}
+        pedidas = [
+            chave
+            for chave, pedida in (
+                ("face", requisitos["return_crops"]),
+                ("imagem_corrigida", requisitos["return_image"]),
+            )
+            if pedida
+        ]
+        # Um resultado extraído com um perfil mais enxuto não traz as imagens
+        # pedidas, e o blob de uma referência em cache pode já ter sido apagado
+        if any(
+            chave not in imagens
+            or (imagens[chave] is not None and not reter_blob(imagens[chave]))
+            for chave in pedidas
+        ):
+            cached_data = None
+        deskewed_image_base64 = (
+            imagens.get("imagem_corrigida") if requisitos["return_image"] else None
+        )
+        face_base64 = imagens.get("face") if requisitos["return_crops"] else None
 
-        logger.info("Enviando imagem para API mostQI...")
+        if cached_data is not None:
+            logger.info("Resultado da extração encontrado em cache.")
+            cnh_data = CNHData(**cached_data)
+        else:
+            # Foto desfocada, escura, com reflexo ou pequena: recusa sem chamar a API
+            recusa = recusar_se_inutilizavel(file_content)
+            if recusa is not None:
+                return recusa
 
-        # Fazer requisição
-        response = requests.post(
-            EXTRACTION_URL, files=files, headers=headers, timeout=TIMEOUT_SECONDS
-        )
+            logger.info("Enviando imagem para API mostQI...")
 
-        logger.info(f"Status da resposta: {response.status_code}")
+            # Fazer requisição
+            try:
+                imagem = preparar_imagem(file_content, PERFIL_DOCUMENTO)
+                api_data = get_client().content_extraction(
+                    client_key,
+                    imagem.conteudo,
+                    filename=imagem.nome_arquivo("cnh_image"),
+                    content_type=imagem.mime,
+                    **PERFIS_EXTRACAO[perfil],
+                )
+            except AuthError as e:
+                return {
+                    "status": "erro",
+                    "mensagem": f"Falha ao obter token JWT: {str(e)}",
+                    "dados": None,
+                }
+            except requests.exceptions.HTTPError as e:
+                return erro_http(e.response)
 
-        # Processar resposta
-        if response.status_code == 200:
-            api_data = response.json()
             logger.info("Resposta recebida com sucesso")
-            print("### DEBUG API DATA ###")
-            print(api_data)
+            logger.debug(f"Resposta da API: {api_data}")
 
             # Verifica se veio imagem corrigida
-            deskewed_image_base64 = None
-            try:
-                deskewed_image_base64 = api_data["result"][0].get("image")
-                if deskewed_image_base64:
+            if requisitos["return_image"]:
+                if api_data.imagem is not None:
                     logger.info("Imagem deskewed capturada com sucesso.")
                 else:
                     logger.warning("A imagem deskewed veio como null.")
-            except Exception as e:
-                logger.error(f"Erro ao tentar acessar imagem deskewed: {e}")
+                deskewed_image_base64 = guardar_trecho(api_data.imagem)
+                imagens["imagem_corrigida"] = deskewed_image_base64
+            # Recorte da face, usado pelo step 08 no lugar da imagem inteira
+            if requisitos["return_crops"]:
+                face_base64 = guardar_trecho(api_data.recorte_face())
+                imagens["face"] = face_base64
+            # Só referências de blob (ou a ausência da imagem) vão para o
+            # cache: o base64 ocuparia MBs por caso em memória e em disco
+            imagens = {
+                chave: valor
+                for chave, valor in imagens.items()
+                if valor is None or eh_referencia(valor)
+            }
+            if imagens:
+                result_cache.set("idp_imagens", image_hash, imagens)
+
             # Extrair dados
             cnh_data = CNHData.from_api_response(api_data)
+            result_cache.set("idp", image_hash, asdict(cnh_data))
 
-            # Verificar se dados foram extraídos
-            if not cnh_data.nome and not cnh_data.cpf:
-                return {
-                    "status": "aviso",
-                    "mensagem": "Nenhum dado foi extraído da imagem",
-                    "dados": None,
-                    "score": cnh_data.score,
-                }
-
-            # Formatar dados
-            formatted_data = format_cnh_output(cnh_data)
-
-            # Contar campos extraídos
-            fields_extracted = sum(
-                1 for field in asdict(cnh_data).values() if field is not None
-            )
-
-            logger.info(f"Extração concluída. Campos extraídos: {fields_extracted}")
-
-            return {
-                "status": "sucesso",
-                "mensagem": "Dados extraídos com sucesso",
-                "dados": formatted_data,
-                "imagem_corrigida": deskewed_image_base64,
-                "metadata": {
-                    "score": cnh_data.score,
-                    "campos_extraidos": fields_extracted,
-                    "metodo_extracao": "mostQI_Content_API",
-                    "qualidade": formatted_data["qualidade"]["status"],
-                },
-            }
-
-        elif response.status_code == 401:
-            logger.error("Token JWT inválido ou expirado")
+        # Verificar se dados foram extraídos
+        if not cnh_data.nome and not cnh_data.cpf:
             return {
-                "status": "erro",
-                "mensagem": "Token JWT inválido ou expirado",
+                "status": "aviso",
+                "mensagem": "Nenhum dado foi extraído da imagem",
                 "dados": None,
+                "score": cnh_data.score,
             }
 
-        elif response.status_code == 400:
-            logger.error(f"Erro na requisição: {response.text}")
-            return {
-                "status": "erro",
-                "mensagem": f"Erro na imagem ou formato: {response.text}",
-                "dados": None,
-            }
+        # Mesmo CPF/registro já usado em outro caso (MOSTQI_INDICE_DOCUMENTOS)
+        reuso = registrar_documento("idp", asdict(cnh_data), image_hash)
 
-        else:
-            logger.error(f"Erro HTTP {response.status_code}: {response.text}")
-            return {
-                "status": "erro",
-                "mensagem": f"Erro da API: {response.status_code} - {response.text}",
-                "dados": None,
-            }
+        # Formatar dados
+        formatted_data = format_cnh_output(cnh_data)
+
+        # Contar campos extraídos
+        fields_extracted = sum(
+            1 for field in asdict(cnh_data).values() if field is not None
+        )
+
+        logger.info(f"Extração concluída. Campos extraídos: {fields_extracted}")
+
+        return {
+            "status": "sucesso",
+            "mensagem": "Dados extraídos com sucesso",
+            "dados": formatted_data,
+            "imagem_corrigida": deskewed_image_base64,
+            "face_recortada": face_base64,
+            "metadata": {
+                "score": cnh_data.score,
+                "campos_extraidos": fields_extracted,
+                "metodo_extracao": "mostQI_Content_API",
+                "qualidade": formatted_data["qualidade"]["status"],
+                "cache": cached_data is not None,
+                "reuso": reuso,
+            },
+        }
 
     except requests.exceptions.Timeout:
         logger.error("Timeout na requisição")
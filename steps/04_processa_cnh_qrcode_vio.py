@@ -1,40 +1,30 @@
 # pip: requests
 # wm-input: client_key:str, qr_image_file:file
+# wm-input: prazo_caso:float
 
 import requests
 import logging
 from typing import Any, Dict, Optional, List
 from dataclasses import dataclass, asdict
 
-# Configs
-TIMEOUT_SECONDS = 30
-VIO_URL = "https://mostqiapi.com/process-image/vio-extraction"
-AUTH_URL = "https://mostqiapi.com/user/authenticate"
-HEADERS = {
-    "Content-Type": "application/json",
-    "User-Agent": "CNH-Validation-Workflow/1.0",
-}
+from mostqi import (
+    AuthError,
+    abrir_entrada,
+    get_client,
+    get_result_cache,
+    hash_conteudo,
+    preparar_imagem,
+)
+from mostqi.imagem import PERFIL_DOCUMENTO
+from mostqi.qualidade import LimitesQualidade, recusar_se_inutilizavel
+from mostqi.reuso import registrar_documento
+from mostqi.tracing import rastrear_step
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def get_jwt_token(client_key: str) -> Optional[str]:
-    try:
-        logger.info("Autenticando na API mostQI...")
-        response = requests.post(
-            AUTH_URL, json={"token": client_key}, headers=HEADERS, timeout=10
-        )
-        if response.status_code != 200:
-            logger.error(f"Erro: {response.status_code} - {response.text}")
-            return None
-        return response.json().get("token")
-    except Exception as e:
-        logger.exception("Erro ao obter token JWT.")
-        return None
-
-
-@dataclass
+@dataclass(slots=True)
 class VIOData:
     nome: Optional[str] = None
     cpf: Optional[str] = None
@@ -113,7 +103,10 @@ def format_vio_output(vio_data: VIOData) -> Dict[str, Any]:
     }
 
 
-def main(client_key: str, qr_image_file: bytes) -> Dict[str, Any]:
+@rastrear_step("04_vio")
+def main(
+    client_key: str, qr_image_file: bytes, prazo_caso: Optional[float] = None
+) -> Dict[str, Any]:
     if not client_key:
         return {"status": "erro", "mensagem": "Chave do cliente ausente", "dados": None}
     if not qr_image_file:
@@ -123,46 +116,77 @@ def main(client_key: str, qr_image_file: bytes) -> Dict[str, Any]:
             "dados": None,
         }
 
-    jwt_token = get_jwt_token(client_key)
-    if not jwt_token:
-        return {"status": "erro", "mensagem": "Falha ao obter token JWT", "dados": None}
+    try:
+        file_content = abrir_entrada(qr_image_file, aceitar_caminho=True)
+    except ValueError as e:
+        return {
+            "status": "erro",
+            "mensagem": f"Erro ao ler arquivo de imagem: {str(e)}",
+            "dados": None,
+        }
 
-    headers = {"Authorization": f"Bearer {jwt_token}"}
-    files = {"file": ("qr_image.jpg", qr_image_file, "image/jpeg")}
+    # Reenvios da mesma imagem reaproveitam o resultado já extraído
+    result_cache = get_result_cache()
+    image_hash = hash_conteudo(file_content)
 
     try:
-        response = requests.post(
-            VIO_URL, files=files, headers=headers, timeout=TIMEOUT_SECONDS
-        )
-
-        if response.status_code == 200:
-            api_data = response.json()
+        cached_data = result_cache.get("vio", image_hash)
+        if cached_data is not None:
+            logger.info("Resultado da extração VIO encontrado em cache.")
+            vio_data = VIOData(**cached_data)
+        else:
+            # Foto desfocada, escura ou pequena: recusa sem chamar a API. Sem
+            # limite de reflexo e de superexposição: o QR Code é quase todo branco
+            recusa = recusar_se_inutilizavel(
+                file_content, LimitesQualidade.do_ambiente().para_qrcode()
+            )
+            if recusa is not None:
+                return recusa
+            imagem = preparar_imagem(file_content, PERFIL_DOCUMENTO)
+            api_data = get_client().vio_extraction(
+                client_key,
+                imagem.conteudo,
+                filename=imagem.nome_arquivo("qr_image"),
+                content_type=imagem.mime,
+            )
             vio_data = VIOData.from_api_response(api_data)
+            result_cache.set("vio", image_hash, asdict(vio_data))
 
-            if not vio_data.cpf and not vio_data.nome:
-                return {
-                    "status": "aviso",
-                    "mensagem": "Nenhum dado relevante extraído da imagem",
-                    "dados": None,
-                    "metadata": {
-                        "tags": vio_data.tags,
-                        "pagina": vio_data.page_number,
-                        "metodo": "mostQI_VIO_API",
-                    },
-                }
-
+        if not vio_data.cpf and not vio_data.nome:
             return {
-                "status": "sucesso",
-                "mensagem": "QR code extraído com sucesso",
-                "dados": format_vio_output(vio_data),
+                "status": "aviso",
+                "mensagem": "Nenhum dado relevante extraído da imagem",
+                "dados": None,
                 "metadata": {
                     "tags": vio_data.tags,
                     "pagina": vio_data.page_number,
                     "metodo": "mostQI_VIO_API",
+                    "cache": cached_data is not None,
                 },
             }
 
-        elif response.status_code == 401:
+        # Mesmo CPF/registro/RENACH já usado em outro caso (MOSTQI_INDICE_DOCUMENTOS)
+        reuso = registrar_documento("vio", asdict(vio_data), image_hash)
+
+        return {
+            "status": "sucesso",
+            "mensagem": "QR code extraído com sucesso",
+            "dados": format_vio_output(vio_data),
+            "metadata": {
+                "tags": vio_data.tags,
+                "pagina": vio_data.page_number,
+                "metodo": "mostQI_VIO_API",
+                "cache": cached_data is not None,
+                "reuso": reuso,
+            },
+        }
+
+    except AuthError:
+        logger.exception("Erro ao obter token JWT.")
+        return {"status": "erro", "mensagem": "Falha ao obter token JWT", "dados": None}
+    except requests.exceptions.HTTPError as e:
+        response = e.response
+        if response.status_code == 401:
             return {
                 "status": "erro",
                 "mensagem": "Token JWT inválido ou expirado",
@@ -180,7 +204,6 @@ def main(client_key: str, qr_image_file: bytes) -> Dict[str, Any]:
                 "mensagem": f"Erro HTTP {response.status_code}: {response.text}",
                 "dados": None,
             }
-
     except requests.exceptions.Timeout:
         return {"status": "erro", "mensagem": "Timeout na requisição", "dados": None}
     except Exception as e:
@@ -1,32 +1,26 @@
 # wm-input: client_key:str
+# wm-input: prazo_caso:float
 
-import requests
+import os
+from typing import Optional
 
+from mostqi import get_client
+from mostqi.liveness import VALIDADE_SESSAO_SEGUNDOS
+from mostqi.tracing import rastrear_step
 
-def authenticate(client_key: str) -> str:
-    """Autentica e retorna o token JWT"""
-    url = "https://mostqiapi.com/user/authenticate"
-    headers = {"Content-Type": "application/json"}
-    payload = {"token": client_key}
+# Destino do webhook de conclusão. Apontado para o receptor de mostqi.webhook,
+# com MOSTQI_WEBHOOK_DB compartilhado com os workers, o step 07 (e o lote)
+# termina assim que o webhook chega, sem esperar a próxima consulta de status
+WEBHOOK_URL = os.getenv(
+    "MOSTQI_WEBHOOK_URL",
+    "https://app.windmill.dev/api/w/desafio-mostqi-josecarlos/jobs/run/p/u/josecarlos/liveness_start",
+)
 
-    response = requests.post(url, headers=headers, json=payload)
-    response.raise_for_status()
 
-    return response.json().get("token")
-
-
-def gerar_link_liveness(jwt_token: str) -> dict:
+def gerar_link_liveness(client_key: str) -> dict:
     """Chama a rota de liveness/streaming com personalizações"""
-    url = "https://mostqiapi.com/liveness/streaming/async"
-    headers = {
-        "Authorization": f"Bearer {jwt_token}",
-        "Content-Type": "application/json",
-    }
-
     payload = {
-        "webhook": {
-            "url": "https://app.windmill.dev/api/w/desafio-mostqi-josecarlos/jobs/run/p/u/josecarlos/liveness_start"
-        },
+        "webhook": {"url": WEBHOOK_URL},
         "uiCustomization": {
             "defaultLanguage": "pt-BR",
             "theme": "dark",
@@ -54,16 +48,14 @@ def gerar_link_liveness(jwt_token: str) -> dict:
         "redirectUrl": "https://most.com.br/",
     }
 
-    response = requests.post(url, headers=headers, json=payload)
-    response.raise_for_status()
-
-    return response.json()
+    return get_client().liveness_start(client_key, payload)
 
 
-def main(client_key: str):
+# Na retomada do caso a sessão já criada é reaproveitada enquanto for válida
+@rastrear_step("05_liveness", validade_diario=VALIDADE_SESSAO_SEGUNDOS)
+def main(client_key: str, prazo_caso: Optional[float] = None):
     try:
-        token = authenticate(client_key)
-        resultado = gerar_link_liveness(token)
+        resultado = gerar_link_liveness(client_key)
 
         session_url = resultado.get("result", {}).get("sessionUrl")
         process_id = resultado.get("result", {}).get("processId")
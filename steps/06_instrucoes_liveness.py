@@ -1,16 +1,52 @@
 # wm-input: session_url:str
+# wm-input: prazo_caso:float
+
+import logging
+from typing import Optional
 
 import requests
 
+from mostqi.encurtador import get_encurtador
+from mostqi.liveness import VALIDADE_SESSAO_SEGUNDOS
+from mostqi.prazo import limitar_timeout
+from mostqi.tracing import rastrear_step, span
+
+# Sem MOSTQI_ENCURTADOR_URL o TinyURL continua em uso, mas com prazo curto
+TIMEOUT_TINYURL_SEGUNDOS = 3
+
+logger = logging.getLogger(__name__)
+
 
 def encurtar_link(session_url: str) -> str:
-    """Encurta o link da sessão usando o TinyURL"""
-    response = requests.get(f"https://tinyurl.com/api-create.php?url={session_url}")
-    response.raise_for_status()
+    """
+    Encurta o link da sessão com o encurtador próprio (mostqi.encurtador) ou,
+    se ele não estiver configurado (URL e banco), com o TinyURL. Se o TinyURL falhar, o
+    link original é devolvido para não bloquear a prova de vida.
+    """
+    encurtador = get_encurtador()
+    if encurtador is not None:
+        return encurtador.encurtar(session_url)
+
+    try:
+        with span("http.get", endpoint="tinyurl.com/api-create.php") as s:
+            response = requests.get(
+                "https://tinyurl.com/api-create.php",
+                params={"url": session_url},
+                timeout=limitar_timeout(TIMEOUT_TINYURL_SEGUNDOS),
+            )
+            s.set(
+                http_status=response.status_code,
+                bytes_recebidos=len(response.content),
+            )
+            response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"TinyURL indisponível, usando o link original: {e}")
+        return session_url
     return response.text
 
 
-def main(session_url: str):
+@rastrear_step("06_instrucoes", validade_diario=VALIDADE_SESSAO_SEGUNDOS)
+def main(session_url: str, prazo_caso: Optional[float] = None):
     try:
         short_link = encurtar_link(session_url)
 
@@ -1,30 +1,29 @@
-import requests
+# wm-input: client_key:str, process_id:str, prazo_segundos:float
+# wm-input: prazo_caso:float
+
+from typing import Optional
 
+import requests
 
-def authenticate(client_key: str) -> str:
-    """Autentica e retorna o token JWT"""
-    url = "https://mostqiapi.com/user/authenticate"
-    headers = {"Content-Type": "application/json"}
-    payload = {"token": client_key}
-    response = requests.post(url, headers=headers, json=payload)
-    response.raise_for_status()
-    return response.json().get("token")
+from mostqi import AuthError, get_client
+from mostqi.blobs import guardar_imagem
+from mostqi.liveness import PRAZO_PADRAO_SEGUNDOS, aguardar_liveness
+from mostqi.tracing import rastrear_step
 
 
-def consultar_status(jwt_token: str, process_id: str) -> dict:
+def consultar_status(client_key: str, process_id: str) -> dict:
     """Consulta o status da prova de vida"""
-    url = "https://mostqiapi.com/liveness/streaming/async/status"
-    headers = {
-        "Authorization": f"Bearer {jwt_token}",
-        "Content-Type": "application/json",
-    }
-    payload = {"processId": process_id}
-    response = requests.post(url, headers=headers, json=payload)
-    response.raise_for_status()
-    return response.json()
-
-
-def main(client_key: str, process_id: str):
+    return get_client().liveness_status(client_key, process_id)
+
+
+# O status muda a cada consulta: não entra no diário de casos
+@rastrear_step("07_status", diario=False)
+def main(
+    client_key: str,
+    process_id: str,
+    prazo_segundos: float = PRAZO_PADRAO_SEGUNDOS,
+    prazo_caso: Optional[float] = None,
+):
     try:
         if not client_key or not process_id:
             return {
@@ -33,32 +32,21 @@ def main(client_key: str, process_id: str):
                 "default_args": {"imagem_base64": None},
             }
 
-        token = authenticate(client_key)
-        if not token:
-            return {
-                "title": "Erro de autenticação",
-                "description": "Não foi possível obter token JWT.",
-                "default_args": {"imagem_base64": None},
-            }
-
-        resultado = consultar_status(token, process_id)
-        result_data = resultado.get("result", {})
+        # Acompanha a sessão com backoff até um estado final, em vez de
+        # depender de uma única consulta após o "Resume"
+        acompanhamento = aguardar_liveness(client_key, process_id, prazo_segundos)
+        resultado = acompanhamento.resposta
 
-        status = result_data.get("status", "Indefinido")
-        liveness_score = result_data.get("livenessScore", "N/A")
-        imagem_base64 = result_data.get("frontalImage")
+        status = acompanhamento.status
+        # Com MOSTQI_BLOBS_DIR, a selfie segue para o step 08 como referência
+        imagem_base64 = guardar_imagem(acompanhamento.frontal_image)
 
         request_id = resultado.get("requestId")
         status_api = resultado.get("status", {})
         codigo_status = status_api.get("code", "N/A")
         mensagem_status = status_api.get("message", "Sem mensagem")
 
-        liveness_score = (
-            result_data.get("livenessScore")
-            or result_data.get("metrics", {}).get("livenessScore")
-            or result_data.get("results", {}).get("livenessScore")
-            or None
-        )
+        liveness_score = acompanhamento.liveness_score
 
         if liveness_score is None:
             liveness_score = 0.0
@@ -67,7 +55,16 @@ def main(client_key: str, process_id: str):
         desc = f"Status atual: **{status}**\n\n"
         desc += f"Score de vivacidade: `{liveness_score}`\n\n"
         desc += f"requestId: `{request_id}`\n"
-        desc += f"Código da resposta: `{codigo_status}` - {mensagem_status}"
+        desc += f"Código da resposta: `{codigo_status}` - {mensagem_status}\n"
+        desc += f"Consultas realizadas: {acompanhamento.consultas} em {acompanhamento.duracao_s} s"
+        if acompanhamento.origem == "webhook":
+            desc += " (resultado entregue pelo webhook)"
+
+        if acompanhamento.expirado:
+            desc += (
+                f"\n\n**A sessão não foi concluída em {prazo_segundos:g} s.** "
+                "Execute o step novamente após o término da verificação."
+            )
 
         if not imagem_base64:
             desc += "\n\n**Nenhuma imagem capturada disponível.**"
@@ -84,6 +81,12 @@ def main(client_key: str, process_id: str):
             "enums": {},
         }
 
+    except AuthError:
+        return {
+            "title": "Erro de autenticação",
+            "description": "Não foi possível obter token JWT.",
+            "default_args": {"imagem_base64": None},
+        }
     except requests.exceptions.HTTPError as http_err:
         status_code = getattr(http_err.response, "status_code", "N/A")
         response_text = getattr(http_err.response, "text", "")
@@ -1,58 +1,90 @@
 # wm-input: client_key:str, face_file_a:file, face_base64_b:str
+# wm-input: face_recortada_a:str
+# wm-input: prazo_caso:float
 
 import requests
 import logging
-import base64
+from typing import Optional
+
+from mostqi import (
+    Arquivo,
+    AuthError,
+    abrir_entrada,
+    get_client,
+    get_result_cache,
+    hash_conteudo,
+    preparar_imagem,
+)
+from mostqi.imagem import PERFIL_FACE
+from mostqi.tracing import rastrear_step
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def authenticate(client_key: str) -> str:
-    url = "https://mostqiapi.com/user/authenticate"
-    headers = {"Content-Type": "application/json"}
-    payload = {"token": client_key}
+def comparar_faces(
+    client_key: str,
+    file_a: Optional[Arquivo],
+    base64_str_b: str,
+    face_recortada_a: Optional[str] = None,
+) -> dict:
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json().get("token")
-    except requests.exceptions.HTTPError as e:
-        raise Exception("Erro na autenticação: token inválido ou serviço indisponível.")
-    except Exception as e:
-        raise Exception(f"Falha ao autenticar: {str(e)}")
-
-
-def comparar_faces(jwt_token: str, file_a: bytes, base64_str_b: str) -> dict:
-    url = "https://mostqiapi.com/process-image/biometrics/face-compare"
-    headers = {"Authorization": f"Bearer {jwt_token}"}
-
-    try:
-        file_b = base64.b64decode(base64_str_b)
+        file_b = abrir_entrada(base64_str_b)
     except Exception as e:
         raise Exception(
             "Erro ao decodificar imagem base64 da selfie: verifique o conteúdo enviado."
         )
 
-    files = {
-        "faceFileA": ("face_a.jpg", file_a, "application/octet-stream"),
-        "faceFileB": ("face_b.jpg", file_b, "application/octet-stream"),
-    }
-
-    try:
-        response = requests.post(url, headers=headers, files=files)
-        response.raise_for_status()
-    except requests.exceptions.HTTPError as e:
-        status_code = getattr(e.response, "status_code", "N/A")
-        response_text = getattr(e.response, "text", "")
-        raise Exception(
-            f"Erro ao comparar imagens: verifique os arquivos enviados.\n"
-            f"Código HTTP: {status_code}\n"
-            f"Detalhes: {response_text}"
+    # O recorte da face devolvido pela IDP (step 02) é bem menor que a CNH inteira
+    if face_recortada_a:
+        entrada_a = abrir_entrada(face_recortada_a)
+    else:
+        entrada_a = abrir_entrada(file_a, aceitar_caminho=True)
+
+    # Repetições do mesmo par de imagens reaproveitam a similaridade já calculada
+    result_cache = get_result_cache()
+    par_hash = f"{hash_conteudo(entrada_a)}:{hash_conteudo(file_b)}"
+    data = result_cache.get("facematch", par_hash)
+    em_cache = data is not None
+
+    if data is None:
+        # Faces não precisam da resolução original: reduz antes do upload
+        face_a = preparar_imagem(entrada_a, PERFIL_FACE)
+        face_b = preparar_imagem(file_b, PERFIL_FACE)
+
+        try:
+            data = get_client().face_compare(
+                client_key,
+                face_a.conteudo,
+                face_b.conteudo,
+                content_type_a=face_a.mime,
+                content_type_b=face_b.mime,
+            )
+        except AuthError:
+            raise Exception(
+                "Erro na autenticação: token inválido ou serviço indisponível."
+            )
+        except requests.exceptions.HTTPError as e:
+            status_code = getattr(e.response, "status_code", "N/A")
+            response_text = getattr(e.response, "text", "")
+            raise Exception(
+                f"Erro ao comparar imagens: verifique os arquivos enviados.\n"
+                f"Código HTTP: {status_code}\n"
+                f"Detalhes: {response_text}"
+            )
+        except Exception as e:
+            raise Exception(f"Erro inesperado na requisição FaceMatch: {str(e)}")
+
+        result_cache.set(
+            "facematch",
+            par_hash,
+            {
+                "result": data.get("result"),
+                "status": data.get("status"),
+                "requestId": data.get("requestId"),
+            },
         )
-    except Exception as e:
-        raise Exception(f"Erro inesperado na requisição FaceMatch: {str(e)}")
 
-    data = response.json()
     similarity = data.get("result", {}).get("similarity", 0.0)
     status = data.get("status", {}).get("message", "Desconhecido")
     code = data.get("status", {}).get("code", "N/A")
@@ -65,6 +97,10 @@ def comparar_faces(jwt_token: str, file_a: bytes, base64_str_b: str) -> dict:
         f"Status da API: {code} - {status}\n"
         f"Request ID: {request_id}"
     )
+    if face_recortada_a:
+        descricao += "\nFace A: recorte da CNH devolvido pela IDP"
+    if em_cache:
+        descricao += "\nResultado reaproveitado de uma comparação anterior do mesmo par"
 
     return {
         "title": "Resultado da Comparação Facial",
@@ -79,13 +115,19 @@ def comparar_faces(jwt_token: str, file_a: bytes, base64_str_b: str) -> dict:
     }
 
 
-def main(client_key: str, face_file_a: bytes, face_base64_b: str):
+@rastrear_step("08_facematch")
+def main(
+    client_key: str,
+    face_file_a: bytes = None,
+    face_base64_b: str = None,
+    face_recortada_a: str = None,
+    prazo_caso: Optional[float] = None,
+):
     try:
-        if not client_key or not face_file_a or not face_base64_b:
+        if not client_key or not (face_file_a or face_recortada_a) or not face_base64_b:
             raise Exception("Todos os campos são obrigatórios. Verifique as entradas.")
 
-        jwt_token = authenticate(client_key)
-        return comparar_faces(jwt_token, face_file_a, face_base64_b)
+        return comparar_faces(client_key, face_file_a, face_base64_b, face_recortada_a)
 
     except Exception as e:
         logger.error(f"Erro: {e}")
@@ -13,7 +13,16 @@
 # wm-input: facematch_score:float
 # wm-input: facematch_aprovado:bool
 
+from mostqi.blobs import finalizar_caso
+from mostqi.tracing import rastrear_step
+from mostqi.validacao import comparar_campo
 
+
+def format_linha(nome, val_frente, val_qr, status):
+    return f"- {nome}: {'✅' if status else '❌'}\n  - Frente da CNH: `{val_frente}`\n  - QR Code: `{val_qr}`"
+
+
+@rastrear_step("09_validacao")
 def main(
     nome_idp,
     nome_vio,
@@ -40,72 +49,48 @@ def main(
     facematch_aprovado,
 ):
     try:
-
-        def normalizar(valor: str) -> str:
-            if not isinstance(valor, str):
-                return ""
-            return (
-                valor.strip()
-                .lower()
-                .replace(" ", "")
-                .replace(".", "")
-                .replace("-", "")
-                .replace("/", "")
-            )
-
-        def comparar(valor1: str, valor2: str) -> bool:
-            return normalizar(valor1) == normalizar(valor2)
-
-        def comparar_rg(rg1, rg2):
-            n1 = normalizar(rg1)
-            n2 = normalizar(rg2)
-            return n1 == n2 or n1 in n2 or n2 in n1
-
-        def format_linha(nome, val_frente, val_qr, status):
-            return f"- {nome}: {'✅' if status else '❌'}\n  - Frente da CNH: `{val_frente}`\n  - QR Code: `{val_qr}`"
-
         comparacoes = {
-            "Nome": (nome_idp, nome_vio, comparar(nome_idp, nome_vio)),
-            "CPF": (cpf_idp, cpf_vio, comparar(cpf_idp, cpf_vio)),
+            "Nome": (nome_idp, nome_vio, comparar_campo("nome", nome_idp, nome_vio)),
+            "CPF": (cpf_idp, cpf_vio, comparar_campo("cpf", cpf_idp, cpf_vio)),
             "Data de nascimento": (
                 nascimento_idp,
                 nascimento_vio,
-                comparar(nascimento_idp, nascimento_vio),
+                comparar_campo("nascimento", nascimento_idp, nascimento_vio),
             ),
             "Filiação mãe": (
                 filiacao1_idp,
                 filiacao1_vio,
-                comparar(filiacao1_idp, filiacao1_vio),
+                comparar_campo("filiacao1", filiacao1_idp, filiacao1_vio),
             ),
             "Filiação pai": (
                 filiacao2_idp,
                 filiacao2_vio,
-                comparar(filiacao2_idp, filiacao2_vio),
+                comparar_campo("filiacao2", filiacao2_idp, filiacao2_vio),
             ),
             "RG": (
                 rg_idp,
                 rg_vio,
-                comparar_rg(rg_idp, rg_vio),
+                comparar_campo("rg", rg_idp, rg_vio),
             ),
             "Registro CNH": (
                 registro_idp,
                 registro_vio,
-                comparar(registro_idp, registro_vio),
+                comparar_campo("registro", registro_idp, registro_vio),
             ),
             "Data de emissão": (
                 emissao_idp,
                 emissao_vio,
-                comparar(emissao_idp, emissao_vio),
+                comparar_campo("emissao", emissao_idp, emissao_vio),
             ),
             "Data de validade": (
                 validade_idp,
                 validade_vio,
-                comparar(validade_idp, validade_vio),
+                comparar_campo("validade", validade_idp, validade_vio),
             ),
             "Categoria de habilitação": (
                 categoria_idp,
                 categoria_vio,
-                comparar(categoria_idp, categoria_vio),
+                comparar_campo("categoria", categoria_idp, categoria_vio),
             ),
         }
 
@@ -181,3 +166,7 @@ def main(
             "aprovado_facematch": False,
             "mensagem_resultado_final": f"Erro inesperado na validação final: {str(e)}",
         }
+    finally:
+        # Fim do caso, com ou sem todos os campos: as imagens guardadas como
+        # blob (MOSTQI_BLOBS_DIR) não serão mais lidas
+        finalizar_caso()
@@ -0,0 +1,52 @@
+from .auth import (
+    FileTokenStore,
+    MemoryTokenStore,
+    SharedMemoryTokenStore,
+    TokenCache,
+    decodificar_expiracao,
+    get_token_cache,
+    invalidar_token,
+    obter_token,
+)
+from .arquivos import (
+    Arquivo,
+    CorpoMultipart,
+    FonteArquivo,
+    abrir_entrada,
+    decodificar_base64,
+    extract_file_content,
+    permitir_diretorio,
+)
+from .cache import LRUCache, ResultCache, SQLiteCache, get_result_cache, hash_conteudo
+from .imagem import ImagemPreparada, detectar_formato, preparar_imagem
+from .client import AsyncMostQIClient, AuthError, MostQIClient, get_client
+
+__all__ = [
+    "Arquivo",
+    "AsyncMostQIClient",
+    "AuthError",
+    "CorpoMultipart",
+    "FileTokenStore",
+    "FonteArquivo",
+    "ImagemPreparada",
+    "LRUCache",
+    "MemoryTokenStore",
+    "MostQIClient",
+    "ResultCache",
+    "SQLiteCache",
+    "SharedMemoryTokenStore",
+    "TokenCache",
+    "abrir_entrada",
+    "decodificar_base64",
+    "decodificar_expiracao",
+    "detectar_formato",
+    "extract_file_content",
+    "get_client",
+    "get_result_cache",
+    "get_token_cache",
+    "hash_conteudo",
+    "invalidar_token",
+    "obter_token",
+    "permitir_diretorio",
+    "preparar_imagem",
+]
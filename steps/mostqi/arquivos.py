@@ -0,0 +1,453 @@
+import binascii
+import hashlib
+import io
+import logging
+import os
+import uuid
+from typing import (
+    Any,
+    BinaryIO,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+# Tamanho dos blocos lidos de arquivos e decodificados de base64
+TAMANHO_BLOCO = 256 * 1024
+_ALFABETO_BASE64 = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+# Espaços finais aceitos, como caractere (str) ou byte (memoryview)
+_ESPACOS = frozenset((" ", "\n", "\r", "\t", 0x20, 0x0A, 0x0D, 0x09))
+# Strings até este tamanho podem ser caminho de arquivo (se não forem base64)
+MAX_CAMINHO = 4096
+# Diretórios de onde strings recebidas podem ser lidas como caminho, além dos
+# de MOSTQI_DIRETORIOS_ENTRADA (separados por os.pathsep)
+_diretorios_permitidos: Set[str] = set()
+
+logger = logging.getLogger(__name__)
+
+
+class FonteArquivo:
+    """
+    Origem de um arquivo de entrada lida sob demanda.
+
+    Evita carregar o arquivo inteiro na memória: o conteúdo é lido em blocos
+    para calcular o hash e para montar o corpo multipart da requisição.
+    """
+
+    def tamanho(self) -> int:
+        raise NotImplementedError
+
+    def abrir(self) -> BinaryIO:
+        """Retorna um leitor posicionado no início do conteúdo."""
+        raise NotImplementedError
+
+    def blocos(self, tamanho: int = TAMANHO_BLOCO) -> Iterator[bytes]:
+        with self.abrir() as f:
+            while True:
+                bloco = f.read(tamanho)
+                if not bloco:
+                    return
+                yield bloco
+
+    def cabecalho(self, tamanho: int = 16) -> bytes:
+        with self.abrir() as f:
+            return f.read(tamanho)
+
+    def sha256(self) -> str:
+        digest = hashlib.sha256()
+        for bloco in self.blocos():
+            digest.update(bloco)
+        return digest.hexdigest()
+
+    def ler(self) -> bytes:
+        """Conteúdo completo em memória (use apenas quando inevitável)."""
+        with self.abrir() as f:
+            return f.read()
+
+    def __len__(self) -> int:
+        return self.tamanho()
+
+
+class _LeitorMemoria(io.RawIOBase):
+    """Leitor sobre um memoryview que copia apenas o bloco pedido."""
+
+    def __init__(self, buffer: memoryview) -> None:
+        self._buffer = buffer
+        self._posicao = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, destino) -> int:
+        restante = len(self._buffer) - self._posicao
+        n = min(len(destino), restante)
+        destino[:n] = self._buffer[self._posicao : self._posicao + n]
+        self._posicao += n
+        return n
+
+
+class FonteBuffer(FonteArquivo):
+    """Conteúdo já em memória (bytes, bytearray ou memoryview), sem cópias."""
+
+    def __init__(self, buffer: Union[bytes, bytearray, memoryview]) -> None:
+        self._original = buffer
+        self.buffer = memoryview(buffer).cast("B")
+
+    def tamanho(self) -> int:
+        return self.buffer.nbytes
+
+    def abrir(self) -> BinaryIO:
+        return io.BufferedReader(_LeitorMemoria(self.buffer), TAMANHO_BLOCO)
+
+    def blocos(self, tamanho: int = TAMANHO_BLOCO) -> Iterator[bytes]:
+        for inicio in range(0, self.buffer.nbytes, tamanho):
+            yield self.buffer[inicio : inicio + tamanho]
+
+    def cabecalho(self, tamanho: int = 16) -> bytes:
+        return bytes(self.buffer[:tamanho])
+
+    def sha256(self) -> str:
+        return hashlib.sha256(self.buffer).hexdigest()
+
+    def ler(self) -> bytes:
+        if isinstance(self._original, bytes):
+            return self._original
+        return self.buffer.tobytes()
+
+
+class FonteCaminho(FonteArquivo):
+    """Arquivo em disco, aberto apenas quando o conteúdo é necessário."""
+
+    def __init__(self, caminho: str) -> None:
+        self.caminho = caminho
+
+    def tamanho(self) -> int:
+        return os.path.getsize(self.caminho)
+
+    def abrir(self) -> BinaryIO:
+        return open(self.caminho, "rb")
+
+
+class FonteStream(FonteArquivo):
+    """
+    Objeto file-like posicionável (seek/tell). O conteúdo é relido a partir
+    da posição inicial a cada abertura, sem cópia para a memória.
+    """
+
+    def __init__(self, stream: BinaryIO) -> None:
+        self.stream = stream
+        self.inicio = stream.tell()
+
+    def tamanho(self) -> int:
+        atual = self.stream.tell()
+        fim = self.stream.seek(0, io.SEEK_END)
+        self.stream.seek(atual)
+        return fim - self.inicio
+
+    def abrir(self) -> BinaryIO:
+        self.stream.seek(self.inicio)
+        return _Janela(self.stream)
+
+
+class _Janela(io.RawIOBase):
+    """Repassa leituras ao stream original sem fechá-lo."""
+
+    def __init__(self, stream: BinaryIO) -> None:
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, destino) -> int:
+        dados = self._stream.read(len(destino))
+        n = len(dados)
+        destino[:n] = dados
+        return n
+
+
+def _inicio_base64(texto: Union[str, memoryview]) -> int:
+    """Posição onde começam os dados base64 (após um eventual prefixo data URI)."""
+    cabeca = texto[:256]
+    if isinstance(cabeca, memoryview):
+        cabeca = cabeca.tobytes().decode("ascii", "replace")
+    inicio = len(cabeca) - len(cabeca.lstrip())
+    if cabeca.startswith("data:", inicio):
+        virgula = cabeca.find(",", inicio)
+        if virgula != -1 and ";base64" in cabeca[inicio:virgula]:
+            return virgula + 1
+    return inicio
+
+
+def _decodificar_em(saida: bytearray, escrito: int, bloco: bytes) -> int:
+    try:
+        dados = binascii.a2b_base64(bloco)
+    except binascii.Error as e:
+        raise ValueError(f"Base64 inválido: {e}")
+    saida[escrito : escrito + len(dados)] = dados
+    return escrito + len(dados)
+
+
+def decodificar_base64(
+    texto: Union[str, bytes, bytearray, memoryview], validar: bool = True
+) -> FonteBuffer:
+    """
+    Decodifica base64 (com ou sem prefixo data URI) em blocos.
+
+    O texto nunca é copiado por inteiro: cada bloco é convertido, validado
+    e decodificado direto no buffer de saída pré-alocado.
+
+    Args:
+        texto: Conteúdo base64.
+        validar (bool): Rejeita caracteres fora do alfabeto base64.
+
+    Returns:
+        FonteBuffer: Conteúdo binário decodificado.
+
+    Raises:
+        ValueError: Se o conteúdo não for base64 válido.
+    """
+    if not isinstance(texto, str):
+        texto = memoryview(texto).cast("B")
+    inicio = _inicio_base64(texto)
+    fim = len(texto)
+    while fim > inicio and texto[fim - 1] in _ESPACOS:
+        fim -= 1
+
+    tamanho = fim - inicio
+    if validar and tamanho % 4:
+        raise ValueError("Comprimento inválido para base64.")
+    saida = bytearray((tamanho + 3) // 4 * 3)
+    escrito = 0
+    resto = b""
+    for posicao in range(inicio, fim, TAMANHO_BLOCO):
+        bloco = texto[posicao : min(posicao + TAMANHO_BLOCO, fim)]
+        if isinstance(bloco, str):
+            try:
+                bloco = bloco.encode("ascii")
+            except UnicodeEncodeError:
+                raise ValueError("Caracteres não ASCII em conteúdo base64.")
+        else:
+            bloco = bytes(bloco)
+        if validar:
+            if bloco.rstrip(b"=").translate(None, _ALFABETO_BASE64):
+                raise ValueError("Caracteres inválidos em conteúdo base64.")
+        else:
+            bloco = bloco.translate(None, b" \r\n\t")
+        # Cada trecho decodificado precisa ter múltiplo de 4 caracteres
+        bloco = resto + bloco
+        corte = len(bloco) - len(bloco) % 4
+        bloco, resto = bloco[:corte], bloco[corte:]
+        escrito = _decodificar_em(saida, escrito, bloco)
+    if resto:
+        escrito = _decodificar_em(saida, escrito, resto + b"=" * (-len(resto) % 4))
+    return FonteBuffer(memoryview(saida)[:escrito])
+
+
+def permitir_diretorio(diretorio: str) -> None:
+    """Aceita strings com caminhos dentro de `diretorio` em ``abrir_entrada``."""
+    _diretorios_permitidos.add(os.path.realpath(diretorio))
+
+
+def caminho_permitido(caminho: str) -> bool:
+    """Se o arquivo fica em um diretório liberado para leitura por caminho."""
+    diretorios = set(_diretorios_permitidos)
+    for diretorio in os.getenv("MOSTQI_DIRETORIOS_ENTRADA", "").split(os.pathsep):
+        if diretorio.strip():
+            diretorios.add(os.path.realpath(diretorio.strip()))
+    if not diretorios:
+        return False
+    real = os.path.realpath(caminho)
+    return any(
+        os.path.commonpath((real, diretorio)) == diretorio for diretorio in diretorios
+    )
+
+
+def abrir_entrada(
+    file_input: Union[str, bytes, Any], aceitar_caminho: bool = False
+) -> FonteArquivo:
+    """
+    Converte a entrada do Windmill em uma FonteArquivo sem ler arquivos
+    inteiros para a memória.
+
+    Strings são lidas primeiro como base64. Só depois podem ser caminho de
+    arquivo, e apenas se `aceitar_caminho` (entradas ``:file`` dos steps) ou
+    se o arquivo estiver em um diretório liberado (``permitir_diretorio`` ou
+    MOSTQI_DIRETORIOS_ENTRADA): um texto enviado pelo usuário, como a selfie
+    do step 08, não pode apontar para arquivos do worker.
+
+    Args:
+        file_input: Caminho, string base64/data URI, referência de blob
+            ("blob:sha256:..."), bytes, file-like object ou objeto com
+            atributo `content`.
+        aceitar_caminho (bool): Aceita qualquer caminho de arquivo em strings.
+
+    Returns:
+        FonteArquivo: Origem do conteúdo binário.
+
+    Raises:
+        ValueError: Se a entrada não puder ser interpretada.
+    """
+    if isinstance(file_input, FonteArquivo):
+        return file_input
+
+    if isinstance(file_input, (bytes, bytearray, memoryview)):
+        return FonteBuffer(file_input)
+
+    if isinstance(file_input, os.PathLike):
+        return FonteCaminho(os.fspath(file_input))
+
+    if isinstance(file_input, str):
+        if file_input.startswith("blob:sha256:"):
+            from .blobs import abrir_blob
+
+            return abrir_blob(file_input)
+        try:
+            return decodificar_base64(file_input)
+        except ValueError:
+            pass
+        if (
+            len(file_input) <= MAX_CAMINHO
+            and os.path.isfile(file_input)
+            and (aceitar_caminho or caminho_permitido(file_input))
+        ):
+            return FonteCaminho(file_input)
+        raise ValueError("String não é base64 nem caminho de arquivo válido.")
+
+    if hasattr(file_input, "read"):
+        try:
+            file_input.tell()
+            if file_input.seekable():
+                return FonteStream(file_input)
+        except (AttributeError, OSError, ValueError):
+            pass
+        content = file_input.read()
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        return FonteBuffer(content)
+
+    if hasattr(file_input, "content"):
+        content = file_input.content
+        if isinstance(content, str):
+            return decodificar_base64(content, validar=False)
+        return FonteBuffer(content)
+
+    return FonteBuffer(str(file_input).encode("utf-8"))
+
+
+def extract_file_content(
+    file_input: Union[str, bytes, Any], aceitar_caminho: bool = True
+) -> bytes:
+    """
+    Extrai conteúdo binário do arquivo independente do tipo
+
+    Args:
+        file_input: Arquivo de entrada (pode ser string base64, bytes, file-like object ou caminho)
+        aceitar_caminho (bool): Veja ``abrir_entrada``.
+
+    Returns:
+        bytes: Conteúdo binário do arquivo
+    """
+    try:
+        return abrir_entrada(file_input, aceitar_caminho).ler()
+    except Exception as e:
+        logger.error(f"Erro ao extrair conteúdo do arquivo: {e}")
+        raise ValueError(f"Não foi possível extrair conteúdo do arquivo: {e}")
+
+
+Arquivo = Union[bytes, bytearray, memoryview, FonteArquivo]
+
+
+class CorpoMultipart(io.RawIOBase):
+    """
+    Corpo multipart/form-data gerado sob demanda.
+
+    Os arquivos são lidos das suas FonteArquivo em blocos durante o envio,
+    então o corpo completo nunca existe em memória. O tamanho total é
+    conhecido de antemão, o que permite enviar Content-Length.
+    """
+
+    def __init__(
+        self,
+        campos: Sequence[Tuple[str, str]] = (),
+        arquivos: Sequence[Tuple[str, str, Arquivo, str]] = (),
+    ) -> None:
+        self.boundary = uuid.uuid4().hex
+        self._partes: List[Union[bytes, FonteArquivo]] = []
+        for nome, valor in campos:
+            self._partes.append(
+                (
+                    f"--{self.boundary}\r\n"
+                    f'Content-Disposition: form-data; name="{nome}"\r\n\r\n'
+                    f"{valor}\r\n"
+                ).encode("utf-8")
+            )
+        for nome, nome_arquivo, conteudo, content_type in arquivos:
+            self._partes.append(
+                (
+                    f"--{self.boundary}\r\n"
+                    f'Content-Disposition: form-data; name="{nome}"; '
+                    f'filename="{nome_arquivo}"\r\n'
+                    f"Content-Type: {content_type}\r\n\r\n"
+                ).encode("utf-8")
+            )
+            self._partes.append(abrir_entrada(conteudo))
+            self._partes.append(b"\r\n")
+        self._partes.append(f"--{self.boundary}--\r\n".encode("utf-8"))
+        self._tamanho = sum(len(parte) for parte in self._partes)
+        self._indice = 0
+        self._leitor: Optional[BinaryIO] = None
+        self._pendente = memoryview(b"")
+        self._lidos = 0
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return self._tamanho
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        # requests usa tell() para descontar o que já foi lido do Content-Length
+        return self._lidos
+
+    def readinto(self, destino) -> int:
+        escrito = 0
+        while escrito < len(destino):
+            if self._pendente:
+                n = min(len(destino) - escrito, len(self._pendente))
+                destino[escrito : escrito + n] = self._pendente[:n]
+                self._pendente = self._pendente[n:]
+                escrito += n
+                continue
+            if self._leitor is not None:
+                n = self._leitor.readinto(memoryview(destino)[escrito:])
+                if n:
+                    escrito += n
+                    continue
+                self._leitor.close()
+                self._leitor = None
+                self._indice += 1
+                continue
+            if self._indice >= len(self._partes):
+                break
+            parte = self._partes[self._indice]
+            if isinstance(parte, bytes):
+                self._pendente = memoryview(parte)
+                self._indice += 1
+            else:
+                self._leitor = parte.abrir()
+        self._lidos += escrito
+        return escrito
+
+    def close(self) -> None:
+        if self._leitor is not None:
+            self._leitor.close()
+            self._leitor = None
+        super().close()
@@ -0,0 +1,378 @@
+import base64
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+# Renova o token alguns segundos antes do "exp" para não enviar um JWT
+# que expira durante a requisição.
+MARGEM_RENOVACAO_SEGUNDOS = 60
+# Validade assumida quando o token não traz o claim "exp".
+TTL_PADRAO_SEGUNDOS = 300
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TokenEntry:
+    """Token JWT armazenado em cache com o instante de expiração (epoch)."""
+
+    token: str
+    expira_em: float
+
+    def valido(self, margem: float = MARGEM_RENOVACAO_SEGUNDOS) -> bool:
+        return time.time() < self.expira_em - margem
+
+
+def decodificar_expiracao(jwt_token: str) -> Optional[float]:
+    """
+    Lê o claim "exp" do payload do JWT sem validar a assinatura.
+
+    Args:
+        jwt_token (str): Token JWT retornado pela API.
+
+    Returns:
+        float | None: Expiração em epoch ou None se o token não tiver "exp".
+    """
+    try:
+        payload = jwt_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        exp = claims.get("exp")
+        return float(exp) if exp is not None else None
+    except Exception:
+        return None
+
+
+def chave_cache(client_key: str) -> str:
+    """Identificador do client_key no cache (nunca persiste a chave em claro)."""
+    return hashlib.sha256(client_key.encode("utf-8")).hexdigest()[:32]
+
+
+def autenticar(client_key: str) -> str:
+    """
+    Autentica na API mostQI usando o cliente compartilhado.
+
+    Raises:
+        requests.exceptions.HTTPError: Se a API responder com erro.
+        ValueError: Se a resposta não contiver o token.
+    """
+    from .client import get_client
+
+    return get_client().authenticate(client_key)
+
+
+class MemoryTokenStore:
+    """Armazena tokens apenas na memória do processo."""
+
+    def __init__(self) -> None:
+        self._entries: Dict[str, TokenEntry] = {}
+
+    def get(self, chave: str) -> Optional[TokenEntry]:
+        return self._entries.get(chave)
+
+    def set(self, chave: str, entry: TokenEntry) -> None:
+        self._entries[chave] = entry
+
+    def delete(self, chave: str) -> None:
+        self._entries.pop(chave, None)
+
+    @contextlib.contextmanager
+    def lock(self, chave: str) -> Iterator[None]:
+        yield
+
+
+class _FileLockMixin:
+    """
+    Lock exclusivo entre processos usando um arquivo auxiliar.
+
+    Reentrante na mesma thread: o ``TokenCache`` lê o store de dentro do lock.
+    """
+
+    lock_path: str
+
+    @contextlib.contextmanager
+    def lock(self, chave: str) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+        local = self.__dict__.setdefault("_lock_local", threading.local())
+        if getattr(local, "profundidade", 0):
+            local.profundidade += 1
+            try:
+                yield
+            finally:
+                local.profundidade -= 1
+            return
+        with open(self.lock_path, "a+") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            local.profundidade = 1
+            try:
+                yield
+            finally:
+                local.profundidade = 0
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class FileTokenStore(_FileLockMixin):
+    """
+    Persiste tokens em um arquivo JSON local para que workers em processos
+    diferentes reutilizem o mesmo token.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock_path = f"{path}.lock"
+
+    def _ler(self) -> Dict[str, Dict[str, float]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _gravar(self, data: Dict[str, Dict[str, float]]) -> None:
+        diretorio = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=diretorio, prefix=".tokens-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp_path)
+            raise
+
+    def get(self, chave: str) -> Optional[TokenEntry]:
+        item = self._ler().get(chave)
+        if not item:
+            return None
+        return TokenEntry(token=item["token"], expira_em=item["expira_em"])
+
+    def set(self, chave: str, entry: TokenEntry) -> None:
+        data = self._ler()
+        data[chave] = {"token": entry.token, "expira_em": entry.expira_em}
+        self._gravar(data)
+
+    def delete(self, chave: str) -> None:
+        data = self._ler()
+        if data.pop(chave, None) is not None:
+            self._gravar(data)
+
+
+class SharedMemoryTokenStore(_FileLockMixin):
+    """
+    Mantém os tokens em um bloco de memória compartilhada nomeado, lido por
+    todos os processos da mesma máquina.
+
+    Layout: 4 bytes com o tamanho do JSON seguidos do JSON em UTF-8. Leituras
+    e gravações passam pelo lock de arquivo, então nenhuma leitura vê uma
+    gravação pela metade.
+
+    O bloco sobrevive ao processo que o criou (os steps do Windmill são
+    processos curtos): ele é retirado do ``resource_tracker``, que o apagaria
+    na saída do processo. Para removê-lo: ``unlink()``.
+    """
+
+    def __init__(self, nome: str = "mostqi_tokens", tamanho: int = 64 * 1024) -> None:
+        self.nome = nome
+        self.lock_path = os.path.join(tempfile.gettempdir(), f"{nome}.lock")
+        try:
+            self._shm = shared_memory.SharedMemory(name=nome)
+        except FileNotFoundError:
+            try:
+                self._shm = shared_memory.SharedMemory(
+                    name=nome, create=True, size=tamanho
+                )
+                self._shm.buf[:4] = (0).to_bytes(4, "little")
+            except FileExistsError:
+                self._shm = shared_memory.SharedMemory(name=nome)
+        # Até o Python 3.12, criar ou abrir o bloco o registra no
+        # resource_tracker, que o apaga quando o processo termina
+        with contextlib.suppress(Exception):
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+
+    def _ler(self) -> Dict[str, Dict[str, float]]:
+        with self.lock(""):
+            tamanho = int.from_bytes(bytes(self._shm.buf[:4]), "little")
+            if not tamanho:
+                return {}
+            raw = bytes(self._shm.buf[4 : 4 + tamanho])
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            return {}
+
+    def _gravar(self, data: Dict[str, Dict[str, float]]) -> None:
+        agora = time.time()
+        data = {k: v for k, v in data.items() if v["expira_em"] > agora}
+        raw = json.dumps(data).encode("utf-8")
+        if len(raw) + 4 > self._shm.size:
+            raise ValueError("Memória compartilhada insuficiente para os tokens.")
+        with self.lock(""):
+            self._shm.buf[4 : 4 + len(raw)] = raw
+            self._shm.buf[:4] = len(raw).to_bytes(4, "little")
+
+    def get(self, chave: str) -> Optional[TokenEntry]:
+        item = self._ler().get(chave)
+        if not item:
+            return None
+        return TokenEntry(token=item["token"], expira_em=item["expira_em"])
+
+    def set(self, chave: str, entry: TokenEntry) -> None:
+        data = self._ler()
+        data[chave] = {"token": entry.token, "expira_em": entry.expira_em}
+        self._gravar(data)
+
+    def delete(self, chave: str) -> None:
+        data = self._ler()
+        if data.pop(chave, None) is not None:
+            self._gravar(data)
+
+    def close(self) -> None:
+        self._shm.close()
+
+    def unlink(self) -> None:
+        """Remove o bloco de memória compartilhada do sistema."""
+        # SharedMemory.unlink() cancela o registro no resource_tracker
+        with contextlib.suppress(Exception):
+            resource_tracker.register(self._shm._name, "shared_memory")
+        with contextlib.suppress(FileNotFoundError):
+            self._shm.unlink()
+
+
+class TokenCache:
+    """
+    Cache de tokens JWT por client_key com renovação antes do "exp".
+
+    Renovações concorrentes da mesma chave são colapsadas em uma única
+    chamada de autenticação: dentro do processo por um lock por chave e entre
+    processos pelo lock do store (quando persistente).
+    """
+
+    def __init__(
+        self,
+        store=None,
+        autenticador: Callable[[str], str] = autenticar,
+        margem_segundos: float = MARGEM_RENOVACAO_SEGUNDOS,
+        ttl_padrao_segundos: float = TTL_PADRAO_SEGUNDOS,
+    ) -> None:
+        self.store = store if store is not None else MemoryTokenStore()
+        self.autenticador = autenticador
+        self.margem_segundos = margem_segundos
+        self.ttl_padrao_segundos = ttl_padrao_segundos
+        self._local: Dict[str, TokenEntry] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock_da_chave(self, chave: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(chave)
+            if lock is None:
+                lock = self._locks[chave] = threading.Lock()
+            return lock
+
+    def _entrada_valida(self, chave: str) -> Optional[TokenEntry]:
+        entry = self._local.get(chave)
+        if entry and entry.valido(self.margem_segundos):
+            return entry
+        entry = self.store.get(chave)
+        if entry and entry.valido(self.margem_segundos):
+            self._local[chave] = entry
+            return entry
+        return None
+
+    def obter(self, client_key: str) -> str:
+        """
+        Retorna um token válido para o client_key, autenticando se necessário.
+
+        Args:
+            client_key (str): Chave fornecida pela mostQI.
+
+        Returns:
+            str: Token JWT.
+        """
+        chave = chave_cache(client_key)
+        entry = self._local.get(chave)
+        if entry and entry.valido(self.margem_segundos):
+            return entry.token
+
+        with self._lock_da_chave(chave):
+            entry = self._entrada_valida(chave)
+            if entry:
+                return entry.token
+            with self.store.lock(chave):
+                # Outro processo pode ter renovado enquanto esperávamos o lock
+                entry = self._entrada_valida(chave)
+                if entry:
+                    return entry.token
+                token = self.autenticador(client_key)
+                expira_em = decodificar_expiracao(token)
+                if expira_em is None:
+                    expira_em = time.time() + self.ttl_padrao_segundos
+                entry = TokenEntry(token=token, expira_em=expira_em)
+                self.store.set(chave, entry)
+                self._local[chave] = entry
+                logger.info("Token JWT renovado e armazenado em cache.")
+                return token
+
+    def invalidar(self, client_key: str) -> None:
+        """Descarta o token em cache (ex.: após um 401 da API)."""
+        chave = chave_cache(client_key)
+        with self._lock_da_chave(chave):
+            self._local.pop(chave, None)
+            with self.store.lock(chave):
+                self.store.delete(chave)
+
+
+def store_do_ambiente():
+    """
+    Cria o store indicado por MOSTQI_TOKEN_STORE.
+
+    Valores aceitos: vazio (memória do processo), "shm:<nome>" (memória
+    compartilhada) ou um caminho de arquivo.
+    """
+    destino = os.getenv("MOSTQI_TOKEN_STORE", "").strip()
+    if not destino:
+        return MemoryTokenStore()
+    if destino.startswith("shm:"):
+        return SharedMemoryTokenStore(destino[4:] or "mostqi_tokens")
+    return FileTokenStore(destino)
+
+
+_cache_padrao: Optional[TokenCache] = None
+_cache_padrao_lock = threading.Lock()
+
+
+def get_token_cache() -> TokenCache:
+    """Cache compartilhado por todos os steps do processo."""
+    global _cache_padrao
+    if _cache_padrao is None:
+        with _cache_padrao_lock:
+            if _cache_padrao is None:
+                _cache_padrao = TokenCache(store=store_do_ambiente())
+    return _cache_padrao
+
+
+def obter_token(client_key: str) -> str:
+    """Atalho para get_token_cache().obter(client_key)."""
+    return get_token_cache().obter(client_key)
+
+
+def invalidar_token(client_key: str) -> None:
+    """Atalho para get_token_cache().invalidar(client_key)."""
+    get_token_cache().invalidar(client_key)
@@ -0,0 +1,419 @@
+"""
+Armazém local de blobs endereçados por conteúdo.
+
+Em vez de trafegar imagens em base64 nos argumentos do Windmill (33% maior,
+codificado e decodificado a cada step), um step grava os bytes uma única vez
+e repassa uma referência curta::
+
+    blob:sha256:<hex>
+
+Qualquer step lê a referência com ``abrir_entrada``: o arquivo é mapeado em
+memória (mmap) e entregue como FonteArquivo, sem cópia.
+
+Ativado por MOSTQI_BLOBS_DIR (diretório compartilhado pelos workers). Sem ele,
+os steps continuam devolvendo base64.
+
+Estrutura do diretório::
+
+    objetos/ab/<sha256>        conteúdo
+    casos/<case_id>/<sha256>   blobs usados por um caso (arquivos vazios)
+    refs/<sha256>/<case_id>    casos que usam um blob (arquivos vazios)
+
+Coleta de lixo: ``finalizar_caso`` (chamado pelo step 09 e pelo lote ao fim
+de cada caso) remove os vínculos do caso e apaga os blobs que ficaram sem
+nenhum caso. ``coletar`` apaga blobs sem vínculo mais antigos que um prazo
+(casos abandonados antes do step 09 ou blobs gravados sem case ID):
+
+    python -m mostqi.blobs coletar --idade 86400
+"""
+
+import argparse
+import contextlib
+import hashlib
+import logging
+import mmap
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Iterator, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows: lock só entre as threads do processo
+    fcntl = None
+
+from .arquivos import TAMANHO_BLOCO, FonteArquivo, FonteBuffer, decodificar_base64
+from .tracing import case_id_atual
+
+PREFIXO = "blob:sha256:"
+# Blobs sem vínculo mais novos que isso não são apagados por `coletar`
+IDADE_COLETA_PADRAO_SEGUNDOS = 24 * 60 * 60
+# Case IDs usados como nome de diretório sem alteração; os demais (".", "..",
+# separadores, nomes longos) viram "~" + SHA-256, fora deste alfabeto
+_NOME_CASO_SEGURO = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9._-]{0,127}")
+
+logger = logging.getLogger(__name__)
+
+
+def eh_referencia(valor) -> bool:
+    """Indica se o valor é uma referência de blob ("blob:sha256:<hex>")."""
+    return isinstance(valor, str) and valor.startswith(PREFIXO)
+
+
+def _sha_da_referencia(ref: str) -> str:
+    sha = ref[len(PREFIXO) :] if eh_referencia(ref) else ""
+    if len(sha) != 64 or sha.strip("0123456789abcdef"):
+        raise ValueError(f"Referência de blob inválida: {ref[:80]}")
+    return sha
+
+
+def _nome_caso(case_id: str) -> str:
+    # Case IDs vêm do usuário (ex.: manifesto do lote) e viram nomes de
+    # diretório: "..", "." ou "a/b" não podem apontar para fora de casos/
+    case_id = str(case_id)
+    if _NOME_CASO_SEGURO.fullmatch(case_id):
+        return case_id
+    return "~" + hashlib.sha256(case_id.encode("utf-8")).hexdigest()
+
+
+class FonteBlob(FonteBuffer):
+    """Blob mapeado em memória; o hash vem da própria referência."""
+
+    def __init__(self, buffer, sha: str) -> None:
+        super().__init__(buffer)
+        self._sha = sha
+
+    def sha256(self) -> str:
+        return self._sha
+
+
+class ArmazemBlobs:
+    """
+    Blobs imutáveis em disco, nomeados pelo SHA-256 do conteúdo.
+
+    A gravação é atômica (arquivo temporário + rename) e deduplicada: o mesmo
+    conteúdo gravado por vários casos ocupa um único arquivo. Seguro para
+    vários processos usando o mesmo diretório: novos vínculos e a remoção de
+    blobs sem dono passam por um lock de arquivo (``.lock`` na raiz).
+    """
+
+    def __init__(self, raiz: str) -> None:
+        self.raiz = raiz
+        self._objetos = os.path.join(raiz, "objetos")
+        self._casos = os.path.join(raiz, "casos")
+        self._refs = os.path.join(raiz, "refs")
+        for diretorio in (self._objetos, self._casos, self._refs):
+            os.makedirs(diretorio, exist_ok=True)
+        self._lock_path = os.path.join(raiz, ".lock")
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _travar(self) -> Iterator[None]:
+        """Exclusão mútua entre vincular um blob e apagá-lo por falta de dono."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self._lock_path, "a+") as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def caminho(self, ref: str) -> str:
+        """Caminho do arquivo de uma referência."""
+        sha = _sha_da_referencia(ref)
+        return os.path.join(self._objetos, sha[:2], sha)
+
+    def existe(self, ref: str) -> bool:
+        return os.path.isfile(self.caminho(ref))
+
+    def gravar(
+        self,
+        conteudo: Union[bytes, bytearray, memoryview, FonteArquivo],
+        case_id: Optional[str] = None,
+    ) -> str:
+        """
+        Grava o conteúdo (se ainda não existir) e o vincula ao caso.
+
+        Args:
+            conteudo: Bytes ou FonteArquivo.
+            case_id (str, opcional): Caso dono do blob. Padrão: case ID atual
+                (MOSTQI_CASE_ID, fluxo do Windmill ou ``tracing.caso``).
+
+        Returns:
+            str: Referência "blob:sha256:<hex>".
+        """
+        if isinstance(conteudo, FonteArquivo):
+            fonte = conteudo
+        else:
+            fonte = FonteBuffer(conteudo)
+        ref = PREFIXO + fonte.sha256()
+        case_id = case_id or case_id_atual()
+        # O vínculo vem antes do conteúdo: um `finalizar_caso` concorrente
+        # de outro caso não apaga um blob que acabou de ganhar dono
+        if case_id:
+            self.vincular(ref, case_id)
+        destino = self.caminho(ref)
+        if os.path.isfile(destino):
+            return ref
+        diretorio = os.path.dirname(destino)
+        os.makedirs(diretorio, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=diretorio, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for bloco in fonte.blocos(TAMANHO_BLOCO):
+                    f.write(bloco)
+            os.replace(temporario, destino)
+        except BaseException:
+            try:
+                os.unlink(temporario)
+            except OSError:
+                pass
+            raise
+        return ref
+
+    def gravar_base64(self, texto: str, case_id: Optional[str] = None) -> str:
+        """Decodifica base64 (ou data URI) e grava o conteúdo."""
+        return self.gravar(decodificar_base64(texto), case_id)
+
+    def abrir(self, ref: str) -> FonteBlob:
+        """
+        Abre o blob mapeado em memória (somente leitura, sem cópia).
+
+        Raises:
+            ValueError: Se a referência for inválida ou o blob não existir.
+        """
+        sha = _sha_da_referencia(ref)
+        try:
+            with open(self.caminho(ref), "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return FonteBlob(b"", sha)
+                mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            raise ValueError(f"Blob não encontrado no armazém: {ref}")
+        return FonteBlob(mapa, sha)
+
+    def vincular(self, ref: str, case_id: str) -> None:
+        """Marca o blob como usado pelo caso (impede a coleta)."""
+        sha = _sha_da_referencia(ref)
+        nome = _nome_caso(case_id)
+        with self._travar():
+            for diretorio, arquivo in (
+                (os.path.join(self._refs, sha), nome),
+                (os.path.join(self._casos, nome), sha),
+            ):
+                os.makedirs(diretorio, exist_ok=True)
+                with open(os.path.join(diretorio, arquivo), "ab"):
+                    pass
+
+    def finalizar_caso(self, case_id: str) -> int:
+        """
+        Remove os vínculos do caso e apaga os blobs que não têm outro dono.
+
+        Returns:
+            int: Quantidade de blobs apagados.
+        """
+        nome = _nome_caso(case_id)
+        diretorio_caso = os.path.join(self._casos, nome)
+        try:
+            shas = os.listdir(diretorio_caso)
+        except FileNotFoundError:
+            return 0
+        apagados = 0
+        for sha in shas:
+            refs = os.path.join(self._refs, sha)
+            # Sem o lock, outro caso poderia vincular o blob entre o rmdir e
+            # o unlink (achando o arquivo ainda no lugar) e perdê-lo
+            with self._travar():
+                try:
+                    os.unlink(os.path.join(refs, nome))
+                except FileNotFoundError:
+                    pass
+                try:
+                    # Só funciona com o diretório vazio, isto é, sem outros casos
+                    os.rmdir(refs)
+                except OSError:
+                    continue
+                try:
+                    os.unlink(os.path.join(self._objetos, sha[:2], sha))
+                    apagados += 1
+                except FileNotFoundError:
+                    pass
+        shutil.rmtree(diretorio_caso, ignore_errors=True)
+        return apagados
+
+    def coletar(self, idade_segundos: float = IDADE_COLETA_PADRAO_SEGUNDOS) -> int:
+        """
+        Apaga blobs sem nenhum caso vinculado modificados há mais de
+        `idade_segundos`, além de temporários de gravações interrompidas.
+
+        Returns:
+            int: Quantidade de arquivos apagados.
+        """
+        limite = time.time() - idade_segundos
+        apagados = 0
+        for prefixo in os.listdir(self._objetos):
+            diretorio = os.path.join(self._objetos, prefixo)
+            if not os.path.isdir(diretorio):
+                continue
+            for entrada in os.scandir(diretorio):
+                try:
+                    if entrada.stat().st_mtime > limite:
+                        continue
+                    with self._travar():
+                        if not entrada.name.startswith(".tmp-") and os.path.isdir(
+                            os.path.join(self._refs, entrada.name)
+                        ):
+                            continue
+                        os.unlink(entrada.path)
+                    apagados += 1
+                except FileNotFoundError:
+                    continue
+        return apagados
+
+    def estatisticas(self) -> Dict[str, int]:
+        blobs = total = 0
+        for prefixo in os.listdir(self._objetos):
+            diretorio = os.path.join(self._objetos, prefixo)
+            if not os.path.isdir(diretorio):
+                continue
+            for entrada in os.scandir(diretorio):
+                if not entrada.name.startswith(".tmp-"):
+                    blobs += 1
+                    total += entrada.stat().st_size
+        return {"blobs": blobs, "bytes": total, "casos": len(os.listdir(self._casos))}
+
+
+_armazem_padrao: Optional[ArmazemBlobs] = None
+_armazem_padrao_lock = threading.Lock()
+
+
+def get_armazem_blobs() -> Optional[ArmazemBlobs]:
+    """Armazém definido por MOSTQI_BLOBS_DIR, ou None se desativado."""
+    global _armazem_padrao
+    raiz = os.getenv("MOSTQI_BLOBS_DIR", "").strip()
+    if not raiz:
+        return None
+    if _armazem_padrao is None or _armazem_padrao.raiz != raiz:
+        with _armazem_padrao_lock:
+            if _armazem_padrao is None or _armazem_padrao.raiz != raiz:
+                _armazem_padrao = ArmazemBlobs(raiz)
+    return _armazem_padrao
+
+
+def abrir_blob(ref: str) -> FonteBlob:
+    """Abre uma referência no armazém padrão (usado por ``abrir_entrada``)."""
+    armazem = get_armazem_blobs()
+    if armazem is None:
+        raise ValueError(
+            "Referência de blob recebida, mas MOSTQI_BLOBS_DIR não está definido."
+        )
+    return armazem.abrir(ref)
+
+
+def guardar_imagem(
+    conteudo: Union[str, bytes, bytearray, memoryview, FonteArquivo, None],
+) -> Union[str, bytes, bytearray, memoryview, FonteArquivo, None]:
+    """
+    Troca a imagem (base64 ou bytes) por uma referência no armazém padrão.
+
+    Sem armazém configurado, ou se a gravação falhar, devolve o valor como
+    veio, para o step seguinte continuar recebendo base64.
+    """
+    armazem = get_armazem_blobs()
+    if armazem is None or not conteudo or eh_referencia(conteudo):
+        return conteudo
+    try:
+        if isinstance(conteudo, str):
+            return armazem.gravar_base64(conteudo)
+        return armazem.gravar(conteudo)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Imagem mantida em base64; falha ao gravar blob: {e}")
+        return conteudo
+
+
+def reter_blob(ref: str, case_id: Optional[str] = None) -> bool:
+    """
+    Vincula ao caso um blob gravado antes (ex.: referência guardada em cache).
+
+    Args:
+        case_id (str, opcional): Padrão: case ID atual.
+
+    Returns:
+        bool: False se não há armazém ou se o blob já foi apagado.
+    """
+    armazem = get_armazem_blobs()
+    if armazem is None or not eh_referencia(ref):
+        return False
+    case_id = case_id or case_id_atual()
+    try:
+        # O vínculo vem antes da checagem: o blob não some entre as duas
+        if case_id:
+            armazem.vincular(ref, case_id)
+        return armazem.existe(ref)
+    except (OSError, ValueError):
+        return False
+
+
+def finalizar_caso(case_id: Optional[str] = None) -> int:
+    """
+    Libera os blobs do caso no armazém padrão (sem armazém, não faz nada).
+
+    Args:
+        case_id (str, opcional): Padrão: case ID atual.
+
+    Returns:
+        int: Quantidade de blobs apagados.
+    """
+    armazem = get_armazem_blobs()
+    case_id = case_id or case_id_atual()
+    if armazem is None or not case_id:
+        return 0
+    try:
+        return armazem.finalizar_caso(case_id)
+    except OSError as e:
+        logger.warning(f"Falha ao liberar os blobs do caso {case_id}: {e}")
+        return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Armazém de blobs dos steps")
+    parser.add_argument(
+        "--raiz",
+        default=os.getenv("MOSTQI_BLOBS_DIR"),
+        help="Diretório do armazém (padrão: MOSTQI_BLOBS_DIR)",
+    )
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    coletar = comandos.add_parser("coletar", help="Apaga blobs sem caso vinculado")
+    coletar.add_argument(
+        "--idade",
+        type=float,
+        default=IDADE_COLETA_PADRAO_SEGUNDOS,
+        help="Idade mínima, em segundos, dos blobs apagados",
+    )
+    finalizar = comandos.add_parser("finalizar", help="Libera os blobs de um caso")
+    finalizar.add_argument("case_id")
+    comandos.add_parser("estatisticas", help="Quantidade e tamanho dos blobs")
+    args = parser.parse_args()
+
+    if not args.raiz:
+        parser.error("informe --raiz ou defina MOSTQI_BLOBS_DIR")
+    armazem = ArmazemBlobs(args.raiz)
+    if args.comando == "coletar":
+        print(f"Blobs apagados: {armazem.coletar(args.idade)}")
+    elif args.comando == "finalizar":
+        print(f"Blobs apagados: {armazem.finalizar_caso(args.case_id)}")
+    else:
+        for chave, valor in armazem.estatisticas().items():
+            print(f"{chave}: {valor}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from .arquivos import Arquivo, FonteArquivo
+
+# Padrões sobrescritos pelas variáveis MOSTQI_CACHE_*
+TTL_PADRAO_SEGUNDOS = 24 * 60 * 60
+MAX_ITENS_MEMORIA = 1024
+MAX_BYTES_MEMORIA = 64 * 1024 * 1024
+MAX_BYTES_DISCO = 256 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def hash_conteudo(conteudo: Arquivo) -> str:
+    """SHA-256 (hex) do conteúdo, usado como chave endereçada por conteúdo."""
+    if isinstance(conteudo, FonteArquivo):
+        return conteudo.sha256()
+    return hashlib.sha256(conteudo).hexdigest()
+
+
+def _tamanho(valor: Any) -> int:
+    """Tamanho aproximado do valor: o do JSON que o nível em disco gravaria."""
+    return len(json.dumps(valor, ensure_ascii=False, default=str))
+
+
+class LRUCache:
+    """
+    Cache em memória com política LRU e expiração por TTL.
+
+    Thread-safe; guarda objetos Python sem serializar. Limitado pelo número
+    de itens e pelo tamanho total (estimado pelo JSON de cada valor); um
+    valor maior que `max_bytes` não é guardado.
+    """
+
+    def __init__(
+        self,
+        max_itens: int = MAX_ITENS_MEMORIA,
+        ttl_segundos: float = TTL_PADRAO_SEGUNDOS,
+        max_bytes: int = MAX_BYTES_MEMORIA,
+    ) -> None:
+        self.max_itens = max_itens
+        self.ttl_segundos = ttl_segundos
+        self.max_bytes = max_bytes
+        self._itens: "OrderedDict[str, Tuple[float, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, chave: str) -> Optional[Any]:
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self.misses += 1
+                return None
+            expira_em, valor, tamanho = item
+            if expira_em < time.time():
+                del self._itens[chave]
+                self._bytes -= tamanho
+                self.misses += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.hits += 1
+            return valor
+
+    def set(self, chave: str, valor: Any) -> None:
+        tamanho = _tamanho(valor)
+        with self._lock:
+            anterior = self._itens.pop(chave, None)
+            if anterior is not None:
+                self._bytes -= anterior[2]
+            if tamanho > self.max_bytes:
+                return
+            self._itens[chave] = (time.time() + self.ttl_segundos, valor, tamanho)
+            self._bytes += tamanho
+            while len(self._itens) > self.max_itens or self._bytes > self.max_bytes:
+                _, (_, _, removido) = self._itens.popitem(last=False)
+                self._bytes -= removido
+                self.evictions += 1
+
+    def delete(self, chave: str) -> None:
+        with self._lock:
+            item = self._itens.pop(chave, None)
+            if item is not None:
+                self._bytes -= item[2]
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+    def estatisticas(self) -> Dict[str, int]:
+        return {
+            "itens": len(self._itens),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SQLiteCache:
+    """
+    Cache persistente em SQLite (modo WAL) com TTL e limite de tamanho total.
+
+    Os valores são gravados como JSON. Quando o total passa de `max_bytes`,
+    as entradas acessadas há mais tempo são removidas.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl_segundos: float = TTL_PADRAO_SEGUNDOS,
+        max_bytes: int = MAX_BYTES_DISCO,
+    ) -> None:
+        self.path = path
+        self.ttl_segundos = ttl_segundos
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        diretorio = os.path.dirname(os.path.abspath(path))
+        os.makedirs(diretorio, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                chave TEXT PRIMARY KEY,
+                valor BLOB NOT NULL,
+                tamanho INTEGER NOT NULL,
+                expira_em REAL NOT NULL,
+                acessado_em REAL NOT NULL
+            )
+            """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_acessado ON cache (acessado_em)"
+        )
+        self._conn.commit()
+
+    def get(self, chave: str) -> Optional[Any]:
+        agora = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT valor, expira_em FROM cache WHERE chave = ?", (chave,)
+            ).fetchone()
+            if row is None or row[1] < agora:
+                if row is not None:
+                    self._conn.execute("DELETE FROM cache WHERE chave = ?", (chave,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE cache SET acessado_em = ? WHERE chave = ?", (agora, chave)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, chave: str, valor: Any) -> None:
+        raw = json.dumps(valor, ensure_ascii=False).encode("utf-8")
+        agora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (chave, raw, len(raw), agora + self.ttl_segundos, agora),
+            )
+            self._evict(agora)
+            self._conn.commit()
+
+    def _evict(self, agora: float) -> None:
+        removidos = self._conn.execute(
+            "DELETE FROM cache WHERE expira_em < ?", (agora,)
+        ).rowcount
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(tamanho), 0) FROM cache"
+        ).fetchone()[0]
+        if total > self.max_bytes:
+            excesso = total - self.max_bytes
+            liberado = 0
+            chaves = []
+            for chave, tamanho in self._conn.execute(
+                "SELECT chave, tamanho FROM cache ORDER BY acessado_em"
+            ):
+                chaves.append((chave,))
+                liberado += tamanho
+                if liberado >= excesso:
+                    break
+            self._conn.executemany("DELETE FROM cache WHERE chave = ?", chaves)
+            removidos += len(chaves)
+        self.evictions += max(removidos, 0)
+
+    def delete(self, chave: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE chave = ?", (chave,))
+            self._conn.commit()
+
+    def estatisticas(self) -> Dict[str, int]:
+        with self._lock:
+            itens, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM cache"
+            ).fetchone()
+        return {
+            "itens": itens,
+            "bytes": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class ResultCache:
+    """
+    Cache em dois níveis (memória LRU + disco SQLite) para resultados de
+    extração, endereçado pelo hash SHA-256 da imagem enviada.
+
+    Um hit no disco promove a entrada para a memória.
+    """
+
+    def __init__(self, memoria: LRUCache, disco: Optional[SQLiteCache] = None) -> None:
+        self.memoria = memoria
+        self.disco = disco
+
+    @staticmethod
+    def _chave(namespace: str, digest: str) -> str:
+        return f"{namespace}:{digest}"
+
+    def get(self, namespace: str, digest: str) -> Optional[Dict[str, Any]]:
+        chave = self._chave(namespace, digest)
+        valor = self.memoria.get(chave)
+        if valor is not None or self.disco is None:
+            return valor
+        valor = self.disco.get(chave)
+        if valor is not None:
+            self.memoria.set(chave, valor)
+        return valor
+
+    def set(self, namespace: str, digest: str, valor: Dict[str, Any]) -> None:
+        chave = self._chave(namespace, digest)
+        self.memoria.set(chave, valor)
+        if self.disco is not None:
+            try:
+                self.disco.set(chave, valor)
+            except sqlite3.Error as e:
+                logger.warning(f"Falha ao gravar cache em disco: {e}")
+
+    def estatisticas(self) -> Dict[str, Dict[str, int]]:
+        estatisticas = {"memoria": self.memoria.estatisticas()}
+        if self.disco is not None:
+            estatisticas["disco"] = self.disco.estatisticas()
+        return estatisticas
+
+
+def cache_do_ambiente() -> ResultCache:
+    """
+    Cria o cache a partir das variáveis de ambiente:
+
+    - MOSTQI_CACHE_DIR: diretório do nível em disco (desativado se vazio)
+    - MOSTQI_CACHE_TTL: validade das entradas em segundos
+    - MOSTQI_CACHE_MAX_ITENS: entradas mantidas em memória
+    - MOSTQI_CACHE_MAX_BYTES_MEMORIA: tamanho máximo do nível em memória
+    - MOSTQI_CACHE_MAX_BYTES: tamanho máximo do nível em disco
+    """
+    ttl = float(os.getenv("MOSTQI_CACHE_TTL", TTL_PADRAO_SEGUNDOS))
+    memoria = LRUCache(
+        int(os.getenv("MOSTQI_CACHE_MAX_ITENS", MAX_ITENS_MEMORIA)),
+        ttl,
+        int(os.getenv("MOSTQI_CACHE_MAX_BYTES_MEMORIA", MAX_BYTES_MEMORIA)),
+    )
+    diretorio = os.getenv("MOSTQI_CACHE_DIR", "").strip()
+    disco = None
+    if diretorio:
+        disco = SQLiteCache(
+            os.path.join(diretorio, "extracoes.sqlite3"),
+            ttl,
+            int(os.getenv("MOSTQI_CACHE_MAX_BYTES", MAX_BYTES_DISCO)),
+        )
+    return ResultCache(memoria, disco)
+
+
+_cache_padrao: Optional[ResultCache] = None
+_cache_padrao_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Cache de resultados compartilhado pelos steps do processo."""
+    global _cache_padrao
+    if _cache_padrao is None:
+        with _cache_padrao_lock:
+            if _cache_padrao is None:
+                _cache_padrao = cache_do_ambiente()
+    return _cache_padrao
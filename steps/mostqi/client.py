@@ -0,0 +1,559 @@
+import asyncio
+import contextvars
+import functools
+import json as json_lib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional: sem ele usa o json da biblioteca padrão
+    orjson = None
+
+from .arquivos import Arquivo, CorpoMultipart
+from .auth import TokenCache, get_token_cache
+from .idp import RespostaIDP, ler_resposta_idp
+from .limites import (
+    STATUS_TRANSITORIOS,
+    ControleConcorrencia,
+    LimitadorTaxa,
+    PoliticaHedge,
+    PoliticaRetry,
+    TentativaCancelada,
+    cancelamento_atual,
+    tentativa_cancelada,
+)
+from .metricas import MedicaoHTTP, observar_resposta
+from .prazo import PrazoEsgotado, comporta_espera, limitar_timeout
+from .tracing import span
+
+BASE_URL = os.getenv("MOSTQI_BASE_URL", "https://mostqiapi.com")
+# Conexões keep-alive mantidas por host; deve acompanhar a concorrência dos workers.
+POOL_SIZE = int(os.getenv("MOSTQI_POOL_SIZE", "32"))
+TIMEOUT_SECONDS = 30
+AUTH_TIMEOUT_SECONDS = 10
+USER_AGENT = "CNH-Validation-Workflow/1.0"
+
+AUTH_PATH = "/user/authenticate"
+CONTENT_EXTRACTION_PATH = "/process-image/content-extraction"
+VIO_EXTRACTION_PATH = "/process-image/vio-extraction"
+LIVENESS_START_PATH = "/liveness/streaming/async"
+LIVENESS_STATUS_PATH = "/liveness/streaming/async/status"
+FACE_COMPARE_PATH = "/process-image/biometrics/face-compare"
+
+# Chamadas que podem ser repetidas mesmo se a mostQI já as tiver processado
+IDEMPOTENTES = frozenset({AUTH_PATH, LIVENESS_STATUS_PATH})
+# Chamadas dos steps 02, 04, 07 e 08, com concorrência adaptativa
+ADAPTATIVOS = (
+    CONTENT_EXTRACTION_PATH,
+    VIO_EXTRACTION_PATH,
+    LIVENESS_STATUS_PATH,
+    FACE_COMPARE_PATH,
+)
+
+CNH_TAGS = ["id=bra-cnh-3", "language=pt-BR", "type=documento-pessoal"]
+
+# O que a IDP devolve além dos campos: imagem corrigida (returnImage) e
+# recortes, entre eles a face usada pelo step 08 (returnCrops). Imagens em
+# base64 ocupam vários MB na resposta; quem só precisa dos campos usa "campos".
+PERFIS_EXTRACAO: Dict[str, Dict[str, bool]] = {
+    "completo": {"return_image": True, "return_crops": True},
+    "face": {"return_image": False, "return_crops": True},
+    "campos": {"return_image": False, "return_crops": False},
+}
+PERFIL_EXTRACAO_PADRAO = os.getenv("MOSTQI_PERFIL_EXTRACAO", "completo")
+
+logger = logging.getLogger(__name__)
+
+
+class AuthError(requests.exceptions.RequestException):
+    """Falha ao obter o token JWT da mostQI."""
+
+
+def decodificar_json(conteudo: bytes) -> Any:
+    """Decodifica o corpo da resposta (orjson, se instalado)."""
+    if orjson is not None:
+        return orjson.loads(conteudo)
+    return json_lib.loads(conteudo)
+
+
+class _PoolCancelavel:
+    """
+    Registra no ``Cancelamento`` da tentativa (mostqi.limites) a conexão que
+    ela usa, para que o hedge possa fechá-la quando a outra cópia vencer.
+    """
+
+    def _get_conn(self, timeout=None):
+        conexao = super()._get_conn(timeout)
+        cancelamento = cancelamento_atual()
+        if cancelamento is not None and not cancelamento.registrar(conexao):
+            self._put_conn(conexao)
+            raise TentativaCancelada("Tentativa cancelada antes de abrir a conexão.")
+        return conexao
+
+    def _put_conn(self, conexao) -> None:
+        cancelamento = cancelamento_atual()
+        if cancelamento is not None and conexao is not None:
+            cancelamento.liberar(conexao)
+        super()._put_conn(conexao)
+
+
+class _PoolHTTPCancelavel(_PoolCancelavel, HTTPConnectionPool):
+    pass
+
+
+class _PoolHTTPSCancelavel(_PoolCancelavel, HTTPSConnectionPool):
+    pass
+
+
+class AdaptadorCancelavel(HTTPAdapter):
+    """HTTPAdapter cujos pools aceitam o cancelamento de uma tentativa."""
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _PoolHTTPCancelavel,
+            "https": _PoolHTTPSCancelavel,
+        }
+
+
+class MostQIClient:
+    """
+    Cliente síncrono das APIs mostQI.
+
+    Usa uma única requests.Session com pool de conexões keep-alive, de modo
+    que as chamadas de um mesmo processo reaproveitam a conexão TCP/TLS. O
+    token JWT vem do TokenCache e é renovado uma vez caso a API responda 401.
+    As chamadas passam pelo limitador de taxa e, em 429/5xx ou falha de
+    conexão, são repetidas conforme a política de retry (ver mostqi.limites).
+    Com MOSTQI_HEDGE, as chamadas idempotentes lentas recebem uma cópia
+    (PoliticaHedge).
+    """
+
+    def __init__(
+        self,
+        base_url: str = BASE_URL,
+        pool_size: int = POOL_SIZE,
+        timeout: float = TIMEOUT_SECONDS,
+        token_cache: Optional[TokenCache] = None,
+        limitador: Optional[LimitadorTaxa] = None,
+        retry: Optional[PoliticaRetry] = None,
+        concorrencia: Optional[ControleConcorrencia] = None,
+        hedge: Optional[PoliticaHedge] = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._token_cache = token_cache
+        self.limitador = limitador or LimitadorTaxa.do_ambiente()
+        self.retry = retry or PoliticaRetry.do_ambiente()
+        self.concorrencia = concorrencia or ControleConcorrencia.do_ambiente(
+            ADAPTATIVOS, pool_size
+        )
+        self.hedge = hedge or PoliticaHedge.do_ambiente(IDEMPOTENTES)
+        self.session = requests.Session()
+        adapter = AdaptadorCancelavel(
+            pool_connections=4, pool_maxsize=pool_size, max_retries=0
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"User-Agent": USER_AGENT})
+
+    @property
+    def token_cache(self) -> TokenCache:
+        return self._token_cache or get_token_cache()
+
+    def close(self) -> None:
+        self.session.close()
+
+    def authenticate(self, client_key: str) -> str:
+        """
+        Autentica na API mostQI sem passar pelo cache.
+
+        Raises:
+            requests.exceptions.HTTPError: Se a API responder com erro.
+            ValueError: Se a resposta não contiver o token.
+        """
+        logger.info("Autenticando na API mostQI...")
+        if self.hedge is None:
+            data = self._autenticar(client_key)
+        else:
+            data = self.hedge.executar(
+                AUTH_PATH, functools.partial(self._autenticar, client_key)
+            )
+        token = data.get("token") if isinstance(data, dict) else None
+        if not token:
+            raise ValueError("O token não foi encontrado na resposta da API.")
+        return token
+
+    def _autenticar(self, client_key: str) -> Any:
+        """Uma chamada a /user/authenticate; devolve o JSON da resposta."""
+        with span("http.post", endpoint=AUTH_PATH) as s:
+            with MedicaoHTTP(AUTH_PATH) as medicao:
+                response = self._enviar_http(
+                    medicao,
+                    self.base_url + AUTH_PATH,
+                    json={"token": client_key},
+                    timeout=limitar_timeout(AUTH_TIMEOUT_SECONDS),
+                )
+                medicao.status = response.status_code
+            s.set(
+                http_status=response.status_code,
+                bytes_recebidos=len(response.content),
+            )
+            response.raise_for_status()
+            return decodificar_json(response.content)
+
+    def _enviar_http(
+        self, medicao: MedicaoHTTP, url: str, **kwargs: Any
+    ) -> requests.Response:
+        """POST na sessão; a perdedora de um hedge sai com TentativaCancelada."""
+        try:
+            return self.session.post(url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            if not tentativa_cancelada():
+                raise
+            medicao.status = "cancelada"
+            if isinstance(e, TentativaCancelada):
+                raise
+            raise TentativaCancelada(
+                "Tentativa encerrada: a outra cópia do hedge respondeu antes."
+            ) from e
+
+    def token(self, client_key: str) -> str:
+        """Token JWT em cache para o client_key."""
+        try:
+            with span("mostqi.token"):
+                return self.token_cache.obter(client_key)
+        except PrazoEsgotado:
+            raise
+        except requests.exceptions.HTTPError as e:
+            raise AuthError(
+                f"A API retornou status {e.response.status_code}: {e.response.text}",
+                response=e.response,
+            ) from e
+        except Exception as e:
+            raise AuthError(str(e)) from e
+
+    def _enviar(
+        self,
+        path: str,
+        client_key: str,
+        timeout: Optional[float],
+        json: Optional[Dict[str, Any]],
+        campos: Sequence[Tuple[str, str]],
+        arquivos: Optional[Sequence[Tuple[str, str, Arquivo, str]]],
+        tentativa: int,
+        decodificar: Callable[[bytes], Any] = decodificar_json,
+    ) -> Tuple[requests.Response, Any]:
+        """Uma tentativa da chamada; devolve a resposta e o JSON (se 2xx)."""
+        headers = {
+            "accept": "application/json",
+            "Authorization": f"Bearer {self.token(client_key)}",
+        }
+        with span("http.post", endpoint=path, tentativa=tentativa) as s:
+            if arquivos is not None:
+                # Corpo novo a cada tentativa: os arquivos são lidos em streaming
+                corpo = CorpoMultipart(campos, arquivos)
+                headers["Content-Type"] = corpo.content_type
+                s.set(bytes_enviados=len(corpo))
+                kwargs: Dict[str, Any] = {"data": corpo}
+            else:
+                kwargs = {"json": json}
+            with MedicaoHTTP(path) as medicao:
+                response = self._enviar_http(
+                    medicao,
+                    self.base_url + path,
+                    headers=headers,
+                    # De novo após as esperas pela taxa e por uma vaga
+                    timeout=limitar_timeout(timeout or self.timeout),
+                    **kwargs,
+                )
+                medicao.status = response.status_code
+            s.set(
+                http_status=response.status_code,
+                bytes_recebidos=len(response.content),
+                # Upload + processamento na mostQI, até os cabeçalhos da resposta
+                servidor_ms=round(response.elapsed.total_seconds() * 1000, 3),
+            )
+            dados = None
+            if response.ok:
+                with span("json.decode", bytes=len(response.content)):
+                    try:
+                        dados = decodificar(response.content)
+                    except ValueError as e:
+                        raise requests.exceptions.InvalidJSONError(
+                            f"Resposta inválida da API: {e}", response=response
+                        ) from e
+                request_id = (
+                    dados.get("requestId")
+                    if isinstance(dados, dict)
+                    else getattr(dados, "request_id", None)
+                )
+                if request_id:
+                    s.set(request_id=request_id)
+                observar_resposta(path, dados)
+        return response, dados
+
+    def _enviar_controlado(
+        self, path: str, client_key: str, *args: Any
+    ) -> Tuple[requests.Response, Any]:
+        """`_enviar` dentro de uma vaga do controle de concorrência adaptativo."""
+        if self.concorrencia is None:
+            return self._enviar(path, client_key, *args)
+        # Token (e uma eventual autenticação) antes de ocupar a vaga
+        self.token(client_key)
+        with self.concorrencia.vaga(path) as vaga:
+            response, dados = self._enviar(path, client_key, *args)
+            vaga.sobrecarga = response.status_code in STATUS_TRANSITORIOS
+        return response, dados
+
+    def _post(
+        self,
+        path: str,
+        client_key: str,
+        timeout: Optional[float] = None,
+        json: Optional[Dict[str, Any]] = None,
+        campos: Sequence[Tuple[str, str]] = (),
+        arquivos: Optional[Sequence[Tuple[str, str, Arquivo, str]]] = None,
+        decodificar: Callable[[bytes], Any] = decodificar_json,
+    ) -> Any:
+        idempotente = path in IDEMPOTENTES
+        self.retry.iniciar()
+        token_renovado = False
+        tentativa = 0
+        while True:
+            # Timeout da tentativa dentro do prazo do caso (PrazoEsgotado se acabou)
+            timeout_tentativa = limitar_timeout(timeout or self.timeout)
+            self.limitador.aguardar(path, client_key)
+            try:
+                tentar = functools.partial(
+                    self._enviar_controlado,
+                    path,
+                    client_key,
+                    timeout_tentativa,
+                    json,
+                    campos,
+                    arquivos,
+                    tentativa,
+                    decodificar,
+                )
+                if self.hedge is None:
+                    response, dados = tentar()
+                else:
+                    response, dados = self.hedge.executar(path, tentar)
+            except PrazoEsgotado:
+                raise
+            except requests.exceptions.RequestException as e:
+                # AuthError de 429/5xx na autenticação também é repetido
+                espera = self.retry.espera(
+                    tentativa,
+                    idempotente or isinstance(e, AuthError),
+                    response=e.response,
+                    erro=e,
+                )
+                # Sem tempo para a espera e outra tentativa, o erro volta já
+                if espera is None or not comporta_espera(espera):
+                    raise
+                logger.warning(f"{path}: {e}; nova tentativa em {espera:.2f} s")
+                time.sleep(espera)
+                tentativa += 1
+                continue
+
+            if response.status_code == 401 and not token_renovado:
+                logger.warning("Token JWT recusado; renovando e repetindo a chamada.")
+                self.token_cache.invalidar(client_key)
+                token_renovado = True
+                tentativa += 1
+                continue
+            if response.ok:
+                return dados
+            espera = self.retry.espera(tentativa, idempotente, response=response)
+            if espera is None or not comporta_espera(espera):
+                break
+            logger.warning(
+                f"{path}: HTTP {response.status_code}; nova tentativa em {espera:.2f} s"
+            )
+            time.sleep(espera)
+            tentativa += 1
+        response.raise_for_status()
+        return dados
+
+    def content_extraction(
+        self,
+        client_key: str,
+        file_content: Arquivo,
+        filename: str = "cnh_image.jpg",
+        content_type: str = "image/jpeg",
+        return_image: bool = True,
+        return_crops: bool = True,
+        tags: Optional[List[str]] = None,
+        timeout: Optional[float] = None,
+    ) -> RespostaIDP:
+        """
+        Envia a frente da CNH para /process-image/content-extraction (IDP).
+
+        A resposta é lida por mostqi.idp.ler_resposta_idp: campos e score do
+        primeiro resultado, com as imagens em base64 ainda não decodificadas.
+        """
+        return self._post(
+            CONTENT_EXTRACTION_PATH,
+            client_key,
+            timeout=timeout,
+            campos=[
+                ("returnImage", "true" if return_image else "false"),
+                ("returnCrops", "true" if return_crops else "false"),
+            ]
+            + [("tags", tag) for tag in (tags if tags is not None else CNH_TAGS)],
+            arquivos=[("file", filename, file_content, content_type)],
+            decodificar=ler_resposta_idp,
+        )
+
+    def vio_extraction(
+        self,
+        client_key: str,
+        file_content: Arquivo,
+        filename: str = "qr_image.jpg",
+        content_type: str = "image/jpeg",
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Envia o verso da CNH para /process-image/vio-extraction (QR Code)."""
+        return self._post(
+            VIO_EXTRACTION_PATH,
+            client_key,
+            timeout=timeout,
+            arquivos=[("file", filename, file_content, content_type)],
+        )
+
+    def liveness_start(
+        self,
+        client_key: str,
+        payload: Dict[str, Any],
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Cria uma sessão de liveness em /liveness/streaming/async."""
+        return self._post(
+            LIVENESS_START_PATH, client_key, timeout=timeout, json=payload
+        )
+
+    def liveness_status(
+        self,
+        client_key: str,
+        process_id: str,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Consulta o status de uma sessão de liveness."""
+        return self._post(
+            LIVENESS_STATUS_PATH,
+            client_key,
+            timeout=timeout,
+            json={"processId": process_id},
+        )
+
+    def face_compare(
+        self,
+        client_key: str,
+        face_a: Arquivo,
+        face_b: Arquivo,
+        content_type_a: str = "application/octet-stream",
+        content_type_b: str = "application/octet-stream",
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Compara duas faces em /process-image/biometrics/face-compare."""
+        return self._post(
+            FACE_COMPARE_PATH,
+            client_key,
+            timeout=timeout,
+            arquivos=[
+                ("faceFileA", "face_a.jpg", face_a, content_type_a),
+                ("faceFileB", "face_b.jpg", face_b, content_type_b),
+            ],
+        )
+
+
+class AsyncMostQIClient:
+    """
+    API asyncio sobre o MostQIClient.
+
+    As chamadas rodam em um pool de threads do mesmo tamanho do pool de
+    conexões, então o event loop nunca bloqueia e a concorrência efetiva
+    continua limitada pelo número de conexões keep-alive.
+    """
+
+    def __init__(
+        self, client: Optional[MostQIClient] = None, max_workers: int = POOL_SIZE
+    ) -> None:
+        self.client = client or get_client()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="mostqi"
+        )
+
+    async def _run(self, func, *args: Any, **kwargs: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        # Copia o contexto para que o case ID e o span atual sigam para a thread
+        contexto = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._executor, contexto.run, functools.partial(func, *args, **kwargs)
+        )
+
+    async def authenticate(self, client_key: str) -> str:
+        return await self._run(self.client.token, client_key)
+
+    async def content_extraction(
+        self, client_key: str, file_content: Arquivo, **kwargs: Any
+    ) -> RespostaIDP:
+        return await self._run(
+            self.client.content_extraction, client_key, file_content, **kwargs
+        )
+
+    async def vio_extraction(
+        self, client_key: str, file_content: Arquivo, **kwargs: Any
+    ) -> Dict[str, Any]:
+        return await self._run(
+            self.client.vio_extraction, client_key, file_content, **kwargs
+        )
+
+    async def liveness_start(
+        self, client_key: str, payload: Dict[str, Any], **kwargs: Any
+    ) -> Dict[str, Any]:
+        return await self._run(
+            self.client.liveness_start, client_key, payload, **kwargs
+        )
+
+    async def liveness_status(
+        self, client_key: str, process_id: str, **kwargs: Any
+    ) -> Dict[str, Any]:
+        return await self._run(
+            self.client.liveness_status, client_key, process_id, **kwargs
+        )
+
+    async def face_compare(
+        self, client_key: str, face_a: Arquivo, face_b: Arquivo, **kwargs: Any
+    ) -> Dict[str, Any]:
+        return await self._run(
+            self.client.face_compare, client_key, face_a, face_b, **kwargs
+        )
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+_client_padrao: Optional[MostQIClient] = None
+_client_padrao_lock = threading.Lock()
+
+
+def get_client() -> MostQIClient:
+    """Cliente compartilhado por todos os steps do processo."""
+    global _client_padrao
+    if _client_padrao is None:
+        with _client_padrao_lock:
+            if _client_padrao is None:
+                _client_padrao = MostQIClient()
+    return _client_padrao
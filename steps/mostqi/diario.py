@@ -0,0 +1,457 @@
+"""
+Diário de casos: retomada de um caso sem pagar de novo pelos steps já feitos.
+
+Se o worker cair depois do step 04 e antes do step 08, a nova execução do
+caso chamaria outra vez a IDP, a VIO e o liveness. Com o diário, cada step
+concluído grava (case ID, step, hash das entradas) -> saída em um SQLite em
+modo WAL; uma nova execução do mesmo step, no mesmo caso e com as mesmas
+entradas, devolve a saída gravada sem chamar a API.
+
+- Só são gravadas saídas sem erro: um step que falhou roda de novo.
+- O hash das entradas ignora ``client_key`` (a chave pode ser trocada entre
+  a queda e a retomada) e ``prazo_caso`` (a retomada tem prazo novo) e usa o
+  conteúdo de bytes e arquivos, não o objeto. Strings com um caminho de
+  arquivo existente ou uma referência de blob também entram pelo conteúdo.
+- Saídas com referências de blob (``blob:sha256:...``) só são reaproveitadas
+  se os blobs ainda existirem no armazém.
+- As gravações vão para uma fila e são confirmadas em lote por uma thread
+  (uma transação e um fsync a cada ``INTERVALO_GRAVACAO_SEGUNDOS`` ou
+  ``LOTE_GRAVACAO`` registros); o step não espera pelo disco. Na saída do
+  processo a fila é descarregada; em uma queda abrupta perde-se no máximo o
+  último lote, e esses steps simplesmente rodam de novo.
+
+Ativado por MOSTQI_DIARIO (caminho do arquivo SQLite, compartilhado pelos
+workers). Os steps entram no diário pelo ``rastrear_step``; a saída fica
+disponível para o mesmo caso até ser removida:
+
+    python -m mostqi.diario mostrar <case_id>
+    python -m mostqi.diario remover <case_id>
+    python -m mostqi.diario coletar --idade 604800
+"""
+
+import argparse
+import atexit
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .arquivos import MAX_CAMINHO, FonteArquivo, FonteCaminho
+from .blobs import PREFIXO, eh_referencia, get_armazem_blobs
+from .metricas import REGISTRO, status_do_resultado
+from .tracing import case_id_atual
+
+LOTE_GRAVACAO = 64
+INTERVALO_GRAVACAO_SEGUNDOS = 0.05
+IDADE_COLETA_PADRAO_SEGUNDOS = 7 * 24 * 60 * 60
+# Entradas que não fazem parte da identidade do step
+ENTRADAS_IGNORADAS = frozenset({"client_key", "prazo_caso"})
+
+DIARIO_REAPROVEITADOS = REGISTRO.contador(
+    "mostqi_diario_reaproveitados_total",
+    "Steps cuja saída veio do diário de casos, sem nova execução",
+    ("step",),
+)
+
+logger = logging.getLogger(__name__)
+
+Chave = Tuple[str, str, str]
+
+
+def _atualizar_hash(h: "hashlib._Hash", valor: Any) -> None:
+    if isinstance(valor, FonteArquivo):
+        h.update(b"arquivo:" + valor.sha256().encode("ascii"))
+    elif isinstance(valor, (bytes, bytearray, memoryview)):
+        h.update(b"bytes:%d:" % len(valor))
+        h.update(valor)
+    elif isinstance(valor, str) and eh_referencia(valor):
+        # A referência já é o SHA-256 do conteúdo
+        h.update(b"arquivo:" + valor[len(PREFIXO) :].encode("ascii"))
+    elif isinstance(valor, str) and len(valor) <= MAX_CAMINHO and os.path.isfile(valor):
+        # Caminho de arquivo (lote, entradas :file): vale o conteúdo, não o
+        # nome; o mesmo caminho com outro arquivo não reaproveita a saída
+        h.update(b"arquivo:" + FonteCaminho(valor).sha256().encode("ascii"))
+    elif isinstance(valor, str):
+        h.update(b"str:%d:" % len(valor))
+        h.update(valor.encode("utf-8"))
+    else:
+        h.update(b"json:")
+        h.update(
+            json.dumps(valor, sort_keys=True, ensure_ascii=False, default=str).encode(
+                "utf-8"
+            )
+        )
+
+
+def hash_entradas(
+    assinatura: inspect.Signature, args: Tuple[Any, ...], kwargs: Dict[str, Any]
+) -> str:
+    """
+    SHA-256 (hex) dos argumentos de um step, pelo nome de cada parâmetro.
+
+    Argumentos posicionais e nomeados com o mesmo valor geram o mesmo hash;
+    parâmetros em ``ENTRADAS_IGNORADAS`` ficam de fora.
+    """
+    ligados = assinatura.bind(*args, **kwargs)
+    ligados.apply_defaults()
+    h = hashlib.sha256()
+    for nome, valor in ligados.arguments.items():
+        if nome in ENTRADAS_IGNORADAS:
+            continue
+        h.update(nome.encode("utf-8") + b"=")
+        _atualizar_hash(h, valor)
+        h.update(b";")
+    return h.hexdigest()
+
+
+def _blobs_disponiveis(saida: Any, case_id: str) -> bool:
+    """Confere (e vincula ao caso) as referências de blob da saída."""
+    if not isinstance(saida, dict):
+        return True
+    refs = [valor for valor in saida.values() if eh_referencia(valor)]
+    if not refs:
+        return True
+    armazem = get_armazem_blobs()
+    if armazem is None or not all(armazem.existe(ref) for ref in refs):
+        return False
+    for ref in refs:
+        armazem.vincular(ref, case_id)
+    return True
+
+
+class DiarioCasos:
+    """
+    Registro append-only das saídas dos steps por caso, em SQLite (WAL).
+
+    Thread-safe e compartilhável entre processos. ``registrar`` só enfileira;
+    a thread de gravação confirma os registros em lote.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        diretorio = os.path.dirname(os.path.abspath(path))
+        os.makedirs(diretorio, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # O fsync de cada lote é o que torna o diário à prova de queda
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS etapas (
+                case_id TEXT NOT NULL,
+                step TEXT NOT NULL,
+                entradas TEXT NOT NULL,
+                saida BLOB NOT NULL,
+                registrado_em REAL NOT NULL,
+                PRIMARY KEY (case_id, step, entradas)
+            ) WITHOUT ROWID
+            """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_etapas_registrado "
+            "ON etapas (registrado_em)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        # Registros ainda na fila, visíveis para consultas do mesmo processo
+        self._pendentes: Dict[Chave, Tuple[bytes, float]] = {}
+        self._fila: "queue.Queue[Optional[Chave]]" = queue.Queue()
+        self._descarregado = threading.Condition(self._lock)
+        self._gravados = 0
+        self.reaproveitados = 0
+        self.registrados = 0
+        self._thread = threading.Thread(
+            target=self._gravar_continuamente, name="mostqi-diario", daemon=True
+        )
+        self._thread.start()
+
+    def consultar(
+        self,
+        case_id: str,
+        step: str,
+        entradas: str,
+        validade_segundos: Optional[float] = None,
+    ) -> Optional[Any]:
+        """
+        Saída gravada do step, ou None se ele ainda não foi concluído.
+
+        Args:
+            validade_segundos (float, opcional): Ignora registros mais antigos
+                que isso (ex.: sessões de liveness, que expiram).
+        """
+        chave = (case_id, step, entradas)
+        with self._lock:
+            item = self._pendentes.get(chave)
+            if item is None:
+                item = self._conn.execute(
+                    "SELECT saida, registrado_em FROM etapas "
+                    "WHERE case_id = ? AND step = ? AND entradas = ?",
+                    chave,
+                ).fetchone()
+        if item is None:
+            return None
+        saida, registrado_em = item
+        if validade_segundos is not None and time.time() - registrado_em > (
+            validade_segundos
+        ):
+            return None
+        return json.loads(saida)
+
+    def registrar(self, case_id: str, step: str, entradas: str, saida: Any) -> bool:
+        """
+        Enfileira a saída do step para gravação; o primeiro registro de cada
+        (caso, step, entradas) prevalece.
+
+        Returns:
+            bool: False se a saída não puder ser serializada em JSON.
+        """
+        try:
+            raw = json.dumps(saida, ensure_ascii=False).encode("utf-8")
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Saída do step {step} não registrada no diário: {e}")
+            return False
+        chave = (case_id, step, entradas)
+        with self._lock:
+            self._pendentes.setdefault(chave, (raw, time.time()))
+            self.registrados += 1
+        self._fila.put(chave)
+        return True
+
+    def _gravar_continuamente(self) -> None:
+        encerrar = False
+        while not encerrar:
+            try:
+                chave = self._fila.get()
+            except Exception:  # interpretador encerrando
+                return
+            lote: List[Chave] = []
+            limite = time.monotonic() + INTERVALO_GRAVACAO_SEGUNDOS
+            while True:
+                if chave is None:
+                    encerrar = True
+                else:
+                    lote.append(chave)
+                if encerrar or len(lote) >= LOTE_GRAVACAO:
+                    break
+                try:
+                    chave = self._fila.get(timeout=max(0.0, limite - time.monotonic()))
+                except queue.Empty:
+                    break
+            if not self._gravar(lote):
+                time.sleep(INTERVALO_GRAVACAO_SEGUNDOS)
+
+    def _gravar(self, lote: List[Chave]) -> bool:
+        with self._lock:
+            linhas = [
+                (*chave, *self._pendentes[chave])
+                for chave in dict.fromkeys(lote)
+                if chave in self._pendentes
+            ]
+            try:
+                if linhas:
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO etapas VALUES (?, ?, ?, ?, ?)", linhas
+                    )
+                    self._conn.commit()
+            except sqlite3.Error as e:
+                # Os registros continuam pendentes e voltam para a fila
+                self._conn.rollback()
+                logger.warning(
+                    f"Falha ao gravar {len(linhas)} registros no diário: {e}"
+                )
+                for chave in lote:
+                    self._fila.put(chave)
+                return False
+            for chave in lote:
+                self._pendentes.pop(chave, None)
+            self._gravados += len(lote)
+            self._descarregado.notify_all()
+        return True
+
+    def descarregar(self, timeout: float = 10.0) -> bool:
+        """Espera a fila atual ser gravada; False se o prazo acabar antes."""
+        with self._lock:
+            alvo = self.registrados
+            return self._descarregado.wait_for(
+                lambda: self._gravados >= alvo or not self._thread.is_alive(), timeout
+            )
+
+    def casos(self, case_id: str) -> Iterator[Dict[str, Any]]:
+        """Registros gravados de um caso, na ordem em que foram concluídos."""
+        self.descarregar()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT step, entradas, saida, registrado_em FROM etapas "
+                "WHERE case_id = ? ORDER BY registrado_em",
+                (case_id,),
+            ).fetchall()
+        for step, entradas, saida, registrado_em in rows:
+            yield {
+                "step": step,
+                "entradas": entradas,
+                "registrado_em": registrado_em,
+                "saida": json.loads(saida),
+            }
+
+    def remover(self, case_id: str) -> int:
+        """Apaga os registros do caso (a próxima execução roda tudo de novo)."""
+        self.descarregar()
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM etapas WHERE case_id = ?", (case_id,)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def coletar(self, idade_segundos: float = IDADE_COLETA_PADRAO_SEGUNDOS) -> int:
+        """Apaga registros mais antigos que `idade_segundos`."""
+        self.descarregar()
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM etapas WHERE registrado_em < ?",
+                (time.time() - idade_segundos,),
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def estatisticas(self) -> Dict[str, int]:
+        with self._lock:
+            registros, casos = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT case_id) FROM etapas"
+            ).fetchone()
+            pendentes = len(self._pendentes)
+        return {
+            "registros": registros,
+            "casos": casos,
+            "pendentes": pendentes,
+            "registrados": self.registrados,
+            "reaproveitados": self.reaproveitados,
+        }
+
+    def fechar(self) -> None:
+        if not self._thread.is_alive():
+            return
+        self._fila.put(None)
+        self._thread.join(timeout=10)
+        with self._lock:
+            self._conn.close()
+
+
+_diario_padrao: Optional[DiarioCasos] = None
+_diario_padrao_lock = threading.Lock()
+
+
+def get_diario() -> Optional[DiarioCasos]:
+    """Diário definido por MOSTQI_DIARIO, ou None se desativado."""
+    global _diario_padrao
+    path = os.getenv("MOSTQI_DIARIO", "").strip()
+    if not path:
+        return None
+    if _diario_padrao is None or _diario_padrao.path != path:
+        with _diario_padrao_lock:
+            if _diario_padrao is None or _diario_padrao.path != path:
+                _diario_padrao = DiarioCasos(path)
+    return _diario_padrao
+
+
+def com_diario(
+    step: str, func: Callable, validade_segundos: Optional[float] = None
+) -> Callable:
+    """
+    Envolve o `main` de um step: com diário ativo e case ID definido, devolve
+    a saída já gravada para as mesmas entradas ou executa e grava a nova.
+
+    Usado pelo ``rastrear_step``; sem MOSTQI_DIARIO ou sem case ID, chama a
+    função diretamente.
+    """
+    assinatura = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        diario = get_diario()
+        case_id = case_id_atual() if diario is not None else None
+        if not case_id:
+            return func(*args, **kwargs)
+        try:
+            entradas = hash_entradas(assinatura, args, kwargs)
+            saida = diario.consultar(case_id, step, entradas, validade_segundos)
+        except (TypeError, sqlite3.Error) as e:
+            logger.warning(f"Diário indisponível para o step {step}: {e}")
+            return func(*args, **kwargs)
+        if saida is not None and _blobs_disponiveis(saida, case_id):
+            logger.info(f"Step {step} do caso {case_id} reaproveitado do diário.")
+            diario.reaproveitados += 1
+            DIARIO_REAPROVEITADOS.inc(step)
+            return saida
+
+        resultado = func(*args, **kwargs)
+        if status_do_resultado(resultado) != "erro":
+            diario.registrar(case_id, step, entradas, resultado)
+        return resultado
+
+    return wrapper
+
+
+def configurar(path: Optional[str]) -> Optional[DiarioCasos]:
+    """Ativa o diário em `path` (None desativa) para os steps deste processo."""
+    if path:
+        os.environ["MOSTQI_DIARIO"] = path
+    else:
+        os.environ.pop("MOSTQI_DIARIO", None)
+    return get_diario()
+
+
+@atexit.register
+def _encerrar() -> None:
+    if _diario_padrao is not None:
+        _diario_padrao.fechar()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Diário de casos dos steps")
+    parser.add_argument(
+        "--db",
+        default=os.getenv("MOSTQI_DIARIO"),
+        help="Arquivo SQLite do diário (padrão: MOSTQI_DIARIO)",
+    )
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    mostrar = comandos.add_parser("mostrar", help="Lista os steps gravados de um caso")
+    mostrar.add_argument("case_id")
+    remover = comandos.add_parser("remover", help="Apaga os registros de um caso")
+    remover.add_argument("case_id")
+    coletar = comandos.add_parser("coletar", help="Apaga registros antigos")
+    coletar.add_argument(
+        "--idade",
+        type=float,
+        default=IDADE_COLETA_PADRAO_SEGUNDOS,
+        help="Idade mínima, em segundos, dos registros apagados",
+    )
+    comandos.add_parser("estatisticas", help="Mostra o tamanho do diário")
+    args = parser.parse_args()
+    if not args.db:
+        parser.error("informe --db ou defina MOSTQI_DIARIO")
+
+    diario = DiarioCasos(args.db)
+    try:
+        if args.comando == "mostrar":
+            for registro in diario.casos(args.case_id):
+                print(json.dumps(registro, ensure_ascii=False))
+        elif args.comando == "remover":
+            print(f"{diario.remover(args.case_id)} registros apagados")
+        elif args.comando == "coletar":
+            print(f"{diario.coletar(args.idade)} registros apagados")
+        else:
+            print(json.dumps(diario.estatisticas()))
+    finally:
+        diario.fechar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,360 @@
+"""
+Encurtador de links próprio para o link da sessão de liveness (step 06).
+
+Substitui a chamada ao TinyURL no caminho crítico: o código curto é gerado
+localmente (microssegundos), fica em um dicionário em memória e, com
+MOSTQI_ENCURTADOR_DB, em um SQLite compartilhado com o servidor de
+redirecionamento. Cada link expira junto com a sessão de liveness
+(``VALIDADE_SESSAO_SEGUNDOS``).
+
+Configuração:
+
+- MOSTQI_ENCURTADOR_URL: endereço público do redirecionador
+  (ex.: ``https://l.exemplo.com.br``). Sem ela, o step 06 usa o TinyURL.
+- MOSTQI_ENCURTADOR_DB: arquivo SQLite com os links, lido pelo redirecionador.
+  Obrigatória junto com a URL: sem ela os códigos ficariam só na memória do
+  worker e o redirecionador responderia 404 (o step 06 volta ao TinyURL).
+
+Redirecionador (a partir da pasta steps/):
+
+    python -m mostqi.encurtador servir --porta 8081
+    python -m mostqi.encurtador encurtar https://exemplo.com/sessao/123
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .liveness import VALIDADE_SESSAO_SEGUNDOS
+
+# Bytes aleatórios por código: 6 bytes = 8 caracteres base64url (2^48
+# códigos); sortear um já em uso é improvável, e a tentativa é refeita
+BYTES_CODIGO = 6
+MAX_TENTATIVAS_CODIGO = 8
+# A cada N links criados, os expirados são removidos
+INTERVALO_LIMPEZA = 1000
+TIMEOUT_LEITURA_SEGUNDOS = 10
+
+_MOTIVOS = {
+    302: "Found",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    410: "Gone",
+}
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Link:
+    url: str
+    expira_em: float
+
+    @property
+    def expirado(self) -> bool:
+        return time.time() >= self.expira_em
+
+
+class EncurtadorLinks:
+    """
+    Códigos curtos aleatórios (base64url) para URLs, com expiração.
+
+    A unicidade do código é garantida pela chave primária do SQLite (ou
+    pelo dicionário, sem banco): em caso de colisão, outro código é sorteado.
+    Os códigos não são sequenciais, então não dá para enumerar as sessões
+    de outros usuários.
+    """
+
+    def __init__(
+        self,
+        url_base: str,
+        path: Optional[str] = None,
+        ttl_segundos: float = VALIDADE_SESSAO_SEGUNDOS,
+    ) -> None:
+        self.url_base = url_base.rstrip("/")
+        self.path = path
+        self.ttl_segundos = ttl_segundos
+        self._links: Dict[str, Link] = {}
+        self._lock = threading.Lock()
+        self._criados = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        if path:
+            diretorio = os.path.dirname(os.path.abspath(path))
+            os.makedirs(diretorio, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS links (
+                    codigo TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    expira_em REAL NOT NULL
+                ) WITHOUT ROWID
+                """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_links_expira ON links (expira_em)"
+            )
+            self._conn.commit()
+
+    def encurtar(self, url: str, ttl_segundos: Optional[float] = None) -> str:
+        """
+        Gera o link curto para `url`.
+
+        Args:
+            url (str): URL de destino (http ou https).
+            ttl_segundos (float, opcional): Validade do link. Padrão: a
+                validade da sessão de liveness.
+
+        Returns:
+            str: URL curta (``<url_base>/<código>``).
+
+        Raises:
+            ValueError: Se a URL não for http(s).
+            RuntimeError: Se não houver código livre após várias tentativas.
+        """
+        if urlsplit(url).scheme not in ("http", "https"):
+            raise ValueError(f"URL inválida para encurtar: {url[:80]}")
+        link = Link(url, time.time() + (ttl_segundos or self.ttl_segundos))
+        with self._lock:
+            for _ in range(MAX_TENTATIVAS_CODIGO):
+                codigo = secrets.token_urlsafe(BYTES_CODIGO)
+                if codigo in self._links or not self._gravar(codigo, link):
+                    continue
+                self._links[codigo] = link
+                self._criados += 1
+                if self._criados % INTERVALO_LIMPEZA == 0:
+                    self._limpar()
+                return f"{self.url_base}/{codigo}"
+        raise RuntimeError("Não foi possível gerar um código curto livre.")
+
+    def _gravar(self, codigo: str, link: Link) -> bool:
+        if self._conn is None:
+            return True
+        try:
+            self._conn.execute(
+                "INSERT INTO links VALUES (?, ?, ?)",
+                (codigo, link.url, link.expira_em),
+            )
+            self._conn.commit()
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def consultar(self, codigo: str) -> Optional[Link]:
+        """Link do código (mesmo expirado), ou None se não existir."""
+        link = self._links.get(codigo)
+        if link is not None or self._conn is None:
+            return link
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, expira_em FROM links WHERE codigo = ?", (codigo,)
+            ).fetchone()
+        return Link(*row) if row else None
+
+    def limpar(self) -> int:
+        """Remove os links expirados; retorna quantos foram removidos."""
+        with self._lock:
+            return self._limpar()
+
+    def _limpar(self) -> int:
+        agora = time.time()
+        expirados = [c for c, link in self._links.items() if link.expira_em <= agora]
+        for codigo in expirados:
+            del self._links[codigo]
+        if self._conn is None:
+            return len(expirados)
+        cursor = self._conn.execute("DELETE FROM links WHERE expira_em <= ?", (agora,))
+        self._conn.commit()
+        return cursor.rowcount
+
+    def fechar(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+_encurtador_padrao: Optional[EncurtadorLinks] = None
+_encurtador_padrao_lock = threading.Lock()
+
+
+def get_encurtador() -> Optional[EncurtadorLinks]:
+    """
+    Encurtador definido por MOSTQI_ENCURTADOR_URL e MOSTQI_ENCURTADOR_DB, ou
+    None se desativado ou sem o banco compartilhado com o redirecionador.
+    """
+    global _encurtador_padrao
+    url_base = os.getenv("MOSTQI_ENCURTADOR_URL", "").strip()
+    if not url_base:
+        return None
+    path = os.getenv("MOSTQI_ENCURTADOR_DB", "").strip()
+    if not path:
+        # Links gravados só neste processo dariam 404 no redirecionador
+        logger.error(
+            "MOSTQI_ENCURTADOR_URL definido sem MOSTQI_ENCURTADOR_DB; "
+            "o encurtador próprio fica desativado."
+        )
+        return None
+    if _encurtador_padrao is None:
+        with _encurtador_padrao_lock:
+            if _encurtador_padrao is None:
+                _encurtador_padrao = EncurtadorLinks(url_base, path)
+    return _encurtador_padrao
+
+
+class Redirecionador:
+    """
+    Servidor HTTP asyncio mínimo: ``GET /<código>`` responde 302 para a URL
+    original, 410 se o link expirou e 404 se o código não existe.
+    """
+
+    def __init__(
+        self, encurtador: EncurtadorLinks, host: str = "127.0.0.1", porta: int = 8081
+    ) -> None:
+        self.encurtador = encurtador
+        self.host = host
+        self.porta = porta
+        self._servidor: Optional[asyncio.AbstractServer] = None
+        self.redirecionados = 0
+        self.expirados = 0
+        self.desconhecidos = 0
+
+    async def iniciar(self) -> "Redirecionador":
+        self._servidor = await asyncio.start_server(
+            self._atender, self.host, self.porta
+        )
+        # Porta 0: usa a porta escolhida pelo sistema
+        self.porta = self._servidor.sockets[0].getsockname()[1]
+        logger.info(f"Redirecionador em http://{self.host}:{self.porta}")
+        return self
+
+    async def parar(self) -> None:
+        if self._servidor is not None:
+            self._servidor.close()
+            await self._servidor.wait_closed()
+            self._servidor = None
+
+    async def __aenter__(self) -> "Redirecionador":
+        return await self.iniciar()
+
+    async def __aexit__(self, *exc: object) -> None:
+        await self.parar()
+
+    def resolver(self, metodo: str, alvo: str) -> Tuple[int, Optional[str]]:
+        """(status HTTP, Location) para uma requisição."""
+        if metodo not in ("GET", "HEAD"):
+            return 405, None
+        codigo = urlsplit(alvo).path.strip("/")
+        if not codigo or len(codigo) > 64:
+            self.desconhecidos += 1
+            return 404, None
+        link = self.encurtador.consultar(codigo)
+        if link is None:
+            self.desconhecidos += 1
+            return 404, None
+        if link.expirado:
+            self.expirados += 1
+            return 410, None
+        self.redirecionados += 1
+        return 302, link.url
+
+    async def _atender(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            bruto = await asyncio.wait_for(
+                reader.readuntil(b"\r\n\r\n"), TIMEOUT_LEITURA_SEGUNDOS
+            )
+            try:
+                metodo, alvo, _ = bruto.decode("latin-1").split("\r\n", 1)[0].split(" ")
+            except ValueError:
+                status, destino = 400, None
+            else:
+                status, destino = self.resolver(metodo, alvo)
+            cabecalhos = (
+                f"HTTP/1.1 {status} {_MOTIVOS.get(status, '')}\r\n"
+                "Content-Length: 0\r\n"
+                "Cache-Control: no-store\r\n"
+                "Connection: close\r\n"
+            )
+            if destino:
+                cabecalhos += f"Location: {destino}\r\n"
+            writer.write((cabecalhos + "\r\n").encode("latin-1"))
+            await writer.drain()
+        except (
+            asyncio.TimeoutError,
+            asyncio.IncompleteReadError,
+            asyncio.LimitOverrunError,
+            ConnectionError,
+        ):
+            pass
+        finally:
+            writer.close()
+
+
+async def _servir(encurtador: EncurtadorLinks, host: str, porta: int) -> None:
+    async with Redirecionador(encurtador, host, porta) as redirecionador:
+        print(
+            f"Redirecionando em http://{redirecionador.host}:{redirecionador.porta}",
+            file=sys.stderr,
+        )
+        while True:
+            await asyncio.sleep(60)
+            encurtador.limpar()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m mostqi.encurtador",
+        description="Encurtador de links da sessão de liveness.",
+    )
+    parser.add_argument(
+        "--db",
+        default=os.getenv("MOSTQI_ENCURTADOR_DB"),
+        help="Arquivo SQLite dos links (padrão: MOSTQI_ENCURTADOR_DB)",
+    )
+    parser.add_argument(
+        "--url-base",
+        default=os.getenv("MOSTQI_ENCURTADOR_URL", "http://127.0.0.1:8081"),
+        help="Endereço público do redirecionador (padrão: MOSTQI_ENCURTADOR_URL)",
+    )
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    servir = comandos.add_parser("servir", help="Inicia o redirecionador")
+    servir.add_argument("--host", default="127.0.0.1")
+    servir.add_argument("--porta", type=int, default=8081)
+    encurtar = comandos.add_parser("encurtar", help="Gera um link curto")
+    encurtar.add_argument("url")
+    encurtar.add_argument("--ttl", type=float, help="Validade do link (segundos)")
+    args = parser.parse_args(argv)
+
+    if not args.db:
+        parser.error(
+            "informe --db ou defina MOSTQI_ENCURTADOR_DB: o redirecionador e "
+            "os steps precisam do mesmo banco"
+        )
+
+    logging.basicConfig(level=logging.INFO)
+    encurtador = EncurtadorLinks(args.url_base, args.db)
+    try:
+        if args.comando == "encurtar":
+            print(encurtador.encurtar(args.url, args.ttl))
+            return 0
+        asyncio.run(_servir(encurtador, args.host, args.porta))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        encurtador.fechar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
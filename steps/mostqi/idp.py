@@ -0,0 +1,257 @@
+"""
+Leitura seletiva da resposta da IDP (/process-image/content-extraction).
+
+A resposta traz poucos KB de campos e vários MB de imagens em base64 (a
+imagem corrigida e os recortes). Decodificar o JSON inteiro cria uma cópia
+``str`` de cada imagem só para, em seguida, decodificar o base64. Aqui o
+corpo é percorrido sem decodificar as strings longas (o fim de cada string
+é achado com ``bytes.find``): só ``fields`` e ``score`` do primeiro
+resultado são decodificados, em registros com ``__slots__``, e as imagens
+ficam como fatias (memoryview) do próprio corpo, decodificadas direto do
+base64 para o armazém de blobs (``TrechoBase64.conteudo``).
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .arquivos import FonteBuffer, decodificar_base64
+
+# Nomes de recorte que correspondem à foto do titular
+NOMES_RECORTE_FACE = ("foto", "face", "photo", "rosto")
+
+_ESPACOS = re.compile(rb"[ \t\r\n]*")
+_ESTRUTURA = re.compile(rb'["{}\[\]]')
+_ESCALAR = re.compile(rb"-?[0-9][0-9.eE+-]*|true|false|null")
+_ASPAS, _BARRA, _VIRGULA, _DOIS_PONTOS = b'"\\,:'
+_ABRE_OBJETO, _FECHA_OBJETO, _ABRE_ARRAY, _FECHA_ARRAY = b"{}[]"
+
+
+class TrechoBase64:
+    """Uma string base64 da resposta, ainda não decodificada (sem cópia)."""
+
+    __slots__ = ("bruto", "escapado")
+
+    def __init__(self, bruto: memoryview, escapado: bool) -> None:
+        self.bruto = bruto
+        # Alguns serializadores escrevem "/" como "\/"
+        self.escapado = escapado
+
+    def __len__(self) -> int:
+        return len(self.bruto)
+
+    def __repr__(self) -> str:
+        return f"<base64 {len(self.bruto)} bytes>"
+
+    def texto(self) -> str:
+        """O base64 como ``str`` (o que os steps devolvem sem armazém de blobs)."""
+        if self.escapado:
+            return json.loads(b'"' + bytes(self.bruto) + b'"')
+        return str(self.bruto, "ascii")
+
+    def conteudo(self) -> FonteBuffer:
+        """Os bytes da imagem, decodificados direto das fatias do corpo."""
+        return decodificar_base64(self.texto() if self.escapado else self.bruto)
+
+
+@dataclass(frozen=True, slots=True)
+class CampoIDP:
+    nome: str
+    valor: Any = None
+    score: Optional[float] = None
+
+
+@dataclass(frozen=True, slots=True)
+class RecorteIDP:
+    nome: str
+    imagem: Optional[TrechoBase64] = None
+
+
+@dataclass(slots=True)
+class RespostaIDP:
+    """O que os steps usam do primeiro resultado da IDP."""
+
+    campos: Tuple[CampoIDP, ...] = ()
+    score: Optional[float] = None
+    imagem: Optional[TrechoBase64] = None
+    recortes: Tuple[RecorteIDP, ...] = ()
+    request_id: Optional[str] = None
+
+    def valores(self) -> Dict[str, Any]:
+        """Nome -> valor dos campos preenchidos."""
+        return {campo.nome: campo.valor for campo in self.campos if campo.valor}
+
+    def recorte_face(self) -> Optional[TrechoBase64]:
+        """O recorte da foto do titular (returnCrops=true), se veio."""
+        for recorte in self.recortes:
+            nome = recorte.nome.lower()
+            if any(chave in nome for chave in NOMES_RECORTE_FACE):
+                return recorte.imagem
+        return None
+
+
+def ler_resposta_idp(conteudo: bytes) -> RespostaIDP:
+    """
+    Lê a resposta da IDP sem decodificar as imagens.
+
+    Raises:
+        ValueError: Se o corpo não for JSON válido.
+    """
+    leitor = _Leitor(bytes(conteudo))
+    try:
+        return leitor.resposta()
+    except IndexError:
+        raise ValueError("JSON incompleto na resposta da IDP.")
+
+
+class _Leitor:
+    """Percorre o corpo por posições; `_pular` acha o fim de cada valor."""
+
+    __slots__ = ("dados", "buf")
+
+    def __init__(self, dados: bytes) -> None:
+        self.dados = dados
+        self.buf = memoryview(dados)
+
+    def resposta(self) -> RespostaIDP:
+        dados = self.dados
+        resposta = RespostaIDP()
+        inicio = self._espacos(0)
+        if self._espacos(self._pular(inicio)) != len(dados):
+            raise ValueError("Conteúdo após o fim do JSON.")
+        if dados[inicio] != _ABRE_OBJETO:
+            return resposta
+        for chave, i, j in self._membros(inicio):
+            if chave == "requestId":
+                resposta.request_id = self._decodificar(i, j)
+            elif chave == "result" and dados[i] == _ABRE_ARRAY:
+                for k, _ in self._itens(i):
+                    if dados[k] == _ABRE_OBJETO:
+                        self._resultado(k, resposta)
+                    break
+        return resposta
+
+    def _resultado(self, inicio: int, resposta: RespostaIDP) -> None:
+        for chave, i, j in self._membros(inicio):
+            if chave == "fields":
+                resposta.campos = tuple(
+                    CampoIDP(
+                        str(campo.get("name")), campo.get("value"), campo.get("score")
+                    )
+                    for campo in self._decodificar(i, j) or ()
+                    if isinstance(campo, dict)
+                )
+            elif chave == "score":
+                resposta.score = self._decodificar(i, j)
+            elif chave == "image":
+                resposta.imagem = self._trecho(i, j)
+            elif chave == "crops" and self.dados[i] == _ABRE_ARRAY:
+                resposta.recortes = tuple(
+                    self._recorte(k)
+                    for k, _ in self._itens(i)
+                    if self.dados[k] == _ABRE_OBJETO
+                )
+
+    def _recorte(self, inicio: int) -> RecorteIDP:
+        nome = ""
+        imagem = None
+        for chave, i, j in self._membros(inicio):
+            if chave in ("name", "type") and not nome:
+                nome = str(self._decodificar(i, j) or "")
+            elif chave in ("image", "value") and imagem is None:
+                imagem = self._trecho(i, j)
+        return RecorteIDP(nome, imagem)
+
+    def _trecho(self, i: int, j: int) -> Optional[TrechoBase64]:
+        """Fatia da string sem as aspas; None para null ou string vazia."""
+        if self.dados[i] != _ASPAS or j - i <= 2:
+            return None
+        escapado = self.dados.find(b"\\", i + 1, j - 1) >= 0
+        return TrechoBase64(self.buf[i + 1 : j - 1], escapado)
+
+    def _decodificar(self, i: int, j: int) -> Any:
+        return json.loads(self.dados[i:j])
+
+    def _espacos(self, i: int) -> int:
+        return _ESPACOS.match(self.dados, i).end()
+
+    def _fim_string(self, i: int) -> int:
+        """Posição logo após a aspa que fecha a string iniciada em `i`."""
+        dados = self.dados
+        j = i
+        while True:
+            j = dados.find(b'"', j + 1)
+            if j < 0:
+                raise ValueError("String sem fim na resposta da IDP.")
+            barras = 0
+            while dados[j - 1 - barras] == _BARRA:
+                barras += 1
+            if barras % 2 == 0:
+                return j + 1
+
+    def _pular(self, i: int) -> int:
+        """Posição logo após o valor JSON que começa em `i`."""
+        dados = self.dados
+        c = dados[i]
+        if c == _ASPAS:
+            return self._fim_string(i)
+        if c != _ABRE_OBJETO and c != _ABRE_ARRAY:
+            m = _ESCALAR.match(dados, i)
+            if m is None:
+                raise ValueError(f"Valor JSON inválido na posição {i}.")
+            return m.end()
+        profundidade = 0
+        while True:
+            m = _ESTRUTURA.search(dados, i)
+            if m is None:
+                raise ValueError("JSON incompleto na resposta da IDP.")
+            i = m.start()
+            c = dados[i]
+            if c == _ASPAS:
+                i = self._fim_string(i)
+                continue
+            profundidade += 1 if c == _ABRE_OBJETO or c == _ABRE_ARRAY else -1
+            i += 1
+            if profundidade == 0:
+                return i
+
+    def _membros(self, i: int) -> Iterator[Tuple[str, int, int]]:
+        """(chave, início, fim) de cada membro do objeto que começa em `i`."""
+        dados = self.dados
+        i = self._espacos(i + 1)
+        if dados[i] == _FECHA_OBJETO:
+            return
+        while True:
+            if dados[i] != _ASPAS:
+                raise ValueError(f"Chave esperada na posição {i}.")
+            fim_chave = self._fim_string(i)
+            chave = self._decodificar(i, fim_chave)
+            i = self._espacos(fim_chave)
+            if dados[i] != _DOIS_PONTOS:
+                raise ValueError(f"':' esperado na posição {i}.")
+            inicio = self._espacos(i + 1)
+            fim = self._pular(inicio)
+            yield chave, inicio, fim
+            i = self._espacos(fim)
+            if dados[i] == _FECHA_OBJETO:
+                return
+            if dados[i] != _VIRGULA:
+                raise ValueError(f"',' esperado na posição {i}.")
+            i = self._espacos(i + 1)
+
+    def _itens(self, i: int) -> Iterator[Tuple[int, int]]:
+        """(início, fim) de cada item do array que começa em `i`."""
+        dados = self.dados
+        i = self._espacos(i + 1)
+        if dados[i] == _FECHA_ARRAY:
+            return
+        while True:
+            fim = self._pular(i)
+            yield i, fim
+            i = self._espacos(fim)
+            if dados[i] == _FECHA_ARRAY:
+                return
+            if dados[i] != _VIRGULA:
+                raise ValueError(f"',' esperado na posição {i}.")
+            i = self._espacos(i + 1)
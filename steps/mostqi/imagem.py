@@ -0,0 +1,139 @@
+import io
+import logging
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from .arquivos import Arquivo, abrir_entrada
+from .tracing import span
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow é opcional: sem ele a imagem segue sem recompressão
+    Image = None
+    ImageOps = None
+
+# Maior lado (px) aceito por perfil; acima disso a imagem é reduzida.
+# Documentos precisam de resolução para OCR/QR Code, faces bem menos.
+MAX_LADO_DOCUMENTO = int(os.getenv("MOSTQI_IMAGEM_MAX_LADO_DOCUMENTO", "2048"))
+MAX_LADO_FACE = int(os.getenv("MOSTQI_IMAGEM_MAX_LADO_FACE", "1024"))
+QUALIDADE_JPEG = int(os.getenv("MOSTQI_IMAGEM_QUALIDADE", "88"))
+PREPROCESSAMENTO_ATIVO = os.getenv("MOSTQI_IMAGEM_PREPROCESSAR", "1") != "0"
+
+PERFIL_DOCUMENTO = "documento"
+PERFIL_FACE = "face"
+_MAX_LADO = {PERFIL_DOCUMENTO: MAX_LADO_DOCUMENTO, PERFIL_FACE: MAX_LADO_FACE}
+
+# Assinaturas (magic numbers) dos formatos mais comuns vindos de celulares
+_ASSINATURAS = (
+    (b"\xff\xd8\xff", "jpeg", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png", "image/png"),
+    (b"GIF87a", "gif", "image/gif"),
+    (b"GIF89a", "gif", "image/gif"),
+    (b"BM", "bmp", "image/bmp"),
+    (b"II*\x00", "tiff", "image/tiff"),
+    (b"MM\x00*", "tiff", "image/tiff"),
+)
+_EXTENSOES = {"jpeg": "jpg", "tiff": "tif"}
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ImagemPreparada:
+    """Imagem pronta para upload, com o tipo real e o tamanho antes/depois."""
+
+    conteudo: Arquivo
+    formato: str
+    mime: str
+    bytes_originais: int
+    largura: Optional[int] = None
+    altura: Optional[int] = None
+
+    def nome_arquivo(self, base: str) -> str:
+        return f"{base}.{_EXTENSOES.get(self.formato, self.formato)}"
+
+
+def detectar_formato(conteudo: bytes) -> Tuple[str, str]:
+    """
+    Identifica o formato real da imagem pelos primeiros bytes.
+
+    Returns:
+        tuple: (formato, mime). Formatos desconhecidos retornam
+        ("bin", "application/octet-stream").
+    """
+    cabecalho = bytes(conteudo[:16])
+    for assinatura, formato, mime in _ASSINATURAS:
+        if cabecalho.startswith(assinatura):
+            return formato, mime
+    if cabecalho[:4] == b"RIFF" and cabecalho[8:12] == b"WEBP":
+        return "webp", "image/webp"
+    if cabecalho[4:8] == b"ftyp" and cabecalho[8:12] in (b"heic", b"heix", b"mif1"):
+        return "heic", "image/heic"
+    return "bin", "application/octet-stream"
+
+
+def preparar_imagem(
+    conteudo: Arquivo,
+    perfil: str = PERFIL_DOCUMENTO,
+    max_lado: Optional[int] = None,
+    qualidade: int = QUALIDADE_JPEG,
+) -> ImagemPreparada:
+    """
+    Reduz e recomprime a imagem antes do upload.
+
+    Aplica a orientação EXIF, limita o maior lado ao necessário para o
+    perfil, remove os metadados EXIF e recodifica em JPEG. Se o Pillow não
+    estiver instalado ou a imagem não puder ser aberta, o conteúdo original
+    é mantido (sem cópia) e apenas o tipo real é detectado.
+
+    Args:
+        conteudo: Imagem original (bytes ou FonteArquivo).
+        perfil (str): PERFIL_DOCUMENTO (OCR/QR Code) ou PERFIL_FACE.
+        max_lado (int, opcional): Sobrescreve o limite do perfil.
+        qualidade (int): Qualidade JPEG (1-95).
+
+    Returns:
+        ImagemPreparada: Conteúdo a enviar com formato e MIME corretos.
+    """
+    fonte = abrir_entrada(conteudo)
+    formato, mime = detectar_formato(fonte.cabecalho())
+    original = ImagemPreparada(fonte, formato, mime, fonte.tamanho())
+    if not PREPROCESSAMENTO_ATIVO or Image is None:
+        return original
+
+    limite = max_lado or _MAX_LADO.get(perfil, MAX_LADO_DOCUMENTO)
+    try:
+        with span(
+            "imagem.preparar", perfil=perfil, bytes_originais=original.bytes_originais
+        ), fonte.abrir() as arquivo, Image.open(arquivo) as imagem:
+            tem_exif = bool(imagem.getexif())
+            # JPEG: decodifica já em escala reduzida, sem alocar a foto inteira
+            imagem.draft("RGB", (limite, limite))
+            imagem = ImageOps.exif_transpose(imagem)
+            reduzir = max(imagem.size) > limite
+            if reduzir:
+                imagem.thumbnail((limite, limite), Image.LANCZOS)
+            if imagem.mode not in ("RGB", "L"):
+                imagem = imagem.convert("RGB")
+            largura, altura = imagem.size
+            saida = io.BytesIO()
+            imagem.save(saida, format="JPEG", quality=qualidade, optimize=True)
+    except Exception as e:
+        logger.warning(f"Não foi possível pré-processar a imagem: {e}")
+        return original
+
+    recodificada = saida.getvalue()
+    # JPEG já pequeno e sem EXIF: recodificar só perderia qualidade
+    if formato == "jpeg" and not reduzir and not tem_exif:
+        if len(recodificada) >= original.bytes_originais:
+            original.largura, original.altura = largura, altura
+            return original
+
+    logger.info(
+        f"Imagem pré-processada: {original.bytes_originais} -> {len(recodificada)} bytes "
+        f"({largura}x{altura})"
+    )
+    return ImagemPreparada(
+        recodificada, "jpeg", "image/jpeg", original.bytes_originais, largura, altura
+    )
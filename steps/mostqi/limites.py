@@ -0,0 +1,1052 @@
+"""
+Limite de taxa (token bucket) e política de repetição das chamadas à mostQI.
+
+Em rajadas a mostQI responde 429/5xx; sem controle, cada worker repete na
+hora e a carga só aumenta. Aqui ficam:
+
+- ``LimitadorTaxa``: um balde de tokens por endpoint e por ``client_key``,
+  configurado por MOSTQI_TAXA (requisições por segundo), que espaça as
+  chamadas antes de sair do processo.
+- ``PoliticaRetry``: backoff exponencial com jitter completo, respeito ao
+  ``Retry-After`` e um orçamento de repetições (no máximo uma fração das
+  chamadas recentes), para que as repetições não virem uma tempestade.
+- ``ControleConcorrencia``: limite adaptativo (AIMD) de chamadas em
+  andamento por endpoint, que sobe devagar enquanto a latência fica perto
+  da base e cai multiplicativamente em 429/5xx, timeout ou latência alta.
+- ``PoliticaHedge``: para chamadas idempotentes, uma segunda cópia quando a
+  resposta passa do p95 recente do endpoint, limitada por um orçamento.
+
+Todos são usados pelo ``MostQIClient``.
+"""
+
+import collections
+import contextlib
+import contextvars
+import email.utils
+import functools
+import heapq
+import itertools
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+import requests
+
+from .metricas import (
+    CONCORRENCIA_EM_ANDAMENTO,
+    CONCORRENCIA_LIMITE,
+    HEDGE_ENVIADOS,
+    HEDGE_VITORIAS,
+)
+from .prazo import PrazoEsgotado, comporta_espera, espera_maxima
+
+# Respostas que indicam sobrecarga ou falha temporária do servidor
+STATUS_TRANSITORIOS = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+MAX_TENTATIVAS = 4
+ESPERA_INICIAL_SEGUNDOS = 0.25
+ESPERA_MAXIMA_SEGUNDOS = 8.0
+# Retry-After acima disso não é aguardado: o erro volta para o step
+MAX_RETRY_AFTER_SEGUNDOS = 30.0
+PROPORCAO_ORCAMENTO = 0.2
+MINIMO_REPETICOES_POR_SEGUNDO = 1.0
+CAPACIDADE_ORCAMENTO = 10.0
+
+CONCORRENCIA_MINIMA = 1
+# Corte multiplicativo em erro de sobrecarga (429/5xx/timeout) e em latência alta
+FATOR_REDUCAO = 0.5
+FATOR_REDUCAO_LATENCIA = 0.9
+# Latência recente acima de TOLERANCIA_LATENCIA x a base conta como sobrecarga
+TOLERANCIA_LATENCIA = 2.0
+# Peso de cada amostra na latência recente (média móvel exponencial)
+PESO_LATENCIA_RECENTE = 0.2
+# Quanto a base acompanha a latência recente quando ela está acima (0..1)
+DERIVA_LATENCIA_BASE = 0.005
+
+# Hedging: a cópia sai após o p95 das últimas JANELA_LATENCIAS chamadas
+PERCENTIL_HEDGE = 0.95
+JANELA_LATENCIAS = 256
+MIN_AMOSTRAS_HEDGE = 20
+RECALCULO_PERCENTIL = 16
+# No máximo 10% das chamadas de cada endpoint recebem uma cópia
+PROPORCAO_HEDGE = 0.1
+CAPACIDADE_ORCAMENTO_HEDGE = 3.0
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class BaldeTokens:
+    """
+    Token bucket thread-safe.
+
+    `reservar()` nunca recusa: desconta o token (o saldo pode ficar
+    negativo) e devolve quanto tempo esperar até ele existir, o que mantém a
+    ordem de chegada entre as threads sem segurar o lock durante a espera.
+    """
+
+    def __init__(self, taxa: float, capacidade: Optional[float] = None) -> None:
+        if taxa <= 0:
+            raise ValueError("a taxa deve ser maior que zero")
+        self.taxa = taxa
+        self.capacidade = capacidade if capacidade else max(1.0, taxa)
+        self._tokens = self.capacidade
+        self._atualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self) -> float:
+        """Consome um token; devolve a espera (s) até poder usá-lo."""
+        with self._lock:
+            agora = time.monotonic()
+            self._tokens = min(
+                self.capacidade, self._tokens + (agora - self._atualizado) * self.taxa
+            )
+            self._atualizado = agora
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.taxa
+
+    def tentar(self) -> bool:
+        """Consome um token apenas se houver um disponível agora."""
+        with self._lock:
+            agora = time.monotonic()
+            self._tokens = min(
+                self.capacidade, self._tokens + (agora - self._atualizado) * self.taxa
+            )
+            self._atualizado = agora
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def devolver(self) -> None:
+        """Devolve um token reservado e não usado."""
+        with self._lock:
+            self._tokens = min(self.capacidade, self._tokens + 1)
+
+
+def _ler_taxas(texto: str) -> Dict[str, float]:
+    """
+    Interpreta MOSTQI_TAXA: ``"20"`` (todos os endpoints) ou
+    ``"content-extraction=10,face-compare=5,*=20"`` (sufixo do path).
+    """
+    taxas: Dict[str, float] = {}
+    for item in texto.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        chave, _, valor = item.rpartition("=")
+        taxas[chave.strip() or "*"] = float(valor)
+    return taxas
+
+
+class LimitadorTaxa:
+    """
+    Um BaldeTokens por (endpoint, client_key).
+
+    Args:
+        taxas: Requisições por segundo por sufixo de path ("*" = demais).
+            Endpoints sem taxa não são limitados.
+        rajada: Capacidade dos baldes (padrão: a própria taxa, ou seja, até
+            um segundo de requisições de uma vez).
+    """
+
+    def __init__(
+        self, taxas: Optional[Dict[str, float]] = None, rajada: Optional[float] = None
+    ) -> None:
+        self.taxas = {chave: taxa for chave, taxa in (taxas or {}).items() if taxa > 0}
+        self.rajada = rajada
+        self._baldes: Dict[Tuple[str, str], Optional[BaldeTokens]] = {}
+        self._lock = threading.Lock()
+        self.espera_total_s = 0.0
+        self.esperas = 0
+
+    @classmethod
+    def do_ambiente(cls) -> "LimitadorTaxa":
+        """MOSTQI_TAXA (req/s) e MOSTQI_TAXA_RAJADA (capacidade dos baldes)."""
+        rajada = os.getenv("MOSTQI_TAXA_RAJADA", "").strip()
+        return cls(
+            _ler_taxas(os.getenv("MOSTQI_TAXA", "")),
+            float(rajada) if rajada else None,
+        )
+
+    def _taxa(self, path: str) -> Optional[float]:
+        for chave, taxa in self.taxas.items():
+            if chave != "*" and path.endswith(chave):
+                return taxa
+        return self.taxas.get("*")
+
+    def _balde(self, path: str, client_key: str) -> Optional[BaldeTokens]:
+        chave = (path, client_key)
+        try:
+            return self._baldes[chave]
+        except KeyError:
+            pass
+        with self._lock:
+            if chave not in self._baldes:
+                taxa = self._taxa(path)
+                self._baldes[chave] = BaldeTokens(taxa, self.rajada) if taxa else None
+            return self._baldes[chave]
+
+    def aguardar(self, path: str, client_key: str) -> float:
+        """
+        Bloqueia até a chamada caber na taxa; devolve o tempo esperado.
+
+        Raises:
+            PrazoEsgotado: Se a espera não cabe no prazo do caso.
+        """
+        if not self.taxas:
+            return 0.0
+        balde = self._balde(path, client_key)
+        if balde is None:
+            return 0.0
+        espera = balde.reservar()
+        if espera > 0:
+            if not comporta_espera(espera):
+                balde.devolver()
+                raise PrazoEsgotado(
+                    f"A espera de {espera:.2f} s pelo limite de taxa de {path} "
+                    "não cabe no prazo do caso."
+                )
+            self.esperas += 1
+            self.espera_total_s += espera
+            time.sleep(espera)
+        return espera
+
+
+class OrcamentoRetry:
+    """
+    Limita as repetições a uma fração das chamadas recentes.
+
+    Cada chamada nova deposita `proporcao` no saldo e cada repetição
+    consome 1; além disso o saldo recebe `minimo_por_segundo` por segundo,
+    para que um processo com pouco tráfego ainda consiga repetir.
+    """
+
+    def __init__(
+        self,
+        proporcao: float = PROPORCAO_ORCAMENTO,
+        minimo_por_segundo: float = MINIMO_REPETICOES_POR_SEGUNDO,
+        capacidade: float = CAPACIDADE_ORCAMENTO,
+    ) -> None:
+        self.proporcao = proporcao
+        self.minimo_por_segundo = minimo_por_segundo
+        self.capacidade = capacidade
+        self._saldo = capacidade
+        self._atualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _recarregar(self) -> None:
+        agora = time.monotonic()
+        self._saldo = min(
+            self.capacidade,
+            self._saldo + (agora - self._atualizado) * self.minimo_por_segundo,
+        )
+        self._atualizado = agora
+
+    def depositar(self) -> None:
+        with self._lock:
+            self._recarregar()
+            self._saldo = min(self.capacidade, self._saldo + self.proporcao)
+
+    def retirar(self) -> bool:
+        with self._lock:
+            self._recarregar()
+            if self._saldo < 1:
+                return False
+            self._saldo -= 1
+            return True
+
+
+def retry_after(response: requests.Response) -> Optional[float]:
+    """Segundos indicados no cabeçalho Retry-After (número ou data HTTP)."""
+    valor = response.headers.get("Retry-After")
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        data = email.utils.parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, data.timestamp() - time.time())
+
+
+class PoliticaRetry:
+    """
+    Decide se e quanto esperar antes de repetir uma chamada.
+
+    Args:
+        max_tentativas: Total de tentativas por chamada (1 = sem repetição).
+        espera_inicial: Base do backoff exponencial (s).
+        espera_maxima: Teto de cada espera (s).
+        orcamento: Orçamento compartilhado de repetições.
+    """
+
+    def __init__(
+        self,
+        max_tentativas: int = MAX_TENTATIVAS,
+        espera_inicial: float = ESPERA_INICIAL_SEGUNDOS,
+        espera_maxima: float = ESPERA_MAXIMA_SEGUNDOS,
+        orcamento: Optional[OrcamentoRetry] = None,
+    ) -> None:
+        self.max_tentativas = max(1, max_tentativas)
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self.orcamento = orcamento or OrcamentoRetry()
+        self.chamadas = 0
+        self.repeticoes = 0
+        self.negadas_orcamento = 0
+
+    @classmethod
+    def do_ambiente(cls) -> "PoliticaRetry":
+        """MOSTQI_RETRY_MAX_TENTATIVAS e MOSTQI_RETRY_ORCAMENTO (fração)."""
+        return cls(
+            max_tentativas=int(
+                os.getenv("MOSTQI_RETRY_MAX_TENTATIVAS", str(MAX_TENTATIVAS))
+            ),
+            orcamento=OrcamentoRetry(
+                proporcao=float(
+                    os.getenv("MOSTQI_RETRY_ORCAMENTO", str(PROPORCAO_ORCAMENTO))
+                )
+            ),
+        )
+
+    def iniciar(self) -> None:
+        """Registra uma chamada nova (alimenta o orçamento)."""
+        self.chamadas += 1
+        self.orcamento.depositar()
+
+    def backoff(self, tentativa: int) -> float:
+        """Jitter completo: uniforme entre 0 e o teto exponencial."""
+        teto = min(self.espera_maxima, self.espera_inicial * 2**tentativa)
+        return random.uniform(0, teto)
+
+    def espera(
+        self,
+        tentativa: int,
+        idempotente: bool,
+        response: Optional[requests.Response] = None,
+        erro: Optional[Exception] = None,
+    ) -> Optional[float]:
+        """
+        Espera antes da próxima tentativa, ou None para desistir.
+
+        Args:
+            tentativa: Número da tentativa que falhou (0 = primeira).
+            idempotente: A chamada pode ser repetida mesmo se já processada.
+            response: Resposta com erro, se houve resposta.
+            erro: Exceção de rede, se não houve resposta.
+        """
+        if tentativa + 1 >= self.max_tentativas:
+            return None
+        atraso = None
+        if response is not None:
+            status = response.status_code
+            if status not in STATUS_TRANSITORIOS:
+                return None
+            atraso = retry_after(response)
+            if atraso is not None and atraso > MAX_RETRY_AFTER_SEGUNDOS:
+                return None
+        elif isinstance(erro, requests.exceptions.ConnectTimeout):
+            pass  # a requisição não chegou a ser enviada
+        elif isinstance(erro, requests.exceptions.Timeout):
+            # Sem resposta a mostQI pode ter processado (e cobrado) a chamada
+            if not idempotente:
+                return None
+        elif not isinstance(erro, requests.exceptions.ConnectionError):
+            return None
+        if not self.orcamento.retirar():
+            self.negadas_orcamento += 1
+            return None
+        self.repeticoes += 1
+        if atraso is not None:
+            # Um pouco de jitter para os clientes não voltarem todos juntos
+            return atraso + random.uniform(0, self.espera_inicial)
+        return self.backoff(tentativa)
+
+    def estatisticas(self) -> Dict[str, int]:
+        return {
+            "chamadas": self.chamadas,
+            "repeticoes": self.repeticoes,
+            "negadas_orcamento": self.negadas_orcamento,
+        }
+
+
+class LimiteAIMD:
+    """
+    Limite adaptativo de chamadas simultâneas para um endpoint.
+
+    A cada resposta boa o limite sobe 1/limite (cerca de +1 a cada "janela"
+    de chamadas). Em 429/5xx ou timeout ele é multiplicado por
+    FATOR_REDUCAO; quando a latência recente (média móvel) passa de
+    TOLERANCIA_LATENCIA vezes a latência base, por FATOR_REDUCAO_LATENCIA.
+    Cada corte acontece no máximo uma vez por latência recente, para uma
+    rajada de erros da mesma janela não zerar o limite.
+
+    A latência base é a menor latência recente observada, que sobe devagar
+    (DERIVA_LATENCIA_BASE) para acompanhar mudanças no tamanho das imagens.
+
+    Com `endpoint`, o limite e as vagas ocupadas são publicados em
+    ``mostqi_concorrencia_limite`` e ``mostqi_concorrencia_em_andamento``.
+    """
+
+    def __init__(
+        self,
+        inicial: int,
+        minimo: int = CONCORRENCIA_MINIMA,
+        maximo: int = 64,
+        tolerancia_latencia: float = TOLERANCIA_LATENCIA,
+        endpoint: Optional[str] = None,
+    ) -> None:
+        self.minimo = max(1, minimo)
+        self.maximo = max(self.minimo, maximo)
+        self.limite = float(min(self.maximo, max(self.minimo, inicial)))
+        self.tolerancia_latencia = tolerancia_latencia
+        self.em_andamento = 0
+        self.latencia_recente: Optional[float] = None
+        self.latencia_base: Optional[float] = None
+        self.reducoes = 0
+        self.esperas = 0
+        self._ultima_reducao = 0.0
+        self._condicao = threading.Condition()
+        self.endpoint = endpoint
+        self._publicar()
+
+    def _publicar(self) -> None:
+        # Chamado com o lock da condição (ou no construtor)
+        if self.endpoint is not None:
+            CONCORRENCIA_LIMITE.definir(round(self.limite, 2), self.endpoint)
+            CONCORRENCIA_EM_ANDAMENTO.definir(self.em_andamento, self.endpoint)
+
+    def adquirir(self) -> None:
+        """
+        Ocupa uma vaga, esperando no máximo o que o prazo do caso comporta.
+
+        Raises:
+            PrazoEsgotado: Se o prazo acabar antes de abrir uma vaga.
+        """
+        with self._condicao:
+            if self.em_andamento >= int(self.limite):
+                self.esperas += 1
+                try:
+                    while self.em_andamento >= int(self.limite):
+                        self._condicao.wait(espera_maxima())
+                except PrazoEsgotado:
+                    # Repassa um eventual notify recebido para o próximo
+                    self._condicao.notify()
+                    raise
+            self.em_andamento += 1
+            self._publicar()
+
+    def _reduzir(self, fator: float, agora: float) -> None:
+        if agora - self._ultima_reducao >= (self.latencia_recente or 0.0):
+            self.limite = max(self.minimo, self.limite * fator)
+            self._ultima_reducao = agora
+            self.reducoes += 1
+
+    def devolver(self) -> None:
+        """Devolve a vaga sem ajustar o limite (a chamada não chegou a sair)."""
+        with self._condicao:
+            self.em_andamento -= 1
+            self._publicar()
+            self._condicao.notify()
+
+    def liberar(self, latencia: float, sobrecarga: bool) -> None:
+        """
+        Devolve a vaga e ajusta o limite.
+
+        Args:
+            latencia: Duração da chamada (s).
+            sobrecarga: A chamada falhou por sobrecarga (429/5xx, timeout).
+        """
+        with self._condicao:
+            self.em_andamento -= 1
+            agora = time.monotonic()
+            if sobrecarga:
+                self._reduzir(FATOR_REDUCAO, agora)
+            else:
+                recente = self.latencia_recente
+                recente = (
+                    latencia
+                    if recente is None
+                    else recente + (latencia - recente) * PESO_LATENCIA_RECENTE
+                )
+                base = self.latencia_base
+                if base is None or recente < base:
+                    base = recente
+                else:
+                    base += (recente - base) * DERIVA_LATENCIA_BASE
+                self.latencia_recente, self.latencia_base = recente, base
+                if recente > self.tolerancia_latencia * base:
+                    self._reduzir(FATOR_REDUCAO_LATENCIA, agora)
+                else:
+                    self.limite = min(self.maximo, self.limite + 1 / self.limite)
+            self._publicar()
+            livres = int(self.limite) - self.em_andamento
+            if livres > 0:
+                self._condicao.notify(livres)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._condicao:
+            return {
+                "limite": round(self.limite, 2),
+                "em_andamento": self.em_andamento,
+                "latencia_base_ms": (
+                    round(self.latencia_base * 1000, 1) if self.latencia_base else None
+                ),
+                "latencia_recente_ms": (
+                    round(self.latencia_recente * 1000, 1)
+                    if self.latencia_recente
+                    else None
+                ),
+                "reducoes": self.reducoes,
+                "esperas": self.esperas,
+            }
+
+
+class ControleConcorrencia:
+    """
+    Um LimiteAIMD por endpoint (compartilhado entre os client_keys, pois a
+    capacidade limitada é a do serviço).
+
+    Args:
+        endpoints: Sufixos de path controlados; os demais passam direto.
+        inicial, minimo, maximo: Limites de chamadas simultâneas.
+    """
+
+    def __init__(
+        self,
+        endpoints: Tuple[str, ...],
+        inicial: int,
+        minimo: int = CONCORRENCIA_MINIMA,
+        maximo: int = 64,
+    ) -> None:
+        self.endpoints = endpoints
+        self.inicial = inicial
+        self.minimo = minimo
+        self.maximo = maximo
+        self._limites: Dict[str, Optional[LimiteAIMD]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def do_ambiente(
+        cls, endpoints: Tuple[str, ...], maximo: int
+    ) -> Optional["ControleConcorrencia"]:
+        """
+        MOSTQI_CONCORRENCIA_ADAPTATIVA=0 desativa; MOSTQI_CONCORRENCIA_MIN,
+        MOSTQI_CONCORRENCIA_MAX (padrão: o pool de conexões) e
+        MOSTQI_CONCORRENCIA_INICIAL (padrão: metade do máximo) ajustam os
+        limites.
+        """
+        if os.getenv("MOSTQI_CONCORRENCIA_ADAPTATIVA", "1").strip() in ("0", "off"):
+            return None
+        maximo = int(os.getenv("MOSTQI_CONCORRENCIA_MAX", str(maximo)))
+        minimo = int(os.getenv("MOSTQI_CONCORRENCIA_MIN", str(CONCORRENCIA_MINIMA)))
+        inicial = int(
+            os.getenv("MOSTQI_CONCORRENCIA_INICIAL", str(max(1, maximo // 2)))
+        )
+        return cls(endpoints, inicial, minimo, maximo)
+
+    def limite(self, path: str) -> Optional[LimiteAIMD]:
+        try:
+            return self._limites[path]
+        except KeyError:
+            pass
+        with self._lock:
+            if path not in self._limites:
+                controlado = any(path.endswith(sufixo) for sufixo in self.endpoints)
+                self._limites[path] = (
+                    LimiteAIMD(self.inicial, self.minimo, self.maximo, endpoint=path)
+                    if controlado
+                    else None
+                )
+            return self._limites[path]
+
+    @contextlib.contextmanager
+    def vaga(self, path: str) -> Iterator["_Vaga"]:
+        """
+        Ocupa uma vaga do endpoint durante o bloco.
+
+        Uso::
+
+            with controle.vaga(path) as vaga:
+                response = ...
+                vaga.sobrecarga = response.status_code in STATUS_TRANSITORIOS
+        """
+        limite = self.limite(path)
+        vaga = _Vaga()
+        if limite is None:
+            yield vaga
+            return
+        limite.adquirir()
+        inicio = time.monotonic()
+        chamou = True
+        try:
+            yield vaga
+        except (PrazoEsgotado, TentativaCancelada):
+            # O prazo do caso acabou antes da chamada, ou a outra cópia do
+            # hedge venceu: não é sobrecarga do servidor nem amostra de latência
+            chamou = False
+            raise
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            vaga.sobrecarga = True
+            raise
+        finally:
+            if chamou:
+                limite.liberar(time.monotonic() - inicio, vaga.sobrecarga)
+            else:
+                limite.devolver()
+
+    def estatisticas(self) -> Dict[str, Dict[str, Any]]:
+        """Limite atual (métrica exposta), vagas ocupadas e reduções por endpoint."""
+        return {
+            path: limite.estatisticas()
+            for path, limite in list(self._limites.items())
+            if limite is not None
+        }
+
+
+class _Vaga:
+    __slots__ = ("sobrecarga",)
+
+    def __init__(self) -> None:
+        self.sobrecarga = False
+
+
+class TentativaCancelada(requests.exceptions.ConnectionError):
+    """A tentativa foi encerrada porque a outra cópia do hedge venceu."""
+
+
+class Cancelamento:
+    """
+    Encerra, de outra thread, a conexão de uma tentativa em andamento.
+
+    O pool de conexões do ``MostQIClient`` registra aqui a conexão que a
+    tentativa ativa no contexto (``tentativa``) está usando. ``cancelar``
+    fecha o socket e a chamada bloqueada termina na hora com erro de
+    conexão, devolvendo a vaga e a conexão. Depois que a tentativa termina,
+    ``cancelar`` não faz nada: a conexão já pode estar com outra chamada.
+    """
+
+    __slots__ = ("cancelada", "_conexoes", "_encerrada", "_lock")
+
+    def __init__(self) -> None:
+        self.cancelada = False
+        self._conexoes: Set[Any] = set()
+        self._encerrada = False
+        self._lock = threading.Lock()
+
+    def registrar(self, conexao: Any) -> bool:
+        """Acompanha a conexão; False se a tentativa já foi cancelada."""
+        with self._lock:
+            if self.cancelada:
+                return False
+            if not self._encerrada:
+                self._conexoes.add(conexao)
+            return True
+
+    def liberar(self, conexao: Any) -> None:
+        """A conexão voltou ao pool e não pode mais ser fechada daqui."""
+        with self._lock:
+            self._conexoes.discard(conexao)
+
+    def cancelar(self) -> None:
+        with self._lock:
+            if self._encerrada or self.cancelada:
+                return
+            self.cancelada = True
+            for conexao in self._conexoes:
+                sock = getattr(conexao, "sock", None)
+                if sock is not None:
+                    with contextlib.suppress(OSError):
+                        sock.shutdown(socket.SHUT_RDWR)
+
+    def encerrar(self) -> None:
+        with self._lock:
+            self._encerrada = True
+            self._conexoes.clear()
+
+
+_cancelamento_atual: contextvars.ContextVar[Optional[Cancelamento]] = (
+    contextvars.ContextVar("mostqi_cancelamento", default=None)
+)
+
+
+def cancelamento_atual() -> Optional[Cancelamento]:
+    """Cancelamento da tentativa em andamento no contexto, ou None."""
+    return _cancelamento_atual.get()
+
+
+def tentativa_cancelada() -> bool:
+    """Se a tentativa em andamento no contexto foi cancelada pelo hedge."""
+    cancelamento = _cancelamento_atual.get()
+    return cancelamento is not None and cancelamento.cancelada
+
+
+@contextlib.contextmanager
+def tentativa(cancelamento: Cancelamento) -> Iterator[Cancelamento]:
+    """Ativa o cancelamento no bloco (uma tentativa da chamada)."""
+    token = _cancelamento_atual.set(cancelamento)
+    try:
+        yield cancelamento
+    finally:
+        cancelamento.encerrar()
+        _cancelamento_atual.reset(token)
+
+
+class _Agendador:
+    """
+    Uma única thread daemon que executa callbacks em instantes marcados.
+
+    Evita uma thread (ou um ``threading.Timer``) por chamada só para
+    esperar o p95: a thread da cópia só é criada quando o hedge dispara.
+    """
+
+    def __init__(self) -> None:
+        self._fila: List[Tuple[float, int]] = []
+        self._pendentes: Dict[int, Callable[[], None]] = {}
+        self._sequencia = itertools.count()
+        self._condicao = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def agendar(self, atraso: float, callback: Callable[[], None]) -> int:
+        with self._condicao:
+            numero = next(self._sequencia)
+            self._pendentes[numero] = callback
+            heapq.heappush(self._fila, (time.monotonic() + atraso, numero))
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._executar, name="mostqi-hedge-agenda", daemon=True
+                )
+                self._thread.start()
+            self._condicao.notify()
+            return numero
+
+    def cancelar(self, numero: int) -> None:
+        with self._condicao:
+            self._pendentes.pop(numero, None)
+
+    def _proximo(self) -> Callable[[], None]:
+        with self._condicao:
+            while True:
+                while self._fila and self._fila[0][1] not in self._pendentes:
+                    heapq.heappop(self._fila)
+                if not self._fila:
+                    self._condicao.wait()
+                    continue
+                quando, numero = self._fila[0]
+                espera = quando - time.monotonic()
+                if espera <= 0:
+                    heapq.heappop(self._fila)
+                    return self._pendentes.pop(numero)
+                self._condicao.wait(espera)
+
+    def _executar(self) -> None:
+        while True:
+            callback = self._proximo()
+            try:
+                callback()
+            except Exception:
+                logger.exception("Falha ao disparar o hedge")
+
+
+class _Corrida:
+    """Estado compartilhado entre a tentativa original e a cópia do hedge."""
+
+    __slots__ = ("original", "copia", "cancelamento_copia", "encerrada", "lock")
+
+    def __init__(self) -> None:
+        self.original = Cancelamento()
+        self.copia: "Optional[Future[Any]]" = None
+        self.cancelamento_copia = Cancelamento()
+        self.encerrada = False
+        self.lock = threading.Lock()
+
+
+class _LatenciasEndpoint:
+    """Janela das latências recentes de um endpoint e contadores do hedging."""
+
+    __slots__ = (
+        "amostras",
+        "orcamento",
+        "chamadas",
+        "hedges",
+        "_percentil",
+        "_novas",
+        "_lock",
+    )
+
+    def __init__(self, orcamento: OrcamentoRetry) -> None:
+        self.amostras: Deque[float] = collections.deque(maxlen=JANELA_LATENCIAS)
+        self.orcamento = orcamento
+        self.chamadas = 0
+        self.hedges = 0
+        self._percentil: Optional[float] = None
+        self._novas = 0
+        self._lock = threading.Lock()
+
+    def registrar(self, duracao: float) -> None:
+        with self._lock:
+            self.amostras.append(duracao)
+            self._novas += 1
+
+    def percentil(self, p: float) -> Optional[float]:
+        with self._lock:
+            if len(self.amostras) < MIN_AMOSTRAS_HEDGE:
+                return None
+            # Reordena a janela só a cada RECALCULO_PERCENTIL amostras novas
+            if self._percentil is None or self._novas >= RECALCULO_PERCENTIL:
+                ordenadas = sorted(self.amostras)
+                indice = min(len(ordenadas) - 1, int(p * len(ordenadas)))
+                self._percentil = ordenadas[indice]
+                self._novas = 0
+            return self._percentil
+
+    def contar_chamada(self) -> None:
+        with self._lock:
+            self.chamadas += 1
+
+    def contar_hedge(self) -> None:
+        with self._lock:
+            self.hedges += 1
+
+
+def _status(resultado: Any) -> Optional[int]:
+    """Status HTTP do resultado de uma tentativa (None se não for resposta)."""
+    return getattr(resultado, "status_code", None)
+
+
+class PoliticaHedge:
+    """
+    Hedging de chamadas idempotentes: se a resposta não chega dentro do p95
+    recente do endpoint, uma segunda cópia é enviada e vale a que responder
+    primeiro.
+
+    A tentativa original roda na própria thread do step; a cópia só ganha
+    uma thread quando a espera acaba (um agendador único marca o instante)
+    e se houver saldo no orçamento do endpoint (no máximo a fração
+    `proporcao` das chamadas). A perdedora é encerrada pelo ``Cancelamento``:
+    o socket é fechado e ela devolve a vaga e a conexão na hora.
+
+    Args:
+        endpoints: Paths que podem ser duplicados (só chamadas idempotentes).
+        proporcao: Fração máxima das chamadas de cada endpoint que recebem
+            uma cópia.
+        percentil: Percentil da latência recente usado como espera.
+        espera_inicial: Espera (s) enquanto o processo ainda não tem
+            MIN_AMOSTRAS_HEDGE latências do endpoint (steps do Windmill rodam
+            em processos curtos). None: sem cópias até lá.
+    """
+
+    def __init__(
+        self,
+        endpoints: Iterable[str],
+        proporcao: float = PROPORCAO_HEDGE,
+        percentil: float = PERCENTIL_HEDGE,
+        espera_inicial: Optional[float] = None,
+    ) -> None:
+        self.endpoints = frozenset(endpoints)
+        self.proporcao = proporcao
+        self.percentil = percentil
+        self.espera_inicial = espera_inicial
+        self._latencias: Dict[str, _LatenciasEndpoint] = {}
+        self._vitorias: Dict[str, int] = {}
+        self._negadas: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._agendador = _Agendador()
+
+    @classmethod
+    def do_ambiente(cls, idempotentes: Iterable[str]) -> Optional["PoliticaHedge"]:
+        """
+        Desativado por padrão. MOSTQI_HEDGE=1 ativa para todas as chamadas
+        idempotentes; ``MOSTQI_HEDGE=status`` (sufixos separados por
+        vírgula) escolhe quais. MOSTQI_HEDGE_ORCAMENTO define a fração e
+        MOSTQI_HEDGE_ESPERA_MS, a espera antes de haver latências medidas
+        (ex.: o p95 do endpoint no painel de métricas).
+        """
+        texto = os.getenv("MOSTQI_HEDGE", "").strip()
+        if not texto or texto in ("0", "off"):
+            return None
+        idempotentes = tuple(idempotentes)
+        if texto not in ("1", "on"):
+            sufixos = [s.strip() for s in texto.split(",") if s.strip()]
+            idempotentes = tuple(
+                path for path in idempotentes if any(path.endswith(s) for s in sufixos)
+            )
+        espera_ms = os.getenv("MOSTQI_HEDGE_ESPERA_MS", "").strip()
+        return cls(
+            idempotentes,
+            proporcao=float(os.getenv("MOSTQI_HEDGE_ORCAMENTO", str(PROPORCAO_HEDGE))),
+            espera_inicial=float(espera_ms) / 1000 if espera_ms else None,
+        )
+
+    def _endpoint(self, path: str) -> _LatenciasEndpoint:
+        try:
+            return self._latencias[path]
+        except KeyError:
+            pass
+        with self._lock:
+            if path not in self._latencias:
+                self._latencias[path] = _LatenciasEndpoint(
+                    OrcamentoRetry(
+                        proporcao=self.proporcao,
+                        minimo_por_segundo=0.0,
+                        capacidade=CAPACIDADE_ORCAMENTO_HEDGE,
+                    )
+                )
+            return self._latencias[path]
+
+    def _contar(self, contagem: Dict[str, int], path: str) -> None:
+        with self._lock:
+            contagem[path] = contagem.get(path, 0) + 1
+
+    def _disparar(
+        self,
+        path: str,
+        endpoint: _LatenciasEndpoint,
+        func: Callable[[], T],
+        contexto: contextvars.Context,
+        corrida: _Corrida,
+    ) -> None:
+        """Envia a cópia (na thread do agendador, quando a espera acaba)."""
+        with corrida.lock:
+            if corrida.encerrada:
+                return
+            if not endpoint.orcamento.retirar():
+                self._contar(self._negadas, path)
+                return
+            endpoint.contar_hedge()
+            HEDGE_ENVIADOS.inc(path)
+            futuro: "Future[T]" = Future()
+            corrida.copia = futuro
+
+        def executar() -> None:
+            futuro.set_running_or_notify_cancel()
+            inicio = time.monotonic()
+            try:
+                with tentativa(corrida.cancelamento_copia):
+                    resultado = func()
+            except BaseException as e:
+                futuro.set_exception(e)
+                return
+            endpoint.registrar(time.monotonic() - inicio)
+            futuro.set_result(resultado)
+            if _status(resultado) not in STATUS_TRANSITORIOS:
+                # A cópia venceu: a original para de esperar a resposta
+                corrida.original.cancelar()
+
+        threading.Thread(
+            target=contexto.run, args=(executar,), name="mostqi-hedge", daemon=True
+        ).start()
+
+    def executar(self, path: str, func: Callable[[], T]) -> T:
+        """
+        Executa `func` (uma tentativa da chamada), duplicando-a se demorar.
+
+        Returns:
+            O resultado da primeira tentativa que terminar sem exceção e sem
+            status transitório (STATUS_TRANSITORIOS); se nenhuma chegar lá,
+            a resposta transitória (para a política de repetição) ou a
+            exceção da tentativa original.
+        """
+        if path not in self.endpoints:
+            return func()
+        endpoint = self._endpoint(path)
+        endpoint.contar_chamada()
+        endpoint.orcamento.depositar()
+        espera = endpoint.percentil(self.percentil)
+        if espera is None:
+            espera = self.espera_inicial
+        if espera is None:
+            # Sem latências suficientes para definir a espera: só mede
+            inicio = time.monotonic()
+            resultado = func()
+            endpoint.registrar(time.monotonic() - inicio)
+            return resultado
+
+        corrida = _Corrida()
+        agendamento = self._agendador.agendar(
+            espera,
+            functools.partial(
+                self._disparar,
+                path,
+                endpoint,
+                func,
+                contextvars.copy_context(),
+                corrida,
+            ),
+        )
+        inicio = time.monotonic()
+        erro: Optional[Exception] = None
+        resultado: Any = None
+        try:
+            with tentativa(corrida.original):
+                resultado = func()
+        except Exception as e:
+            erro = e
+        finally:
+            self._agendador.cancelar(agendamento)
+            with corrida.lock:
+                corrida.encerrada = True
+                copia = corrida.copia
+        if erro is None:
+            endpoint.registrar(time.monotonic() - inicio)
+
+        original_valida = erro is None and _status(resultado) not in STATUS_TRANSITORIOS
+        if copia is None or original_valida:
+            if copia is not None:
+                corrida.cancelamento_copia.cancelar()
+            if erro is not None:
+                raise erro
+            return resultado
+
+        # A original falhou, deu status transitório ou foi cancelada porque
+        # a cópia venceu: vale a cópia, se ela der certo
+        wait([copia])
+        erro_copia = copia.exception()
+        if erro_copia is None and _status(copia.result()) not in STATUS_TRANSITORIOS:
+            self._contar(self._vitorias, path)
+            HEDGE_VITORIAS.inc(path)
+            return copia.result()
+        if erro is None:
+            return resultado
+        if erro_copia is None:
+            return copia.result()
+        raise erro
+
+    def estatisticas(self) -> Dict[str, Dict[str, Any]]:
+        """Espera atual (ms), chamadas, cópias enviadas e taxas por endpoint."""
+        resultado = {}
+        for path, endpoint in list(self._latencias.items()):
+            espera = endpoint.percentil(self.percentil)
+            vitorias = self._vitorias.get(path, 0)
+            resultado[path] = {
+                "espera_ms": round(espera * 1000, 1) if espera is not None else None,
+                "chamadas": endpoint.chamadas,
+                "hedges": endpoint.hedges,
+                "vitorias": vitorias,
+                "negadas_orcamento": self._negadas.get(path, 0),
+                "taxa_hedge": round(endpoint.hedges / max(endpoint.chamadas, 1), 4),
+                "taxa_vitoria": round(vitorias / max(endpoint.hedges, 1), 4),
+            }
+        return resultado
@@ -0,0 +1,338 @@
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterable, List, Optional
+
+import requests
+
+from .client import AsyncMostQIClient, AuthError, MostQIClient, get_client
+from .limites import STATUS_TRANSITORIOS
+from .prazo import PrazoEsgotado, prazo_atual
+
+if TYPE_CHECKING:
+    from .webhook import ReceptorWebhook, ResultadosWebhook
+
+# Prazo total padrão para a sessão de liveness terminar (segundos)
+PRAZO_PADRAO_SEGUNDOS = 180.0
+# Por quanto tempo o link da sessão pode ser aberto pelo usuário (segundos)
+VALIDADE_SESSAO_SEGUNDOS = float(
+    os.getenv("MOSTQI_LIVENESS_VALIDADE_SESSAO", str(30 * 60))
+)
+# Entre as consultas de status, o banco dos webhooks é lido a cada intervalo
+INTERVALO_WEBHOOK_SEGUNDOS = 0.25
+
+# Status em que a sessão não muda mais. Qualquer outro valor (Waiting,
+# Processing, ...) é tratado como pendente.
+ESTADOS_TERMINAIS = frozenset(
+    {
+        "finished",
+        "finalized",
+        "completed",
+        "done",
+        "success",
+        "failed",
+        "failure",
+        "error",
+        "expired",
+        "canceled",
+        "cancelled",
+    }
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PoliticaBackoff:
+    """
+    Intervalo entre consultas: exponencial a partir de `inicial`, limitado a
+    `maximo`, com jitter proporcional para que vários casos iniciados juntos
+    não consultem a API em rajadas sincronizadas.
+    """
+
+    inicial: float = 1.0
+    fator: float = 2.0
+    maximo: float = 15.0
+    jitter: float = 0.5
+
+    def intervalo(self, tentativa: int) -> float:
+        base = min(self.maximo, self.inicial * self.fator**tentativa)
+        return base * (1 - self.jitter * random.random())
+
+
+@dataclass
+class ResultadoLiveness:
+    """Estado final (ou o último observado) de uma sessão de liveness."""
+
+    process_id: str
+    status: str = "Indefinido"
+    terminal: bool = False
+    liveness_score: Optional[float] = None
+    frontal_image: Optional[str] = None
+    consultas: int = 0
+    duracao_s: float = 0.0
+    resposta: Dict[str, Any] = field(default_factory=dict, repr=False)
+    erro: Optional[str] = None
+    # "status" (consulta à API) ou "webhook"
+    origem: str = "status"
+
+    @property
+    def expirado(self) -> bool:
+        """True se o prazo acabou antes de a sessão chegar a um estado final."""
+        return not self.terminal and self.erro is None
+
+
+def extrair_score(result_data: Dict[str, Any]) -> Optional[float]:
+    """livenessScore da resposta, que pode vir na raiz, em metrics ou em results."""
+    return (
+        result_data.get("livenessScore")
+        or (result_data.get("metrics") or {}).get("livenessScore")
+        or (result_data.get("results") or {}).get("livenessScore")
+        or None
+    )
+
+
+def estado_terminal(resposta: Dict[str, Any]) -> bool:
+    """Indica se a resposta de status corresponde a uma sessão encerrada."""
+    result_data = resposta.get("result") or {}
+    status = str(result_data.get("status") or "").strip().lower()
+    if status in ESTADOS_TERMINAIS:
+        return True
+    # Algumas respostas trazem o resultado antes de atualizar o status
+    return extrair_score(result_data) is not None and bool(
+        result_data.get("frontalImage")
+    )
+
+
+def _atualizar(resultado: ResultadoLiveness, resposta: Dict[str, Any]) -> None:
+    result_data = resposta.get("result") or {}
+    resultado.resposta = resposta
+    resultado.status = result_data.get("status") or resultado.status
+    resultado.liveness_score = extrair_score(result_data)
+    resultado.frontal_image = result_data.get("frontalImage")
+    resultado.terminal = estado_terminal(resposta)
+
+
+@contextlib.asynccontextmanager
+async def _cliente_temporario() -> AsyncIterator[AsyncMostQIClient]:
+    client = AsyncMostQIClient()
+    try:
+        yield client
+    finally:
+        client.close()
+
+
+def _limitar_ao_prazo_do_caso(prazo_segundos: float) -> float:
+    """O acompanhamento não passa do prazo do caso, se houver um ativo."""
+    prazo = prazo_atual()
+    if prazo is None:
+        return prazo_segundos
+    return max(0.0, min(prazo_segundos, prazo.restante()))
+
+
+def _erro_definitivo(erro: Exception) -> bool:
+    if isinstance(erro, AuthError):
+        return True
+    if isinstance(erro, requests.exceptions.HTTPError):
+        status = getattr(erro.response, "status_code", None)
+        return status not in STATUS_TRANSITORIOS
+    return not isinstance(erro, requests.exceptions.RequestException)
+
+
+def _esperar_webhook(
+    webhooks: Optional["ResultadosWebhook"], process_id: str, segundos: float
+) -> Optional[Dict[str, Any]]:
+    """Dorme `segundos`, saindo antes se o webhook do processo chegar."""
+    if webhooks is None:
+        time.sleep(segundos)
+        return None
+    limite = time.monotonic() + segundos
+    while True:
+        payload = webhooks.resultado(process_id)
+        restante = limite - time.monotonic()
+        if payload is not None or restante <= 0:
+            return payload
+        time.sleep(min(INTERVALO_WEBHOOK_SEGUNDOS, restante))
+
+
+def aguardar_liveness(
+    client_key: str,
+    process_id: str,
+    prazo_segundos: float = PRAZO_PADRAO_SEGUNDOS,
+    politica: Optional[PoliticaBackoff] = None,
+    client: Optional[MostQIClient] = None,
+    webhooks: Optional["ResultadosWebhook"] = None,
+) -> ResultadoLiveness:
+    """
+    Consulta o status da sessão até um estado final ou até o prazo acabar.
+
+    Erros transitórios (timeout, conexão, 429, 5xx) são repetidos dentro do
+    prazo; erros de autenticação ou de requisição encerram o acompanhamento.
+    O prazo nunca passa do prazo do caso ativo (mostqi.prazo).
+
+    Com o banco dos webhooks (MOSTQI_WEBHOOK_DB, gravado pelo receptor de
+    mostqi.webhook), a espera entre consultas termina assim que o webhook do
+    processo chega, e o resultado dele é usado sem nova consulta.
+
+    Args:
+        client_key (str): Chave fornecida pela mostQI.
+        process_id (str): processId retornado pelo step 05.
+        prazo_segundos (float): Tempo máximo total de espera.
+        politica (PoliticaBackoff, opcional): Intervalos entre consultas.
+        client (MostQIClient, opcional): Cliente a usar (padrão: compartilhado).
+        webhooks (ResultadosWebhook, opcional): Banco dos webhooks (padrão:
+            o de MOSTQI_WEBHOOK_DB, se definido).
+
+    Returns:
+        ResultadoLiveness: Estado final, ou o último observado se o prazo acabou.
+
+    Raises:
+        AuthError, requests.exceptions.HTTPError: Erros definitivos da API.
+    """
+    from .webhook import get_resultados_webhook
+
+    client = client or get_client()
+    politica = politica or PoliticaBackoff()
+    webhooks = webhooks if webhooks is not None else get_resultados_webhook()
+    resultado = ResultadoLiveness(process_id)
+    inicio = time.monotonic()
+    limite = inicio + _limitar_ao_prazo_do_caso(prazo_segundos)
+    tentativa = 0
+    payload = webhooks.resultado(process_id) if webhooks is not None else None
+
+    while payload is None:
+        restante = limite - time.monotonic()
+        try:
+            resposta = client.liveness_status(
+                client_key, process_id, timeout=max(0.1, min(client.timeout, restante))
+            )
+            _atualizar(resultado, resposta)
+        except PrazoEsgotado:
+            break
+        except Exception as e:
+            if _erro_definitivo(e):
+                raise
+            logger.warning(f"Falha transitória ao consultar liveness {process_id}: {e}")
+        resultado.consultas += 1
+        if resultado.terminal:
+            break
+
+        espera = politica.intervalo(tentativa)
+        tentativa += 1
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            break
+        payload = _esperar_webhook(webhooks, process_id, min(espera, restante))
+
+    if payload is not None:
+        _atualizar(resultado, payload)
+        resultado.origem = "webhook"
+    resultado.duracao_s = round(time.monotonic() - inicio, 3)
+    return resultado
+
+
+async def aguardar_liveness_async(
+    client_key: str,
+    process_id: str,
+    prazo_segundos: float = PRAZO_PADRAO_SEGUNDOS,
+    politica: Optional[PoliticaBackoff] = None,
+    client: Optional[AsyncMostQIClient] = None,
+    receptor: Optional["ReceptorWebhook"] = None,
+) -> ResultadoLiveness:
+    """
+    Versão asyncio de aguardar_liveness.
+
+    Erros definitivos não são propagados: ficam em `ResultadoLiveness.erro`,
+    para que um processo com falha não interrompa o acompanhamento em massa.
+
+    Com um `receptor` de webhooks, a espera entre consultas termina assim que
+    o webhook do processo chega, e o resultado dele é usado sem nova consulta.
+    """
+    if client is None:
+        async with _cliente_temporario() as client:
+            return await aguardar_liveness_async(
+                client_key, process_id, prazo_segundos, politica, client, receptor
+            )
+    politica = politica or PoliticaBackoff()
+    loop = asyncio.get_running_loop()
+    resultado = ResultadoLiveness(process_id)
+    inicio = loop.time()
+    limite = inicio + _limitar_ao_prazo_do_caso(prazo_segundos)
+    tentativa = 0
+
+    while True:
+        payload = receptor.resultado(process_id) if receptor is not None else None
+        if payload is not None:
+            _atualizar(resultado, payload)
+            resultado.origem = "webhook"
+            break
+
+        restante = limite - loop.time()
+        try:
+            resposta = await client.liveness_status(
+                client_key,
+                process_id,
+                timeout=max(0.1, min(client.client.timeout, restante)),
+            )
+            _atualizar(resultado, resposta)
+        except PrazoEsgotado:
+            break
+        except Exception as e:
+            if _erro_definitivo(e):
+                resultado.erro = str(e)
+                break
+            logger.warning(f"Falha transitória ao consultar liveness {process_id}: {e}")
+        resultado.consultas += 1
+        if resultado.terminal:
+            break
+
+        espera = politica.intervalo(tentativa)
+        tentativa += 1
+        restante = limite - loop.time()
+        if restante <= 0:
+            break
+        if receptor is not None:
+            await receptor.aguardar(process_id, min(espera, restante))
+        else:
+            await asyncio.sleep(min(espera, restante))
+
+    resultado.duracao_s = round(loop.time() - inicio, 3)
+    return resultado
+
+
+async def aguardar_varios(
+    client_key: str,
+    process_ids: Iterable[str],
+    prazo_segundos: float = PRAZO_PADRAO_SEGUNDOS,
+    politica: Optional[PoliticaBackoff] = None,
+    client: Optional[AsyncMostQIClient] = None,
+    receptor: Optional["ReceptorWebhook"] = None,
+) -> List[ResultadoLiveness]:
+    """
+    Acompanha vários processId em um único event loop.
+
+    Cada processo tem seu próprio backoff e prazo. As consultas em andamento
+    ficam limitadas pelo pool do AsyncMostQIClient; enquanto esperam, os
+    processos não ocupam threads nem conexões. Com um `receptor`, cada
+    processo é liberado assim que o seu webhook chega.
+
+    Returns:
+        list: Um ResultadoLiveness por processId, na ordem recebida.
+    """
+    if client is None:
+        async with _cliente_temporario() as client:
+            return await aguardar_varios(
+                client_key, process_ids, prazo_segundos, politica, client, receptor
+            )
+    return await asyncio.gather(
+        *(
+            aguardar_liveness_async(
+                client_key, process_id, prazo_segundos, politica, client, receptor
+            )
+            for process_id in process_ids
+        )
+    )
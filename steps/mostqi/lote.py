@@ -0,0 +1,420 @@
+"""
+Validação em lote a partir de um manifesto de casos.
+
+Uso (a partir da pasta steps/):
+
+    python -m mostqi.lote manifesto.csv --saida resultados.jsonl --concorrencia 16
+
+O manifesto pode ser CSV (com cabeçalho) ou JSONL, com as colunas
+``cnh_frente``, ``cnh_qrcode`` e ``selfie`` (caminhos dos arquivos) e,
+opcionalmente, ``case_id`` e ``liveness_score``. Sem ``liveness_score``, um
+``process_id`` da sessão de liveness é acompanhado pelo step 07 (com
+MOSTQI_WEBHOOK_DB, o caso segue assim que o webhook da sessão chega).
+
+Com ``--diario`` (ou MOSTQI_DIARIO), um lote interrompido pode ser executado
+de novo com o mesmo manifesto: os steps já concluídos de cada caso vêm do
+diário (mostqi.diario), sem novas chamadas à API.
+"""
+
+import argparse
+import csv
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+
+from .arquivos import permitir_diretorio
+from .blobs import finalizar_caso
+from .diario import configurar as configurar_diario
+from .prazo import PrazoCaso, prazo_caso
+from .tracing import caso as caso_tracing
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+ETAPAS = ("02_idp", "04_vio", "07_liveness", "08_facematch", "09_validacao")
+
+
+def carregar_steps() -> Dict[str, Any]:
+    """Importa os módulos dos steps usados no lote."""
+    return {
+        "02_idp": importlib.import_module("02_processar_cnh_frente_idp"),
+        "04_vio": importlib.import_module("04_processa_cnh_qrcode_vio"),
+        "07_liveness": importlib.import_module("07_verifica_status_liveness"),
+        "08_facematch": importlib.import_module("08_compara_faces_facematch"),
+        "09_validacao": importlib.import_module("09_validacao_final"),
+    }
+
+
+def ler_manifesto(caminho: str) -> Iterator[Dict[str, Any]]:
+    """
+    Lê o manifesto em streaming, um caso por vez.
+
+    Args:
+        caminho (str): Arquivo .csv ou .jsonl.
+
+    Returns:
+        Iterator de dicionários com os campos de cada caso.
+    """
+    with open(caminho, "r", encoding="utf-8", newline="") as f:
+        if caminho.lower().endswith((".jsonl", ".ndjson", ".json")):
+            for numero, linha in enumerate(f, start=1):
+                linha = linha.strip()
+                if linha:
+                    caso = json.loads(linha)
+                    caso.setdefault("case_id", str(numero))
+                    yield caso
+        else:
+            for numero, caso in enumerate(csv.DictReader(f), start=1):
+                caso = {k.strip(): (v or "").strip() for k, v in caso.items() if k}
+                if not caso.get("case_id"):
+                    caso["case_id"] = str(numero)
+                yield caso
+
+
+def argumentos_validacao(
+    idp: Optional[Dict[str, Any]],
+    vio: Optional[Dict[str, Any]],
+    liveness_score: float,
+    facematch_score: float,
+    facematch_aprovado: bool,
+) -> Dict[str, Any]:
+    """
+    Monta os argumentos do step 09 a partir das saídas formatadas dos steps
+    02 (format_cnh_output) e 04 (format_vio_output).
+    """
+    idp = idp or {}
+    vio = vio or {}
+
+    def campos(dados: Dict[str, Any]) -> Dict[str, Any]:
+        pessoa = dados.get("pessoa") or {}
+        filiacao = pessoa.get("filiacao") or {}
+        habilitacao = dados.get("habilitacao") or {}
+        return {
+            "nome": pessoa.get("nome"),
+            "cpf": pessoa.get("cpf"),
+            "nascimento": pessoa.get("data_nascimento"),
+            "filiacao1": filiacao.get("mae"),
+            "filiacao2": filiacao.get("pai"),
+            "rg": pessoa.get("rg"),
+            "registro": habilitacao.get("registro"),
+            "emissao": habilitacao.get("data_emissao"),
+            "validade": habilitacao.get("data_validade"),
+            "categoria": habilitacao.get("categoria"),
+        }
+
+    argumentos: Dict[str, Any] = {}
+    for origem, dados in (("idp", idp), ("vio", vio)):
+        for campo, valor in campos(dados).items():
+            argumentos[f"{campo}_{origem}"] = valor
+    argumentos.update(
+        liveness_score=liveness_score,
+        facematch_score=facematch_score,
+        facematch_aprovado=facematch_aprovado,
+    )
+    return argumentos
+
+
+def _caminho_arquivo(caminho: str) -> str:
+    # Os steps leem o arquivo em streaming; aqui só validamos que ele existe
+    if not os.path.isfile(caminho):
+        raise FileNotFoundError(f"arquivo não encontrado: {caminho}")
+    # A selfie chega ao step 08 como texto: o diretório precisa estar liberado
+    permitir_diretorio(os.path.dirname(os.path.abspath(caminho)))
+    return caminho
+
+
+def processar_caso(
+    client_key: str,
+    caso: Dict[str, Any],
+    steps: Dict[str, Any],
+    prazo_segundos: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Executa os steps 02, 04, 07 (se houver process_id), 08 e 09 para um caso
+    do manifesto.
+
+    Args:
+        prazo_segundos (float, opcional): Prazo de ponta a ponta do caso; as
+            chamadas de todos os steps ficam dentro dele (mostqi.prazo).
+
+    Returns:
+        dict: Registro do caso com as saídas de cada step, tempos (ms) e erros.
+        Se o prazo acabou, "prazo_esgotado_por" indica em qual step.
+    """
+    case_id = str(caso.get("case_id"))
+    prazo = PrazoCaso.novo(prazo_segundos) if prazo_segundos else None
+    with caso_tracing(case_id), prazo_caso(prazo), span("caso"):
+        try:
+            registro = _processar_caso(client_key, caso, steps)
+            if prazo is not None and prazo.esgotado_por:
+                registro["prazo_esgotado_por"] = prazo.esgotado_por
+            return registro
+        finally:
+            # Libera os blobs do caso mesmo quando a validação não chegou ao fim
+            finalizar_caso(case_id)
+
+
+def _processar_caso(
+    client_key: str, caso: Dict[str, Any], steps: Dict[str, Any]
+) -> Dict[str, Any]:
+    tempos: Dict[str, float] = {}
+    erros: List[str] = []
+    registro: Dict[str, Any] = {"case_id": caso.get("case_id")}
+
+    def medir(etapa: str, func, *args: Any) -> Any:
+        inicio = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            tempos[etapa] = round((time.perf_counter() - inicio) * 1000, 3)
+
+    try:
+        frente = _caminho_arquivo(caso["cnh_frente"])
+        qrcode = _caminho_arquivo(caso["cnh_qrcode"])
+        selfie = _caminho_arquivo(caso["selfie"])
+    except (KeyError, OSError) as e:
+        registro.update(status="erro", erros=[f"manifesto: {e}"], tempos_ms=tempos)
+        return registro
+
+    # O lote não usa a imagem corrigida, só o recorte da face
+    idp = medir("02_idp", steps["02_idp"].main, client_key, frente, "face")
+    idp.pop("imagem_corrigida", None)
+    face_recortada = idp.pop("face_recortada", None)
+    if idp.get("status") == "erro":
+        erros.append("02_idp")
+
+    vio = medir("04_vio", steps["04_vio"].main, client_key, qrcode)
+    if vio.get("status") == "erro":
+        erros.append("04_vio")
+
+    facematch = medir(
+        "08_facematch",
+        steps["08_facematch"].main,
+        client_key,
+        frente,
+        selfie,
+        face_recortada,
+    )
+    fields = facematch.get("fields") or {}
+    if "similaridade_percentual" not in fields:
+        erros.append("08_facematch")
+
+    liveness_score = caso.get("liveness_score")
+    if liveness_score in (None, "") and caso.get("process_id"):
+        liveness = medir(
+            "07_liveness", steps["07_liveness"].main, client_key, caso["process_id"]
+        )
+        liveness_score = (liveness.get("outputs") or {}).get("liveness_score")
+        if liveness_score is None:
+            erros.append("07_liveness")
+
+    argumentos = argumentos_validacao(
+        idp.get("dados"),
+        vio.get("dados"),
+        float(liveness_score or 0.0),
+        float(fields.get("similaridade_percentual") or 0.0),
+        bool(fields.get("aprovado")),
+    )
+    validacao = medir("09_validacao", lambda: steps["09_validacao"].main(**argumentos))
+    if validacao.get("mensagem_resultado_final", "").startswith("Erro inesperado"):
+        erros.append("09_validacao")
+
+    registro.update(
+        status="erro" if erros else "ok",
+        erros=erros,
+        idp=idp,
+        vio=vio,
+        facematch=fields,
+        validacao=validacao,
+        tempos_ms=tempos,
+    )
+    return registro
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil por posto mais próximo (valores já ordenados)."""
+    if not valores:
+        return 0.0
+    indice = max(0, min(len(valores) - 1, int(round(p / 100 * len(valores))) - 1))
+    return valores[indice]
+
+
+class EstatisticasLote:
+    """Acumula tempos e erros por step durante a execução do lote."""
+
+    def __init__(self) -> None:
+        self.tempos: Dict[str, List[float]] = {etapa: [] for etapa in ETAPAS}
+        self.erros: Dict[str, int] = {etapa: 0 for etapa in ETAPAS}
+        self.erros["manifesto"] = 0
+        self.casos = 0
+        self.casos_erro = 0
+        self.prazos_esgotados: Dict[str, int] = {}
+        self.inicio = time.perf_counter()
+
+    def registrar(self, registro: Dict[str, Any]) -> None:
+        self.casos += 1
+        if registro.get("status") != "ok":
+            self.casos_erro += 1
+        for etapa, ms in registro.get("tempos_ms", {}).items():
+            self.tempos.setdefault(etapa, []).append(ms)
+        for erro in registro.get("erros", []):
+            etapa = erro.split(":", 1)[0]
+            self.erros[etapa] = self.erros.get(etapa, 0) + 1
+        etapa = registro.get("prazo_esgotado_por")
+        if etapa:
+            self.prazos_esgotados[etapa] = self.prazos_esgotados.get(etapa, 0) + 1
+
+    def resumo(self) -> Dict[str, Any]:
+        duracao = time.perf_counter() - self.inicio
+        etapas = {}
+        for etapa, valores in self.tempos.items():
+            ordenados = sorted(valores)
+            etapas[etapa] = {
+                "chamadas": len(ordenados),
+                "p50_ms": percentil(ordenados, 50),
+                "p95_ms": percentil(ordenados, 95),
+                "p99_ms": percentil(ordenados, 99),
+                "erros": self.erros.get(etapa, 0),
+            }
+        return {
+            "casos": self.casos,
+            "casos_erro": self.casos_erro,
+            "erros_manifesto": self.erros["manifesto"],
+            "duracao_s": round(duracao, 3),
+            "casos_por_segundo": round(self.casos / duracao, 3) if duracao else 0.0,
+            "prazos_esgotados": self.prazos_esgotados,
+            "etapas": etapas,
+        }
+
+
+def formatar_resumo(resumo: Dict[str, Any]) -> str:
+    linhas = [
+        f"Casos: {resumo['casos']} (erro: {resumo['casos_erro']}) "
+        f"em {resumo['duracao_s']} s - {resumo['casos_por_segundo']} casos/s",
+        f"{'step':<14}{'chamadas':>10}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}{'erros':>8}",
+    ]
+    for etapa, dados in resumo["etapas"].items():
+        linhas.append(
+            f"{etapa:<14}{dados['chamadas']:>10}{dados['p50_ms']:>12.1f}"
+            f"{dados['p95_ms']:>12.1f}{dados['p99_ms']:>12.1f}{dados['erros']:>8}"
+        )
+    if resumo.get("prazos_esgotados"):
+        esgotados = ", ".join(
+            f"{etapa}: {n}" for etapa, n in resumo["prazos_esgotados"].items()
+        )
+        linhas.append(f"Prazo do caso esgotado em: {esgotados}")
+    return "\n".join(linhas)
+
+
+def executar_lote(
+    client_key: str,
+    manifesto: str,
+    saida: TextIO,
+    concorrencia: int = 8,
+    prazo_caso_segundos: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Processa o manifesto com no máximo `concorrencia` casos em andamento e
+    grava cada resultado em JSONL assim que fica pronto. Com
+    `prazo_caso_segundos`, cada caso tem um prazo de ponta a ponta, contado
+    a partir do seu início.
+
+    Returns:
+        dict: Resumo com throughput, latências p50/p95/p99 por step e erros.
+    """
+    steps = carregar_steps()
+    estatisticas = EstatisticasLote()
+    escrita = threading.Lock()
+
+    def concluir(futuro: Future) -> None:
+        registro = futuro.result()
+        with escrita:
+            saida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            saida.flush()
+            estatisticas.registrar(registro)
+
+    with ThreadPoolExecutor(
+        max_workers=concorrencia, thread_name_prefix="lote"
+    ) as executor:
+        pendentes = set()
+        for caso in ler_manifesto(manifesto):
+            if len(pendentes) >= concorrencia:
+                prontos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+                for futuro in prontos:
+                    concluir(futuro)
+            pendentes.add(
+                executor.submit(
+                    processar_caso, client_key, caso, steps, prazo_caso_segundos
+                )
+            )
+        for futuro in wait(pendentes).done:
+            concluir(futuro)
+
+    return estatisticas.resumo()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m mostqi.lote",
+        description="Executa os steps 02, 04, 07, 08 e 09 para cada caso de um manifesto.",
+    )
+    parser.add_argument("manifesto", help="Arquivo .csv ou .jsonl com os casos")
+    parser.add_argument(
+        "--saida", default="resultados.jsonl", help="Arquivo JSONL de saída"
+    )
+    parser.add_argument("--concorrencia", type=int, default=8, help="Casos simultâneos")
+    parser.add_argument(
+        "--client-key",
+        default=None,
+        help="Chave da mostQI (padrão: variável de ambiente CLIENT_KEY)",
+    )
+    parser.add_argument(
+        "--diario",
+        default=os.getenv("MOSTQI_DIARIO"),
+        help="Diário de casos (SQLite): ao rodar de novo o mesmo manifesto, os "
+        "steps já concluídos de cada caso não são refeitos (padrão: MOSTQI_DIARIO)",
+    )
+    parser.add_argument(
+        "--prazo-caso",
+        type=float,
+        default=None,
+        help="Prazo de ponta a ponta de cada caso, em segundos; os timeouts das "
+        "chamadas vêm do tempo restante",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Exibe logs dos steps")
+    args = parser.parse_args(argv)
+
+    try:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+    except ImportError:
+        pass
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    client_key = args.client_key or os.getenv("CLIENT_KEY")
+    if not client_key:
+        parser.error("informe --client-key ou defina CLIENT_KEY")
+    if args.concorrencia < 1:
+        parser.error("--concorrencia deve ser maior que zero")
+
+    configurar_diario(args.diario)
+    with open(args.saida, "w", encoding="utf-8") as saida:
+        resumo = executar_lote(
+            client_key, args.manifesto, saida, args.concorrencia, args.prazo_caso
+        )
+
+    print(formatar_resumo(resumo), file=sys.stderr)
+    return 1 if resumo["casos_erro"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,496 @@
+"""
+Registro de métricas em processo, exportado no formato texto do Prometheus.
+
+Métricas registradas pelo pacote:
+
+- ``mostqi_http_duracao_segundos`` (histograma por endpoint): cada tentativa
+  de chamada às APIs da mostQI
+- ``mostqi_http_respostas_total`` (contador por endpoint e status HTTP, ou
+  ``timeout``/``erro_conexao``)
+- ``mostqi_http_em_andamento`` (gauge por endpoint)
+- ``mostqi_concorrencia_limite`` e ``mostqi_concorrencia_em_andamento``
+  (gauges por endpoint): limite adaptativo (AIMD) atual e vagas ocupadas
+- ``mostqi_hedge_enviados_total`` e ``mostqi_hedge_vitorias_total`` (por
+  endpoint): cópias enviadas pelo hedging e quantas responderam primeiro
+- ``mostqi_step_duracao_segundos`` e ``mostqi_step_resultados_total`` (por step
+  e status ``sucesso``/``aviso``/``erro``)
+- ``mostqi_prazo_esgotado_total`` (por step): casos cujo prazo acabou no step
+- ``mostqi_idp_score``, ``mostqi_liveness_score`` e
+  ``mostqi_facematch_similaridade`` (distribuições, de 0 a 1)
+
+Exposição, por MOSTQI_METRICAS:
+
+- ``porta:9464`` (ou apenas ``9464``): ``GET /metrics`` em 127.0.0.1
+- ``arquivo:/caminho/metricas.prom``: o texto é gravado ao fim do processo
+  (modo lote) e a cada ``gravar_metricas()``
+
+As atualizações não usam lock: cada thread escreve em seu próprio fragmento
+(threading.local) e os fragmentos só são somados na exportação. A exceção
+são os ``MedidorValor``, definidos por quem controla o valor (sob o seu
+próprio lock).
+"""
+
+import atexit
+import bisect
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+from .idp import RespostaIDP
+
+# Limites dos buckets (segundos) para chamadas HTTP e steps
+BUCKETS_LATENCIA = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Scores e similaridade vêm como fração (0 a 1)
+BUCKETS_SCORE = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 1.0)
+
+logger = logging.getLogger(__name__)
+
+
+def _rotulos_texto(nomes: Sequence[str], valores: Sequence[str]) -> str:
+    pares = []
+    for nome, valor in zip(nomes, valores):
+        valor = str(valor).replace("\\", "\\\\").replace('"', '\\"')
+        pares.append(f'{nome}="{valor}"')
+    return ",".join(pares)
+
+
+def _serie(nome: str, rotulos: str) -> str:
+    return f"{nome}{{{rotulos}}}" if rotulos else nome
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+class Metrica:
+    """
+    Base das métricas: um fragmento (dict rótulos -> valor) por thread.
+
+    Só a thread dona escreve no seu fragmento, então `inc`/`observar` não
+    disputam lock; a exportação lê e soma todos os fragmentos. Fragmentos de
+    threads encerradas são incorporados a um total único na exportação.
+    """
+
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> None:
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._local = threading.local()
+        self._fragmentos: List[Tuple[threading.Thread, Dict[Tuple[str, ...], Any]]] = []
+        self._encerrados: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _fragmento(self) -> Dict[Tuple[str, ...], Any]:
+        try:
+            return self._local.valores
+        except AttributeError:
+            valores: Dict[Tuple[str, ...], Any] = {}
+            with self._lock:
+                self._fragmentos.append((threading.current_thread(), valores))
+            self._local.valores = valores
+            return valores
+
+    def valores(self) -> Dict[Tuple[str, ...], Any]:
+        """Soma dos fragmentos de todas as threads, por combinação de rótulos."""
+        with self._lock:
+            vivos = []
+            for thread, fragmento in self._fragmentos:
+                if thread.is_alive():
+                    vivos.append((thread, fragmento))
+                else:
+                    self._somar(self._encerrados, fragmento)
+            self._fragmentos = vivos
+            total: Dict[Tuple[str, ...], Any] = {}
+            self._somar(total, self._encerrados)
+        for _, fragmento in vivos:
+            self._somar(total, fragmento)
+        return total
+
+    def _somar(
+        self, destino: Dict[Tuple[str, ...], Any], origem: Dict[Tuple[str, ...], Any]
+    ) -> None:
+        raise NotImplementedError
+
+    def linhas(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Contador(Metrica):
+    """Valor que só cresce (ex.: respostas por status)."""
+
+    tipo = "counter"
+
+    def inc(self, *rotulos: str, n: float = 1) -> None:
+        fragmento = self._fragmento()
+        fragmento[rotulos] = fragmento.get(rotulos, 0) + n
+
+    def _somar(self, destino, origem) -> None:
+        for chave, valor in list(origem.items()):
+            destino[chave] = destino.get(chave, 0) + valor
+
+    def linhas(self) -> List[str]:
+        return [
+            f"{_serie(self.nome, _rotulos_texto(self.rotulos, chave))} {_numero(valor)}"
+            for chave, valor in sorted(self.valores().items())
+        ]
+
+
+class Medidor(Contador):
+    """Valor que sobe e desce (ex.: requisições em andamento)."""
+
+    tipo = "gauge"
+
+    def dec(self, *rotulos: str, n: float = 1) -> None:
+        self.inc(*rotulos, n=-n)
+
+
+class MedidorValor(Medidor):
+    """
+    Valor atual definido por um único dono (ex.: limite de concorrência).
+
+    Não é somado entre threads: vale o último `definir`.
+    """
+
+    def _fragmento(self) -> Dict[Tuple[str, ...], Any]:
+        return self._encerrados
+
+    def definir(self, valor: float, *rotulos: str) -> None:
+        self._encerrados[rotulos] = valor
+
+    def valores(self) -> Dict[Tuple[str, ...], Any]:
+        return dict(self._encerrados)
+
+
+class Histograma(Metrica):
+    """Distribuição em buckets cumulativos, com soma e contagem."""
+
+    tipo = "histogram"
+
+    def __init__(
+        self,
+        nome: str,
+        ajuda: str,
+        rotulos: Sequence[str] = (),
+        buckets: Sequence[float] = BUCKETS_LATENCIA,
+    ) -> None:
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(sorted(buckets))
+
+    def observar(self, valor: float, *rotulos: str) -> None:
+        fragmento = self._fragmento()
+        contagens = fragmento.get(rotulos)
+        if contagens is None:
+            # len(buckets) + 1 posições (a última é +Inf), soma e contagem
+            contagens = fragmento[rotulos] = [0] * (len(self.buckets) + 3)
+        contagens[bisect.bisect_left(self.buckets, valor)] += 1
+        contagens[-2] += valor
+        contagens[-1] += 1
+
+    def _somar(self, destino, origem) -> None:
+        for chave, contagens in list(origem.items()):
+            acumulado = destino.setdefault(chave, [0] * len(contagens))
+            for i, valor in enumerate(list(contagens)):
+                acumulado[i] += valor
+
+    def linhas(self) -> List[str]:
+        linhas = []
+        for chave, contagens in sorted(self.valores().items()):
+            rotulos = _rotulos_texto(self.rotulos, chave)
+            prefixo = f"{rotulos}," if rotulos else ""
+            acumulado = 0
+            for limite, n in zip(self.buckets + (float("inf"),), contagens):
+                acumulado += n
+                linhas.append(
+                    f'{self.nome}_bucket{{{prefixo}le="{_numero(limite)}"}} {acumulado}'
+                )
+            linhas.append(
+                f"{_serie(self.nome + '_sum', rotulos)} {_numero(contagens[-2])}"
+            )
+            linhas.append(f"{_serie(self.nome + '_count', rotulos)} {contagens[-1]}")
+        return linhas
+
+
+class RegistroMetricas:
+    """Conjunto de métricas exportadas juntas."""
+
+    def __init__(self) -> None:
+        self._metricas: Dict[str, Metrica] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, metrica: Metrica) -> Metrica:
+        with self._lock:
+            return self._metricas.setdefault(metrica.nome, metrica)
+
+    def contador(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> Contador:
+        return self.registrar(Contador(nome, ajuda, rotulos))
+
+    def medidor(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> Medidor:
+        return self.registrar(Medidor(nome, ajuda, rotulos))
+
+    def medidor_valor(
+        self, nome: str, ajuda: str, rotulos: Sequence[str] = ()
+    ) -> MedidorValor:
+        return self.registrar(MedidorValor(nome, ajuda, rotulos))
+
+    def histograma(
+        self,
+        nome: str,
+        ajuda: str,
+        rotulos: Sequence[str] = (),
+        buckets: Sequence[float] = BUCKETS_LATENCIA,
+    ) -> Histograma:
+        return self.registrar(Histograma(nome, ajuda, rotulos, buckets))
+
+    def exportar(self) -> str:
+        """Todas as métricas no formato texto do Prometheus (0.0.4)."""
+        with self._lock:
+            metricas = list(self._metricas.values())
+        linhas = []
+        for metrica in metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(metrica.linhas())
+        return "\n".join(linhas) + "\n"
+
+    def gravar(self, path: str) -> None:
+        """Grava o texto em `path` de forma atômica (arquivo temporário + rename)."""
+        diretorio = os.path.dirname(os.path.abspath(path))
+        os.makedirs(diretorio, exist_ok=True)
+        temporario = f"{path}.{os.getpid()}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write(self.exportar())
+        os.replace(temporario, path)
+
+
+REGISTRO = RegistroMetricas()
+
+HTTP_DURACAO = REGISTRO.histograma(
+    "mostqi_http_duracao_segundos",
+    "Duração de cada tentativa de chamada às APIs da mostQI",
+    ("endpoint",),
+)
+HTTP_RESPOSTAS = REGISTRO.contador(
+    "mostqi_http_respostas_total",
+    "Respostas das APIs da mostQI por status HTTP (ou timeout/erro_conexao)",
+    ("endpoint", "status"),
+)
+HTTP_EM_ANDAMENTO = REGISTRO.medidor(
+    "mostqi_http_em_andamento",
+    "Chamadas às APIs da mostQI em andamento",
+    ("endpoint",),
+)
+CONCORRENCIA_LIMITE = REGISTRO.medidor_valor(
+    "mostqi_concorrencia_limite",
+    "Limite adaptativo (AIMD) de chamadas simultâneas por endpoint",
+    ("endpoint",),
+)
+CONCORRENCIA_EM_ANDAMENTO = REGISTRO.medidor_valor(
+    "mostqi_concorrencia_em_andamento",
+    "Vagas do limite adaptativo ocupadas por endpoint",
+    ("endpoint",),
+)
+HEDGE_ENVIADOS = REGISTRO.contador(
+    "mostqi_hedge_enviados_total",
+    "Cópias de chamadas idempotentes enviadas pelo hedging",
+    ("endpoint",),
+)
+HEDGE_VITORIAS = REGISTRO.contador(
+    "mostqi_hedge_vitorias_total",
+    "Cópias do hedging que responderam antes da chamada original",
+    ("endpoint",),
+)
+STEP_DURACAO = REGISTRO.histograma(
+    "mostqi_step_duracao_segundos", "Duração do main de cada step", ("step",)
+)
+STEP_RESULTADOS = REGISTRO.contador(
+    "mostqi_step_resultados_total",
+    "Execuções de cada step por status (sucesso/aviso/erro)",
+    ("step", "status"),
+)
+PRAZO_ESGOTADO = REGISTRO.contador(
+    "mostqi_prazo_esgotado_total",
+    "Casos cujo prazo de ponta a ponta acabou durante o step",
+    ("step",),
+)
+IDP_SCORE = REGISTRO.histograma(
+    "mostqi_idp_score", "Score da extração IDP (frente da CNH)", buckets=BUCKETS_SCORE
+)
+LIVENESS_SCORE = REGISTRO.histograma(
+    "mostqi_liveness_score",
+    "livenessScore das sessões concluídas",
+    buckets=BUCKETS_SCORE,
+)
+FACEMATCH_SIMILARIDADE = REGISTRO.histograma(
+    "mostqi_facematch_similaridade",
+    "Similaridade devolvida pelo face-compare",
+    buckets=BUCKETS_SCORE,
+)
+
+
+class MedicaoHTTP:
+    """
+    Mede uma tentativa de chamada HTTP: em andamento, duração e status.
+
+    Uso::
+
+        with MedicaoHTTP(path) as m:
+            response = session.post(...)
+            m.status = response.status_code
+    """
+
+    __slots__ = ("endpoint", "status", "_inicio")
+
+    def __init__(self, endpoint: str) -> None:
+        self.endpoint = endpoint
+        self.status: Any = None
+
+    def __enter__(self) -> "MedicaoHTTP":
+        HTTP_EM_ANDAMENTO.inc(self.endpoint)
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, valor, tb) -> None:
+        HTTP_DURACAO.observar(time.perf_counter() - self._inicio, self.endpoint)
+        HTTP_EM_ANDAMENTO.dec(self.endpoint)
+        if valor is not None and self.status is None:
+            if isinstance(valor, requests.exceptions.Timeout):
+                self.status = "timeout"
+            else:
+                self.status = "erro_conexao"
+        HTTP_RESPOSTAS.inc(self.endpoint, str(self.status))
+
+
+def _fracao(valor: Any) -> Optional[float]:
+    try:
+        valor = float(valor)
+    except (TypeError, ValueError):
+        return None
+    # Alguns campos chegam em porcentagem (0 a 100)
+    return valor / 100 if valor > 1 else valor
+
+
+def observar_resposta(endpoint: str, dados: Any) -> None:
+    """Alimenta as distribuições de score a partir da resposta da API."""
+    if isinstance(dados, RespostaIDP):
+        score = _fracao(dados.score)
+        if score is not None:
+            IDP_SCORE.observar(score)
+        return
+    if not isinstance(dados, dict):
+        return
+    resultado = dados.get("result")
+    if endpoint.endswith("content-extraction"):
+        if isinstance(resultado, list) and resultado:
+            score = _fracao(resultado[0].get("score"))
+            if score is not None:
+                IDP_SCORE.observar(score)
+    elif endpoint.endswith("face-compare"):
+        if isinstance(resultado, dict):
+            similaridade = _fracao(resultado.get("similarity"))
+            if similaridade is not None:
+                FACEMATCH_SIMILARIDADE.observar(similaridade)
+    elif endpoint.endswith("status"):
+        if isinstance(resultado, dict):
+            score = _fracao(resultado.get("livenessScore"))
+            if score is not None:
+                LIVENESS_SCORE.observar(score)
+
+
+def status_do_resultado(resultado: Any) -> str:
+    """
+    Status do step (sucesso/aviso/erro) a partir da saída do `main`.
+
+    Steps 02 e 04 trazem "status"; os demais (formulários do Windmill)
+    indicam erro pelo título e o step 09, campos faltando, pela mensagem final.
+    """
+    if not isinstance(resultado, dict):
+        return "sucesso"
+    status = resultado.get("status")
+    if status in ("sucesso", "aviso", "erro"):
+        return status
+    texto = str(resultado.get("title") or resultado.get("mensagem_resultado_final"))
+    if texto.startswith(("Erro", "Falha")):
+        return "erro"
+    return "aviso" if texto.startswith("Atenção") else "sucesso"
+
+
+def observar_step(step: str, duracao_s: float, resultado: Any) -> None:
+    STEP_DURACAO.observar(duracao_s, step)
+    STEP_RESULTADOS.inc(step, status_do_resultado(resultado))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registro: RegistroMetricas = REGISTRO
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        corpo = self.registro.exportar().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, formato: str, *args: Any) -> None:
+        pass
+
+
+def servir_metricas(
+    porta: int, host: str = "127.0.0.1", registro: RegistroMetricas = REGISTRO
+) -> ThreadingHTTPServer:
+    """Inicia ``GET /metrics`` em uma thread daemon."""
+    handler = type("Handler", (_Handler,), {"registro": registro})
+    servidor = ThreadingHTTPServer((host, porta), handler)
+    servidor.daemon_threads = True
+    threading.Thread(
+        target=servidor.serve_forever, name="mostqi-metricas", daemon=True
+    ).start()
+    logger.info(f"Métricas em http://{host}:{servidor.server_address[1]}/metrics")
+    return servidor
+
+
+_arquivo_metricas: Optional[str] = None
+_servidor_metricas: Optional[ThreadingHTTPServer] = None
+
+
+def gravar_metricas() -> None:
+    """Grava as métricas no arquivo de MOSTQI_METRICAS (modo arquivo)."""
+    if _arquivo_metricas:
+        try:
+            REGISTRO.gravar(_arquivo_metricas)
+        except OSError as e:
+            logger.warning(f"Falha ao gravar métricas em {_arquivo_metricas}: {e}")
+
+
+def configurar_do_ambiente() -> None:
+    """Aplica MOSTQI_METRICAS (porta ou arquivo); sem ela, só registra."""
+    global _arquivo_metricas, _servidor_metricas
+    destino = os.getenv("MOSTQI_METRICAS", "").strip()
+    if not destino or destino in ("0", "off"):
+        return
+    if destino.startswith("arquivo:"):
+        _arquivo_metricas = destino[8:]
+        return
+    if destino.startswith("porta:"):
+        destino = destino[6:]
+    try:
+        _servidor_metricas = servir_metricas(int(destino))
+    except (ValueError, OSError) as e:
+        logger.warning(f"Servidor de métricas não iniciado ({destino}): {e}")
+
+
+configurar_do_ambiente()
+atexit.register(gravar_metricas)
@@ -0,0 +1,205 @@
+"""
+Prazo de ponta a ponta de um caso, propagado para o timeout de cada chamada.
+
+Sem prazo, cada chamada tem o próprio timeout fixo (30 s na mostQI, 10 s na
+autenticação, 3 s no TinyURL) e um caso com várias chamadas lentas e
+repetições pode ocupar o worker muito além do SLA. Com ``PrazoCaso``:
+
+- o prazo é criado na entrada do fluxo (step 00 no Windmill, ou por caso no
+  lote) e passado aos steps como ``prazo_caso`` (instante limite, em segundos
+  desde a época, para atravessar processos);
+- ``rastrear_step`` ativa o prazo durante o step e o ``MostQIClient``, o
+  acompanhamento da prova de vida e o TinyURL usam ``limitar_timeout``: o
+  timeout de cada chamada é o menor entre o seu padrão e o tempo restante;
+- uma chamada que não cabe no tempo restante nem é aberta (``PrazoEsgotado``,
+  subclasse de ``requests.exceptions.Timeout``, tratada pelos steps como
+  qualquer timeout), e as esperas entre repetições, pelo limite de taxa e
+  por uma vaga do controle de concorrência não passam do prazo;
+- o step em que o prazo acabou (ou deixou de comportar uma chamada) fica em
+  ``PrazoCaso.esgotado_por``, no log e na métrica
+  ``mostqi_prazo_esgotado_total``.
+
+MOSTQI_PRAZO_CASO_SEGUNDOS define a duração padrão dos prazos novos.
+"""
+
+import contextlib
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import time
+from typing import Any, Callable, Iterator, Optional, Union
+
+import requests
+
+from .metricas import PRAZO_ESGOTADO
+from .tracing import case_id_atual
+
+PRAZO_CASO_PADRAO_SEGUNDOS = float(os.getenv("MOSTQI_PRAZO_CASO_SEGUNDOS", "600"))
+# Com menos tempo que isso, a chamada não é aberta
+TIMEOUT_MINIMO_SEGUNDOS = 0.5
+# Nome do argumento dos steps que recebe o prazo
+ARGUMENTO_PRAZO = "prazo_caso"
+
+logger = logging.getLogger(__name__)
+
+
+class PrazoEsgotado(requests.exceptions.Timeout):
+    """O prazo do caso acabou (ou não comporta a chamada)."""
+
+
+class PrazoCaso:
+    """
+    Instante limite de um caso (relógio de parede, comum a todos os workers).
+
+    Args:
+        expira_em (float): Limite em segundos desde a época (time.time()).
+    """
+
+    __slots__ = ("expira_em", "esgotado_por", "insuficiente")
+
+    def __init__(self, expira_em: float) -> None:
+        self.expira_em = float(expira_em)
+        self.esgotado_por: Optional[str] = None
+        # Uma chamada ou repetição já foi recusada por falta de tempo
+        self.insuficiente = False
+
+    @classmethod
+    def novo(cls, segundos: Optional[float] = None) -> "PrazoCaso":
+        """Prazo que acaba daqui a `segundos` (padrão: MOSTQI_PRAZO_CASO_SEGUNDOS)."""
+        return cls(time.time() + (segundos or PRAZO_CASO_PADRAO_SEGUNDOS))
+
+    @classmethod
+    def de_valor(
+        cls, valor: Union["PrazoCaso", float, int, str, None]
+    ) -> Optional["PrazoCaso"]:
+        """Prazo a partir do argumento `prazo_caso` de um step (None se ausente)."""
+        if valor is None or valor == "":
+            return None
+        if isinstance(valor, PrazoCaso):
+            return valor
+        return cls(float(valor))
+
+    def restante(self) -> float:
+        """Segundos até o limite (negativo se já passou)."""
+        return self.expira_em - time.time()
+
+    @property
+    def esgotado(self) -> bool:
+        return self.restante() < TIMEOUT_MINIMO_SEGUNDOS
+
+    def timeout(self, maximo: float) -> float:
+        """
+        Timeout de uma chamada: o menor entre `maximo` e o tempo restante.
+
+        Raises:
+            PrazoEsgotado: Se restar menos que TIMEOUT_MINIMO_SEGUNDOS.
+        """
+        restante = self.restante()
+        if restante < TIMEOUT_MINIMO_SEGUNDOS:
+            self.insuficiente = True
+            raise PrazoEsgotado(
+                f"Prazo do caso esgotado (restavam {max(restante, 0.0):.2f} s)."
+            )
+        return min(maximo, restante)
+
+    def comporta(self, espera: float) -> bool:
+        """Se ainda cabe uma chamada depois de esperar `espera` segundos."""
+        if self.restante() - espera >= TIMEOUT_MINIMO_SEGUNDOS:
+            return True
+        self.insuficiente = True
+        return False
+
+
+_prazo_atual: contextvars.ContextVar[Optional[PrazoCaso]] = contextvars.ContextVar(
+    "mostqi_prazo", default=None
+)
+
+
+def prazo_atual() -> Optional[PrazoCaso]:
+    """Prazo do caso em andamento no contexto, ou None."""
+    return _prazo_atual.get()
+
+
+@contextlib.contextmanager
+def prazo_caso(
+    prazo: Union[PrazoCaso, float, int, str, None],
+) -> Iterator[Optional[PrazoCaso]]:
+    """Ativa o prazo no bloco (None mantém o prazo que já estiver ativo)."""
+    prazo = PrazoCaso.de_valor(prazo)
+    if prazo is None:
+        yield prazo_atual()
+        return
+    token = _prazo_atual.set(prazo)
+    try:
+        yield prazo
+    finally:
+        _prazo_atual.reset(token)
+
+
+def limitar_timeout(maximo: float) -> float:
+    """
+    Timeout de uma chamada dentro do prazo ativo (sem prazo, `maximo`).
+
+    Raises:
+        PrazoEsgotado: Se o prazo ativo não comporta mais nenhuma chamada.
+    """
+    prazo = _prazo_atual.get()
+    return maximo if prazo is None else prazo.timeout(maximo)
+
+
+def comporta_espera(espera: float) -> bool:
+    """Se, depois de `espera` segundos, ainda cabe uma chamada no prazo ativo."""
+    prazo = _prazo_atual.get()
+    return prazo is None or prazo.comporta(espera)
+
+
+def espera_maxima() -> Optional[float]:
+    """
+    Quanto (s) ainda se pode esperar e caber uma chamada no prazo ativo
+    (sem prazo, None: sem limite).
+
+    Raises:
+        PrazoEsgotado: Se o prazo ativo não comporta mais nenhuma chamada.
+    """
+    prazo = _prazo_atual.get()
+    if prazo is None:
+        return None
+    return max(0.0, prazo.timeout(float("inf")) - TIMEOUT_MINIMO_SEGUNDOS)
+
+
+def com_prazo(step: str, func: Callable) -> Callable:
+    """
+    Envolve o `main` de um step: ativa o prazo recebido em `prazo_caso` (ou
+    mantém o do contexto) e registra o step se o prazo acabar durante ele.
+
+    Usado pelo ``rastrear_step``.
+    """
+    parametros = list(inspect.signature(func).parameters)
+    indice = (
+        parametros.index(ARGUMENTO_PRAZO) if ARGUMENTO_PRAZO in parametros else None
+    )
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        valor = kwargs.get(ARGUMENTO_PRAZO)
+        if valor is None and indice is not None and indice < len(args):
+            valor = args[indice]
+        with prazo_caso(valor) as prazo:
+            if prazo is None:
+                return func(*args, **kwargs)
+            # Quem começa sem prazo não é culpado por esgotá-lo
+            tinha_prazo = not (prazo.esgotado or prazo.insuficiente)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                esgotou = prazo.esgotado or prazo.insuficiente
+                if tinha_prazo and esgotou and prazo.esgotado_por is None:
+                    prazo.esgotado_por = step
+                    PRAZO_ESGOTADO.inc(step)
+                    logger.warning(
+                        f"Prazo do caso {case_id_atual() or '-'} esgotado no step {step}."
+                    )
+
+    return wrapper
@@ -0,0 +1,383 @@
+"""
+Verificação local da qualidade da foto antes das chamadas pagas (steps 02 e 04).
+
+Uma foto tremida, escura, com reflexo ou pequena demais só seria recusada
+depois de uma ida e volta à IDP/VIO (score <= 0.8). Aqui a imagem é
+decodificada em escala reduzida e medida com NumPy em poucos milissegundos:
+
+- nitidez: variância do Laplaciano da imagem em tons de cinza
+- exposição: brilho médio (0-255) e fração estourada (>= NIVEL_REFLEXO) do
+  documento, sem o fundo branco em volta dele
+- reflexo: fração da área coberta por manchas estouradas (>= NIVEL_REFLEXO)
+  sobre uma superfície clara; fundo branco, papel e as células brancas de um
+  QR Code não contam (veja ``fracao_reflexo``)
+- resolução: menor lado da imagem original, em pixels
+
+Os limites vêm de MOSTQI_QUALIDADE_* (veja ``LimitesQualidade.do_ambiente``);
+o step 04 usa ``LimitesQualidade.para_qrcode``, sem os limites de reflexo e de
+superexposição (um QR Code em tela ou papel branco é quase todo branco).
+``MOSTQI_QUALIDADE=0`` desativa a verificação. Imagens que não puderem ser
+decodificadas localmente (sem Pillow, HEIC etc.) seguem para a API.
+
+Calibração e economia de chamadas: ``python benchmarks/bench_qualidade.py``.
+"""
+
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+from .arquivos import Arquivo, abrir_entrada
+from .tracing import span
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:  # NumPy e Pillow são opcionais: sem eles nada é recusado
+    np = None
+    Image = None
+
+# Maior lado da imagem analisada: as medidas independem da resolução enviada
+LADO_ANALISE = 640
+# Pixels (0-255) a partir deste nível contam como reflexo
+NIVEL_REFLEXO = 250
+# O reflexo é procurado em células de CELULA_REFLEXO x CELULA_REFLEXO pixels
+# (da imagem analisada); uma célula é estourada com esta fração de pixels
+CELULA_REFLEXO = 8
+FRACAO_CELULA_ESTOURADA = 0.9
+# Entorno médio mínimo de uma mancha para ser reflexo: abaixo disso ela está
+# sobre tinta escura (células brancas de um QR Code, papel sobre mesa escura)
+ENTORNO_REFLEXO_MINIMO = 110.0
+# Manchas maiores que esta fração da imagem, ou que tocam 3 ou mais bordas,
+# são o fundo (papel, tela, mesa branca), não reflexo
+AREA_FUNDO = 0.5
+BORDAS_FUNDO = 3
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LimitesQualidade:
+    """Limites de aceitação; os padrões foram calibrados no bench_qualidade."""
+
+    nitidez_minima: float = 100.0
+    brilho_minimo: float = 50.0
+    brilho_maximo: float = 225.0
+    estouro_maximo: float = 0.2
+    reflexo_maximo: float = 0.08
+    lado_minimo: int = 480
+
+    @classmethod
+    def do_ambiente(cls) -> "LimitesQualidade":
+        """
+        MOSTQI_QUALIDADE_NITIDEZ_MIN, MOSTQI_QUALIDADE_BRILHO_MIN,
+        MOSTQI_QUALIDADE_BRILHO_MAX, MOSTQI_QUALIDADE_ESTOURO_MAX e
+        MOSTQI_QUALIDADE_REFLEXO_MAX (frações da área) e
+        MOSTQI_QUALIDADE_LADO_MIN (px).
+        """
+        padrao = cls()
+        return cls(
+            nitidez_minima=float(
+                os.getenv("MOSTQI_QUALIDADE_NITIDEZ_MIN", padrao.nitidez_minima)
+            ),
+            brilho_minimo=float(
+                os.getenv("MOSTQI_QUALIDADE_BRILHO_MIN", padrao.brilho_minimo)
+            ),
+            brilho_maximo=float(
+                os.getenv("MOSTQI_QUALIDADE_BRILHO_MAX", padrao.brilho_maximo)
+            ),
+            estouro_maximo=float(
+                os.getenv("MOSTQI_QUALIDADE_ESTOURO_MAX", padrao.estouro_maximo)
+            ),
+            reflexo_maximo=float(
+                os.getenv("MOSTQI_QUALIDADE_REFLEXO_MAX", padrao.reflexo_maximo)
+            ),
+            lado_minimo=int(os.getenv("MOSTQI_QUALIDADE_LADO_MIN", padrao.lado_minimo)),
+        )
+
+    def para_qrcode(self) -> "LimitesQualidade":
+        """
+        Limites do step 04: sem reflexo nem superexposição. O QR Code é lido
+        pelo contraste preto/branco, e a imagem típica (tela ou papel branco)
+        é quase toda estourada.
+        """
+        return replace(
+            self, brilho_maximo=255.0, estouro_maximo=1.0, reflexo_maximo=1.0
+        )
+
+
+@dataclass
+class AvaliacaoQualidade:
+    """Medidas da imagem e, se recusada, o que o usuário deve corrigir."""
+
+    aprovada: bool
+    avaliada: bool
+    largura: Optional[int] = None
+    altura: Optional[int] = None
+    nitidez: Optional[float] = None
+    brilho: Optional[float] = None
+    estouro: Optional[float] = None
+    reflexo: Optional[float] = None
+    problemas: List[str] = field(default_factory=list)
+    duracao_ms: float = 0.0
+
+    @property
+    def mensagem(self) -> str:
+        return " ".join(self.problemas)
+
+    def como_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _rotular(mascara: "np.ndarray") -> "np.ndarray":
+    """Componentes conexos (vizinhança 4) de uma máscara 2D pequena; 0 = fundo."""
+    altura, largura = mascara.shape
+    sem_rotulo = altura * largura + 1
+    rotulos = np.where(
+        mascara, np.arange(1, altura * largura + 1).reshape(altura, largura), 0
+    )
+    atual = np.where(mascara, rotulos, sem_rotulo)
+    plano = np.append(atual.ravel(), sem_rotulo)
+    # Cada célula fica com o menor rótulo entre os vizinhos até estabilizar;
+    # o rótulo é o índice (+1) de uma célula, e saltar para o rótulo dela
+    # encurta os caminhos longos (fundo serpenteando entre módulos do QR)
+    while True:
+        novo = atual.copy()
+        np.minimum(novo[1:], atual[:-1], out=novo[1:])
+        np.minimum(novo[:-1], atual[1:], out=novo[:-1])
+        np.minimum(novo[:, 1:], atual[:, :-1], out=novo[:, 1:])
+        np.minimum(novo[:, :-1], atual[:, 1:], out=novo[:, :-1])
+        novo[~mascara] = sem_rotulo
+        plano[:-1] = novo.ravel()
+        novo = np.minimum(novo, plano[novo - 1])
+        if np.array_equal(novo, atual):
+            return np.where(mascara, atual, 0)
+        atual = novo
+
+
+def _estouro(cinza: "np.ndarray") -> Tuple[float, Optional["np.ndarray"]]:
+    """
+    Manchas estouradas da imagem: (fração de reflexo, células de fundo).
+
+    As células de CELULA_REFLEXO pixels com FRACAO_CELULA_ESTOURADA dos
+    pixels >= NIVEL_REFLEXO são agrupadas em manchas conexas. Uma mancha é:
+
+    - fundo (papel, tela, mesa branca) se ocupa AREA_FUNDO da imagem ou mais,
+      ou se toca BORDAS_FUNDO bordas;
+    - reflexo se, fora isso, o seu entorno é uma superfície clara (média >=
+      ENTORNO_REFLEXO_MINIMO), como o fundo da CNH;
+    - nenhum dos dois se está sobre tinta escura (células brancas de um QR
+      Code, letras vazadas).
+
+    Returns:
+        tuple: Pixels estourados das manchas de reflexo / total de pixels, e a
+        máscara (por célula) das manchas de fundo, ou None se não houver.
+    """
+    altura = cinza.shape[0] // CELULA_REFLEXO
+    largura = cinza.shape[1] // CELULA_REFLEXO
+    if not altura or not largura:
+        return 0.0, None
+    blocos = cinza[: altura * CELULA_REFLEXO, : largura * CELULA_REFLEXO].reshape(
+        altura, CELULA_REFLEXO, largura, CELULA_REFLEXO
+    )
+    estourados = np.count_nonzero(blocos >= NIVEL_REFLEXO, axis=(1, 3))
+    mascara = estourados >= FRACAO_CELULA_ESTOURADA * CELULA_REFLEXO**2
+    if not mascara.any():
+        return 0.0, None
+    medias = blocos.mean(axis=(1, 3), dtype=np.float32)
+
+    rotulos = _rotular(mascara)
+    n = int(rotulos.max()) + 1
+    areas = np.bincount(rotulos.ravel(), minlength=n)
+    # Entorno: soma e quantidade das células vizinhas não estouradas
+    entorno_soma = np.zeros(n)
+    entorno_qtd = np.zeros(n)
+    for origem, vizinho in (
+        ((slice(1, None), slice(None)), (slice(None, -1), slice(None))),
+        ((slice(None, -1), slice(None)), (slice(1, None), slice(None))),
+        ((slice(None), slice(1, None)), (slice(None), slice(None, -1))),
+        ((slice(None), slice(None, -1)), (slice(None), slice(1, None))),
+    ):
+        borda = mascara[origem] & ~mascara[vizinho]
+        entorno_soma += np.bincount(
+            rotulos[origem][borda], weights=medias[vizinho][borda], minlength=n
+        )
+        entorno_qtd += np.bincount(rotulos[origem][borda], minlength=n)
+    bordas = np.zeros(n, dtype=np.int64)
+    for linha in (rotulos[0], rotulos[-1], rotulos[:, 0], rotulos[:, -1]):
+        bordas[np.unique(linha)] += 1
+
+    fundo = (areas >= AREA_FUNDO * altura * largura) | (bordas >= BORDAS_FUNDO)
+    entorno = entorno_soma / np.maximum(entorno_qtd, 1)
+    reflexo = ~fundo & (entorno_qtd > 0) & (entorno >= ENTORNO_REFLEXO_MINIMO)
+    fundo[0] = reflexo[0] = False
+    pixels = np.bincount(rotulos.ravel(), weights=estourados.ravel(), minlength=n)
+    celulas_fundo = fundo[rotulos] if fundo.any() else None
+    return float(pixels[reflexo].sum()) / max(cinza.size, 1), celulas_fundo
+
+
+def fracao_reflexo(cinza: "np.ndarray") -> float:
+    """
+    Fração da imagem coberta por reflexo: manchas estouradas sobre uma
+    superfície clara, sem contar fundo branco, papel ou QR Code (``_estouro``).
+
+    Args:
+        cinza: Matriz 2D (uint8) com a luminância.
+    """
+    return _estouro(np.asarray(cinza, dtype=np.uint8))[0]
+
+
+def medir(cinza: "np.ndarray") -> Dict[str, float]:
+    """
+    Nitidez, brilho, estouro e fração de reflexo de uma imagem em tons de cinza.
+
+    Brilho e estouro (fração de pixels >= NIVEL_REFLEXO) são medidos no
+    documento: manchas estouradas de fundo (papel, tela ou mesa branca em
+    volta da CNH) ficam de fora.
+
+    Args:
+        cinza: Matriz 2D (uint8 ou float) com a luminância.
+
+    Returns:
+        dict: {"nitidez", "brilho", "estouro", "reflexo"}.
+    """
+    a = cinza.astype(np.float32, copy=False)
+    # Laplaciano de 4 vizinhos por fatias, sem convolução nem cópias extras
+    laplaciano = (
+        a[:-2, 1:-1] + a[2:, 1:-1] + a[1:-1, :-2] + a[1:-1, 2:] - 4.0 * a[1:-1, 1:-1]
+    )
+    reflexo, fundo = _estouro(np.asarray(cinza, dtype=np.uint8))
+    brilho = float(a.mean())
+    estouro = float(np.count_nonzero(a >= NIVEL_REFLEXO)) / max(a.size, 1)
+    if fundo is not None and not fundo.all():
+        altura, largura = fundo.shape
+        celulas = a[: altura * CELULA_REFLEXO, : largura * CELULA_REFLEXO].reshape(
+            altura, CELULA_REFLEXO, largura, CELULA_REFLEXO
+        )
+        documento = ~fundo
+        brilho = float(celulas.mean(axis=(1, 3))[documento].mean())
+        estourados = np.count_nonzero(celulas >= NIVEL_REFLEXO, axis=(1, 3))
+        estouro = float(estourados[documento].sum()) / (
+            np.count_nonzero(documento) * CELULA_REFLEXO**2
+        )
+    return {
+        "nitidez": float(laplaciano.var()) if laplaciano.size else 0.0,
+        "brilho": brilho,
+        "estouro": estouro,
+        "reflexo": reflexo,
+    }
+
+
+def avaliar_qualidade(
+    conteudo: Arquivo, limites: Optional[LimitesQualidade] = None
+) -> AvaliacaoQualidade:
+    """
+    Mede a foto e diz se vale a pena enviá-la à API.
+
+    A imagem é decodificada direto em escala reduzida (JPEG draft) e em tons
+    de cinza; o tempo típico fica em poucos milissegundos.
+
+    Args:
+        conteudo: Imagem (bytes, FonteArquivo ou qualquer entrada aceita por
+            ``abrir_entrada``).
+        limites (LimitesQualidade, opcional): Padrão: variáveis de ambiente.
+
+    Returns:
+        AvaliacaoQualidade: `aprovada=False` traz em `problemas` as
+        orientações para uma nova foto. Com `avaliada=False` a imagem não
+        pôde ser analisada localmente e segue para a API.
+    """
+    inicio = time.perf_counter()
+    if np is None or Image is None:
+        return AvaliacaoQualidade(aprovada=True, avaliada=False)
+    limites = limites or LimitesQualidade.do_ambiente()
+    fonte = abrir_entrada(conteudo)
+    try:
+        with span("imagem.qualidade", bytes=fonte.tamanho()), fonte.abrir() as f:
+            with Image.open(f) as imagem:
+                largura, altura = imagem.size
+                escala = min(1.0, LADO_ANALISE / max(largura, altura, 1))
+                analise = (max(1, int(largura * escala)), max(1, int(altura * escala)))
+                # JPEG: o decodificador já entrega a imagem reduzida (1/2 a 1/8)
+                imagem.draft("L", analise)
+                cinza = imagem.convert("L")
+                if cinza.size != analise:
+                    cinza = cinza.resize(analise, Image.BOX)
+                medidas = medir(np.asarray(cinza))
+    except Exception as e:
+        logger.warning(f"Qualidade da imagem não avaliada: {e}")
+        return AvaliacaoQualidade(aprovada=True, avaliada=False)
+
+    problemas = []
+    if min(largura, altura) < limites.lado_minimo:
+        problemas.append(
+            f"Resolução insuficiente ({largura}x{altura}): aproxime a câmera ou "
+            f"use uma foto com pelo menos {limites.lado_minimo} px no menor lado."
+        )
+    if medidas["nitidez"] < limites.nitidez_minima:
+        problemas.append(
+            "Foto desfocada ou tremida: apoie o celular, aguarde o foco e "
+            "fotografe novamente."
+        )
+    if medidas["brilho"] < limites.brilho_minimo:
+        problemas.append("Foto escura: fotografe em um local mais iluminado.")
+    elif (
+        medidas["brilho"] > limites.brilho_maximo
+        or medidas["estouro"] > limites.estouro_maximo
+    ):
+        problemas.append("Foto superexposta: reduza a luz direta sobre o documento.")
+    if medidas["reflexo"] > limites.reflexo_maximo:
+        problemas.append(
+            f"Reflexo cobrindo {medidas['reflexo']:.0%} do documento: incline o "
+            "documento ou desligue o flash."
+        )
+
+    return AvaliacaoQualidade(
+        aprovada=not problemas,
+        avaliada=True,
+        largura=largura,
+        altura=altura,
+        nitidez=round(medidas["nitidez"], 2),
+        brilho=round(medidas["brilho"], 2),
+        estouro=round(medidas["estouro"], 4),
+        reflexo=round(medidas["reflexo"], 4),
+        problemas=problemas,
+        duracao_ms=round((time.perf_counter() - inicio) * 1000, 3),
+    )
+
+
+def verificacao_ativa() -> bool:
+    return os.getenv("MOSTQI_QUALIDADE", "1") != "0"
+
+
+def recusar_se_inutilizavel(
+    conteudo: Arquivo, limites: Optional[LimitesQualidade] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Verificação usada pelos steps 02 e 04 antes de chamar a API.
+
+    Args:
+        conteudo: Imagem enviada ao step.
+        limites (LimitesQualidade, opcional): Padrão: variáveis de ambiente
+            (o step 04 passa ``LimitesQualidade.do_ambiente().para_qrcode()``).
+
+    Returns:
+        dict | None: Saída de erro do step, com as orientações em "mensagem"
+        e as medidas em "metadata.verificacao_imagem", ou None se a imagem
+        pode seguir (ou a verificação está desativada).
+    """
+    if not verificacao_ativa():
+        return None
+    avaliacao = avaliar_qualidade(conteudo, limites)
+    if avaliacao.aprovada:
+        return None
+    logger.info(
+        f"Imagem recusada localmente em {avaliacao.duracao_ms} ms: {avaliacao.mensagem}"
+    )
+    return {
+        "status": "erro",
+        "mensagem": f"Imagem recusada na verificação de qualidade. {avaliacao.mensagem}",
+        "dados": None,
+        "metadata": {"verificacao_imagem": avaliacao.como_dict()},
+    }
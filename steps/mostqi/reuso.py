@@ -0,0 +1,424 @@
+"""
+Índice de documentos já processados (reuso de CPF, registro e RENACH).
+
+O padrão de fraude mais comum é o mesmo CPF ou registro de CNH voltar ao
+fluxo com outro nome ou outra foto. Os steps 02 e 04 registram aqui os
+identificadores extraídos e recebem de volta as ocorrências anteriores em
+outros casos, com a indicação de nome divergente.
+
+O índice é um SQLite em modo WAL (vários processos podem gravar ao mesmo
+tempo) com a tabela organizada pela chave (tipo, valor): cada consulta é
+uma busca na árvore B, que continua com poucos níveis mesmo com dezenas de
+milhões de entradas. Ativado por MOSTQI_INDICE_DOCUMENTOS (caminho do
+arquivo).
+
+Carga do histórico (a partir da pasta steps/):
+
+    python -m mostqi.reuso carregar resultados.jsonl --indice documentos.sqlite3
+    python -m mostqi.reuso consultar --cpf 123.456.789-00 --indice documentos.sqlite3
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from .tracing import case_id_atual
+from .validacao import coincidem, normalizar
+
+# Campos identificadores, na ordem de prioridade
+TIPOS = ("cpf", "registro", "renach")
+MAX_OCORRENCIAS = 20
+LOTE_CARGA = 200_000
+# Cache de páginas do SQLite por conexão (KiB); mantém os níveis internos da
+# árvore em memória nas cargas grandes
+CACHE_PAGINAS_KIB = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Ocorrencia:
+    """Passagem anterior de um identificador pelo fluxo."""
+
+    tipo: str
+    valor: str
+    case_id: str
+    origem: str
+    nome: Optional[str]
+    imagem_hash: Optional[str]
+    visto_em: float
+
+
+@dataclass
+class VerificacaoReuso:
+    """
+    Resultado da consulta de um documento no índice.
+
+    Attributes:
+        ocorrencias: Passagens dos mesmos identificadores em outros casos.
+        nome_divergente: Algum caso anterior tem o mesmo identificador com
+            outro nome (mesma regra de comparação de nomes do step 09).
+    """
+
+    ocorrencias: List[Ocorrencia] = field(default_factory=list)
+    nome_divergente: bool = False
+
+    @property
+    def visto_antes(self) -> bool:
+        return bool(self.ocorrencias)
+
+    def como_dict(self) -> Dict[str, Any]:
+        return {
+            "visto_antes": self.visto_antes,
+            "nome_divergente": self.nome_divergente,
+            "casos_anteriores": sorted({o.case_id for o in self.ocorrencias}),
+            "ocorrencias": [asdict(o) for o in self.ocorrencias],
+        }
+
+
+def identificadores(dados: Mapping[str, Any]) -> List[Tuple[str, str]]:
+    """(tipo, valor normalizado) dos identificadores presentes nos dados."""
+    pares = []
+    for tipo in TIPOS:
+        valor = normalizar(dados.get(tipo))
+        if valor:
+            pares.append((tipo, valor))
+    return pares
+
+
+class IndiceDocumentos:
+    """
+    Índice persistente de identificadores de documentos.
+
+    Thread-safe (uma conexão por instância, protegida por lock); processos
+    diferentes podem usar o mesmo arquivo ao mesmo tempo.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        diretorio = os.path.dirname(os.path.abspath(path))
+        os.makedirs(diretorio, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA cache_size=-{CACHE_PAGINAS_KIB}")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documentos (
+                tipo TEXT NOT NULL,
+                valor TEXT NOT NULL,
+                case_id TEXT NOT NULL,
+                origem TEXT NOT NULL,
+                nome TEXT,
+                imagem_hash TEXT,
+                visto_em REAL NOT NULL,
+                PRIMARY KEY (tipo, valor, case_id, origem)
+            ) WITHOUT ROWID
+            """)
+        self._conn.commit()
+
+    def _consultar(
+        self, pares: List[Tuple[str, str]], case_id: Optional[str]
+    ) -> List[Ocorrencia]:
+        ocorrencias = []
+        for tipo, valor in pares:
+            for linha in self._conn.execute(
+                "SELECT tipo, valor, case_id, origem, nome, imagem_hash, visto_em "
+                "FROM documentos WHERE tipo = ? AND valor = ? AND case_id != ? "
+                "LIMIT ?",
+                (tipo, valor, case_id or "", MAX_OCORRENCIAS),
+            ):
+                ocorrencias.append(Ocorrencia(*linha))
+        return ocorrencias
+
+    def visto(self, tipo: str, valor: str) -> bool:
+        """Indica se o identificador já passou pelo fluxo."""
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT 1 FROM documentos WHERE tipo = ? AND valor = ? LIMIT 1",
+                (tipo, normalizar(valor)),
+            ).fetchone()
+        return linha is not None
+
+    def consultar(
+        self, dados: Mapping[str, Any], case_id: Optional[str] = None
+    ) -> VerificacaoReuso:
+        """
+        Procura os identificadores de `dados` em casos diferentes de `case_id`.
+
+        Args:
+            dados (Mapping): Campos extraídos (asdict de CNHData/VIOData).
+            case_id (str, opcional): Caso atual, ignorado na busca.
+
+        Returns:
+            VerificacaoReuso: Ocorrências anteriores e divergência de nome.
+        """
+        with self._lock:
+            ocorrencias = self._consultar(identificadores(dados), case_id)
+        return _verificacao(dados, ocorrencias)
+
+    def registrar(
+        self,
+        origem: str,
+        dados: Mapping[str, Any],
+        case_id: str,
+        imagem_hash: Optional[str] = None,
+    ) -> VerificacaoReuso:
+        """
+        Consulta e registra os identificadores do documento em uma única
+        transação.
+
+        Args:
+            origem (str): "idp" (frente da CNH) ou "vio" (QR Code).
+            dados (Mapping): Campos extraídos (asdict de CNHData/VIOData).
+            case_id (str): Caso atual.
+            imagem_hash (str, opcional): SHA-256 da imagem enviada.
+
+        Returns:
+            VerificacaoReuso: Ocorrências em outros casos, antes do registro.
+        """
+        pares = identificadores(dados)
+        if not pares:
+            return VerificacaoReuso()
+        nome = normalizar(dados.get("nome")) or None
+        agora = time.time()
+        with self._lock:
+            # Reserva a escrita antes da consulta: outro processo não registra
+            # o mesmo documento entre a busca e a gravação
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                ocorrencias = self._consultar(pares, case_id)
+            except sqlite3.Error:
+                self._conn.rollback()
+                raise
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO documentos VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (tipo, valor, case_id, origem, nome, imagem_hash, agora)
+                    for tipo, valor in pares
+                ],
+            )
+            self._conn.commit()
+        return _verificacao(dados, ocorrencias)
+
+    def carregar(self, registros: Iterable[Dict[str, Any]]) -> int:
+        """
+        Carga em massa (histórico), em transações de LOTE_CARGA linhas.
+
+        Args:
+            registros: Dicionários com case_id, origem, nome, imagem_hash,
+                visto_em e os identificadores (cpf, registro, renach).
+
+        Returns:
+            int: Quantidade de identificadores gravados.
+        """
+        total = 0
+        linhas: List[Tuple[Any, ...]] = []
+
+        def gravar() -> None:
+            # Em ordem de chave as inserções caem em páginas vizinhas da árvore
+            linhas.sort()
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO documentos VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    linhas,
+                )
+                self._conn.commit()
+            linhas.clear()
+
+        for registro in registros:
+            nome = normalizar(registro.get("nome")) or None
+            for tipo, valor in identificadores(registro):
+                linhas.append(
+                    (
+                        tipo,
+                        valor,
+                        str(registro["case_id"]),
+                        registro.get("origem") or "historico",
+                        nome,
+                        registro.get("imagem_hash"),
+                        float(registro.get("visto_em") or time.time()),
+                    )
+                )
+            if len(linhas) >= LOTE_CARGA:
+                total += len(linhas)
+                gravar()
+        if linhas:
+            total += len(linhas)
+            gravar()
+        return total
+
+    def estatisticas(self) -> Dict[str, int]:
+        with self._lock:
+            linhas = self._conn.execute(
+                "SELECT tipo, COUNT(*) FROM documentos GROUP BY tipo"
+            ).fetchall()
+        return dict(linhas)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def _verificacao(
+    dados: Mapping[str, Any], ocorrencias: List[Ocorrencia]
+) -> VerificacaoReuso:
+    nome = normalizar(dados.get("nome"))
+    divergente = any(
+        o.nome and nome and not coincidem("nome", nome, o.nome) for o in ocorrencias
+    )
+    return VerificacaoReuso(ocorrencias=ocorrencias, nome_divergente=divergente)
+
+
+_indice_padrao: Optional[IndiceDocumentos] = None
+_indice_padrao_lock = threading.Lock()
+
+
+def get_indice_documentos() -> Optional[IndiceDocumentos]:
+    """Índice definido por MOSTQI_INDICE_DOCUMENTOS, ou None se desativado."""
+    global _indice_padrao
+    path = os.getenv("MOSTQI_INDICE_DOCUMENTOS", "").strip()
+    if not path:
+        return None
+    if _indice_padrao is None:
+        with _indice_padrao_lock:
+            if _indice_padrao is None:
+                _indice_padrao = IndiceDocumentos(path)
+    return _indice_padrao
+
+
+def registrar_documento(
+    origem: str, dados: Mapping[str, Any], imagem_hash: str
+) -> Optional[Dict[str, Any]]:
+    """
+    Registra o documento no índice padrão e devolve as ocorrências em outros
+    casos. Usado pelos steps 02 e 04; falhas do índice não interrompem o step.
+
+    Returns:
+        dict | None: VerificacaoReuso.como_dict(), ou None sem índice.
+    """
+    indice = get_indice_documentos()
+    if indice is None:
+        return None
+    # Sem case ID, a imagem identifica o caso (reenvios não contam como reuso)
+    case_id = case_id_atual() or imagem_hash
+    try:
+        verificacao = indice.registrar(origem, dados, case_id, imagem_hash)
+    except sqlite3.Error as e:
+        logger.warning(f"Falha ao consultar o índice de documentos: {e}")
+        return None
+    if verificacao.nome_divergente:
+        logger.warning(
+            f"Documento já usado com outro nome nos casos "
+            f"{sorted({o.case_id for o in verificacao.ocorrencias})}"
+        )
+    return verificacao.como_dict()
+
+
+# --- Carga do histórico ----------------------------------------------------
+
+
+def _campos_formatados(dados: Mapping[str, Any]) -> Dict[str, Any]:
+    # Saída de format_cnh_output/format_vio_output
+    pessoa = dados.get("pessoa") or {}
+    habilitacao = dados.get("habilitacao") or {}
+    return {
+        "nome": pessoa.get("nome"),
+        "cpf": pessoa.get("cpf"),
+        "registro": habilitacao.get("registro"),
+        "renach": habilitacao.get("renach"),
+    }
+
+
+def registros_historico(caminho: str) -> Iterator[Dict[str, Any]]:
+    """
+    Lê um arquivo de histórico em streaming.
+
+    Aceita o JSONL de resultados do `mostqi.lote` (com as saídas dos steps
+    02 e 04 em "idp" e "vio"), JSONL/CSV com as colunas case_id, cpf,
+    registro, renach e nome, ou JSONL com saídas formatadas ("pessoa",
+    "habilitacao").
+    """
+    with open(caminho, "r", encoding="utf-8", newline="") as f:
+        if caminho.lower().endswith(".csv"):
+            for numero, linha in enumerate(csv.DictReader(f), start=1):
+                if not linha.get("case_id"):
+                    linha["case_id"] = f"{caminho}:{numero}"
+                yield linha
+            return
+        for numero, linha in enumerate(f, start=1):
+            linha = linha.strip()
+            if not linha:
+                continue
+            registro = json.loads(linha)
+            case_id = registro.get("case_id") or f"{caminho}:{numero}"
+            if "idp" in registro or "vio" in registro:
+                for origem in ("idp", "vio"):
+                    dados = (registro.get(origem) or {}).get("dados")
+                    if dados:
+                        yield dict(
+                            _campos_formatados(dados), case_id=case_id, origem=origem
+                        )
+            elif "pessoa" in registro:
+                yield dict(_campos_formatados(registro), case_id=case_id)
+            else:
+                registro["case_id"] = case_id
+                yield registro
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m mostqi.reuso",
+        description="Índice de documentos já processados (CPF, registro, RENACH).",
+    )
+    parser.add_argument(
+        "--indice",
+        default=os.getenv("MOSTQI_INDICE_DOCUMENTOS"),
+        help="Arquivo SQLite do índice (padrão: MOSTQI_INDICE_DOCUMENTOS)",
+    )
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    carregar = comandos.add_parser("carregar", help="Carrega arquivos de histórico")
+    carregar.add_argument("arquivos", nargs="+", help="Arquivos .jsonl ou .csv")
+    consultar = comandos.add_parser("consultar", help="Consulta um identificador")
+    for tipo in TIPOS:
+        consultar.add_argument(f"--{tipo}")
+    args = parser.parse_args(argv)
+    if not args.indice:
+        parser.error("informe --indice ou defina MOSTQI_INDICE_DOCUMENTOS")
+
+    indice = IndiceDocumentos(args.indice)
+    try:
+        if args.comando == "carregar":
+            inicio = time.perf_counter()
+            total = 0
+            for caminho in args.arquivos:
+                total += indice.carregar(registros_historico(caminho))
+            duracao = time.perf_counter() - inicio
+            print(
+                f"{total} identificadores carregados em {duracao:.1f} s; "
+                f"índice: {indice.estatisticas()}",
+                file=sys.stderr,
+            )
+            return 0
+        dados = {tipo: getattr(args, tipo) for tipo in TIPOS}
+        if not identificadores(dados):
+            parser.error("informe --cpf, --registro ou --renach")
+        print(
+            json.dumps(
+                indice.consultar(dados).como_dict(), ensure_ascii=False, indent=2
+            )
+        )
+        return 0
+    finally:
+        indice.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,531 @@
+"""
+Simulador local das APIs mostQI para testes de carga sem rede.
+
+Uso (a partir da pasta steps/):
+
+    python -m mostqi.simulador --porta 8765 --taxa-erro 0.01 --taxa-429 0.02 \\
+        --latencia content-extraction=lognormal:900:0.4
+
+Depois aponte os steps para ele com ``MOSTQI_BASE_URL=http://127.0.0.1:8765``.
+
+As respostas seguem o formato das APIs reais (campos usados pelos steps
+02, 04, 05, 07 e 08). Latência, taxa de erros 5xx, respostas 429 (com
+Retry-After) e 401 (token recusado ou expirado) são configuráveis.
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import math
+import random
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Nome curto de cada endpoint, usado na configuração de latência e nas estatísticas
+ENDPOINTS = {
+    "/user/authenticate": "authenticate",
+    "/process-image/content-extraction": "content-extraction",
+    "/process-image/vio-extraction": "vio-extraction",
+    "/liveness/streaming/async": "liveness-start",
+    "/liveness/streaming/async/status": "liveness-status",
+    "/process-image/biometrics/face-compare": "face-compare",
+}
+
+# Latências típicas observadas (ms)
+LATENCIAS_PADRAO = {
+    "authenticate": "lognormal:80:0.3",
+    "content-extraction": "lognormal:900:0.35",
+    "vio-extraction": "lognormal:600:0.35",
+    "liveness-start": "lognormal:150:0.3",
+    "liveness-status": "lognormal:100:0.3",
+    "face-compare": "lognormal:500:0.3",
+}
+
+# 1x1 JPEG, usado como imagem devolvida (frontalImage, image)
+IMAGEM_BASE64 = (
+    "/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDABALDA4MChAODQ4SERATGCgaGBYWGDEjJR0oOjM9"
+    "PDkzODdASFxOQERXRTc4UG1RV19iZ2hnPk1xeXBkeFxlZ2P/wAALCAABAAEBAREA/8QAHwAA"
+    "AQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQR"
+    "BRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RF"
+    "RkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ip"
+    "qrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/9oACAEB"
+    "AAA/ACv/2Q=="
+)
+
+CAMPOS_CNH = {
+    "nome": "MARIA DA SILVA SANTOS",
+    "cpf": "123.456.789-09",
+    "rg": "12.345.678-9 SSP SP",
+    "data_nascimento": "15/03/1990",
+    "local_nascimento": "SAO PAULO, SP",
+    "cat_hab": "AB",
+    "data_emissao": "10/01/2020",
+    "data_validade": "10/01/2030",
+    "registro": "01234567890",
+    "filiacao_1": "ANA DA SILVA",
+    "filiacao_2": "JOSE DOS SANTOS",
+}
+
+CAMPOS_QRCODE = dict(
+    CAMPOS_CNH,
+    renach="SP123456789",
+    local_uf="SP",
+    local_cidade="SAO PAULO",
+    codigo_seguranca="12345678901",
+    observacoes="",
+)
+
+
+@dataclass
+class Latencia:
+    """
+    Distribuição de latência de um endpoint, descrita como texto:
+
+    - ``fixa:<ms>``
+    - ``uniforme:<min_ms>:<max_ms>``
+    - ``exponencial:<media_ms>``
+    - ``lognormal:<mediana_ms>:<sigma>`` (cauda longa, mais realista)
+    """
+
+    distribuicao: str = "fixa"
+    parametros: Tuple[float, ...] = (0.0,)
+
+    @classmethod
+    def de_texto(cls, texto: str) -> "Latencia":
+        nome, *valores = texto.strip().split(":")
+        esperado = {"fixa": 1, "uniforme": 2, "exponencial": 1, "lognormal": 2}
+        if nome not in esperado or len(valores) != esperado[nome]:
+            raise ValueError(f"latência inválida: {texto!r}")
+        return cls(nome, tuple(float(v) for v in valores))
+
+    def amostrar_ms(self, rng: random.Random) -> float:
+        p = self.parametros
+        if self.distribuicao == "uniforme":
+            return rng.uniform(p[0], p[1])
+        if self.distribuicao == "exponencial":
+            return rng.expovariate(1 / p[0]) if p[0] > 0 else 0.0
+        if self.distribuicao == "lognormal":
+            return rng.lognormvariate(math.log(p[0]), p[1]) if p[0] > 0 else 0.0
+        return p[0]
+
+
+@dataclass
+class ConfiguracaoSimulador:
+    """
+    Comportamento do simulador.
+
+    Attributes:
+        latencias: Latência por endpoint (nomes de ENDPOINTS).
+        escala: Multiplica todas as latências (ex.: 0.01 para rodar em CI).
+        taxa_erro: Fração de respostas 500.
+        taxa_429: Fração de respostas 429 com Retry-After.
+        taxa_401: Fração de tokens válidos recusados com 401.
+        max_simultaneas: Acima deste número de chamadas em andamento a
+            resposta é 429 (0 desativa).
+        retry_after_s: Valor do cabeçalho Retry-After nas respostas 429.
+        token_ttl_s: Validade dos tokens emitidos.
+        liveness_duracao_s: Tempo até a sessão de liveness terminar.
+        similaridade: Similaridade devolvida pelo face-compare (0 a 1).
+        semente: Semente do gerador aleatório (resultados reproduzíveis).
+    """
+
+    latencias: Dict[str, Latencia] = field(
+        default_factory=lambda: {
+            nome: Latencia.de_texto(texto) for nome, texto in LATENCIAS_PADRAO.items()
+        }
+    )
+    escala: float = 1.0
+    taxa_erro: float = 0.0
+    taxa_429: float = 0.0
+    taxa_401: float = 0.0
+    max_simultaneas: int = 0
+    retry_after_s: float = 1.0
+    token_ttl_s: float = 3600.0
+    liveness_duracao_s: float = 5.0
+    similaridade: float = 0.92
+    semente: Optional[int] = None
+
+
+class EstatisticasSimulador:
+    """Contagem de respostas por endpoint e status HTTP."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.respostas: Dict[str, Dict[int, int]] = {}
+        self.em_andamento = 0
+        self.pico_simultaneas = 0
+
+    def entrar(self) -> int:
+        with self._lock:
+            self.em_andamento += 1
+            self.pico_simultaneas = max(self.pico_simultaneas, self.em_andamento)
+            return self.em_andamento
+
+    def sair(self, endpoint: str, status: int) -> None:
+        with self._lock:
+            self.em_andamento -= 1
+            por_status = self.respostas.setdefault(endpoint, {})
+            por_status[status] = por_status.get(status, 0) + 1
+
+    def resumo(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "respostas": {
+                    endpoint: dict(sorted(por_status.items()))
+                    for endpoint, por_status in self.respostas.items()
+                },
+                "pico_simultaneas": self.pico_simultaneas,
+            }
+
+
+class SimuladorMostQI(ThreadingHTTPServer):
+    """Servidor HTTP (uma thread por conexão) que imita as APIs mostQI."""
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(
+        self,
+        endereco: Tuple[str, int] = ("127.0.0.1", 0),
+        config: Optional[ConfiguracaoSimulador] = None,
+    ) -> None:
+        super().__init__(endereco, _Handler)
+        self.config = config or ConfiguracaoSimulador()
+        self.estatisticas = EstatisticasSimulador()
+        self._segredo = uuid.uuid4().bytes
+        self._rng = random.Random(self.config.semente)
+        self._rng_lock = threading.Lock()
+        self._sessoes: Dict[str, float] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, porta = self.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def iniciar(self) -> "SimuladorMostQI":
+        """Atende em uma thread daemon e retorna o próprio servidor."""
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="simulador-mostqi", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def parar(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "SimuladorMostQI":
+        return self.iniciar()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.parar()
+
+    def sortear(self, func: Callable[[random.Random], float]) -> float:
+        with self._rng_lock:
+            return func(self._rng)
+
+    def emitir_token(self) -> str:
+        def b64(dados: bytes) -> str:
+            return base64.urlsafe_b64encode(dados).decode().rstrip("=")
+
+        cabecalho = b64(json.dumps({"alg": "HS256", "typ": "JWT"}).encode())
+        claims = b64(
+            json.dumps(
+                {
+                    "exp": int(time.time() + self.config.token_ttl_s),
+                    "jti": uuid.uuid4().hex,
+                }
+            ).encode()
+        )
+        assinatura = hmac.new(
+            self._segredo, f"{cabecalho}.{claims}".encode(), hashlib.sha256
+        ).digest()
+        return f"{cabecalho}.{claims}.{b64(assinatura)}"
+
+    def token_valido(self, token: str) -> bool:
+        try:
+            cabecalho, claims, assinatura = token.split(".")
+            recebido = base64.urlsafe_b64decode(
+                assinatura + "=" * (-len(assinatura) % 4)
+            )
+        except ValueError:
+            # Inclui binascii.Error: assinatura que não é base64
+            return False
+        esperado = hmac.new(
+            self._segredo, f"{cabecalho}.{claims}".encode(), hashlib.sha256
+        ).digest()
+        if not hmac.compare_digest(esperado, recebido):
+            return False
+        dados = json.loads(base64.urlsafe_b64decode(claims + "=" * (-len(claims) % 4)))
+        return dados.get("exp", 0) > time.time()
+
+    def iniciar_sessao(self) -> str:
+        process_id = uuid.uuid4().hex
+        self._sessoes[process_id] = time.time() + self.config.liveness_duracao_s
+        return process_id
+
+    def sessao_concluida(self, process_id: str) -> Optional[bool]:
+        fim = self._sessoes.get(process_id)
+        return None if fim is None else time.time() >= fim
+
+
+def _campo_ativo(corpo: bytes, nome: str) -> bool:
+    return f'name="{nome}"\r\n\r\ntrue'.encode() in corpo
+
+
+def _resposta_extracao(
+    campos: Dict[str, str], imagem: bool, crops: bool = False
+) -> Dict[str, Any]:
+    resultado: Dict[str, Any] = {
+        "fields": [
+            {"name": nome, "value": valor, "score": 0.97}
+            for nome, valor in campos.items()
+        ],
+        "score": 0.95,
+        "pageNumber": 1,
+        "tags": ["id=bra-cnh-3"],
+    }
+    if imagem:
+        resultado["image"] = IMAGEM_BASE64
+    if crops:
+        resultado["crops"] = [{"name": "foto", "image": IMAGEM_BASE64}]
+    return {
+        "result": [resultado],
+        "requestId": uuid.uuid4().hex,
+        "status": {"code": 200, "message": "Ok"},
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Cabeçalhos e corpo saem em escritas separadas: com o Nagle ativo, o
+    # ACK atrasado do cliente somaria ~40 ms a cada resposta
+    disable_nagle_algorithm = True
+    server: SimuladorMostQI
+
+    def log_message(self, formato: str, *args: Any) -> None:
+        logger.debug(formato % args)
+
+    def _enviar(
+        self,
+        status: int,
+        corpo: Dict[str, Any],
+        cabecalhos: Optional[Dict[str, str]] = None,
+    ) -> None:
+        raw = json.dumps(corpo).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        try:
+            self.end_headers()
+            self.wfile.write(raw)
+        except (BrokenPipeError, ConnectionResetError):
+            # O cliente desistiu (ex.: a cópia perdedora de um hedge)
+            self.close_connection = True
+
+    def do_POST(self) -> None:
+        simulador = self.server
+        config = simulador.config
+        endpoint = ENDPOINTS.get(self.path.split("?", 1)[0])
+        corpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if endpoint is None:
+            self._enviar(404, {"status": {"code": 404, "message": "Not Found"}})
+            return
+
+        simultaneas = simulador.estatisticas.entrar()
+        status = 500
+        try:
+            latencia = config.latencias.get(endpoint, Latencia())
+            time.sleep(simulador.sortear(latencia.amostrar_ms) * config.escala / 1000)
+            status, resposta, cabecalhos = self._responder(endpoint, corpo, simultaneas)
+        finally:
+            # Contada antes do envio: quem recebe a resposta já a vê no resumo
+            simulador.estatisticas.sair(endpoint, status)
+        self._enviar(status, resposta, cabecalhos)
+
+    def _responder(
+        self, endpoint: str, corpo: bytes, simultaneas: int
+    ) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+        simulador = self.server
+        config = simulador.config
+        sorteio = simulador.sortear(lambda rng: rng.random())
+
+        if config.max_simultaneas and simultaneas > config.max_simultaneas:
+            return self._limite()
+        if sorteio < config.taxa_429:
+            return self._limite()
+        if sorteio < config.taxa_429 + config.taxa_erro:
+            return 500, {"status": {"code": 500, "message": "Internal Error"}}, {}
+
+        if endpoint == "authenticate":
+            return 200, {"token": simulador.emitir_token()}, {}
+
+        token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+        recusado = simulador.sortear(lambda rng: rng.random()) < config.taxa_401
+        if recusado or not simulador.token_valido(token):
+            return 401, {"status": {"code": 401, "message": "Unauthorized"}}, {}
+
+        request_id = uuid.uuid4().hex
+        if endpoint == "content-extraction":
+            resposta = _resposta_extracao(
+                CAMPOS_CNH,
+                _campo_ativo(corpo, "returnImage"),
+                _campo_ativo(corpo, "returnCrops"),
+            )
+            return 200, resposta, {}
+        if endpoint == "vio-extraction":
+            return 200, _resposta_extracao(CAMPOS_QRCODE, False), {}
+        if endpoint == "liveness-start":
+            process_id = simulador.iniciar_sessao()
+            return (
+                200,
+                {
+                    "result": {
+                        "processId": process_id,
+                        "sessionUrl": f"{simulador.url}/sessao/{process_id}",
+                    },
+                    "requestId": request_id,
+                    "status": {"code": 200, "message": "Ok"},
+                },
+                {},
+            )
+        if endpoint == "liveness-status":
+            try:
+                process_id = json.loads(corpo).get("processId", "")
+            except ValueError:
+                process_id = ""
+            concluida = simulador.sessao_concluida(process_id)
+            if concluida is None:
+                return (
+                    404,
+                    {"status": {"code": 404, "message": "Process not found"}},
+                    {},
+                )
+            result: Dict[str, Any] = {"processId": process_id, "status": "Processing"}
+            if concluida:
+                result.update(
+                    status="Finished",
+                    livenessScore=0.98,
+                    frontalImage=IMAGEM_BASE64,
+                )
+            return (
+                200,
+                {
+                    "result": result,
+                    "requestId": request_id,
+                    "status": {"code": 200, "message": "Ok"},
+                },
+                {},
+            )
+        # face-compare
+        return (
+            200,
+            {
+                "result": {"similarity": config.similaridade},
+                "requestId": request_id,
+                "status": {"code": 200, "message": "Ok"},
+            },
+            {},
+        )
+
+    def _limite(self) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+        retry_after = self.server.config.retry_after_s
+        return (
+            429,
+            {"status": {"code": 429, "message": "Too Many Requests"}},
+            {"Retry-After": f"{retry_after:g}"},
+        )
+
+
+def configuracao_dos_argumentos(args: argparse.Namespace) -> ConfiguracaoSimulador:
+    config = ConfiguracaoSimulador(
+        escala=args.escala,
+        taxa_erro=args.taxa_erro,
+        taxa_429=args.taxa_429,
+        taxa_401=args.taxa_401,
+        max_simultaneas=args.max_simultaneas,
+        retry_after_s=args.retry_after,
+        token_ttl_s=args.token_ttl,
+        liveness_duracao_s=args.liveness_duracao,
+        semente=args.semente,
+    )
+    for item in args.latencia or []:
+        nome, _, texto = item.partition("=")
+        if nome not in config.latencias:
+            raise ValueError(f"endpoint desconhecido: {nome!r}")
+        config.latencias[nome] = Latencia.de_texto(texto)
+    return config
+
+
+def adicionar_argumentos(parser: argparse.ArgumentParser) -> None:
+    """Opções de configuração do simulador (também usadas pelo benchmark)."""
+    parser.add_argument("--escala", type=float, default=1.0, help="Fator das latências")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração de 500")
+    parser.add_argument("--taxa-429", type=float, default=0.0, help="Fração de 429")
+    parser.add_argument("--taxa-401", type=float, default=0.0, help="Fração de 401")
+    parser.add_argument(
+        "--max-simultaneas",
+        type=int,
+        default=0,
+        help="Chamadas simultâneas acima das quais responde 429 (0 = sem limite)",
+    )
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--token-ttl", type=float, default=3600.0)
+    parser.add_argument(
+        "--liveness-duracao",
+        type=float,
+        default=5.0,
+        help="Segundos até a sessão de liveness terminar",
+    )
+    parser.add_argument("--semente", type=int, default=None)
+    parser.add_argument(
+        "--latencia",
+        action="append",
+        metavar="ENDPOINT=DIST",
+        help="Ex.: content-extraction=lognormal:900:0.4 (pode repetir)",
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m mostqi.simulador",
+        description="Simulador local das APIs mostQI.",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    adicionar_argumentos(parser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        config = configuracao_dos_argumentos(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    simulador = SimuladorMostQI((args.host, args.porta), config)
+    print(f"Simulador mostQI em {simulador.url}", file=sys.stderr)
+    try:
+        simulador.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulador.server_close()
+        print(json.dumps(simulador.estatisticas.resumo()), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+"""
+Spans de tempo para os steps e as chamadas às APIs.
+
+Desativado por padrão. Ative com MOSTQI_TRACE:
+
+- ``jsonl:/caminho/spans.jsonl`` (ou apenas um caminho .jsonl): um span por linha
+- ``otlp:http://localhost:4318/v1/traces``: OTLP/HTTP (JSON) para um coletor
+
+Todos os spans de um caso compartilham o mesmo trace, derivado do case ID
+(``caso(...)``, MOSTQI_CASE_ID ou o ID do fluxo no Windmill), então steps
+executados em jobs diferentes aparecem juntos no coletor.
+
+Com o tracing desativado, ``span()`` devolve um objeto nulo compartilhado e
+``rastrear_step`` chama a função diretamente: o custo é uma checagem de
+variável global por chamada.
+"""
+
+import atexit
+import contextlib
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import requests
+
+from .metricas import observar_step
+
+SERVICO = "cnh-validation-workflow"
+LOTE_EXPORTACAO = 256
+INTERVALO_EXPORTACAO_SEGUNDOS = 2.0
+
+logger = logging.getLogger(__name__)
+
+_caso_atual: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "mostqi_caso", default=None
+)
+_span_atual: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "mostqi_span", default=None
+)
+
+
+def _trace_id(case_id: Optional[str]) -> str:
+    if case_id:
+        return hashlib.sha256(case_id.encode("utf-8")).hexdigest()[:32]
+    return os.urandom(16).hex()
+
+
+def case_id_atual() -> Optional[str]:
+    """Case ID do contexto, de MOSTQI_CASE_ID ou do fluxo no Windmill."""
+    return (
+        _caso_atual.get()
+        or os.getenv("MOSTQI_CASE_ID")
+        or os.getenv("WM_ROOT_FLOW_JOB_ID")
+        or os.getenv("WM_FLOW_JOB_ID")
+        or os.getenv("WM_JOB_ID")
+    )
+
+
+class Span:
+    """Intervalo de tempo com atributos, exportado ao sair do bloco `with`."""
+
+    __slots__ = (
+        "nome",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "case_id",
+        "inicio_ns",
+        "fim_ns",
+        "atributos",
+        "erro",
+        "_token",
+    )
+
+    def __init__(self, nome: str, atributos: Dict[str, Any]) -> None:
+        pai = _span_atual.get()
+        self.nome = nome
+        self.case_id = pai.case_id if pai else case_id_atual()
+        self.trace_id = pai.trace_id if pai else _trace_id(self.case_id)
+        self.parent_id = pai.span_id if pai else None
+        self.span_id = os.urandom(8).hex()
+        self.atributos = atributos
+        self.erro: Optional[str] = None
+        self.inicio_ns = 0
+        self.fim_ns = 0
+        self._token: Optional[contextvars.Token] = None
+
+    def set(self, **atributos: Any) -> None:
+        self.atributos.update(atributos)
+
+    @property
+    def duracao_ms(self) -> float:
+        return (self.fim_ns - self.inicio_ns) / 1e6
+
+    def __enter__(self) -> "Span":
+        self._token = _span_atual.set(self)
+        self.inicio_ns = time.time_ns()
+        return self
+
+    def __exit__(self, tipo, valor, tb) -> None:
+        self.fim_ns = time.time_ns()
+        if valor is not None:
+            self.erro = f"{tipo.__name__}: {valor}"
+        _span_atual.reset(self._token)
+        exportador = _exportador
+        if exportador is not None:
+            exportador.exportar(self)
+
+    def como_dict(self) -> Dict[str, Any]:
+        return {
+            "nome": self.nome,
+            "case_id": self.case_id,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "inicio_ns": self.inicio_ns,
+            "fim_ns": self.fim_ns,
+            "duracao_ms": round(self.duracao_ms, 3),
+            "atributos": self.atributos,
+            "erro": self.erro,
+        }
+
+
+class _SpanNulo:
+    """Usado quando o tracing está desativado: não mede nem guarda nada."""
+
+    __slots__ = ()
+
+    def set(self, **atributos: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_SpanNulo":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+
+SPAN_NULO = _SpanNulo()
+
+
+class ExportadorJSONL:
+    """Acrescenta um span por linha em um arquivo local."""
+
+    def __init__(self, path: str) -> None:
+        diretorio = os.path.dirname(os.path.abspath(path))
+        os.makedirs(diretorio, exist_ok=True)
+        self.path = path
+        self._arquivo = open(path, "a", encoding="utf-8", buffering=64 * 1024)
+        self._lock = threading.Lock()
+
+    def exportar(self, span: Span) -> None:
+        linha = json.dumps(span.como_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._arquivo.write(linha + "\n")
+
+    def fechar(self) -> None:
+        with self._lock:
+            self._arquivo.close()
+
+
+def _valor_otlp(valor: Any) -> Dict[str, Any]:
+    if isinstance(valor, bool):
+        return {"boolValue": valor}
+    if isinstance(valor, int):
+        return {"intValue": str(valor)}
+    if isinstance(valor, float):
+        return {"doubleValue": valor}
+    return {"stringValue": str(valor)}
+
+
+class ExportadorOTLP:
+    """
+    Envia os spans em lotes para um coletor OTLP/HTTP (JSON), a partir de
+    uma thread em segundo plano, sem bloquear os steps.
+    """
+
+    def __init__(self, url: str, servico: str = SERVICO) -> None:
+        self.url = url
+        self.servico = servico
+        self._fila: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=10000)
+        self._session = requests.Session()
+        self.descartados = 0
+        self._thread = threading.Thread(
+            target=self._enviar_continuamente, name="mostqi-otlp", daemon=True
+        )
+        self._thread.start()
+
+    def exportar(self, span: Span) -> None:
+        try:
+            self._fila.put_nowait(span)
+        except queue.Full:
+            self.descartados += 1
+
+    def _enviar_continuamente(self) -> None:
+        encerrar = False
+        while not encerrar:
+            lote: List[Span] = []
+            limite = time.monotonic() + INTERVALO_EXPORTACAO_SEGUNDOS
+            while len(lote) < LOTE_EXPORTACAO:
+                try:
+                    span = self._fila.get(timeout=max(0.0, limite - time.monotonic()))
+                except queue.Empty:
+                    break
+                if span is None:
+                    encerrar = True
+                    break
+                lote.append(span)
+            if lote:
+                self._enviar(lote)
+
+    def _enviar(self, lote: List[Span]) -> None:
+        try:
+            self._session.post(self.url, json=self.payload(lote), timeout=5)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Falha ao exportar {len(lote)} spans: {e}")
+
+    def payload(self, lote: List[Span]) -> Dict[str, Any]:
+        spans = []
+        for span in lote:
+            atributos = dict(span.atributos)
+            if span.case_id:
+                atributos["case.id"] = span.case_id
+            dados: Dict[str, Any] = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.nome,
+                "kind": 3 if span.nome.startswith("http.") else 1,
+                "startTimeUnixNano": str(span.inicio_ns),
+                "endTimeUnixNano": str(span.fim_ns),
+                "attributes": [
+                    {"key": chave, "value": _valor_otlp(valor)}
+                    for chave, valor in atributos.items()
+                    if valor is not None
+                ],
+                "status": (
+                    {"code": 2, "message": span.erro} if span.erro else {"code": 1}
+                ),
+            }
+            if span.parent_id:
+                dados["parentSpanId"] = span.parent_id
+            spans.append(dados)
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {"key": "service.name", "value": _valor_otlp(self.servico)}
+                        ]
+                    },
+                    "scopeSpans": [{"scope": {"name": "mostqi"}, "spans": spans}],
+                }
+            ]
+        }
+
+    def fechar(self) -> None:
+        self._fila.put(None)
+        self._thread.join(timeout=10)
+        self._session.close()
+
+
+def exportador_do_ambiente():
+    """Exportador indicado por MOSTQI_TRACE, ou None (tracing desativado)."""
+    destino = os.getenv("MOSTQI_TRACE", "").strip()
+    if not destino or destino in ("0", "off"):
+        return None
+    if destino.startswith("otlp:"):
+        return ExportadorOTLP(destino[5:])
+    if destino.startswith("jsonl:"):
+        destino = destino[6:]
+    return ExportadorJSONL(destino)
+
+
+_exportador = exportador_do_ambiente()
+
+
+def configurar(exportador) -> None:
+    """Troca o exportador em uso (None desativa o tracing)."""
+    global _exportador
+    anterior, _exportador = _exportador, exportador
+    if anterior is not None and anterior is not exportador:
+        anterior.fechar()
+
+
+def ativo() -> bool:
+    return _exportador is not None
+
+
+def span(nome: str, **atributos: Any):
+    """
+    Abre um span filho do span atual.
+
+    Uso::
+
+        with span("http.post", endpoint=path) as s:
+            ...
+            s.set(http_status=200)
+    """
+    if _exportador is None:
+        return SPAN_NULO
+    return Span(nome, atributos)
+
+
+@contextlib.contextmanager
+def caso(case_id: str) -> Iterator[None]:
+    """Associa os spans abertos no bloco ao case ID informado."""
+    token = _caso_atual.set(str(case_id))
+    try:
+        yield
+    finally:
+        _caso_atual.reset(token)
+
+
+def rastrear_step(
+    nome: str, diario: bool = True, validade_diario: Optional[float] = None
+) -> Callable:
+    """
+    Decorador que envolve o `main` de um step em um span `step.<nome>` e
+    registra a duração e o status nas métricas (mostqi.metricas).
+
+    Args:
+        nome (str): Nome do step.
+        diario (bool): Grava e reaproveita a saída no diário de casos
+            (mostqi.diario), quando ativo. Use False para steps cuja saída
+            muda a cada chamada com as mesmas entradas (ex.: consulta de status).
+        validade_diario (float, opcional): Idade máxima, em segundos, de uma
+            saída reaproveitada do diário.
+
+    O prazo do caso (argumento `prazo_caso` do step, ou o já ativo) vale
+    durante toda a execução (mostqi.prazo).
+    """
+
+    def decorador(func: Callable) -> Callable:
+        # Importados aqui: mostqi.diario e mostqi.prazo dependem deste módulo
+        from .prazo import com_prazo
+
+        executar = func
+        if diario:
+            from .diario import com_diario
+
+            executar = com_diario(nome, func, validade_diario)
+        executar = com_prazo(nome, executar)
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            inicio = time.perf_counter()
+            resultado: Any = {"status": "erro"}
+            try:
+                if _exportador is None:
+                    resultado = executar(*args, **kwargs)
+                    return resultado
+                with Span(f"step.{nome}", {"step": nome}) as s:
+                    resultado = executar(*args, **kwargs)
+                    if isinstance(resultado, dict) and "status" in resultado:
+                        s.set(resultado_status=str(resultado["status"]))
+                    return resultado
+            finally:
+                observar_step(nome, time.perf_counter() - inicio, resultado)
+
+        return wrapper
+
+    return decorador
+
+
+@atexit.register
+def _encerrar() -> None:
+    if _exportador is not None:
+        _exportador.fechar()
@@ -0,0 +1,381 @@
+"""
+Comparação entre os dados da frente da CNH (IDP) e do QR Code (VIO).
+
+Concentra as regras usadas pelo step 09 para um caso e oferece o modo em
+lote (`validar_lote`), que recebe colunas (listas, arrays NumPy ou Arrow)
+com os campos de muitos casos e faz a normalização e a comparação de forma
+vetorizada, sobre matrizes de code points.
+"""
+
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# (chave, rótulo) na ordem em que os campos aparecem no relatório do step 09
+CAMPOS: Tuple[Tuple[str, str], ...] = (
+    ("nome", "Nome"),
+    ("cpf", "CPF"),
+    ("nascimento", "Data de nascimento"),
+    ("filiacao1", "Filiação mãe"),
+    ("filiacao2", "Filiação pai"),
+    ("rg", "RG"),
+    ("registro", "Registro CNH"),
+    ("emissao", "Data de emissão"),
+    ("validade", "Data de validade"),
+    ("categoria", "Categoria de habilitação"),
+)
+CHAVES = tuple(chave for chave, _ in CAMPOS)
+
+SCORE_MINIMO_DADOS = 75
+SCORE_MINIMO_LIVENESS = 80
+
+# Edições (inserção, remoção ou troca de caractere) toleradas por campo, após
+# a normalização. Campos ausentes daqui precisam ser idênticos.
+LIMITES_EDICAO: Dict[str, int] = {"nome": 2, "filiacao1": 2, "filiacao2": 2}
+# Cada edição tolerada exige ao menos esta quantidade de caracteres no valor,
+# para que nomes curtos ("ana" x "ivo") não sejam aceitos
+CARACTERES_POR_EDICAO = 8
+
+_REMOVIDOS = " .-/"
+# Faixas latinas com letras acentuadas (Latin-1, Latin Extended-A/B e
+# Latin Extended Additional) e marcas combinantes soltas
+_FAIXAS_ACENTOS = ((0x00C0, 0x0250), (0x0300, 0x0370), (0x1E00, 0x1F00))
+
+
+def _mapear(caractere: str) -> str:
+    """Forma normalizada de um caractere isolado (pode ser vazia)."""
+    if caractere in _REMOVIDOS or caractere.isspace():
+        return ""
+    decomposto = unicodedata.normalize("NFD", caractere)
+    sem_acento = "".join(c for c in decomposto if not unicodedata.combining(c))
+    return sem_acento.lower()
+
+
+def _tabela_traducao() -> Dict[int, Optional[str]]:
+    tabela: Dict[int, Optional[str]] = {}
+    codigos = list(range(0x80)) + [
+        codigo for inicio, fim in _FAIXAS_ACENTOS for codigo in range(inicio, fim)
+    ]
+    codigos += [codigo for codigo in range(0x80, 0x3001) if chr(codigo).isspace()]
+    for codigo in codigos:
+        mapeado = _mapear(chr(codigo))
+        if mapeado != chr(codigo):
+            tabela[codigo] = mapeado or None
+    return tabela
+
+
+_TABELA = _tabela_traducao()
+# Para entradas ASCII (a maioria: CPF, datas, registro) bytes.translate é
+# bem mais rápido que str.translate; as duas tabelas têm o mesmo conteúdo
+_TABELA_ASCII = bytes(
+    ord(_TABELA.get(codigo) or chr(codigo)) if codigo < 0x80 else codigo
+    for codigo in range(256)
+)
+_REMOVIDOS_ASCII = bytes(
+    codigo for codigo in range(0x80) if codigo in _TABELA and _TABELA[codigo] is None
+)
+
+
+def normalizar(valor: Any) -> str:
+    """
+    Remove espaços, separadores (ponto, hífen, barra), acentos e caixa em uma
+    única passada de tradução por tabela.
+    """
+    if not isinstance(valor, str):
+        return ""
+    if valor.isascii():
+        return (
+            valor.encode("ascii")
+            .translate(_TABELA_ASCII, _REMOVIDOS_ASCII)
+            .decode("ascii")
+        )
+    normalizado = valor.translate(_TABELA)
+    # A tabela já cobre o ASCII e o latim; lower() só para outros alfabetos
+    return normalizado if normalizado.isascii() else normalizado.lower()
+
+
+def distancia_limitada(a: str, b: str, limite: int) -> int:
+    """
+    Distância de Levenshtein entre `a` e `b`, calculada só até `limite`.
+
+    Usa apenas a faixa diagonal de largura 2*limite+1 da matriz e para
+    assim que todas as células passam do limite.
+
+    Returns:
+        int: A distância, ou limite + 1 se ela for maior que o limite.
+    """
+    if a == b:
+        return 0
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) - len(a) > limite:
+        return limite + 1
+    # Prefixo e sufixo comuns não mudam a distância
+    inicio = 0
+    while inicio < len(a) and a[inicio] == b[inicio]:
+        inicio += 1
+    fim_a, fim_b = len(a), len(b)
+    while fim_a > inicio and a[fim_a - 1] == b[fim_b - 1]:
+        fim_a -= 1
+        fim_b -= 1
+    a, b = a[inicio:fim_a], b[inicio:fim_b]
+    if not a:
+        return len(b) if len(b) <= limite else limite + 1
+
+    fora = limite + 1
+    anterior = [j if j <= limite else fora for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        atual = [fora] * (len(b) + 1)
+        if i <= limite:
+            atual[0] = i
+        menor = atual[0]
+        caractere = a[i - 1]
+        for j in range(max(1, i - limite), min(len(b), i + limite) + 1):
+            custo = anterior[j - 1] + (caractere != b[j - 1])
+            if anterior[j] + 1 < custo:
+                custo = anterior[j] + 1
+            if atual[j - 1] + 1 < custo:
+                custo = atual[j - 1] + 1
+            atual[j] = custo if custo < fora else fora
+            if custo < menor:
+                menor = custo
+        if menor > limite:
+            return fora
+        anterior = atual
+    return anterior[len(b)]
+
+
+def limite_edicao(chave: str, normalizado1: str, normalizado2: str) -> int:
+    """Edições toleradas para o campo, conforme o tamanho do menor valor."""
+    maximo = LIMITES_EDICAO.get(chave, 0)
+    if not maximo:
+        return 0
+    menor = min(len(normalizado1), len(normalizado2))
+    return min(maximo, menor // CARACTERES_POR_EDICAO)
+
+
+def coincidem(chave: str, normalizado1: str, normalizado2: str) -> bool:
+    """Regra de comparação do campo sobre valores já normalizados."""
+    if normalizado1 == normalizado2:
+        return True
+    if chave == "rg":
+        # O RG pode vir com ou sem órgão emissor/UF em uma das fontes
+        return normalizado1 in normalizado2 or normalizado2 in normalizado1
+    limite = limite_edicao(chave, normalizado1, normalizado2)
+    return (
+        limite > 0 and distancia_limitada(normalizado1, normalizado2, limite) <= limite
+    )
+
+
+def comparar_campo(chave: str, valor1: Any, valor2: Any) -> bool:
+    """Aplica a regra de comparação do campo (igualdade, RG contido ou edições)."""
+    return coincidem(chave, normalizar(valor1), normalizar(valor2))
+
+
+# --- Modo em lote ----------------------------------------------------------
+
+# Classes de caractere usadas no modo em lote
+_REMOVIDO = 1
+_NULO = 2
+_EXPANDE = 4
+
+_tabelas: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+
+def _tabelas_bmp() -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Tabelas indexadas por code point do BMP, derivadas da mesma tabela de
+    `normalizar`: o caractere normalizado e a classe (removido,
+    preenchimento ou caractere que precisa da comparação em Python).
+    """
+    global _tabelas
+    if _tabelas is None:
+        mapeados = np.arange(0x10000, dtype=np.uint32)
+        classes = np.zeros(0x10000, dtype=np.uint8)
+        for codigo in range(1, 0x10000):
+            traduzido = _TABELA.get(codigo, chr(codigo))
+            mapeado = traduzido.lower() if traduzido else ""
+            if not mapeado:
+                classes[codigo] = _REMOVIDO
+            elif len(mapeado) == 1:
+                mapeados[codigo] = ord(mapeado)
+            else:
+                # Minúscula com mais de um caractere (ex.: "İ")
+                classes[codigo] = _EXPANDE
+        # O sigma maiúsculo vira "σ" ou "ς" conforme a posição na palavra
+        classes[0x03A3] = _EXPANDE
+        classes[0] = _NULO
+        _tabelas = (mapeados, classes)
+    return _tabelas
+
+
+def _como_texto(coluna: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converte a coluna em array de texto de largura fixa.
+
+    Returns:
+        tuple: (array dtype "U", máscara de valores ausentes/vazios).
+    """
+    if hasattr(coluna, "to_numpy"):  # pyarrow.Array, pandas.Series
+        try:
+            coluna = coluna.to_numpy(zero_copy_only=False)
+        except TypeError:
+            coluna = coluna.to_numpy()
+    array = np.asarray(coluna)
+    if array.dtype.kind != "U":
+        objetos = np.asarray(coluna, dtype=object)
+        # None/NaN/valores não textuais contam como ausentes, como no step 09
+        array = np.array(
+            [v if isinstance(v, str) else "" for v in objetos.tolist()], dtype=str
+        )
+    return array, np.char.str_len(array) == 0
+
+
+def _normalizar_coluna(
+    texto: np.ndarray, largura: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Normaliza uma coluna "U" com as mesmas regras de `normalizar`.
+
+    Returns:
+        tuple: Matriz (n, largura) de code points, com os caracteres
+        removidos compactados para o fim como zeros, e a máscara das linhas
+        que precisam ser comparadas em Python (caracteres cuja forma
+        normalizada depende do contexto ou tem mais de um caractere).
+    """
+    n = texto.shape[0]
+    codigos = texto.astype(f"U{largura}").view(np.uint32).reshape(n, largura)
+
+    mapeados, classes = _tabelas_bmp()
+    fora_bmp = codigos.size > 0 and codigos.max() >= 0x10000
+    indices = np.minimum(codigos, 0xFFFF) if fora_bmp else codigos
+    classe = classes.take(indices)
+    normalizados = mapeados.take(indices)
+    if fora_bmp:
+        # Fora do BMP (emoji etc.) o caractere é mantido como está
+        fora = codigos >= 0x10000
+        normalizados[fora] = codigos[fora]
+        classe[fora] = 0
+
+    removido = (classe & (_REMOVIDO | _NULO)).astype(bool)
+    normalizados[removido] = 0
+
+    # Compacta os caracteres mantidos à esquerda, preservando a ordem
+    ordem = np.argsort(removido.view(np.uint8), axis=1, kind="stable")
+    expande = (classe & _EXPANDE).any(axis=1)
+    return np.take_along_axis(normalizados, ordem, axis=1), expande
+
+
+def _texto_normalizado(codigos: np.ndarray) -> List[str]:
+    largura = codigos.shape[1]
+    return np.ascontiguousarray(codigos).view(f"U{largura}").ravel().tolist()
+
+
+@dataclass
+class ResultadoLote:
+    """
+    Resultado da validação em lote (um elemento por caso).
+
+    Attributes:
+        campos: Chaves dos campos, na ordem das colunas das matrizes.
+        coincide: Matriz (casos, campos) com o resultado de cada comparação.
+        ausente: Matriz (casos, campos) com campos vazios em IDP ou VIO.
+        score_dados: Percentual de campos coincidentes (0 se faltar campo).
+        aprovado_dados, aprovado_liveness, aprovado_facematch: Flags por caso.
+    """
+
+    campos: Tuple[str, ...]
+    coincide: np.ndarray
+    ausente: np.ndarray
+    score_dados: np.ndarray
+    aprovado_dados: np.ndarray
+    aprovado_liveness: np.ndarray
+    aprovado_facematch: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.score_dados.shape[0])
+
+    def caso(self, indice: int) -> Dict[str, Any]:
+        """Flags e score de um caso, com as mesmas chaves do step 09."""
+        return {
+            "score_dados": float(self.score_dados[indice]),
+            "aprovado_dados": bool(self.aprovado_dados[indice]),
+            "aprovado_liveness": bool(self.aprovado_liveness[indice]),
+            "aprovado_facematch": bool(self.aprovado_facematch[indice]),
+            "campos": {
+                campo: bool(self.coincide[indice, j])
+                for j, campo in enumerate(self.campos)
+            },
+        }
+
+
+def validar_lote(
+    idp: Mapping[str, Any],
+    vio: Mapping[str, Any],
+    liveness_score: Any,
+    facematch_aprovado: Any,
+    campos: Sequence[str] = CHAVES,
+) -> ResultadoLote:
+    """
+    Valida muitos casos de uma vez a partir de colunas.
+
+    Args:
+        idp (Mapping): Coluna de valores por campo (chaves de CAMPOS) vinda
+            da frente da CNH. Aceita listas, arrays NumPy ou Arrow.
+        vio (Mapping): Colunas equivalentes vindas do QR Code.
+        liveness_score: Score de liveness por caso (array ou escalar).
+        facematch_aprovado: Aprovação do facematch por caso (array ou escalar).
+        campos (Sequence[str]): Campos comparados (padrão: todos de CAMPOS).
+
+    Returns:
+        ResultadoLote: Matrizes de coincidência/ausência e flags por caso.
+    """
+    colunas_idp = [_como_texto(idp[campo]) for campo in campos]
+    colunas_vio = [_como_texto(vio[campo]) for campo in campos]
+    n = colunas_idp[0][0].shape[0] if colunas_idp else 0
+    for texto, _ in colunas_idp + colunas_vio:
+        if texto.shape[0] != n:
+            raise ValueError("todas as colunas devem ter o mesmo número de casos")
+
+    coincide = np.zeros((n, len(campos)), dtype=bool)
+    ausente = np.zeros((n, len(campos)), dtype=bool)
+    for j, campo in enumerate(campos):
+        (texto_idp, vazio_idp), (texto_vio, vazio_vio) = colunas_idp[j], colunas_vio[j]
+        largura = max(texto_idp.dtype.itemsize, texto_vio.dtype.itemsize) // 4
+        norm_idp, expande_idp = _normalizar_coluna(texto_idp, largura)
+        norm_vio, expande_vio = _normalizar_coluna(texto_vio, largura)
+        iguais = (norm_idp == norm_vio).all(axis=1)
+        especiais = np.flatnonzero(expande_idp | expande_vio)
+        if especiais.size:
+            iguais[especiais] = [
+                comparar_campo(campo, texto_idp[i], texto_vio[i]) for i in especiais
+            ]
+        if campo == "rg" or LIMITES_EDICAO.get(campo):
+            # RG contido ou nomes com poucas edições: só os casos divergentes
+            # passam pelo Python
+            divergentes = np.setdiff1d(np.flatnonzero(~iguais), especiais)
+            pares = zip(
+                _texto_normalizado(norm_idp[divergentes]),
+                _texto_normalizado(norm_vio[divergentes]),
+            )
+            iguais[divergentes] = [coincidem(campo, a, b) for a, b in pares]
+        coincide[:, j] = iguais
+        ausente[:, j] = vazio_idp | vazio_vio
+
+    total = max(len(campos), 1)
+    completo = ~ausente.any(axis=1)
+    score = np.where(completo, np.round(coincide.sum(axis=1) / total * 100, 2), 0.0)
+    liveness = np.broadcast_to(np.asarray(liveness_score, dtype=float), (n,))
+    facematch = np.broadcast_to(np.asarray(facematch_aprovado, dtype=bool), (n,))
+
+    return ResultadoLote(
+        campos=tuple(campos),
+        coincide=coincide,
+        ausente=ausente,
+        score_dados=score,
+        aprovado_dados=completo & (score >= SCORE_MINIMO_DADOS),
+        aprovado_liveness=liveness >= SCORE_MINIMO_LIVENESS,
+        aprovado_facematch=facematch.copy(),
+    )
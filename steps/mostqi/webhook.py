@@ -0,0 +1,520 @@
+"""
+Receptor local dos webhooks de conclusão da prova de vida.
+
+Uso (a partir da pasta steps/):
+
+    python -m mostqi.webhook --porta 8080
+    python -m mostqi.webhook --simular http://127.0.0.1:8080/webhook/liveness --processos 100
+
+O receptor aceita o payload enviado pela mostQI ao fim da sessão de
+liveness, descarta repetições do mesmo ``processId``, guarda o resultado e
+acorda imediatamente quem estiver aguardando aquele processo.
+
+O receptor roda em um processo próprio; para que o step 07 e o lote (em
+outros processos) vejam os resultados, ele os grava em um SQLite
+compartilhado, MOSTQI_WEBHOOK_DB (``ResultadosWebhook``), consultado por
+``aguardar_liveness`` entre as consultas de status.
+"""
+
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .liveness import estado_terminal
+
+CAMINHO_PADRAO = "/webhook/liveness"
+# Segredo opcional conferido no cabeçalho X-Webhook-Token
+SEGREDO = os.getenv("MOSTQI_WEBHOOK_SEGREDO", "")
+MAX_RESULTADOS = 10000
+# O payload pode trazer a frontalImage em base64
+MAX_CORPO_BYTES = 16 * 1024 * 1024
+MAX_CABECALHO_BYTES = 16 * 1024
+TIMEOUT_LEITURA_SEGUNDOS = 30
+# Resultados no SQLite compartilhado são removidos depois disso
+RETENCAO_SEGUNDOS = 24 * 3600
+# A cada N resultados gravados, os antigos são removidos
+INTERVALO_LIMPEZA = 1000
+
+_MOTIVOS = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+}
+
+logger = logging.getLogger(__name__)
+
+
+class RequisicaoInvalida(Exception):
+    def __init__(self, status: int, mensagem: str) -> None:
+        super().__init__(mensagem)
+        self.status = status
+
+
+def extrair_process_id(payload: Dict[str, Any]) -> Optional[str]:
+    """processId do payload, na raiz ou dentro de `result`."""
+    process_id = payload.get("processId") or (payload.get("result") or {}).get(
+        "processId"
+    )
+    return str(process_id) if process_id else None
+
+
+class ResultadosWebhook:
+    """
+    Payloads finais dos webhooks em um SQLite compartilhado entre o receptor
+    e os processos que aguardam a prova de vida.
+
+    O primeiro payload de um processId é o que vale (chave primária); as
+    repetições são ignoradas.
+    """
+
+    def __init__(self, path: str, retencao_segundos: float = RETENCAO_SEGUNDOS) -> None:
+        self.path = path
+        self.retencao_segundos = retencao_segundos
+        self._lock = threading.Lock()
+        self._gravados = 0
+        diretorio = os.path.dirname(os.path.abspath(path))
+        os.makedirs(diretorio, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS resultados (
+                process_id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                recebido_em REAL NOT NULL
+            ) WITHOUT ROWID
+            """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_resultados_recebido "
+            "ON resultados (recebido_em)"
+        )
+        self._conn.commit()
+
+    def gravar(self, process_id: str, payload: Dict[str, Any]) -> bool:
+        """Guarda o payload; False se o processId já tinha um resultado."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO resultados VALUES (?, ?, ?)",
+                (process_id, json.dumps(payload), time.time()),
+            )
+            self._conn.commit()
+            if cursor.rowcount != 1:
+                return False
+            self._gravados += 1
+            if self._gravados % INTERVALO_LIMPEZA == 0:
+                self._limpar()
+            return True
+
+    def resultado(self, process_id: str) -> Optional[Dict[str, Any]]:
+        """Payload final do processId, se o webhook já chegou."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM resultados WHERE process_id = ?", (process_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def limpar(self) -> int:
+        """Remove os resultados mais antigos que a retenção."""
+        with self._lock:
+            return self._limpar()
+
+    def _limpar(self) -> int:
+        cursor = self._conn.execute(
+            "DELETE FROM resultados WHERE recebido_em <= ?",
+            (time.time() - self.retencao_segundos,),
+        )
+        self._conn.commit()
+        return cursor.rowcount
+
+    def fechar(self) -> None:
+        self._conn.close()
+
+
+_resultados_padrao: Optional[ResultadosWebhook] = None
+_resultados_padrao_lock = threading.Lock()
+
+
+def get_resultados_webhook() -> Optional[ResultadosWebhook]:
+    """Resultados em MOSTQI_WEBHOOK_DB, ou None se a variável não estiver definida."""
+    global _resultados_padrao
+    path = os.getenv("MOSTQI_WEBHOOK_DB", "").strip()
+    if not path:
+        return None
+    if _resultados_padrao is None or _resultados_padrao.path != path:
+        with _resultados_padrao_lock:
+            if _resultados_padrao is None or _resultados_padrao.path != path:
+                _resultados_padrao = ResultadosWebhook(path)
+    return _resultados_padrao
+
+
+class ReceptorWebhook:
+    """
+    Servidor HTTP asyncio mínimo para os webhooks de liveness.
+
+    Os resultados ficam em memória (os `max_resultados` mais recentes) e,
+    com `armazem`, no SQLite compartilhado lido pelos outros processos. O
+    primeiro payload final de um processId é o que vale; repetições são
+    respondidas com 200 e ignoradas, já que o remetente pode reenviar.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        porta: int = 8080,
+        caminho: str = CAMINHO_PADRAO,
+        segredo: str = SEGREDO,
+        max_resultados: int = MAX_RESULTADOS,
+        armazem: Optional[ResultadosWebhook] = None,
+    ) -> None:
+        self.host = host
+        self.porta = porta
+        self.caminho = caminho
+        self.segredo = segredo
+        self.max_resultados = max_resultados
+        self.armazem = armazem
+        self._resultados: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._espera: Dict[str, List[asyncio.Future]] = {}
+        self._servidor: Optional[asyncio.AbstractServer] = None
+        self.recebidos = 0
+        self.duplicados = 0
+        self.rejeitados = 0
+
+    async def iniciar(self) -> "ReceptorWebhook":
+        self._servidor = await asyncio.start_server(
+            self._atender, self.host, self.porta
+        )
+        # Porta 0: usa a porta escolhida pelo sistema
+        self.porta = self._servidor.sockets[0].getsockname()[1]
+        logger.info(f"Receptor de webhook em {self.url}")
+        return self
+
+    async def parar(self) -> None:
+        if self._servidor is not None:
+            self._servidor.close()
+            await self._servidor.wait_closed()
+            self._servidor = None
+
+    async def __aenter__(self) -> "ReceptorWebhook":
+        return await self.iniciar()
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.parar()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.porta}{self.caminho}"
+
+    def resultado(self, process_id: str) -> Optional[Dict[str, Any]]:
+        """Payload final já recebido para o processId, se houver."""
+        payload = self._resultados.get(process_id)
+        if payload is None and self.armazem is not None:
+            payload = self.armazem.resultado(process_id)
+        return payload
+
+    def registrar(self, payload: Dict[str, Any]) -> bool:
+        """
+        Guarda o payload e acorda quem aguarda o processId.
+
+        Returns:
+            bool: False se o processId já tinha um resultado final (duplicado).
+
+        Raises:
+            RequisicaoInvalida: Se o payload não tiver processId.
+        """
+        process_id = extrair_process_id(payload)
+        if not process_id:
+            raise RequisicaoInvalida(400, "processId ausente")
+        self.recebidos += 1
+        if process_id in self._resultados:
+            self.duplicados += 1
+            return False
+        if not estado_terminal(payload):
+            # Atualização intermediária: não há o que entregar ainda
+            logger.info(f"Webhook intermediário para {process_id}")
+            return True
+        if self.armazem is not None and not self.armazem.gravar(process_id, payload):
+            # Já entregue por outro receptor que usa o mesmo banco
+            self.duplicados += 1
+            return False
+        self._resultados[process_id] = payload
+        while len(self._resultados) > self.max_resultados:
+            self._resultados.popitem(last=False)
+        for futuro in self._espera.pop(process_id, ()):
+            if not futuro.done():
+                futuro.set_result(payload)
+        return True
+
+    async def aguardar(
+        self, process_id: str, timeout: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Espera o payload final do processId.
+
+        Returns:
+            dict ou None: O payload, ou None se o timeout acabar antes.
+        """
+        payload = self.resultado(process_id)
+        if payload is not None:
+            return payload
+        futuro = asyncio.get_running_loop().create_future()
+        self._espera.setdefault(process_id, []).append(futuro)
+        try:
+            return await asyncio.wait_for(futuro, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            # Quem desistiu sai da fila para não acumular esperas órfãs
+            fila = self._espera.get(process_id)
+            if fila is not None and futuro in fila:
+                fila.remove(futuro)
+                if not fila:
+                    del self._espera[process_id]
+
+    def estatisticas(self) -> Dict[str, int]:
+        return {
+            "recebidos": self.recebidos,
+            "duplicados": self.duplicados,
+            "rejeitados": self.rejeitados,
+            "resultados": len(self._resultados),
+            "aguardando": len(self._espera),
+        }
+
+    async def _ler_requisicao(
+        self, reader: asyncio.StreamReader
+    ) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        try:
+            bruto = await asyncio.wait_for(
+                reader.readuntil(b"\r\n\r\n"), TIMEOUT_LEITURA_SEGUNDOS
+            )
+        except asyncio.IncompleteReadError:
+            return None  # conexão encerrada pelo cliente
+        except asyncio.LimitOverrunError:
+            raise RequisicaoInvalida(413, "cabeçalho muito grande")
+        if len(bruto) > MAX_CABECALHO_BYTES:
+            raise RequisicaoInvalida(413, "cabeçalho muito grande")
+
+        linhas = bruto.decode("latin-1").split("\r\n")
+        try:
+            metodo, alvo, _ = linhas[0].split(" ", 2)
+        except ValueError:
+            raise RequisicaoInvalida(400, "linha de requisição inválida")
+        cabecalhos = {}
+        for linha in linhas[1:]:
+            if ":" in linha:
+                nome, valor = linha.split(":", 1)
+                cabecalhos[nome.strip().lower()] = valor.strip()
+
+        try:
+            tamanho = int(cabecalhos.get("content-length", "0"))
+        except ValueError:
+            raise RequisicaoInvalida(400, "Content-Length inválido")
+        if tamanho > MAX_CORPO_BYTES:
+            raise RequisicaoInvalida(413, "payload muito grande")
+        corpo = await asyncio.wait_for(
+            reader.readexactly(tamanho), TIMEOUT_LEITURA_SEGUNDOS
+        )
+        return metodo, alvo, cabecalhos, corpo
+
+    def _processar(
+        self, metodo: str, alvo: str, cabecalhos: Dict[str, str], corpo: bytes
+    ) -> Tuple[int, Dict[str, Any]]:
+        if urlsplit(alvo).path != self.caminho:
+            raise RequisicaoInvalida(404, "caminho desconhecido")
+        if metodo != "POST":
+            raise RequisicaoInvalida(405, "use POST")
+        if self.segredo and not hmac.compare_digest(
+            cabecalhos.get("x-webhook-token", ""), self.segredo
+        ):
+            raise RequisicaoInvalida(401, "token do webhook inválido")
+        try:
+            payload = json.loads(corpo)
+        except ValueError:
+            raise RequisicaoInvalida(400, "JSON inválido")
+        if not isinstance(payload, dict):
+            raise RequisicaoInvalida(400, "o payload deve ser um objeto JSON")
+        novo = self.registrar(payload)
+        return 200, {"recebido": True, "duplicado": not novo}
+
+    async def _atender(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                manter_conexao = False
+                try:
+                    requisicao = await self._ler_requisicao(reader)
+                    if requisicao is None:
+                        break
+                    metodo, alvo, cabecalhos, corpo = requisicao
+                    manter_conexao = cabecalhos.get("connection", "").lower() != "close"
+                    status, resposta = self._processar(metodo, alvo, cabecalhos, corpo)
+                except RequisicaoInvalida as e:
+                    self.rejeitados += 1
+                    status, resposta = e.status, {"erro": str(e)}
+                    logger.warning(f"Webhook rejeitado ({e.status}): {e}")
+                await self._responder(writer, status, resposta, manter_conexao)
+                if not manter_conexao:
+                    break
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _responder(
+        writer: asyncio.StreamWriter,
+        status: int,
+        resposta: Dict[str, Any],
+        manter_conexao: bool,
+    ) -> None:
+        corpo = json.dumps(resposta).encode("utf-8")
+        writer.write(
+            (
+                f"HTTP/1.1 {status} {_MOTIVOS.get(status, '')}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(corpo)}\r\n"
+                f"Connection: {'keep-alive' if manter_conexao else 'close'}\r\n\r\n"
+            ).encode("latin-1")
+            + corpo
+        )
+        await writer.drain()
+
+
+async def enviar_webhook(
+    url: str, payload: Dict[str, Any], segredo: str = ""
+) -> Tuple[int, Dict[str, Any]]:
+    """
+    Envia um payload de webhook como a mostQI faria (remetente simulado).
+
+    Returns:
+        tuple: (status HTTP, corpo JSON da resposta).
+    """
+    partes = urlsplit(url)
+    reader, writer = await asyncio.open_connection(partes.hostname, partes.port or 80)
+    corpo = json.dumps(payload).encode("utf-8")
+    cabecalhos = (
+        f"POST {partes.path or '/'} HTTP/1.1\r\n"
+        f"Host: {partes.netloc}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(corpo)}\r\n"
+        "Connection: close\r\n"
+    )
+    if segredo:
+        cabecalhos += f"X-Webhook-Token: {segredo}\r\n"
+    try:
+        writer.write(cabecalhos.encode("latin-1") + b"\r\n" + corpo)
+        await writer.drain()
+        resposta = await reader.read()
+    finally:
+        writer.close()
+    cabecalho, _, corpo_resposta = resposta.partition(b"\r\n\r\n")
+    status = int(cabecalho.split(b" ", 2)[1])
+    return status, json.loads(corpo_resposta or b"{}")
+
+
+def payload_simulado(process_id: str, score: float = 0.97) -> Dict[str, Any]:
+    """Payload no mesmo formato da resposta de status da sessão de liveness."""
+    return {
+        "processId": process_id,
+        "result": {
+            "processId": process_id,
+            "status": "Finished",
+            "livenessScore": score,
+            "frontalImage": "aGk=",
+        },
+        "status": {"code": 200, "message": "Ok"},
+    }
+
+
+async def simular(
+    url: str, processos: int, repeticoes: int = 2, segredo: str = SEGREDO
+) -> Dict[str, Any]:
+    """
+    Envia `processos` webhooks, cada um repetido `repeticoes` vezes, para
+    exercitar a deduplicação do receptor.
+    """
+    inicio = time.perf_counter()
+    envios = [
+        enviar_webhook(url, payload_simulado(f"sim-{i}"), segredo)
+        for i in range(processos)
+        for _ in range(repeticoes)
+    ]
+    respostas: List[Tuple[int, Dict[str, Any]]] = await asyncio.gather(*envios)
+    return {
+        "enviados": len(respostas),
+        "aceitos": sum(1 for s, r in respostas if s == 200 and not r.get("duplicado")),
+        "duplicados": sum(1 for s, r in respostas if r.get("duplicado")),
+        "erros": sum(1 for s, _ in respostas if s != 200),
+        "duracao_s": round(time.perf_counter() - inicio, 3),
+    }
+
+
+async def _servir(
+    host: str, porta: int, caminho: str, armazem: Optional[ResultadosWebhook]
+) -> None:
+    async with ReceptorWebhook(host, porta, caminho, armazem=armazem) as receptor:
+        print(f"Aguardando webhooks em {receptor.url}", file=sys.stderr)
+        while True:
+            await asyncio.sleep(3600)
+            if armazem is not None:
+                armazem.limpar()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m mostqi.webhook",
+        description="Receptor local (ou remetente simulado) dos webhooks de liveness.",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8080)
+    parser.add_argument("--caminho", default=CAMINHO_PADRAO)
+    parser.add_argument(
+        "--db",
+        default=os.getenv("MOSTQI_WEBHOOK_DB"),
+        help="SQLite compartilhado com os workers (padrão: MOSTQI_WEBHOOK_DB)",
+    )
+    parser.add_argument(
+        "--simular",
+        metavar="URL",
+        help="Envia webhooks simulados para a URL em vez de iniciar o receptor",
+    )
+    parser.add_argument("--processos", type=int, default=10)
+    parser.add_argument("--repeticoes", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        if args.simular:
+            resumo = asyncio.run(simular(args.simular, args.processos, args.repeticoes))
+            print(json.dumps(resumo, ensure_ascii=False))
+            return 1 if resumo["erros"] else 0
+        if not args.db:
+            parser.error(
+                "informe --db ou defina MOSTQI_WEBHOOK_DB: sem o banco "
+                "compartilhado, nenhum step em outro processo vê os resultados"
+            )
+        armazem = ResultadosWebhook(args.db)
+        try:
+            asyncio.run(_servir(args.host, args.porta, args.caminho, armazem))
+        finally:
+            armazem.fechar()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+Fixtures dos testes: o simulador da mostQI (mostqi.simulador) em uma porta
+livre e clientes apontados para ele.
+
+Cada teste começa sem as variáveis MOSTQI_* do ambiente e sem as instâncias
+compartilhadas (cliente, cache de tokens, armazém de blobs, diário,
+encurtador, banco dos webhooks) criadas por outro teste.
+"""
+
+import os
+import sys
+from typing import Any, Callable, Iterator, List
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STEPS = os.path.join(RAIZ, "steps")
+sys.path.insert(0, STEPS)
+
+from mostqi import auth, blobs, cache, client, diario, encurtador, webhook  # noqa: E402
+from mostqi.auth import TokenCache  # noqa: E402
+from mostqi.client import MostQIClient  # noqa: E402
+from mostqi.limites import OrcamentoRetry, PoliticaRetry  # noqa: E402
+from mostqi.simulador import ConfiguracaoSimulador, SimuladorMostQI  # noqa: E402
+
+CLIENT_KEY = "chave-de-teste"
+
+# Instâncias compartilhadas criadas sob demanda a partir do ambiente
+PADROES = (
+    (client, "_client_padrao"),
+    (auth, "_cache_padrao"),
+    (cache, "_cache_padrao"),
+    (blobs, "_armazem_padrao"),
+    (diario, "_diario_padrao"),
+    (encurtador, "_encurtador_padrao"),
+    (webhook, "_resultados_padrao"),
+)
+
+
+@pytest.fixture(autouse=True)
+def ambiente_limpo(monkeypatch: pytest.MonkeyPatch) -> None:
+    for nome in list(os.environ):
+        if nome.startswith("MOSTQI_"):
+            monkeypatch.delenv(nome)
+    for modulo, atributo in PADROES:
+        monkeypatch.setattr(modulo, atributo, None)
+
+
+@pytest.fixture
+def iniciar_simulador() -> Iterator[Callable[..., SimuladorMostQI]]:
+    """
+    Fábrica de simuladores: ``iniciar_simulador(taxa_429=0.5, ...)`` recebe
+    os campos de ConfiguracaoSimulador. Latências em 1% das reais.
+    """
+    simuladores: List[SimuladorMostQI] = []
+
+    def iniciar(**config: Any) -> SimuladorMostQI:
+        config.setdefault("escala", 0.01)
+        config.setdefault("liveness_duracao_s", 0.3)
+        config.setdefault("semente", 7)
+        simulador = SimuladorMostQI(config=ConfiguracaoSimulador(**config))
+        simuladores.append(simulador.iniciar())
+        return simulador
+
+    yield iniciar
+    for simulador in simuladores:
+        simulador.parar()
+
+
+@pytest.fixture
+def simulador(iniciar_simulador) -> SimuladorMostQI:
+    return iniciar_simulador()
+
+
+def politica_retry(max_tentativas: int = 4, **kwargs: Any) -> PoliticaRetry:
+    """Repetições com esperas de milissegundos (o backoff real passa de 1 s)."""
+    kwargs.setdefault("espera_inicial", 0.01)
+    kwargs.setdefault("espera_maxima", 0.05)
+    kwargs.setdefault("orcamento", OrcamentoRetry(capacidade=100.0))
+    return PoliticaRetry(max_tentativas, **kwargs)
+
+
+@pytest.fixture
+def criar_cliente() -> Iterator[Callable[..., MostQIClient]]:
+    """
+    Fábrica de clientes para um simulador, cada um com o próprio cache de
+    tokens (autenticando nele mesmo) e a política de ``politica_retry``.
+    """
+    clientes: List[MostQIClient] = []
+
+    def criar(simulador: SimuladorMostQI, **kwargs: Any) -> MostQIClient:
+        token_cache = kwargs.pop("token_cache", None) or TokenCache()
+        kwargs.setdefault("retry", politica_retry())
+        cliente = MostQIClient(
+            base_url=simulador.url, token_cache=token_cache, **kwargs
+        )
+        token_cache.autenticador = cliente.authenticate
+        clientes.append(cliente)
+        return cliente
+
+    yield criar
+    for cliente in clientes:
+        cliente.close()
+
+
+@pytest.fixture
+def cliente(simulador, criar_cliente) -> MostQIClient:
+    return criar_cliente(simulador)
+
+
+def respostas(simulador: SimuladorMostQI, endpoint: str) -> dict:
+    """Respostas do simulador para o endpoint, por status HTTP."""
+    return simulador.estatisticas.resumo()["respostas"].get(endpoint, {})
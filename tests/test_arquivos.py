@@ -0,0 +1,102 @@
+"""Corpo multipart em streaming: o conteúdo certo, sem cópia do arquivo."""
+
+import email.parser
+import os
+import tracemalloc
+
+from conftest import CLIENT_KEY, politica_retry, respostas
+from mostqi.arquivos import CorpoMultipart, FonteBuffer, FonteCaminho
+
+
+def ler_corpo(corpo: CorpoMultipart, bloco: int = 1000) -> bytes:
+    partes = []
+    destino = bytearray(bloco)
+    while True:
+        n = corpo.readinto(destino)
+        if not n:
+            return b"".join(partes)
+        partes.append(bytes(destino[:n]))
+
+
+def test_corpo_multipart_e_valido(tmp_path):
+    imagem = os.urandom(5000)
+    caminho = tmp_path / "verso.png"
+    caminho.write_bytes(os.urandom(3000))
+    corpo = CorpoMultipart(
+        [("returnImage", "true")],
+        [
+            ("file", "frente.jpg", FonteBuffer(imagem), "image/jpeg"),
+            ("qr", "verso.png", FonteCaminho(str(caminho)), "image/png"),
+        ],
+    )
+
+    bruto = ler_corpo(corpo)
+    assert len(bruto) == len(corpo)
+
+    mensagem = email.parser.BytesParser().parsebytes(
+        f"Content-Type: {corpo.content_type}\r\n\r\n".encode() + bruto
+    )
+    partes = mensagem.get_payload()
+    assert [p.get_param("name", header="content-disposition") for p in partes] == [
+        "returnImage",
+        "file",
+        "qr",
+    ]
+    assert partes[0].get_payload() == "true"
+    assert partes[1].get_filename() == "frente.jpg"
+    assert partes[1].get_payload(decode=True) == imagem
+    assert partes[2].get_content_type() == "image/png"
+    assert partes[2].get_payload(decode=True) == caminho.read_bytes()
+
+
+def test_arquivo_grande_e_enviado_em_blocos(tmp_path):
+    caminho = tmp_path / "grande.jpg"
+    with open(caminho, "wb") as f:
+        for _ in range(16):
+            f.write(os.urandom(512 * 1024))
+    destino = bytearray(64 * 1024)
+
+    tracemalloc.start()
+    try:
+        corpo = CorpoMultipart(
+            arquivos=[("file", "grande.jpg", FonteCaminho(str(caminho)), "image/jpeg")]
+        )
+        lidos = 0
+        while n := corpo.readinto(destino):
+            lidos += n
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert lidos == len(corpo) > 8 * 1024 * 1024
+    assert pico < 512 * 1024
+
+
+def test_upload_de_caminho_pelo_simulador(simulador, cliente, tmp_path):
+    caminho = tmp_path / "frente.jpg"
+    caminho.write_bytes(os.urandom(200 * 1024))
+
+    sem_imagem = cliente.content_extraction(
+        CLIENT_KEY, FonteCaminho(str(caminho)), return_image=False
+    )
+    assert sem_imagem.imagem is None
+    assert sem_imagem.recorte_face() is not None
+
+    com_imagem = cliente.content_extraction(
+        CLIENT_KEY, FonteCaminho(str(caminho)), return_image=True, return_crops=False
+    )
+    assert com_imagem.imagem is not None and not com_imagem.recortes
+
+
+def test_repeticao_reenvia_o_corpo_inteiro(iniciar_simulador, criar_cliente, tmp_path):
+    simulador = iniciar_simulador(taxa_erro=0.5)
+    cliente = criar_cliente(simulador, retry=politica_retry(max_tentativas=10))
+    caminho = tmp_path / "frente.jpg"
+    caminho.write_bytes(os.urandom(200 * 1024))
+
+    for _ in range(4):
+        resposta = cliente.content_extraction(CLIENT_KEY, FonteCaminho(str(caminho)))
+        # returnImage=true chegou: o corpo repetido foi lido do início
+        assert resposta.imagem is not None
+
+    assert respostas(simulador, "content-extraction").get(500, 0) > 0
@@ -0,0 +1,90 @@
+"""Cache de tokens: uma autenticação por chave, entre threads e processos."""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import pytest
+
+from conftest import CLIENT_KEY, STEPS, respostas
+from mostqi.auth import SharedMemoryTokenStore, TokenCache, TokenEntry, chave_cache
+from mostqi.simulador import Latencia
+
+# Cada processo filho obtém o token pelo store de MOSTQI_TOKEN_STORE
+PROCESSO_FILHO = """
+import sys
+from mostqi.auth import TokenCache, store_do_ambiente
+from mostqi.client import MostQIClient
+
+cliente = MostQIClient(base_url=sys.argv[1])
+print(TokenCache(store_do_ambiente(), cliente.authenticate).obter(sys.argv[2]))
+"""
+
+
+def test_threads_compartilham_uma_autenticacao(simulador, cliente):
+    tokens = []
+    barreira = threading.Barrier(16)
+
+    def obter():
+        barreira.wait()
+        tokens.append(cliente.token(CLIENT_KEY))
+
+    threads = [threading.Thread(target=obter) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(tokens)) == 1 and len(tokens) == 16
+    assert respostas(simulador, "authenticate") == {200: 1}
+
+
+def test_token_recusado_e_renovado_uma_vez(simulador, criar_cliente):
+    token_cache = TokenCache()
+    token_cache.store.set(
+        chave_cache(CLIENT_KEY), TokenEntry("a.b.c", time.time() + 3600)
+    )
+    cliente = criar_cliente(simulador, token_cache=token_cache)
+
+    assert cliente.face_compare(CLIENT_KEY, b"a", b"b")["result"]
+    assert respostas(simulador, "face-compare") == {200: 1, 401: 1}
+    assert respostas(simulador, "authenticate") == {200: 1}
+    assert token_cache.obter(CLIENT_KEY) != "a.b.c"
+
+
+@pytest.fixture(params=["arquivo", "shm"])
+def token_store(request, tmp_path):
+    """Valor de MOSTQI_TOKEN_STORE para cada store persistente."""
+    if request.param == "arquivo":
+        yield str(tmp_path / "tokens.json")
+        return
+    nome = f"mostqi_teste_{uuid.uuid4().hex[:8]}"
+    yield f"shm:{nome}"
+    store = SharedMemoryTokenStore(nome)
+    store.unlink()
+    os.unlink(store.lock_path)
+
+
+def test_processos_compartilham_uma_autenticacao(iniciar_simulador, token_store):
+    # Autenticação lenta: os processos chegam ao lock enquanto o primeiro espera
+    simulador = iniciar_simulador(
+        latencias={"authenticate": Latencia.de_texto("fixa:300")}, escala=1.0
+    )
+    env = dict(os.environ, PYTHONPATH=STEPS, MOSTQI_TOKEN_STORE=token_store)
+    processos = [
+        subprocess.Popen(
+            [sys.executable, "-c", PROCESSO_FILHO, simulador.url, CLIENT_KEY],
+            env=env,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        for _ in range(6)
+    ]
+    tokens = {processo.communicate(timeout=60)[0].strip() for processo in processos}
+
+    assert all(processo.returncode == 0 for processo in processos)
+    assert len(tokens) == 1 and "" not in tokens
+    assert respostas(simulador, "authenticate") == {200: 1}
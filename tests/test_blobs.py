@@ -0,0 +1,82 @@
+"""Armazém de blobs: deduplicação, vínculo por caso e coleta."""
+
+import base64
+import os
+import time
+
+import pytest
+
+from mostqi import tracing
+from mostqi.arquivos import abrir_entrada
+from mostqi.blobs import (
+    ArmazemBlobs,
+    eh_referencia,
+    finalizar_caso,
+    guardar_imagem,
+    reter_blob,
+)
+
+
+@pytest.fixture
+def armazem(tmp_path, monkeypatch):
+    raiz = str(tmp_path / "blobs")
+    monkeypatch.setenv("MOSTQI_BLOBS_DIR", raiz)
+    return ArmazemBlobs(raiz)
+
+
+def envelhecer(caminho: str, segundos: float) -> None:
+    antes = time.time() - segundos
+    os.utime(caminho, (antes, antes))
+
+
+def test_blob_compartilhado_sobrevive_ao_fim_de_um_caso(armazem):
+    ref = armazem.gravar(b"imagem", "caso-a")
+    assert armazem.gravar(bytearray(b"imagem"), "caso-b") == ref
+    assert armazem.estatisticas() == {"blobs": 1, "bytes": 6, "casos": 2}
+
+    assert armazem.finalizar_caso("caso-a") == 0
+    assert armazem.abrir(ref).ler() == b"imagem"
+
+    assert armazem.finalizar_caso("caso-b") == 1
+    assert not armazem.existe(ref)
+    with pytest.raises(ValueError):
+        armazem.abrir(ref)
+
+
+def test_coleta_apaga_so_blobs_antigos_sem_dono(armazem):
+    sem_dono = armazem.gravar(b"abandonado")
+    recente = armazem.gravar(b"recente")
+    com_dono = armazem.gravar(b"em uso", "caso-a")
+    for ref in (sem_dono, com_dono):
+        envelhecer(armazem.caminho(ref), 7200)
+    temporario = os.path.join(os.path.dirname(armazem.caminho(recente)), ".tmp-x")
+    open(temporario, "wb").close()
+    envelhecer(temporario, 7200)
+
+    assert armazem.coletar(idade_segundos=3600) == 2
+
+    assert not armazem.existe(sem_dono) and not os.path.exists(temporario)
+    assert armazem.existe(recente) and armazem.existe(com_dono)
+
+
+def test_referencias_pelo_caso_atual(armazem):
+    imagem = os.urandom(1000)
+    with tracing.caso("caso-a"):
+        ref = guardar_imagem(base64.b64encode(imagem).decode())
+        assert eh_referencia(ref)
+        assert abrir_entrada(ref).ler() == imagem
+    with tracing.caso("caso-b"):
+        # Referência guardada em cache por outro caso: passa a ser dele também
+        assert reter_blob(ref)
+
+    assert finalizar_caso("caso-a") == 0
+    assert finalizar_caso("caso-b") == 1
+    # Depois de apagado, o cache não pode mais entregar a referência
+    assert not reter_blob(ref, "caso-c")
+
+
+def test_sem_armazem_a_imagem_continua_em_base64(monkeypatch):
+    monkeypatch.delenv("MOSTQI_BLOBS_DIR", raising=False)
+    assert guardar_imagem("aGk=") == "aGk="
+    assert not reter_blob("blob:sha256:" + "0" * 64)
+    assert finalizar_caso("caso-a") == 0
@@ -0,0 +1,106 @@
+"""Limite adaptativo (AIMD) de chamadas simultâneas por endpoint."""
+
+import threading
+import time
+
+from conftest import CLIENT_KEY, politica_retry, respostas
+from mostqi.client import FACE_COMPARE_PATH
+from mostqi.limites import ControleConcorrencia, LimiteAIMD
+from mostqi.simulador import Latencia
+
+
+def test_sobe_aditivo_e_cai_multiplicativo():
+    limite = LimiteAIMD(inicial=4, minimo=1, maximo=8)
+    for _ in range(4):
+        limite.adquirir()
+        limite.liberar(0.01, sobrecarga=False)
+    assert 4.9 < limite.limite < 5.0
+
+    limite.adquirir()
+    limite.liberar(0.01, sobrecarga=True)
+    assert limite.limite < 2.5 and limite.reducoes == 1
+    assert limite.em_andamento == 0
+
+
+def test_um_corte_por_janela_de_latencia():
+    limite = LimiteAIMD(inicial=8, minimo=1, maximo=8)
+    limite.adquirir()
+    limite.liberar(5.0, sobrecarga=False)
+    # Rajada de falhas dentro da mesma latência recente (5 s): um corte só
+    for _ in range(3):
+        limite.adquirir()
+        limite.liberar(0.01, sobrecarga=True)
+    assert limite.reducoes == 1 and limite.limite == 4
+
+
+def test_nao_passa_do_minimo_nem_do_maximo():
+    limite = LimiteAIMD(inicial=2, minimo=2, maximo=3)
+    limite.adquirir()
+    limite.liberar(0.01, sobrecarga=True)
+    assert limite.limite == 2
+    for _ in range(20):
+        limite.adquirir()
+        limite.liberar(0.01, sobrecarga=False)
+    assert limite.limite == 3
+
+
+def test_chamada_espera_por_uma_vaga():
+    controle = ControleConcorrencia(("face-compare",), inicial=1, maximo=1)
+    ocupada = threading.Event()
+    liberar = threading.Event()
+
+    def ocupar():
+        with controle.vaga(FACE_COMPARE_PATH):
+            ocupada.set()
+            liberar.wait(5)
+
+    thread = threading.Thread(target=ocupar)
+    thread.start()
+    ocupada.wait(5)
+    threading.Timer(0.1, liberar.set).start()
+    inicio = time.monotonic()
+    with controle.vaga(FACE_COMPARE_PATH):
+        assert time.monotonic() - inicio >= 0.09
+    thread.join()
+
+    estatisticas = controle.estatisticas()[FACE_COMPARE_PATH]
+    assert estatisticas["esperas"] == 1 and estatisticas["em_andamento"] == 0
+    # Endpoints fora da lista não são controlados
+    assert controle.limite("/user/authenticate") is None
+
+
+def test_limite_cai_quando_o_servidor_satura(iniciar_simulador, criar_cliente):
+    simulador = iniciar_simulador(
+        latencias={"face-compare": Latencia.de_texto("fixa:50")},
+        escala=1.0,
+        max_simultaneas=4,
+        retry_after_s=0.01,
+    )
+    controle = ControleConcorrencia(("face-compare",), inicial=16, maximo=16)
+    cliente = criar_cliente(
+        simulador, concorrencia=controle, retry=politica_retry(max_tentativas=20)
+    )
+    cliente.token(CLIENT_KEY)
+    barreira = threading.Barrier(16)
+    erros = []
+
+    def comparar():
+        barreira.wait()
+        try:
+            for _ in range(3):
+                cliente.face_compare(CLIENT_KEY, b"a", b"b")
+        except Exception as e:
+            erros.append(e)
+
+    threads = [threading.Thread(target=comparar) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not erros
+    assert respostas(simulador, "face-compare")[429] > 0
+    estatisticas = controle.estatisticas()[FACE_COMPARE_PATH]
+    assert estatisticas["reducoes"] > 0
+    assert estatisticas["limite"] < 16
+    assert estatisticas["em_andamento"] == 0
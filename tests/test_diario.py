@@ -0,0 +1,116 @@
+"""Diário de casos: saídas de steps concluídos reaproveitadas sem nova chamada."""
+
+import pytest
+import requests
+
+from conftest import CLIENT_KEY, respostas
+from mostqi import tracing
+from mostqi.blobs import ArmazemBlobs
+from mostqi.diario import DiarioCasos, get_diario
+
+
+@pytest.fixture
+def diario(tmp_path, monkeypatch):
+    monkeypatch.setenv("MOSTQI_DIARIO", str(tmp_path / "diario.sqlite3"))
+    diario = get_diario()
+    yield diario
+    diario.fechar()
+
+
+@pytest.fixture
+def step_face_compare(cliente):
+    """Step que chama o face-compare do simulador a cada execução."""
+
+    @tracing.rastrear_step("teste_face_compare")
+    def main(face_a, face_b, client_key: str = CLIENT_KEY):
+        try:
+            resposta = cliente.face_compare(client_key, face_a, face_b)
+        except requests.exceptions.HTTPError as e:
+            return {"status": "erro", "mensagem": str(e)}
+        return {"status": "sucesso", "similaridade": resposta["result"]["similarity"]}
+
+    return main
+
+
+def test_segunda_execucao_reaproveita_a_saida(simulador, diario, step_face_compare):
+    with tracing.caso("caso-1"):
+        primeira = step_face_compare(b"a", b"b")
+        # Mesmas entradas, outra client_key (fora do hash): não chama a API
+        assert step_face_compare(b"a", b"b", client_key="outra") == primeira
+        # Entradas diferentes executam o step
+        step_face_compare(b"a", b"c")
+    with tracing.caso("caso-2"):
+        step_face_compare(b"a", b"b")
+
+    assert respostas(simulador, "face-compare") == {200: 3}
+    assert diario.estatisticas()["reaproveitados"] == 1
+
+
+def test_caminho_vale_pelo_conteudo(
+    simulador, diario, step_face_compare, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("MOSTQI_DIRETORIOS_ENTRADA", str(tmp_path))
+    caminho = tmp_path / "selfie.jpg"
+    caminho.write_bytes(b"a")
+    with tracing.caso("caso-1"):
+        step_face_compare(str(caminho), b"b")
+        step_face_compare(str(caminho), b"b")
+        # Mesmo caminho com outra foto: outra entrada
+        caminho.write_bytes(b"outra")
+        step_face_compare(str(caminho), b"b")
+
+    assert respostas(simulador, "face-compare") == {200: 2}
+
+
+def test_saida_com_erro_nao_e_gravada(simulador, cliente, diario, step_face_compare):
+    cliente.token(CLIENT_KEY)
+    simulador.config.taxa_erro = 1.0
+    with tracing.caso("caso-1"):
+        assert step_face_compare(b"a", b"b")["status"] == "erro"
+        simulador.config.taxa_erro = 0.0
+        assert step_face_compare(b"a", b"b")["status"] == "sucesso"
+        step_face_compare(b"a", b"b")
+
+    assert respostas(simulador, "face-compare")[200] == 1
+    assert [r["saida"]["status"] for r in diario.casos("caso-1")] == ["sucesso"]
+
+
+def test_registros_visiveis_para_outra_conexao(tmp_path):
+    path = str(tmp_path / "diario.sqlite3")
+    worker = DiarioCasos(path)
+    assert worker.registrar("caso-1", "02", "h1", {"cpf": "1"})
+    # Primeiro registro prevalece
+    worker.registrar("caso-1", "02", "h1", {"cpf": "2"})
+    assert worker.descarregar()
+    worker.fechar()
+
+    retomada = DiarioCasos(path)
+    try:
+        assert retomada.consultar("caso-1", "02", "h1") == {"cpf": "1"}
+        assert retomada.consultar("caso-1", "02", "h2") is None
+        assert retomada.remover("caso-1") == 1
+        assert retomada.consultar("caso-1", "02", "h1") is None
+    finally:
+        retomada.fechar()
+
+
+def test_saida_com_blob_apagado_executa_de_novo(
+    simulador, cliente, diario, tmp_path, monkeypatch
+):
+    raiz = str(tmp_path / "blobs")
+    monkeypatch.setenv("MOSTQI_BLOBS_DIR", raiz)
+    armazem = ArmazemBlobs(raiz)
+    execucoes = []
+
+    @tracing.rastrear_step("teste_blob")
+    def main(imagem: bytes):
+        execucoes.append(imagem)
+        return {"status": "sucesso", "imagem": armazem.gravar(imagem)}
+
+    with tracing.caso("caso-1"):
+        main(b"foto")
+        armazem.finalizar_caso("caso-1")
+        main(b"foto")
+        main(b"foto")
+
+    assert len(execucoes) == 2
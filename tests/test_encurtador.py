@@ -0,0 +1,102 @@
+"""Encurtador próprio: links gravados pelo worker resolvidos pelo redirecionador."""
+
+import asyncio
+import importlib
+import logging
+import time
+
+import pytest
+import requests
+
+from mostqi.encurtador import EncurtadorLinks, Redirecionador, get_encurtador
+
+SESSAO = "https://liveness.mostqi.com/sessao/abc?token=1"
+
+step_06 = importlib.import_module("06_instrucoes_liveness")
+
+
+def resolver_por_http(path: str, links: list) -> list:
+    """Status e Location de cada link, por um redirecionador com outra conexão."""
+
+    async def cenario():
+        redirecionador_db = EncurtadorLinks("http://curto.local", path)
+        try:
+            async with Redirecionador(redirecionador_db, porta=0) as redirecionador:
+                base = f"http://127.0.0.1:{redirecionador.porta}"
+                resultados = []
+                for link in links:
+                    resposta = await asyncio.to_thread(
+                        requests.get,
+                        base + link.removeprefix("http://curto.local"),
+                        allow_redirects=False,
+                        timeout=5,
+                    )
+                    resultados.append(
+                        (resposta.status_code, resposta.headers.get("Location"))
+                    )
+                return resultados
+        finally:
+            redirecionador_db.fechar()
+
+    return asyncio.run(cenario())
+
+
+def test_redirecionador_le_os_links_de_outro_processo(tmp_path):
+    path = str(tmp_path / "links.sqlite3")
+    worker = EncurtadorLinks("http://curto.local", path)
+    valido = worker.encurtar(SESSAO)
+    expirado = worker.encurtar(SESSAO, ttl_segundos=0.01)
+    worker.fechar()
+    time.sleep(0.05)
+
+    assert resolver_por_http(path, [valido, expirado, "/naoexiste"]) == [
+        (302, SESSAO),
+        (410, None),
+        (404, None),
+    ]
+
+
+def test_so_encurta_http():
+    encurtador = EncurtadorLinks("http://curto.local")
+    with pytest.raises(ValueError):
+        encurtador.encurtar("javascript:alert(1)")
+
+
+def test_url_sem_banco_desativa_o_encurtador(monkeypatch, caplog):
+    monkeypatch.setenv("MOSTQI_ENCURTADOR_URL", "http://curto.local")
+    with caplog.at_level(logging.ERROR, logger="mostqi.encurtador"):
+        assert get_encurtador() is None
+    assert "MOSTQI_ENCURTADOR_DB" in caplog.text
+
+
+def test_step_06_gera_link_que_o_redirecionador_resolve(monkeypatch, tmp_path):
+    path = str(tmp_path / "links.sqlite3")
+    monkeypatch.setenv("MOSTQI_ENCURTADOR_URL", "http://curto.local")
+    monkeypatch.setenv("MOSTQI_ENCURTADOR_DB", path)
+
+    def tinyurl(*args, **kwargs):
+        raise AssertionError("o TinyURL não deveria ser chamado")
+
+    with monkeypatch.context() as m:
+        m.setattr(step_06.requests, "get", tinyurl)
+        link = step_06.encurtar_link(SESSAO)
+    get_encurtador().fechar()
+
+    assert link.startswith("http://curto.local/")
+    assert resolver_por_http(path, [link]) == [(302, SESSAO)]
+
+
+def test_step_06_usa_o_link_original_se_o_tinyurl_falhar(monkeypatch):
+    # URL sem banco: o encurtador próprio fica desativado e o TinyURL é usado
+    monkeypatch.setenv("MOSTQI_ENCURTADOR_URL", "http://curto.local")
+    chamadas = []
+
+    def tinyurl(url, params, timeout):
+        chamadas.append(params["url"])
+        raise requests.exceptions.ConnectionError("sem rede")
+
+    monkeypatch.setattr(step_06.requests, "get", tinyurl)
+    saida = step_06.main(SESSAO)
+
+    assert chamadas == [SESSAO]
+    assert SESSAO in saida["description"]
@@ -0,0 +1,110 @@
+"""Hedging: a cópia só sai depois da espera e a perdedora devolve a vaga."""
+
+import threading
+import time
+
+from conftest import CLIENT_KEY, respostas
+from mostqi.client import LIVENESS_STATUS_PATH
+from mostqi.limites import ControleConcorrencia, PoliticaHedge
+from mostqi.simulador import Latencia
+
+
+class PrimeiraLenta:
+    """Latência do simulador: a primeira resposta demora, as demais não."""
+
+    def __init__(self, lenta_ms: float, rapida_ms: float = 5.0) -> None:
+        self.lenta_ms = lenta_ms
+        self.rapida_ms = rapida_ms
+        self.amostras = 0
+
+    def amostrar_ms(self, rng) -> float:
+        self.amostras += 1
+        return self.lenta_ms if self.amostras == 1 else self.rapida_ms
+
+
+def cliente_com_hedge(iniciar_simulador, criar_cliente, latencia, espera_s):
+    simulador = iniciar_simulador(
+        latencias={"liveness-status": latencia}, escala=1.0, liveness_duracao_s=60
+    )
+    cliente = criar_cliente(
+        simulador,
+        hedge=PoliticaHedge(
+            [LIVENESS_STATUS_PATH], proporcao=1.0, espera_inicial=espera_s
+        ),
+        concorrencia=ControleConcorrencia(("status",), inicial=4, maximo=4),
+    )
+    process_id = cliente.liveness_start(CLIENT_KEY, {})["result"]["processId"]
+    return simulador, cliente, process_id
+
+
+def test_copia_vence_e_a_original_devolve_a_vaga(iniciar_simulador, criar_cliente):
+    simulador, cliente, process_id = cliente_com_hedge(
+        iniciar_simulador, criar_cliente, PrimeiraLenta(3000), espera_s=0.1
+    )
+
+    inicio = time.monotonic()
+    resposta = cliente.liveness_status(CLIENT_KEY, process_id, timeout=10)
+    duracao = time.monotonic() - inicio
+
+    assert resposta["result"]["processId"] == process_id
+    assert duracao < 1.5
+    estatisticas = cliente.hedge.estatisticas()[LIVENESS_STATUS_PATH]
+    assert estatisticas["hedges"] == 1 and estatisticas["vitorias"] == 1
+    # A original abortada não conta como sobrecarga nem fica com a vaga
+    vagas = cliente.concorrencia.estatisticas()[LIVENESS_STATUS_PATH]
+    assert vagas["em_andamento"] == 0 and vagas["reducoes"] == 0
+    assert cliente.retry.estatisticas()["repeticoes"] == 0
+    assert respostas(simulador, "liveness-status") == {200: 1}
+
+
+def test_sem_disparo_nenhuma_thread_por_chamada(
+    iniciar_simulador, criar_cliente, monkeypatch
+):
+    simulador, cliente, process_id = cliente_com_hedge(
+        iniciar_simulador, criar_cliente, Latencia.de_texto("fixa:5"), espera_s=1.0
+    )
+    criadas = []
+    thread_original = threading.Thread
+
+    class ThreadContada(thread_original):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            if self.name.startswith("mostqi-hedge"):
+                criadas.append(self.name)
+
+    monkeypatch.setattr(threading, "Thread", ThreadContada)
+
+    for _ in range(20):
+        cliente.liveness_status(CLIENT_KEY, process_id)
+
+    # Só o agendador, compartilhado por todas as chamadas
+    assert criadas == ["mostqi-hedge-agenda"]
+    estatisticas = cliente.hedge.estatisticas()[LIVENESS_STATUS_PATH]
+    assert estatisticas["chamadas"] == 20 and estatisticas["hedges"] == 0
+    assert respostas(simulador, "liveness-status") == {200: 20}
+
+
+def test_original_vence_e_a_copia_e_abortada(iniciar_simulador, criar_cliente):
+    # A original demora um pouco além da espera; a cópia demoraria muito mais
+    class CopiaLenta(PrimeiraLenta):
+        def amostrar_ms(self, rng) -> float:
+            self.amostras += 1
+            return 300.0 if self.amostras == 1 else 3000.0
+
+    simulador, cliente, process_id = cliente_com_hedge(
+        iniciar_simulador, criar_cliente, CopiaLenta(0), espera_s=0.1
+    )
+
+    inicio = time.monotonic()
+    cliente.liveness_status(CLIENT_KEY, process_id, timeout=10)
+    assert time.monotonic() - inicio < 1.5
+
+    # A cópia é encerrada pelo cancelamento e devolve a vaga logo em seguida
+    limite = time.monotonic() + 1
+    vagas = cliente.concorrencia.estatisticas()[LIVENESS_STATUS_PATH]
+    while vagas["em_andamento"] and time.monotonic() < limite:
+        time.sleep(0.01)
+        vagas = cliente.concorrencia.estatisticas()[LIVENESS_STATUS_PATH]
+    assert vagas["em_andamento"] == 0 and vagas["reducoes"] == 0
+    estatisticas = cliente.hedge.estatisticas()[LIVENESS_STATUS_PATH]
+    assert estatisticas["hedges"] == 1 and estatisticas["vitorias"] == 0
@@ -0,0 +1,75 @@
+"""Leitura seletiva da resposta da IDP e cache em memória limitado por bytes."""
+
+import base64
+import json
+
+import pytest
+
+from conftest import CLIENT_KEY
+from mostqi.cache import LRUCache
+from mostqi.idp import ler_resposta_idp
+from mostqi.simulador import CAMPOS_CNH, IMAGEM_BASE64, _resposta_extracao
+
+
+def test_le_campos_e_fatias_das_imagens():
+    resposta = _resposta_extracao(CAMPOS_CNH, imagem=True, crops=True)
+    lida = ler_resposta_idp(json.dumps(resposta).encode())
+
+    assert lida.valores() == CAMPOS_CNH
+    assert lida.score == 0.95
+    assert lida.request_id == resposta["requestId"]
+    assert lida.imagem.texto() == IMAGEM_BASE64
+    assert lida.recorte_face().conteudo().ler() == base64.b64decode(IMAGEM_BASE64)
+
+
+def test_barras_escapadas_e_chaves_desconhecidas():
+    resposta = {
+        "status": {"message": 'texto com "aspas", {chaves} e [colchetes]'},
+        "result": [
+            {
+                "extra": [{"a": [1, 2.5e-3, True, None]}],
+                "fields": [{"name": "nome", "value": "JOSÉ \\ SILVA", "score": 1}],
+                "image": IMAGEM_BASE64,
+            },
+            {"fields": [{"name": "ignorado", "value": "x"}]},
+        ],
+    }
+    bruto = json.dumps(resposta, indent=2).replace("/", "\\/").encode()
+
+    lida = ler_resposta_idp(bruto)
+
+    assert lida.valores() == {"nome": "JOSÉ \\ SILVA"}
+    assert lida.imagem.escapado
+    assert lida.imagem.texto() == IMAGEM_BASE64
+    assert lida.recortes == () and lida.request_id is None
+
+
+@pytest.mark.parametrize(
+    "bruto",
+    [b'{"result": [{"fields": []}', b'{"result": []} x', b'{"result" []}', b"{'a': 1}"],
+)
+def test_json_invalido(bruto):
+    with pytest.raises(ValueError):
+        ler_resposta_idp(bruto)
+
+
+def test_resposta_do_simulador_pelo_cliente(cliente):
+    resposta = cliente.content_extraction(CLIENT_KEY, b"frente", return_image=True)
+    assert resposta.valores()["nome"] == CAMPOS_CNH["nome"]
+    assert resposta.imagem.texto() == IMAGEM_BASE64
+
+
+def test_lru_limitado_por_bytes():
+    cache = LRUCache(max_itens=100, max_bytes=100)
+    cache.set("a", "x" * 40)
+    cache.set("b", "y" * 40)
+    cache.get("a")
+    cache.set("c", "z" * 40)
+
+    # "b" era o menos usado; os três juntos passariam de 100 bytes
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    assert cache.estatisticas()["evictions"] == 1
+
+    cache.set("grande", "w" * 200)
+    assert cache.get("grande") is None and len(cache) == 2
@@ -0,0 +1,113 @@
+"""Prazo do caso: chamadas, esperas e vagas não passam do instante limite."""
+
+import threading
+import time
+
+import pytest
+import requests
+
+from conftest import CLIENT_KEY, politica_retry, respostas
+from mostqi.client import FACE_COMPARE_PATH
+from mostqi.limites import ControleConcorrencia, LimitadorTaxa
+from mostqi.prazo import PrazoCaso, PrazoEsgotado, limitar_timeout, prazo_caso
+from mostqi.simulador import Latencia
+from mostqi.tracing import rastrear_step
+
+
+def test_prazo_esgotado_na_vaga_nao_reduz_o_limite():
+    controle = ControleConcorrencia(("face-compare",), inicial=4, maximo=8)
+    with prazo_caso(time.time() + 0.2):
+        for _ in range(3):
+            with pytest.raises(PrazoEsgotado):
+                with controle.vaga(FACE_COMPARE_PATH):
+                    limitar_timeout(30)
+
+    estatisticas = controle.estatisticas()[FACE_COMPARE_PATH]
+    assert estatisticas["limite"] == 4
+    assert estatisticas["reducoes"] == 0
+    assert estatisticas["em_andamento"] == 0
+
+
+def test_espera_por_vaga_para_no_prazo():
+    controle = ControleConcorrencia(("face-compare",), inicial=1, maximo=1)
+    liberar = threading.Event()
+    ocupada = threading.Event()
+
+    def ocupar():
+        with controle.vaga(FACE_COMPARE_PATH):
+            ocupada.set()
+            liberar.wait(5)
+
+    thread = threading.Thread(target=ocupar)
+    thread.start()
+    ocupada.wait(5)
+    inicio = time.monotonic()
+    try:
+        with prazo_caso(time.time() + 1.0):
+            with pytest.raises(PrazoEsgotado):
+                with controle.vaga(FACE_COMPARE_PATH):
+                    pass
+    finally:
+        liberar.set()
+        thread.join()
+
+    # Espera até sobrar só o timeout mínimo de uma chamada
+    assert 0.4 <= time.monotonic() - inicio < 0.8
+    estatisticas = controle.estatisticas()[FACE_COMPARE_PATH]
+    assert estatisticas["em_andamento"] == 0 and estatisticas["reducoes"] == 0
+
+
+def test_chamada_lenta_termina_no_prazo(iniciar_simulador, criar_cliente):
+    simulador = iniciar_simulador(
+        latencias={"liveness-status": Latencia.de_texto("fixa:3000")}, escala=1.0
+    )
+    cliente = criar_cliente(simulador, retry=politica_retry(max_tentativas=5))
+    cliente.token(CLIENT_KEY)
+
+    inicio = time.monotonic()
+    with prazo_caso(time.time() + 1.2):
+        with pytest.raises(requests.exceptions.Timeout):
+            cliente.liveness_status(CLIENT_KEY, "x")
+
+    # Status é idempotente, mas não há tempo para repetir depois do timeout
+    assert time.monotonic() - inicio < 1.6
+
+
+def test_espera_pela_taxa_alem_do_prazo(simulador, criar_cliente):
+    limitador = LimitadorTaxa({"face-compare": 0.5}, rajada=1)
+    cliente = criar_cliente(simulador, limitador=limitador)
+    cliente.face_compare(CLIENT_KEY, b"a", b"b")
+
+    inicio = time.monotonic()
+    with prazo_caso(time.time() + 1.0):
+        with pytest.raises(PrazoEsgotado):
+            cliente.face_compare(CLIENT_KEY, b"a", b"b")
+
+    # A espera de 2 s não cabe: o erro volta na hora, sem chamar a API
+    assert time.monotonic() - inicio < 0.2
+    assert limitador.esperas == 0
+    assert respostas(simulador, "face-compare") == {200: 1}
+
+
+def test_step_que_esgota_o_prazo_fica_registrado(simulador, cliente):
+    cliente.token(CLIENT_KEY)
+    simulador.config.latencias["face-compare"] = Latencia.de_texto("fixa:3000")
+    simulador.config.escala = 1.0
+
+    @rastrear_step("teste_prazo", diario=False)
+    def main(prazo_caso=None):
+        return cliente.face_compare(CLIENT_KEY, b"a", b"b")
+
+    prazo = PrazoCaso(time.time() + 0.8)
+    with pytest.raises(requests.exceptions.Timeout):
+        main(prazo_caso=prazo)
+    assert prazo.esgotado_por == "teste_prazo"
+
+    # O step seguinte, já sem prazo, não é culpado por ele
+    @rastrear_step("teste_seguinte", diario=False)
+    def seguinte(prazo_caso=None):
+        return limitar_timeout(30)
+
+    with pytest.raises(PrazoEsgotado):
+        seguinte(prazo_caso=prazo)
+    assert prazo.esgotado_por == "teste_prazo"
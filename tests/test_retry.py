@@ -0,0 +1,133 @@
+"""Repetições (Retry-After, backoff, orçamento) e limite de taxa do cliente."""
+
+import time
+
+import pytest
+import requests
+
+from conftest import CLIENT_KEY, politica_retry, respostas
+from mostqi.limites import LimitadorTaxa, OrcamentoRetry
+from mostqi.simulador import Latencia
+
+
+def total(simulador, endpoint: str) -> int:
+    return sum(respostas(simulador, endpoint).values())
+
+
+def test_429_respeita_retry_after_ate_o_limite_de_tentativas(simulador, criar_cliente):
+    cliente = criar_cliente(simulador, retry=politica_retry(max_tentativas=3))
+    cliente.token(CLIENT_KEY)
+    simulador.config.taxa_429 = 1.0
+    simulador.config.retry_after_s = 0.1
+
+    inicio = time.monotonic()
+    with pytest.raises(requests.exceptions.HTTPError) as erro:
+        cliente.face_compare(CLIENT_KEY, b"a", b"b")
+
+    assert erro.value.response.status_code == 429
+    assert time.monotonic() - inicio >= 0.2
+    assert respostas(simulador, "face-compare") == {429: 3}
+    assert cliente.retry.estatisticas()["repeticoes"] == 2
+
+
+def test_erros_5xx_sao_repetidos_ate_dar_certo(iniciar_simulador, criar_cliente):
+    simulador = iniciar_simulador(taxa_erro=0.5)
+    cliente = criar_cliente(simulador, retry=politica_retry(max_tentativas=10))
+
+    for _ in range(10):
+        assert cliente.face_compare(CLIENT_KEY, b"a", b"b")["result"]
+
+    por_status = respostas(simulador, "face-compare")
+    assert por_status[200] == 10 and por_status[500] > 0
+    erros = por_status[500] + respostas(simulador, "authenticate").get(500, 0)
+    assert cliente.retry.estatisticas()["repeticoes"] == erros
+
+
+def test_orcamento_esgotado_encerra_as_repeticoes(simulador, criar_cliente):
+    orcamento = OrcamentoRetry(proporcao=0.0, minimo_por_segundo=0.0, capacidade=1.0)
+    cliente = criar_cliente(
+        simulador, retry=politica_retry(max_tentativas=4, orcamento=orcamento)
+    )
+    cliente.token(CLIENT_KEY)
+    simulador.config.taxa_erro = 1.0
+
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.HTTPError):
+            cliente.face_compare(CLIENT_KEY, b"a", b"b")
+
+    # Uma repetição no orçamento; depois, cada chamada tenta uma vez só
+    assert respostas(simulador, "face-compare") == {500: 3}
+    assert cliente.retry.estatisticas() == {
+        "chamadas": 2,
+        "repeticoes": 1,
+        "negadas_orcamento": 2,
+    }
+
+
+@pytest.mark.parametrize(
+    "chamada, endpoint, tentativas",
+    [
+        # Sem resposta, a mostQI pode ter processado (e cobrado) a comparação
+        (
+            lambda c: c.face_compare(CLIENT_KEY, b"a", b"b", timeout=0.1),
+            "face-compare",
+            1,
+        ),
+        (
+            lambda c: c.liveness_status(CLIENT_KEY, "x", timeout=0.1),
+            "liveness-status",
+            3,
+        ),
+    ],
+    ids=["nao-idempotente", "idempotente"],
+)
+def test_timeout_so_e_repetido_em_chamadas_idempotentes(
+    iniciar_simulador, criar_cliente, chamada, endpoint, tentativas
+):
+    simulador = iniciar_simulador(
+        latencias={
+            "face-compare": Latencia.de_texto("fixa:400"),
+            "liveness-status": Latencia.de_texto("fixa:400"),
+        },
+        escala=1.0,
+    )
+    cliente = criar_cliente(simulador, retry=politica_retry(max_tentativas=3))
+
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        chamada(cliente)
+
+    # O simulador só conta a resposta depois da latência
+    time.sleep(0.5)
+    assert total(simulador, endpoint) == tentativas
+
+
+def test_limite_de_taxa_espaca_as_chamadas():
+    limitador = LimitadorTaxa({"face-compare": 20.0}, rajada=1)
+    path = "/process-image/biometrics/face-compare"
+
+    inicio = time.monotonic()
+    for _ in range(5):
+        limitador.aguardar(path, CLIENT_KEY)
+    duracao = time.monotonic() - inicio
+
+    # Rajada de 1: as 4 chamadas seguintes saem a cada 50 ms
+    assert duracao >= 4 / 20 * 0.9
+    assert limitador.esperas == 4
+
+    # Outros endpoints e outras chaves têm baldes próprios (ou nenhum)
+    limitador.aguardar("/process-image/vio-extraction", CLIENT_KEY)
+    limitador.aguardar(path, "outra-chave")
+    assert limitador.esperas == 4
+
+
+def test_cliente_aguarda_o_limite_de_taxa(simulador, criar_cliente):
+    limitador = LimitadorTaxa({"face-compare": 2.0}, rajada=1)
+    cliente = criar_cliente(simulador, limitador=limitador)
+
+    inicio = time.monotonic()
+    for _ in range(2):
+        cliente.face_compare(CLIENT_KEY, b"a", b"b")
+
+    assert time.monotonic() - inicio >= 0.45
+    assert limitador.esperas == 1
+    assert respostas(simulador, "face-compare") == {200: 2}
@@ -0,0 +1,58 @@
+"""O simulador responde como as APIs mostQI que os steps usam."""
+
+import requests
+
+from conftest import CLIENT_KEY, respostas
+from mostqi.client import AuthError
+
+
+def test_fluxo_completo_pelo_cliente(simulador, cliente):
+    resposta = cliente.content_extraction(CLIENT_KEY, b"frente")
+    assert resposta.valores()["cpf"] == "123.456.789-09"
+    assert resposta.request_id
+
+    vio = cliente.vio_extraction(CLIENT_KEY, b"verso")
+    assert vio["result"][0]["fields"]
+
+    sessao = cliente.liveness_start(CLIENT_KEY, {})
+    process_id = sessao["result"]["processId"]
+    assert sessao["result"]["sessionUrl"].endswith(process_id)
+    status = cliente.liveness_status(CLIENT_KEY, process_id)
+    assert status["result"]["status"] == "Processing"
+
+    similaridade = cliente.face_compare(CLIENT_KEY, b"a", b"b")
+    assert similaridade["result"]["similarity"] == simulador.config.similaridade
+
+    # Um único token atende todas as chamadas
+    assert respostas(simulador, "authenticate") == {200: 1}
+
+
+def test_status_de_processo_desconhecido_e_404(simulador, cliente):
+    try:
+        cliente.liveness_status(CLIENT_KEY, "nao-existe")
+    except requests.exceptions.HTTPError as e:
+        assert e.response.status_code == 404
+    else:
+        raise AssertionError("esperava HTTP 404")
+    # 404 não é repetido
+    assert respostas(simulador, "liveness-status") == {404: 1}
+
+
+def test_token_invalido_e_recusado(simulador):
+    resposta = requests.post(
+        simulador.url + "/process-image/biometrics/face-compare",
+        headers={"Authorization": "Bearer a.b.c"},
+        timeout=5,
+    )
+    assert resposta.status_code == 401
+
+
+def test_autenticacao_recusada_vira_auth_error(iniciar_simulador, criar_cliente):
+    simulador = iniciar_simulador(taxa_erro=1.0)
+    cliente = criar_cliente(simulador)
+    try:
+        cliente.face_compare(CLIENT_KEY, b"a", b"b")
+    except AuthError as e:
+        assert "500" in str(e)
+    else:
+        raise AssertionError("esperava AuthError")
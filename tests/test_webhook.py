@@ -0,0 +1,81 @@
+"""Webhooks de liveness: banco compartilhado entre receptores e workers."""
+
+import asyncio
+import threading
+
+from conftest import CLIENT_KEY, respostas
+from mostqi.liveness import PoliticaBackoff, aguardar_liveness
+from mostqi.webhook import (
+    ReceptorWebhook,
+    ResultadosWebhook,
+    enviar_webhook,
+    payload_simulado,
+)
+
+
+def test_primeiro_payload_vale_entre_conexoes(tmp_path):
+    path = str(tmp_path / "webhooks.sqlite3")
+    receptor_a, receptor_b = ResultadosWebhook(path), ResultadosWebhook(path)
+    try:
+        assert receptor_a.gravar("p1", payload_simulado("p1", 0.9))
+        assert not receptor_b.gravar("p1", payload_simulado("p1", 0.1))
+        assert receptor_b.resultado("p1")["result"]["livenessScore"] == 0.9
+        assert receptor_b.resultado("p2") is None
+    finally:
+        receptor_a.fechar()
+        receptor_b.fechar()
+
+
+def test_receptores_deduplicam_pelo_banco(tmp_path):
+    path = str(tmp_path / "webhooks.sqlite3")
+
+    async def cenario():
+        armazem_a, armazem_b = ResultadosWebhook(path), ResultadosWebhook(path)
+        try:
+            async with ReceptorWebhook(
+                porta=0, segredo="", armazem=armazem_a
+            ) as receptor_a, ReceptorWebhook(
+                porta=0, segredo="", armazem=armazem_b
+            ) as receptor_b:
+                espera = asyncio.create_task(receptor_a.aguardar("p1", timeout=5))
+                primeiro = await enviar_webhook(receptor_a.url, payload_simulado("p1"))
+                repetido = await enviar_webhook(receptor_b.url, payload_simulado("p1"))
+                return await espera, primeiro, repetido, receptor_b.estatisticas()
+        finally:
+            armazem_a.fechar()
+            armazem_b.fechar()
+
+    payload, primeiro, repetido, estatisticas = asyncio.run(cenario())
+    assert payload["processId"] == "p1"
+    assert primeiro == (200, {"recebido": True, "duplicado": False})
+    assert repetido == (200, {"recebido": True, "duplicado": True})
+    assert estatisticas["duplicados"] == 1
+
+
+def test_webhook_encerra_a_espera_pela_liveness(
+    iniciar_simulador, criar_cliente, tmp_path, monkeypatch
+):
+    # A sessão no simulador não termina durante o teste: só o webhook encerra
+    simulador = iniciar_simulador(liveness_duracao_s=60)
+    cliente = criar_cliente(simulador)
+    process_id = cliente.liveness_start(CLIENT_KEY, {})["result"]["processId"]
+    path = str(tmp_path / "webhooks.sqlite3")
+    monkeypatch.setenv("MOSTQI_WEBHOOK_DB", path)
+    receptor = ResultadosWebhook(path)
+    threading.Timer(
+        0.3, receptor.gravar, (process_id, payload_simulado(process_id, 0.91))
+    ).start()
+
+    resultado = aguardar_liveness(
+        CLIENT_KEY,
+        process_id,
+        prazo_segundos=10,
+        politica=PoliticaBackoff(inicial=5.0, jitter=0.0),
+        client=cliente,
+    )
+    receptor.fechar()
+
+    assert resultado.origem == "webhook"
+    assert resultado.terminal and resultado.liveness_score == 0.91
+    assert resultado.duracao_s < 2
+    assert respostas(simulador, "liveness-status") == {200: 1}